@@ -26,6 +26,8 @@ from typing import List, Dict, Any, Optional
 sys.path.append(os.path.dirname(__file__))
 
 from unified_prescription_processor import UnifiedPrescriptionProcessor
+from ai_analyzer.ai_gating import summarize_ai_gating
+from ai_analyzer.model_routing import prescription_complexity
 from config.settings import Settings
 
 class AdvancedBatchProcessor:
@@ -110,19 +112,55 @@ class AdvancedBatchProcessor:
                 except Exception as e:
                     logger.error(f"Batch processing failed: {e}")
         
+        batch_summary = self._build_batch_summary(prescriptions, results, source, start_time)
+        
+        logger.info(f"Async batch processing completed: {total_processed} prescriptions in "
+                    f"{batch_summary['metadata']['processing_duration_seconds']:.2f}s")
+        
+        return batch_summary
+    
+    def process_batch_with_message_batches(self, prescriptions: List[Dict], source: str = "message_batch") -> Dict[str, Any]:
+        """Overnight batch processing: AI requests are sent as a single Message Batches job"""
+        start_time = datetime.now()
+        
+        logger.info(f"Starting message batch processing: {len(prescriptions)} prescriptions")
+        
+        # Initialize processor if needed
+        if not self.processor:
+            self.processor = UnifiedPrescriptionProcessor()
+        
+        results = [result for result in self.processor.process_with_message_batches(prescriptions, source) if result]
+        
+        batch_summary = self._build_batch_summary(prescriptions, results, source, start_time)
+        batch_summary["metadata"]["mode"] = "message_batches"
+        
+        logger.info(f"Message batch processing completed: {len(results)} prescriptions in "
+                    f"{batch_summary['metadata']['processing_duration_seconds']:.2f}s")
+        
+        return batch_summary
+    
+    def _build_batch_summary(self, prescriptions: List[Dict], results: List[Dict], source: str,
+                             start_time: datetime) -> Dict[str, Any]:
+        """Analytics, metrics and summary for a finished batch"""
         end_time = datetime.now()
         processing_duration = (end_time - start_time).total_seconds()
         
         # Generate comprehensive analytics
         analytics = self._generate_batch_analytics(results, processing_duration, source)
         
+        gating = analytics.get("ai_gating") or {}
+        if gating.get("ai_calls_avoided"):
+            logger.info(f"AI gating: {gating['ai_calls_avoided']} API calls avoided, {gating['ai_calls']} made, "
+                        f"avg {gating['avg_time_gated']:.2f}s gated vs {gating['avg_time_ai']:.2f}s with AI")
+        self.processor.ai_analyzer.model_router.stats.log()
+        
         # Update performance metrics
         self._update_performance_metrics(results, processing_duration)
         
         # Store results
         self.completed_results.extend(results)
         
-        batch_summary = {
+        return {
             "metadata": {
                 "start_time": start_time.isoformat(),
                 "end_time": end_time.isoformat(),
@@ -137,10 +175,6 @@ class AdvancedBatchProcessor:
             "analytics": analytics,
             "performance": self.performance_metrics.copy()
         }
-        
-        logger.info(f"Async batch processing completed: {total_processed} prescriptions in {processing_duration:.2f}s")
-        
-        return batch_summary
     
     def _create_optimal_batches(self, prescriptions: List[Dict]) -> List[List[Dict]]:
         """Create optimally sized batches for processing"""
@@ -175,26 +209,7 @@ class AdvancedBatchProcessor:
     
     def _calculate_prescription_complexity(self, prescription: Dict) -> int:
         """Calculate processing complexity score for a prescription"""
-        
-        complexity = 1  # Base complexity
-        
-        # More drugs = higher complexity
-        drugs = prescription.get("drugs", [])
-        complexity += len(drugs)
-        
-        # Report requirements add complexity
-        if prescription.get("report_details") or prescription.get("rapor_no"):
-            complexity += 2
-        
-        # Message codes add complexity
-        if prescription.get("ilac_mesajlari"):
-            complexity += 1
-        
-        # Patient age considerations (if available)
-        if prescription.get("hasta_tc"):
-            complexity += 1
-        
-        return min(complexity, 5)  # Cap at 5
+        return prescription_complexity(prescription)
     
     def _process_batch_sync(self, batch: List[Dict], source: str) -> List[Dict]:
         """Synchronous processing of a single batch"""
@@ -247,6 +262,9 @@ class AdvancedBatchProcessor:
             "error_analysis": self._analyze_errors(results),
             "drug_analysis": self._analyze_drugs(results),
             "temporal_analysis": self._analyze_temporal_patterns(results),
+            "ai_gating": summarize_ai_gating(results),
+            "model_tiers": self.processor.ai_analyzer.get_routing_stats(),
+            "ai_circuit": self.processor.ai_analyzer.get_circuit_stats(),
             "recommendations": self._generate_recommendations(results)
         }
         
@@ -765,8 +783,12 @@ class AdvancedBatchProcessor:
             logger.error(f"Auto-processing error for {file_path}: {e}")
     
     def schedule_batch_processing(self, schedule_time: str, source_directory: str, 
-                                pattern: str = "*.json", recurring: bool = True):
-        """Schedule regular batch processing"""
+                                pattern: str = "*.json", recurring: bool = True,
+                                use_message_batches: Optional[bool] = None):
+        """Schedule regular batch processing (AI_BATCH_MODE selects Message Batches for overnight jobs)"""
+        
+        if use_message_batches is None:
+            use_message_batches = self.settings.ai_batch_mode
         
         def scheduled_job():
             logger.info(f"Running scheduled batch processing: {source_directory}")
@@ -795,13 +817,16 @@ class AdvancedBatchProcessor:
                         logger.error(f"Failed to load {file_path}: {e}")
                 
                 if all_prescriptions:
-                    # Run async processing
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    
-                    result = loop.run_until_complete(
-                        self.process_batch_async(all_prescriptions, "scheduled")
-                    )
+                    if use_message_batches:
+                        result = self.process_batch_with_message_batches(all_prescriptions, "scheduled")
+                    else:
+                        # Run async processing
+                        loop = asyncio.new_event_loop()
+                        asyncio.set_event_loop(loop)
+                        
+                        result = loop.run_until_complete(
+                            self.process_batch_async(all_prescriptions, "scheduled")
+                        )
                     
                     # Save results
                     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -836,7 +861,8 @@ class AdvancedBatchProcessor:
             self._scheduler_thread.daemon = True
             self._scheduler_thread.start()
         
-        logger.info(f"Batch processing scheduled for {schedule_time} ({'recurring' if recurring else 'one-time'})")
+        logger.info(f"Batch processing scheduled for {schedule_time} ({'recurring' if recurring else 'one-time'}"
+                    f"{', message batches' if use_message_batches else ''})")
     
     def _scheduler_worker(self):
         """Worker thread for scheduled jobs"""
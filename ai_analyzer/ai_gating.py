@@ -0,0 +1,156 @@
+"""
+Deterministik AI Kapısı
+Doz ve SUT kontrolleri sonucu kesin belirlediğinde Claude çağrısını atlar;
+AI sadece belirsiz veya çelişkili reçetelerde çağrılır
+"""
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+
+def sut_findings(sut_analysis: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    SUT analizindeki tüm bulgular (ilaç, mesaj kodu ve genel kurallar dahil)
+
+    _build_sut_analysis üst düzey "warnings" alanını doldurmaz; ilaç uyarıları
+    drug_analyses, eksik mesaj kodları message_code_analysis, TC/tarih sorunları
+    general_compliance altındadır.
+    """
+    sut_analysis = sut_analysis or {}
+    findings = [str(item) for item in sut_analysis.get("issues", []) or []]
+    findings += [str(item) for item in sut_analysis.get("warnings", []) or []]
+    for drug in sut_analysis.get("drug_analyses", []) or []:
+        findings += [f"drug: {item}" for item in drug.get("issues", []) or []]
+        findings += [f"drug: {item}" for item in drug.get("warnings", []) or []]
+    for missing in (sut_analysis.get("message_code_analysis") or {}).get("missing_codes", []) or []:
+        findings.append(f"missing_code: {missing.get('drug')}: {missing.get('missing_code')}")
+    general = sut_analysis.get("general_compliance") or {}
+    findings += [f"general: {item}" for item in general.get("issues", []) or []]
+    if general and not general.get("compliant", True):
+        findings.append("general: noncompliant")
+    return findings
+
+
+class GateDecision(NamedTuple):
+    """AI çağrısı yerine kullanılan deterministik karar"""
+    action: str
+    confidence: float
+    rule: str
+    reason: str
+
+
+class AIGatingPolicy:
+    """
+    AI çağrısını atlama politikası
+
+    Kurallar (sırasıyla):
+    - dose_reject: Doz kontrolü reddettiyse nihai karar zaten "reject"
+    - sut_reject: SUT reddettiyse nihai karar zaten "reject"
+    - sut_approve: SUT yüksek güvenle onayladı, ilaç/mesaj kodu/genel kural bulgusu yok
+      ve doz kontrolü çelişmiyor
+    """
+
+    # sut_approve kuralında doz kontrolünün çelişki sayılmayan sonuçları
+    NON_CONFLICTING_DOSE_ACTIONS = ("approve", "hold")
+
+    def __init__(self, enabled: bool = True, skip_on_reject: bool = True,
+                 sut_approve_min_confidence: float = 0.95):
+        self.enabled = enabled
+        self.skip_on_reject = skip_on_reject
+        self.sut_approve_min_confidence = sut_approve_min_confidence
+
+    @classmethod
+    def from_settings(cls, settings) -> "AIGatingPolicy":
+        """Ayarlardan politika oluşturur"""
+        return cls(
+            enabled=getattr(settings, "ai_gating_enabled", True),
+            skip_on_reject=getattr(settings, "ai_gating_skip_on_reject", True),
+            sut_approve_min_confidence=getattr(settings, "ai_gating_sut_approve_confidence", 0.95)
+        )
+
+    def evaluate(self, dose_result: Dict[str, Any], sut_result: Dict[str, Any]) -> Optional[GateDecision]:
+        """
+        Deterministik aşamalar kesin ise kararı döndürür, AI gerekiyorsa None
+
+        Args:
+            dose_result: _perform_dose_control sonucu
+            sut_result: _perform_sut_analysis sonucu
+        """
+        if not self.enabled:
+            return None
+
+        dose_rec = dose_result.get("recommendation") or {}
+        sut_rec = sut_result.get("recommendation") or {}
+        sut_analysis = sut_result.get("analysis") or {}
+
+        if sut_result.get("error") or dose_result.get("error"):
+            return None
+
+        if self.skip_on_reject and dose_rec.get("action") == "reject":
+            return GateDecision("reject", dose_rec.get("confidence", 0.9), "dose_reject",
+                                dose_rec.get("reason", "Dose control rejected the prescription"))
+
+        if self.skip_on_reject and sut_rec.get("action") == "reject":
+            return GateDecision("reject", sut_rec.get("confidence", 0.9), "sut_reject",
+                                sut_rec.get("reason", "SUT rejected the prescription"))
+
+        if (sut_rec.get("action") == "approve"
+                and sut_rec.get("confidence", 0.0) >= self.sut_approve_min_confidence
+                and sut_analysis.get("overall_compliance")
+                and "general_compliance" in sut_analysis
+                and not sut_findings(sut_analysis)
+                and dose_rec.get("action") in self.NON_CONFLICTING_DOSE_ACTIONS
+                and not (dose_result.get("analysis") or {}).get("violations")):
+            return GateDecision("approve", sut_rec["confidence"], "sut_approve",
+                                sut_rec.get("reason", "SUT approved the prescription"))
+
+        return None
+
+    @staticmethod
+    def to_ai_result(gate: GateDecision) -> Dict[str, Any]:
+        """Kapı kararını _combine_analysis_results'ın beklediği AI sonucu biçimine çevirir"""
+        return {
+            "result": {
+                "action": gate.action,
+                "confidence": gate.confidence,
+                "reason": f"AI skipped ({gate.rule}): {gate.reason}",
+                "claude_available": False,
+                "analysis_method": "deterministic_gate",
+                "gate_rule": gate.rule
+            },
+            "processing_time": 0.0,
+            "gated": True
+        }
+
+
+def summarize_ai_gating(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Batch için atlanan AI çağrıları ve gecikme farkı
+
+    Returns:
+        Dict: AI çağrısı/atlama sayıları, yol başına ortalama süre ve tahmini kazanç (saniye)
+    """
+    gated_times, ai_times, rules = [], [], {}
+    for result in results:
+        ai_analysis = result.get("ai_analysis") or {}
+        if ai_analysis.get("action") == "error":
+            continue
+        elapsed = (result.get("processing_metadata") or {}).get("processing_time_seconds", 0.0)
+        if ai_analysis.get("gated"):
+            gated_times.append(elapsed)
+            rule = ai_analysis.get("gate_rule", "unknown")
+            rules[rule] = rules.get(rule, 0) + 1
+        else:
+            ai_times.append(elapsed)
+
+    avg_gated = sum(gated_times) / len(gated_times) if gated_times else 0.0
+    avg_ai = sum(ai_times) / len(ai_times) if ai_times else 0.0
+    total = len(gated_times) + len(ai_times)
+    return {
+        "ai_calls": len(ai_times),
+        "ai_calls_avoided": len(gated_times),
+        "avoided_rate": round(len(gated_times) / total, 4) if total else 0.0,
+        "by_rule": rules,
+        "avg_time_gated": round(avg_gated, 4),
+        "avg_time_ai": round(avg_ai, 4),
+        "estimated_time_saved": round(max(avg_ai - avg_gated, 0.0) * len(gated_times), 4) if ai_times else 0.0
+    }
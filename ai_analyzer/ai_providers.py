@@ -0,0 +1,277 @@
+"""
+AI Sağlayıcı Katmanı
+Claude ve OpenAI için ortak istek/yanıt tipi, süreç genelinde paylaşılan
+(keep-alive bağlantı havuzlu) istemci ve eşzamanlı istek sınırı
+"""
+
+import importlib.util
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+from loguru import logger
+
+from ai_analyzer.decision_schema import (DECISION_TOOL_NAME, anthropic_tool_choice, extract_tool_input,
+                                         openai_tool, openai_tool_choice, response_text)
+from ai_analyzer.prompts import usage_to_dict
+
+# Ayarlardaki sağlayıcı adları -> sağlayıcı
+PROVIDER_ALIASES = {"claude": "anthropic", "anthropic": "anthropic", "openai": "openai"}
+
+_PROVIDER_MODULES = {"anthropic": "anthropic", "openai": "openai"}
+
+
+class ProviderConfig(NamedTuple):
+    """Sağlayıcı bağlantı ayarları (tek kaynak: Settings)"""
+    name: str
+    api_key: str
+    model: str
+    timeout: float = 60.0
+    max_retries: int = 2
+    max_concurrency: int = 8
+    keepalive_seconds: float = 30.0
+    base_url: str = ""  # Boş: SDK varsayılanı
+
+    @classmethod
+    def from_settings(cls, settings, name: str) -> "ProviderConfig":
+        name = canonical_provider(name)
+        if name == "anthropic":
+            api_key, model = settings.claude_api_key, settings.ai_model
+        else:
+            api_key, model = settings.openai_api_key, settings.openai_model
+        return cls(
+            name=name,
+            api_key=api_key or "",
+            model=model,
+            timeout=settings.ai_request_timeout,
+            max_retries=settings.ai_max_retries,
+            max_concurrency=settings.ai_max_concurrency,
+            keepalive_seconds=settings.ai_keepalive_seconds,
+            base_url=settings.ai_base_url,
+        )
+
+
+class AIRequest(NamedTuple):
+    """Sağlayıcıdan bağımsız tek mesajlık istek"""
+    prompt: str
+    system: str = ""
+    model: Optional[str] = None
+    max_tokens: int = 1000
+    temperature: float = 0.3
+    tool: Optional[Dict[str, Any]] = None  # Anthropic biçimi: name, description, input_schema
+    cache_system: bool = False
+
+
+class AIResponse(NamedTuple):
+    """Sağlayıcıdan bağımsız yanıt"""
+    provider: str
+    model: str
+    text: str
+    tool_input: Optional[Dict[str, Any]]
+    usage: Dict[str, int]
+    latency: float
+    raw: Any = None
+
+    @property
+    def content(self) -> Any:
+        """Araç çağrısı girdisi varsa o, yoksa metin"""
+        return self.tool_input if self.tool_input is not None else self.text
+
+
+def canonical_provider(name: str) -> str:
+    try:
+        return PROVIDER_ALIASES[(name or "").lower()]
+    except KeyError:
+        raise ValueError(f"Bilinmeyen AI sağlayıcısı: {name}") from None
+
+
+def provider_available(name: str) -> bool:
+    """Sağlayıcı kütüphanesi kurulu mu (içe aktarmadan)"""
+    return importlib.util.find_spec(_PROVIDER_MODULES[canonical_provider(name)]) is not None
+
+
+class AIProvider:
+    """
+    Tek sağlayıcı için paylaşılan istemci
+
+    SDK istemcisi ilk kullanımda oluşturulur; kütüphane o ana kadar içe aktarılmaz.
+    """
+
+    def __init__(self, config: ProviderConfig, client=None):
+        """client verilirse SDK istemcisi yerine o kullanılır (özel uç nokta, testler)"""
+        self.config = config
+        self._client = client
+        self._http_client = None
+        self._client_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, config.max_concurrency))
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def client(self):
+        """Keep-alive bağlantı havuzlu SDK istemcisi"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+                    logger.info(f"AI client initialized - provider: {self.name}, "
+                                f"max concurrency: {self.config.max_concurrency}")
+        return self._client
+
+    def _http_pool(self):
+        import httpx
+
+        self._http_client = httpx.Client(
+            timeout=self.config.timeout,
+            limits=httpx.Limits(max_connections=self.config.max_concurrency,
+                                max_keepalive_connections=self.config.max_concurrency,
+                                keepalive_expiry=self.config.keepalive_seconds),
+        )
+        return self._http_client
+
+    def _create_client(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Sağlayıcıya aynı anda giden istek sayısını sınırlar"""
+        with self._slots:
+            yield
+
+    def build_params(self, request: AIRequest) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _send(self, client, params: Dict[str, Any]):
+        raise NotImplementedError
+
+    def to_response(self, raw: Any, latency: float, model: str = "",
+                    tool_name: Optional[str] = DECISION_TOOL_NAME) -> AIResponse:
+        """SDK yanıtını ortak yanıt tipine çevirir"""
+        tool_input = extract_tool_input(raw, tool_name) if tool_name else None
+        return AIResponse(
+            provider=self.name,
+            model=getattr(raw, "model", None) or model,
+            text=response_text(raw),
+            tool_input=tool_input,
+            usage=usage_to_dict(getattr(raw, "usage", None)),
+            latency=latency,
+            raw=raw,
+        )
+
+    def complete(self, request: AIRequest, client=None) -> AIResponse:
+        """
+        İsteği gönderir
+
+        Args:
+            request: Ortak istek
+            client: Paylaşılan istemci yerine kullanılacak istemci (test/özel uç nokta)
+        """
+        params = self.build_params(request)
+        client = client if client is not None else self.client
+        with self.slot():
+            start = time.time()
+            raw = self._send(client, params)
+            latency = time.time() - start
+        return self.to_response(raw, latency, params["model"], request.tool["name"] if request.tool else None)
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+        self._client = self._http_client = None
+
+
+class AnthropicProvider(AIProvider):
+    """Claude Messages API"""
+
+    def _create_client(self):
+        import anthropic
+
+        return anthropic.Anthropic(api_key=self.config.api_key, base_url=self.config.base_url or None,
+                                   timeout=self.config.timeout, max_retries=self.config.max_retries,
+                                   http_client=self._http_pool())
+
+    def build_params(self, request: AIRequest) -> Dict[str, Any]:
+        system_block = {"type": "text", "text": request.system}
+        if request.cache_system:
+            system_block["cache_control"] = {"type": "ephemeral"}
+
+        params = {
+            "model": request.model or self.config.model,
+            "max_tokens": request.max_tokens,
+            "temperature": request.temperature,
+            "system": [system_block],
+            "messages": [{"role": "user", "content": request.prompt}],
+        }
+        if request.tool:
+            params["tools"] = [request.tool]
+            params["tool_choice"] = anthropic_tool_choice(request.tool["name"])
+        return params
+
+    def _send(self, client, params):
+        return client.messages.create(**params)
+
+
+class OpenAIProvider(AIProvider):
+    """OpenAI Chat Completions API"""
+
+    def _create_client(self):
+        import openai
+
+        return openai.OpenAI(api_key=self.config.api_key, base_url=self.config.base_url or None,
+                             timeout=self.config.timeout, max_retries=self.config.max_retries,
+                             http_client=self._http_pool())
+
+    def build_params(self, request: AIRequest) -> Dict[str, Any]:
+        messages = [{"role": "user", "content": request.prompt}]
+        if request.system:
+            messages.insert(0, {"role": "system", "content": request.system})
+
+        params = {
+            "model": request.model or self.config.model,
+            "messages": messages,
+            "temperature": request.temperature,
+            "max_tokens": request.max_tokens,
+        }
+        if request.tool:
+            params["tools"] = [openai_tool(request.tool["name"], request.tool["input_schema"])]
+            params["tool_choice"] = openai_tool_choice(request.tool["name"])
+        return params
+
+    def _send(self, client, params):
+        return client.chat.completions.create(**params)
+
+
+_PROVIDER_CLASSES = {"anthropic": AnthropicProvider, "openai": OpenAIProvider}
+
+_providers: Dict[ProviderConfig, AIProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name: str, settings=None) -> AIProvider:
+    """
+    Süreç genelinde paylaşılan sağlayıcı (aynı bağlantı ayarları için tek istemci)
+
+    Anahtar tüm ProviderConfig'dir: base_url, zaman aşımı veya model değişen
+    Settings önceki istemciyi yeniden kullanmaz.
+    """
+    if settings is None:
+        from config.settings import Settings
+        settings = Settings()
+
+    config = ProviderConfig.from_settings(settings, name)
+    with _providers_lock:
+        provider = _providers.get(config)
+        if provider is None:
+            provider = _providers[config] = _PROVIDER_CLASSES[config.name](config)
+        return provider
+
+
+def close_providers():
+    """Paylaşılan istemcilerin bağlantılarını kapatır"""
+    with _providers_lock:
+        for provider in _providers.values():
+            provider.close()
+        _providers.clear()
@@ -0,0 +1,177 @@
+"""
+AI Kayıt / Tekrar Oynatma Katmanı
+Messages API istek/yanıt çiftlerini diske (JSONL kaset) yazar ve aynı istek
+tekrar geldiğinde ağa çıkmadan kayıtlı yanıtı döndürür. Böylece AI yolu
+çevrimdışı ve deterministik olarak ölçülebilir.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Mapping, Optional
+
+from loguru import logger
+
+from ai_analyzer.prompts import usage_to_dict
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+
+
+class CassetteMiss(KeyError):
+    """Tekrar oynatma modunda kasette olmayan istek"""
+
+
+def request_key(params: Mapping[str, Any]) -> str:
+    """İsteğin kanonik JSON özetine göre kaset anahtarı"""
+    canonical = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def message_to_dict(message: Any) -> Dict[str, Any]:
+    """SDK yanıtını Messages API JSON biçimine çevirir"""
+    content = []
+    for block in getattr(message, "content", None) or []:
+        kind = getattr(block, "type", "text")
+        if kind == "tool_use":
+            content.append({"type": "tool_use", "id": getattr(block, "id", ""), "name": block.name,
+                            "input": dict(block.input)})
+        else:
+            content.append({"type": kind, "text": getattr(block, "text", "")})
+    return {
+        "id": getattr(message, "id", ""),
+        "type": "message",
+        "role": "assistant",
+        "model": getattr(message, "model", ""),
+        "content": content,
+        "stop_reason": getattr(message, "stop_reason", None),
+        "usage": usage_to_dict(getattr(message, "usage", None)),
+    }
+
+
+def message_from_dict(data: Mapping[str, Any]) -> SimpleNamespace:
+    """Messages API JSON'ını SDK yanıtı gibi okunabilen nesneye çevirir"""
+    return SimpleNamespace(
+        id=data.get("id", ""),
+        type=data.get("type", "message"),
+        role=data.get("role", "assistant"),
+        model=data.get("model", ""),
+        content=[SimpleNamespace(**block) for block in data.get("content", [])],
+        stop_reason=data.get("stop_reason"),
+        usage=SimpleNamespace(**(data.get("usage") or {})),
+    )
+
+
+class Cassette:
+    """
+    JSONL istek/yanıt kaydı
+
+    Modlar:
+        record: her istek gerçek istemciye gider, yanıt kaydedilir (varsa üzerine yazılır)
+        replay: sadece kayıttan okunur, kayıt yoksa CassetteMiss
+        auto:   kayıt varsa oynatılır, yoksa gerçek istemciye gidip kaydedilir
+    """
+
+    def __init__(self, path: str, mode: str = "replay", replay_latency: bool = False):
+        if mode not in CASSETTE_MODES or mode == "off":
+            raise ValueError(f"Geçersiz kaset modu: {mode}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self._load()
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["Cassette"]:
+        """Ayarlardan kaset açar (AI_CASSETTE_MODE=off ise None)"""
+        mode = (getattr(settings, "ai_cassette_mode", "off") or "off").lower()
+        if mode == "off":
+            return None
+        return cls(settings.ai_cassette_path, mode, settings.ai_cassette_replay_latency)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Kaset satırı okunamadı ({self.path}:{line_no}): {e}")
+        logger.info(f"AI kaseti yüklendi: {len(self._entries)} kayıt ({self.mode})")
+
+    def lookup(self, params: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+        """Kayıtlı etkileşim (yoksa None)"""
+        with self._lock:
+            entry = self._entries.get(request_key(params))
+            self._stats["hits" if entry else "misses"] += 1
+            return entry
+
+    def record(self, params: Mapping[str, Any], message: Any, latency: float) -> Dict[str, Any]:
+        """Etkileşimi belleğe ve dosyaya ekler (dosyada son satır geçerlidir)"""
+        entry = {"key": request_key(params), "request": dict(params), "response": message_to_dict(message),
+                 "latency": round(latency, 4), "recorded_at": time.time()}
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self._entries[entry["key"]] = entry
+            self._stats["recorded"] += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "mode": self.mode}
+
+
+class _CassetteMessages:
+    def __init__(self, owner: "CassetteClient"):
+        self._owner = owner
+
+    def create(self, **params):
+        return self._owner.create(params)
+
+
+class CassetteClient:
+    """
+    anthropic.Anthropic yerine kullanılabilen kayıt/oynatma istemcisi (client.messages.create)
+
+    inner: Kayıt için gerçek istemci (SDK, yerel sahte sunucu istemcisi vb.); replay modunda gerekmez.
+    """
+
+    def __init__(self, cassette: Cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner
+        self.messages = _CassetteMessages(self)
+
+    def create(self, params: Dict[str, Any]):
+        # İstek başına zaman aşımı kayıt anahtarına girmez
+        options = {"timeout": params.pop("timeout")} if "timeout" in params else {}
+        if self.cassette.mode != "record":
+            entry = self.cassette.lookup(params)
+            if entry is not None:
+                if self.cassette.replay_latency:
+                    time.sleep(entry.get("latency", 0.0))
+                return message_from_dict(entry["response"])
+            if self.cassette.mode == "replay":
+                raise CassetteMiss(f"Kasette kayıt yok: {request_key(params)[:12]}")
+
+        if self.inner is None:
+            raise CassetteMiss("Kayıt için gerçek istemci yok")
+        start = time.time()
+        message = self.inner.messages.create(**params, **options)
+        self.cassette.record(params, message, time.time() - start)
+        return message
@@ -0,0 +1,218 @@
+"""
+AI Çağrıları için Devre Kesici ve Uyarlanabilir Zaman Aşımı
+Art arda hatalarda veya gecikme yükseldiğinde AI çağrıları bir bekleme süresi
+boyunca hiç denenmeden atlanır (SUT'a düşülür); süre dolunca tek bir deneme
+(probe) isteği geçirilir. İstek zaman aşımı gözlenen p95 gecikmeden hesaplanır.
+"""
+
+import socket
+import threading
+import time
+import urllib.error
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Metrik olarak dışa verilen sayısal durum
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """Devre açıkken AI çağrısı denenmez"""
+
+
+# Durum kodu taşımayan ağ hataları
+TRANSIENT_ERROR_TYPES = (TimeoutError, socket.timeout, ConnectionError, urllib.error.URLError)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Devreyi etkileyen hata mı: zaman aşımı, bağlantı hatası, 429 veya 5xx
+
+    Diğer 4xx yanıtları ve programlama/kaset hataları (TypeError, CassetteMiss)
+    API'nin sağlığı hakkında bilgi vermez, devreyi etkilemez.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None and isinstance(error, urllib.error.HTTPError):
+        status = error.code
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, TRANSIENT_ERROR_TYPES):
+        return True
+    # SDK hataları (APITimeoutError, APIConnectionError) standart tiplerden türemez
+    return any("Timeout" in cls.__name__ or "Connection" in cls.__name__ for cls in type(error).__mro__)
+
+
+class CircuitBreaker:
+    """
+    Kapalı / açık / yarı açık devre kesici
+
+    Args:
+        failure_threshold: Devreyi açan art arda geçici hata sayısı
+        cooldown_seconds: Açık devrenin deneme isteğine kadar beklediği süre
+        slow_call_seconds: p95 gecikme bunu aşarsa devre açılır (0: kapalı)
+        window: p95 için tutulan son gecikme sayısı
+        min_samples: p95 kullanılmadan önce gereken örnek sayısı
+        timeout_multiplier: Zaman aşımı = p95 * çarpan
+        min_timeout / max_timeout: Zaman aşımı sınırları (örnek yokken max_timeout)
+        adaptive_timeout: False ise zaman aşımı her zaman max_timeout
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0, slow_call_seconds: float = 0.0,
+                 window: int = 100, min_samples: int = 10, timeout_multiplier: float = 2.0,
+                 min_timeout: float = 5.0, max_timeout: float = 60.0, adaptive_timeout: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.min_samples = min_samples
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.max_timeout = max_timeout
+        self.adaptive_timeout = adaptive_timeout
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._open_reason = ""
+        self._probe_in_flight = False
+        self._consecutive_failures = 0
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "short_circuited": 0, "probes": 0, "opened": 0}
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["CircuitBreaker"]:
+        """Ayarlardan devre kesici oluşturur (AI_CIRCUIT_BREAKER=false ise None)"""
+        if not getattr(settings, "ai_circuit_breaker", True):
+            return None
+        return cls(
+            failure_threshold=settings.ai_circuit_failure_threshold,
+            cooldown_seconds=settings.ai_circuit_cooldown_seconds,
+            slow_call_seconds=settings.ai_circuit_slow_call_seconds,
+            timeout_multiplier=settings.ai_timeout_p95_multiplier,
+            min_timeout=settings.ai_min_request_timeout,
+            max_timeout=settings.ai_request_timeout,
+            adaptive_timeout=settings.ai_adaptive_timeout,
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            logger.info("AI circuit half-open: next call is a probe")
+        return self._state
+
+    def _open(self, reason: str):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._open_reason = reason
+        self._probe_in_flight = False
+        self._stats["opened"] += 1
+        logger.warning(f"AI circuit opened ({reason}): skipping AI for {self.cooldown_seconds:.0f}s")
+
+    def _p95(self) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return None
+        return float(np.percentile(np.fromiter(self._latencies, dtype=float), 95))
+
+    def allow_request(self) -> bool:
+        """
+        Çağrı yapılabilir mi
+
+        Yarı açık devrede aynı anda tek deneme isteğine izin verilir; sonucu
+        record_success / record_failure ile bildirilmelidir.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                self._stats["calls"] += 1
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._stats["calls"] += 1
+                self._stats["probes"] += 1
+                return True
+            self._stats["short_circuited"] += 1
+            return False
+
+    def release(self):
+        """Sonucu bildirilmeyecek (API'ye hiç gitmeyen) çağrının deneme hakkını bırakır"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def timeout(self) -> float:
+        """Sonraki çağrının zaman aşımı (p95 * çarpan, sınırlar içinde)"""
+        with self._lock:
+            p95 = self._p95() if self.adaptive_timeout else None
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_multiplier))
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._stats["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                # Eski yavaş örnekler devreyi hemen yeniden açmasın
+                self._latencies.clear()
+                self._state = CLOSED
+                self._probe_in_flight = False
+                logger.info(f"AI circuit closed: probe succeeded in {latency:.2f}s")
+            self._latencies.append(latency)
+
+            p95 = self._p95()
+            if self._state == CLOSED and self.slow_call_seconds and p95 is not None and p95 > self.slow_call_seconds:
+                self._open(f"p95 latency {p95:.2f}s > {self.slow_call_seconds:.2f}s")
+
+    def record_failure(self, error: Optional[BaseException] = None, latency: float = 0.0, timed_out: bool = False):
+        """
+        Başarısız çağrıyı bildirir
+
+        Zaman aşımına uğrayan çağrının süresi p95'e eklenir, böylece fazla sıkı
+        bir zaman aşımı kendiliğinden gevşer. Geçici olmayan (4xx) hatalar devreyi etkilemez.
+        """
+        with self._lock:
+            self._stats["failures"] += 1
+            if timed_out:
+                self._latencies.append(latency)
+            if error is not None and not timed_out and not is_transient_error(error):
+                if self._state == HALF_OPEN:
+                    self._probe_in_flight = False
+                return
+
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN:
+                self._open(f"probe failed: {error}")
+            elif self._state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._open(f"{self._consecutive_failures} consecutive failures")
+
+    def stats(self) -> Dict[str, Any]:
+        """Devre durumu ve sayaçları (state_value: 0 kapalı, 1 yarı açık, 2 açık)"""
+        with self._lock:
+            state = self._current_state()
+            stats = dict(self._stats)
+            p95 = self._p95()
+            result = {
+                "state": state,
+                "state_value": STATE_VALUES[state],
+                **stats,
+                "consecutive_failures": self._consecutive_failures,
+                "open_reason": self._open_reason if state != CLOSED else "",
+                "p95_latency_seconds": round(p95, 4) if p95 is not None else None,
+            }
+        result["timeout_seconds"] = round(self.timeout(), 3)
+        return result
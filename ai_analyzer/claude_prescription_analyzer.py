@@ -6,6 +6,8 @@ Gerçek reçete verilerini Claude API ile analiz eder
 import json
 import os
 import sys
+import time
+from collections import deque
 from datetime import datetime
 from loguru import logger
 
@@ -13,13 +15,22 @@ from loguru import logger
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from ai_analyzer.sut_rules_database import SUTRulesDatabase
+from ai_analyzer.ai_providers import AIRequest, get_provider, provider_available
+from ai_analyzer.ai_replay import Cassette, CassetteClient
+from ai_analyzer.circuit_breaker import CircuitBreaker, CircuitOpenError
+from ai_analyzer.decision_cache import DecisionCache, estimate_cost, prescription_fingerprint
+from ai_analyzer.model_routing import FAST_TIER, STRONG_TIER, ModelRouter
+from ai_analyzer.similarity_index import (SimilarityIndex, canonical_drug_set, deterministic_signature,
+                                          similarity_features)
+from ai_analyzer.decision_schema import (PACKED_DECISION_SCHEMA, PACKED_DECISION_TOOL_NAME, DecisionValidationError,
+                                         ParseMetrics, anthropic_tool, parse_decision, validate_decision)
+from ai_analyzer.prompts import (PACKED_SYSTEM_PROMPT, PROMPT_VERSION, SYSTEM_PROMPT, TokenTally,
+                                 compact_prescription_payload, estimate_params_tokens, estimate_tokens,
+                                 pack_payloads)
 from config.settings import Settings
 
-try:
-    import anthropic
-    CLAUDE_AVAILABLE = True
-except ImportError:
-    CLAUDE_AVAILABLE = False
+CLAUDE_AVAILABLE = provider_available("claude")
+if not CLAUDE_AVAILABLE:
     logger.warning("Anthropic library not found. Install with: pip install anthropic")
 
 class ClaudePrescriptionAnalyzer:
@@ -29,11 +40,12 @@ class ClaudePrescriptionAnalyzer:
         self.settings = Settings()
         self.sut_db = SUTRulesDatabase()
         
-        # Claude API setup
-        if CLAUDE_AVAILABLE and hasattr(self.settings, 'ANTHROPIC_API_KEY') and self.settings.ANTHROPIC_API_KEY:
+        # Claude API setup (süreç genelinde paylaşılan istemci)
+        self.provider = get_provider("claude", self.settings)
+        self.model = self.settings.ai_fast_model
+        if CLAUDE_AVAILABLE and self.settings.claude_api_key:
             try:
-                self.client = anthropic.Anthropic(api_key=self.settings.ANTHROPIC_API_KEY)
-                self.model = "claude-3-haiku-20240307"  # Working model
+                self.client = self.provider.client
                 self.claude_enabled = True
                 logger.info("Claude API initialized successfully")
             except Exception as e:
@@ -41,9 +53,36 @@ class ClaudePrescriptionAnalyzer:
                 self.claude_enabled = False
         else:
             self.claude_enabled = False
+        
+        # Kayıt/tekrar oynatma: replay modunda SDK veya ağ olmadan çalışır
+        self.cassette = Cassette.from_settings(self.settings)
+        if self.cassette is not None:
+            self.client = CassetteClient(self.cassette, self.client if self.claude_enabled else None)
+            self.claude_enabled = self.claude_enabled or self.cassette.mode == "replay"
+            logger.info(f"Claude cassette {self.cassette.mode}: {self.cassette.path}")
+        if not self.claude_enabled:
             logger.warning("Claude API not available - using SUT rules only")
         
         self.analysis_results = []
+        
+        # Aynı analiz girdisi için kalıcı Claude karar önbelleği
+        self.decision_cache = DecisionCache.from_settings(self.settings)
+        
+        # Sadece tarih/miktarı farklı tekrar reçeteler için benzer karar indeksi
+        self.similarity_index = SimilarityIndex.from_settings(self.settings)
+        
+        # Karar başına token/gecikme/maliyet sayacı
+        self.token_tally = TokenTally()
+        
+        # Yapılandırılmış yanıt ayrıştırma sayaçları
+        self.parse_metrics = ParseMetrics()
+        
+        # Karmaşık ve çelişkili reçeteler güçlü modele yönlendirilir
+        self.strong_model = self.settings.ai_strong_model
+        self.model_router = ModelRouter.from_settings(self.settings)
+        
+        # API yavaş/hatalıyken çağrılar bekleme süresince atlanır, zaman aşımı p95'ten uyarlanır
+        self.circuit_breaker = CircuitBreaker.from_settings(self.settings)
     
     def analyze_prescription_with_claude(self, prescription_data):
         """Claude AI ile reçete analizi yapar"""
@@ -51,154 +90,453 @@ class ClaudePrescriptionAnalyzer:
             if not self.claude_enabled:
                 return self._analyze_with_sut_only(prescription_data)
             
-            # SUT analizi yap
-            sut_analysis = self.sut_db.get_sut_analysis_for_prescription(prescription_data)
-            sut_recommendation = self.sut_db.get_recommendation_for_prescription(prescription_data)
-            
-            # Claude için prompt hazırla
-            prompt = self._create_claude_prompt(prescription_data, sut_analysis)
+            prepared = self.prepare_claude_request(prescription_data)
+            if "decision" in prepared:
+                return prepared["decision"]
             
             # Claude API çağrısı
-            claude_response = self._call_claude_api(prompt)
+            response = self._call_claude_api(prepared["prompt"], self.build_request_params(prepared))
             
             # Yanıtı birleştir
-            final_decision = self._combine_analyses(sut_recommendation, claude_response, prescription_data)
+            return self.complete_claude_request(prepared, prescription_data, response.content,
+                                                self.estimate_call_cost(response.usage, prepared["routing"].tier),
+                                                response.usage, response.latency)
+            
+        except CircuitOpenError:
+            return self._analyze_with_sut_only(prescription_data, ai_skipped="circuit_open")
+        except Exception as e:
+            logger.error(f"Claude analysis error: {e}")
+            return self._analyze_with_sut_only(prescription_data)
+    
+    def prepare_claude_request(self, prescription_data):
+        """
+        Claude çağrısı öncesi SUT analizi, önbellek kontrolü ve prompt hazırlığı
+        
+        Returns:
+            Dict: API çağrısı gerekmiyorsa "decision", aksi halde "prompt",
+                "fingerprint", "sut_recommendation", "estimated_input_tokens",
+                "model" ve "routing"
+        """
+        # SUT analizi yap
+        sut_analysis = self.sut_db.get_sut_analysis_for_prescription(prescription_data)
+        sut_recommendation = self.sut_db.get_recommendation_for_prescription(prescription_data)
+        
+        # Model katmanı (hızlı / güçlü)
+        routing = self.model_router.route(prescription_data, sut_analysis, sut_recommendation)
+        model = self.model_for_tier(routing.tier)
+        
+        # Aynı girdi için önceki Claude kararı (hasta kimliği hariç özet)
+        fingerprint = prescription_fingerprint(prescription_data, sut_analysis.get("rule_version"),
+                                               extra={"model": model, "prompt": PROMPT_VERSION},
+                                               general_compliance=sut_analysis.get("general_compliance"))
+        cached = self.decision_cache.get(fingerprint) if self.decision_cache is not None else None
+        if cached is not None:
+            decision = self._combine_analyses(sut_recommendation, cached, prescription_data)
+            decision["cache_hit"] = True
+            logger.info(f"Prescription {prescription_data.get('recete_no')} analyzed (cache) - Decision: {decision['action']}")
+            return {"decision": decision}
+        
+        # Benzer geçmiş karar (kural sonuçları birebir aynıysa)
+        similarity = None
+        if self.similarity_index is not None:
+            similarity = (similarity_features(prescription_data),
+                          deterministic_signature(sut_analysis, sut_recommendation,
+                                                  {"model": model, "prompt": PROMPT_VERSION},
+                                                  canonical_drug_set(prescription_data)))
+            neighbour = self.similarity_index.find_reusable(*similarity)
+            if neighbour is not None:
+                decision = self._combine_analyses(sut_recommendation, neighbour.payload, prescription_data)
+                decision["cache_hit"] = False
+                decision["similar_reuse"] = {"similarity": round(neighbour.similarity, 4), "source": neighbour.key}
+                logger.info(f"Prescription {prescription_data.get('recete_no')} analyzed (similar decision, "
+                            f"{neighbour.similarity:.3f}) - Decision: {decision['action']}")
+                return {"decision": decision}
+        
+        prompt = self._create_claude_prompt(prescription_data, sut_analysis)
+        return {
+            "prompt": prompt,
+            "fingerprint": fingerprint,
+            "sut_recommendation": sut_recommendation,
+            "estimated_input_tokens": self.count_prompt_tokens(prompt),
+            "model": model,
+            "routing": routing,
+            "similarity": similarity
+        }
+    
+    def model_for_tier(self, tier):
+        """Katmanın Claude modeli"""
+        return self.strong_model if tier == STRONG_TIER else self.model
+    
+    def build_request_params(self, prepared):
+        """Hazırlanmış reçete için yönlendirilen modelle Messages API parametreleri"""
+        return self.build_message_params(prepared["prompt"], model=prepared.get("model"))
+    
+    def complete_claude_request(self, prepared, prescription_data, claude_response, cost=0.0, usage=None, latency=0.0):
+        """Claude yanıtını (araç girdisi veya metin) doğrular, önbelleğe yazar ve SUT önerisiyle birleştirir"""
+        claude_data = self._parse_claude_response(claude_response)
+        return self._record_claude_decision(prepared, prescription_data, claude_data, cost, usage, latency)
+    
+    def _record_claude_decision(self, prepared, prescription_data, claude_data, cost, usage, latency):
+        """Doğrulanmış Claude kararını kaydeder ve nihai kararı döndürür"""
+        token_usage = self.token_tally.record(usage, prepared.get("estimated_input_tokens", 0), latency, cost)
+        
+        routing = prepared.get("routing")
+        tier = routing.tier if routing else FAST_TIER
+        self.model_router.stats.record(tier, latency, cost, claude_data.get("action"),
+                                       prepared["sut_recommendation"].get("action"))
+        
+        if self.decision_cache is not None and "error" not in claude_data:
+            self.decision_cache.put(prepared["fingerprint"], claude_data, cost,
+                                    namespace="claude_prescription_analyzer")
+        if self.similarity_index is not None and prepared.get("similarity") and "error" not in claude_data:
+            features, signature = prepared["similarity"]
+            self.similarity_index.add(prepared["fingerprint"], features, claude_data, signature)
+        
+        final_decision = self._combine_analyses(prepared["sut_recommendation"], claude_data, prescription_data)
+        final_decision["cache_hit"] = False
+        final_decision["token_usage"] = token_usage
+        final_decision["model_routing"] = {
+            "tier": tier,
+            "model": prepared.get("model", self.model),
+            "complexity": routing.complexity if routing else None,
+            "reasons": routing.reasons if routing else []
+        }
+        
+        logger.info(f"Prescription {prescription_data.get('recete_no')} analyzed - Decision: {final_decision['action']}")
+        
+        return final_decision
+    
+    def build_message_params(self, prompt, system_prompt=SYSTEM_PROMPT, max_tokens=None, tool=None, model=None):
+        """
+        Messages API parametreleri (senkron çağrı, paketleme ve Message Batches için ortak)
+        
+        AI_STRUCTURED_OUTPUT açıkken model karar aracını çağırmaya zorlanır
+        (varsayılan: tekli karar aracı).
+        """
+        return self.provider.build_params(AIRequest(
+            prompt=prompt,
+            system=system_prompt,
+            model=model or self.model,
+            max_tokens=max_tokens or self.settings.ai_max_output_tokens,
+            temperature=0.3,
+            tool=(tool or anthropic_tool()) if self.settings.ai_structured_output else None,
+            cache_system=self.settings.ai_prompt_caching
+        ))
+    
+    def count_prompt_tokens(self, prompt):
+        """Göndermeden önce girdi token sayısı (AI_TOKEN_COUNT_API=true ise API'den, değilse yerel tahmin)"""
+        params = self.build_message_params(prompt)
+        
+        client = getattr(self, "client", None)
+        if self.settings.ai_token_count_api and hasattr(getattr(client, "messages", None), "count_tokens"):
+            try:
+                count_params = {key: params[key] for key in ("model", "system", "messages", "tools") if key in params}
+                return client.messages.count_tokens(**count_params).input_tokens
+            except Exception as e:
+                logger.warning(f"Token count API failed, using local estimate: {e}")
+        
+        return estimate_params_tokens(params)
+    
+    def analyze_prescriptions_packed(self, prescriptions, max_items=None, token_budget=None):
+        """
+        Birden fazla reçeteyi tek Claude isteğinde analiz eder
+        
+        Paket boyutu, tahmini girdi + beklenen çıktı token'ı token_budget'ı aşmayacak
+        şekilde max_items'a kadar büyür. Yanıtta karşılığı bulunamayan veya geçersiz
+        olan reçeteler sonraki pakete, ikinci denemeden sonra tekli çağrıya aktarılır.
+        
+        Args:
+            prescriptions: Reçete listesi
+            max_items: İstek başına en fazla reçete (varsayılan: AI_PACK_SIZE)
+            token_budget: İstek başına token bütçesi (varsayılan: AI_PACK_TOKEN_BUDGET)
             
-            logger.info(f"Prescription {prescription_data.get('recete_no')} analyzed - Decision: {final_decision['action']}")
+        Returns:
+            List[Dict]: Girdi sırasıyla kararlar
+        """
+        if not self.claude_enabled:
+            return [self._analyze_with_sut_only(prescription) for prescription in prescriptions]
+        
+        max_items = max_items or self.settings.ai_pack_size
+        token_budget = token_budget or self.settings.ai_pack_token_budget
+        
+        decisions = [None] * len(prescriptions)
+        queue = deque()
+        for index, prescription in enumerate(prescriptions):
+            try:
+                prepared = self.prepare_claude_request(prescription)
+            except Exception as e:
+                logger.error(f"Claude request preparation error: {e}")
+                decisions[index] = self._analyze_with_sut_only(prescription)
+                continue
+            if "decision" in prepared:
+                decisions[index] = prepared["decision"]
+            else:
+                queue.append((index, prepared, 0))
+        
+        while queue:
+            pack = self._next_pack(queue, prescriptions, max_items, token_budget)
             
-            return final_decision
+            if len(pack) == 1 and pack[0][2] >= self.settings.ai_pack_max_attempts:
+                index, prepared, _ = pack[0]
+                decisions[index] = self._analyze_prepared_single(prepared, prescriptions[index])
+                continue
             
+            for index, prepared, attempts in self._send_pack(pack, prescriptions, decisions):
+                queue.append((index, prepared, attempts + 1))
+        
+        return decisions
+    
+    def _next_pack(self, queue, prescriptions, max_items, token_budget):
+        """Kuyruktan token bütçesine sığan, aynı modele yönlendirilmiş ve reçete numaraları tekil olan bir paket seçer"""
+        per_item_output = self.settings.ai_pack_output_tokens_per_item
+        used = estimate_tokens(PACKED_SYSTEM_PROMPT)
+        pack, skipped, recete_nos = [], [], set()
+        
+        while queue and len(pack) < max_items:
+            entry = queue.popleft()
+            index, prepared, attempts = entry
+            recete_no = str(prescriptions[index].get("recete_no", index))
+            
+            # Tekrar denenen reçeteler tekli çağrıya tek başına gider
+            if attempts >= self.settings.ai_pack_max_attempts:
+                if pack:
+                    skipped.append(entry)
+                    continue
+                pack.append(entry)
+                break
+            
+            cost = estimate_tokens(prepared["prompt"]) + per_item_output
+            other_model = bool(pack) and prepared.get("model") != pack[0][1].get("model")
+            if recete_no in recete_nos or other_model or (pack and used + cost > token_budget):
+                skipped.append(entry)
+                if used + cost > token_budget:
+                    break
+                continue
+            
+            pack.append(entry)
+            recete_nos.add(recete_no)
+            used += cost
+        
+        queue.extendleft(reversed(skipped))
+        return pack
+    
+    def _send_pack(self, pack, prescriptions, decisions):
+        """
+        Paketi gönderir, eşleşen kararları decisions listesine yazar
+        
+        Returns:
+            List: Yeniden kuyruğa alınacak (index, prepared, attempts) girdileri
+        """
+        prompt = pack_payloads([prepared["prompt"] for _, prepared, _ in pack])
+        expected = {str(prescriptions[entry[0]].get("recete_no", entry[0])): entry for entry in pack}
+        params = self.build_message_params(
+            prompt, PACKED_SYSTEM_PROMPT,
+            max_tokens=min(self.settings.ai_pack_output_tokens_per_item * len(pack), self.settings.ai_pack_max_output_tokens),
+            tool=anthropic_tool(PACKED_DECISION_TOOL_NAME, PACKED_DECISION_SCHEMA),
+            model=pack[0][1].get("model")
+        )
+        
+        try:
+            response = self._call_claude_api(prompt, params)
+        except CircuitOpenError:
+            return list(pack)
+        except Exception as e:
+            logger.error(f"Packed Claude request failed ({len(pack)} prescriptions): {e}")
+            return list(pack)
+        
+        items = self._parse_packed_response(response.content, expected)
+        share = len(pack)
+        cost = self.estimate_call_cost(response.usage, pack[0][1]["routing"].tier) / share
+        usage = {key: value // share for key, value in response.usage.items()}
+        
+        for recete_no, item in items.items():
+            index, prepared, _ = expected.pop(recete_no)
+            decisions[index] = self._record_claude_decision(prepared, prescriptions[index], item, cost, usage,
+                                                            response.latency)
+        
+        if expected:
+            logger.warning(f"Packed response missing {len(expected)}/{len(pack)} prescriptions, re-queued")
+        logger.info(f"Packed Claude request: {len(items)}/{len(pack)} decisions in {response.latency:.2f}s")
+        return list(expected.values())
+    
+    def _parse_packed_response(self, response, expected):
+        """
+        Paketli yanıttan reçete numarasına göre geçerli kararları çıkarır
+        
+        Araç girdisinde "decisions" listesi kullanılır. Metin yanıtta dizi bozuk veya
+        yarım kalmış olsa bile tam olarak okunabilen nesneler kullanılır.
+        """
+        if isinstance(response, dict):
+            method = "tool_use"
+            candidates = response.get("decisions")
+            candidates = candidates if isinstance(candidates, list) else []
+        else:
+            method = "json_text"
+            candidates = self._scan_json_objects(str(response or ""))
+        
+        items = {}
+        for item in candidates:
+            if not isinstance(item, dict):
+                continue
+            item = dict(item)
+            recete_no = str(item.pop("recete_no", ""))
+            if recete_no not in expected or recete_no in items:
+                continue
+            try:
+                items[recete_no] = validate_decision(item)
+                self.parse_metrics.record(method)
+            except DecisionValidationError as e:
+                self.parse_metrics.record("failed", f"{method}: {recete_no}: {e}")
+        
+        for recete_no in expected.keys() - items.keys():
+            self.parse_metrics.record("failed", f"{method}: {recete_no}: paketli yanıtta yok")
+        return items
+    
+    @staticmethod
+    def _scan_json_objects(text):
+        """Metindeki tam okunabilen tüm JSON nesneleri (iç içe olanlar hariç)"""
+        decoder = json.JSONDecoder()
+        objects = []
+        position = text.find("{")
+        
+        while position != -1:
+            try:
+                item, end = decoder.raw_decode(text, position)
+            except ValueError:
+                position = text.find("{", position + 1)
+                continue
+            objects.append(item)
+            position = text.find("{", end)
+        
+        return objects
+    
+    def _analyze_prepared_single(self, prepared, prescription_data):
+        """Paketten ayrıştırılamayan reçete için tekli Claude çağrısı"""
+        try:
+            response = self._call_claude_api(prepared["prompt"], self.build_request_params(prepared))
+            return self.complete_claude_request(prepared, prescription_data, response.content,
+                                                self.estimate_call_cost(response.usage, prepared["routing"].tier),
+                                                response.usage, response.latency)
+        except CircuitOpenError:
+            return self._analyze_with_sut_only(prescription_data, ai_skipped="circuit_open")
         except Exception as e:
             logger.error(f"Claude analysis error: {e}")
             return self._analyze_with_sut_only(prescription_data)
     
-    def _analyze_with_sut_only(self, prescription_data):
-        """Sadece SUT kuralları ile analiz"""
+    def _analyze_with_sut_only(self, prescription_data, ai_skipped=None):
+        """Sadece SUT kuralları ile analiz (ai_skipped: AI'ın denenmeden atlanma nedeni)"""
         logger.info("Using SUT rules only for analysis")
         
         sut_recommendation = self.sut_db.get_recommendation_for_prescription(prescription_data)
         
-        return {
+        result = {
             **sut_recommendation,
             "analysis_method": "sut_only",
             "timestamp": datetime.now().isoformat(),
             "prescription_id": prescription_data.get("recete_no", ""),
             "claude_available": False
         }
+        if ai_skipped:
+            result["ai_skipped"] = ai_skipped
+        return result
     
     def _create_claude_prompt(self, prescription_data, sut_analysis):
-        """Claude için detaylı prompt oluşturur"""
-        
-        # İlaçları formatla
-        drugs_text = ""
-        for i, drug in enumerate(prescription_data.get("drugs", []), 1):
-            drugs_text += f"{i}. {drug.get('ilac_adi', 'N/A')} - Adet: {drug.get('adet', 'N/A')}\\n"
-        
-        # Tanı kodlarını formatla
-        diagnosis_codes = []
-        if "report_details" in prescription_data:
-            tani_bilgileri = prescription_data["report_details"].get("tani_bilgileri", [])
-            for tani in tani_bilgileri:
-                if isinstance(tani, dict):
-                    diagnosis_codes.append(tani.get("tani_kodu", ""))
-                else:
-                    diagnosis_codes.append(str(tani))
-        
-        diagnosis_text = ", ".join(diagnosis_codes) if diagnosis_codes else "Belirtilmemiş"
-        
-        # SUT analizi özeti
-        sut_summary = f"""
-        SUT Uyumluluğu: {'✓ Uyumlu' if sut_analysis.get('overall_compliance') else '✗ Uyumsuz'}
-        Issues: {len(sut_analysis.get('issues', []))} problem
-        Warnings: {len(sut_analysis.get('warnings', []))} uyarı
+        """Reçeteye özgü kısa prompt (talimatlar sistem bloğunda, hasta kimliği gönderilmez)"""
+        return compact_prescription_payload(prescription_data, sut_analysis)
+    
+    def _call_claude_api(self, prompt, params=None):
         """
+        Claude API çağrısı yapar
         
-        prompt = """
-        Lütfen aşağıdaki reçeteyi değerlendir ve bir karar ver:
-
-        ## RECETE BILGILERI
-        Reçete No: """ + str(prescription_data.get('recete_no', 'N/A')) + """
-        Hasta: """ + str(prescription_data.get('hasta_ad', '')) + " " + str(prescription_data.get('hasta_soyad', '')) + """
-        TC: """ + str(prescription_data.get('hasta_tc', 'N/A')) + """
-        Reçete Tarihi: """ + str(prescription_data.get('recete_tarihi', 'N/A')) + """
-        
-        ## ILACLAR
-        """ + drugs_text + """
-        
-        ## TANI KODLARI (ICD)
-        """ + diagnosis_text + """
-        
-        ## ILAC MESAJLARI
-        """ + str(prescription_data.get('ilac_mesajlari', 'Mesaj yok')) + """
-        
-        ## RAPOR BILGILERI
-        Rapor No: """ + str(prescription_data.get('rapor_no', 'N/A')) + """
-        Rapor Tarihi: """ + str(prescription_data.get('rapor_tarihi', 'N/A')) + """
-        
-        ## SUT ANALIZ OZETI
-        """ + sut_summary + """
-        
-        ## TALIMAT
-        Sen uzman bir eczane müdürüsün. Bu reçeteyi SGK SUT kurallarına göre değerlendir.
-        
-        Özellikle kontrol et:
-        1. İlaç-tanı uyumluluğu (ICD kodları ile ilaçlar eşleşiyor mu?)
-        2. Rapor gereklilikleri (Raporlu ilaçlar için rapor var mı?)
-        3. İlaç mesaj kodları (1013, 1301, 1038, 1002 kodları doğru mu?)
-        4. Dozaj ve süre limitleri
-        5. Hasta güvenliği (etkileşimler, kontrendikasyonlar)
-        
-        ## KARAR SECENEKLERI
-        - approve: Reçete tamamen uygun, onaylanabilir
-        - reject: Ciddi sorunlar var, kesinlikle reddedilmeli
-        - hold: Belirsizlikler var, manuel inceleme gerekli
-        
-        Yanıtını JSON formatında ver:
-        {
-            "action": "approve/reject/hold",
-            "confidence": 0.0-1.0,
-            "reason": "Kararının detaylı gerekçesi",
-            "clinical_assessment": "Klinik değerlendirme",
-            "sut_compliance": "SUT uyumluluğu değerlendirmesi", 
-            "risk_factors": ["Risk faktörleri listesi"],
-            "recommendations": ["Öneriler listesi"],
-            "key_findings": ["Önemli bulgular"]
-        }
+        Returns:
+            AIResponse: Karar içeriği ile bu çağrının token kullanımı ve gecikmesi
+        
+        Raises:
+            CircuitOpenError: Devre açıkken (çağrı denenmez)
         """
+        # Parametreler devre kontrolünden önce hazırlanır: buradaki hata deneme hakkını harcamaz
+        params = params or self.build_message_params(prompt)
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow_request():
+            raise CircuitOpenError("AI circuit open")
         
-        return prompt
-    
-    def _call_claude_api(self, prompt):
-        """Claude API çağrısı yapar"""
+        outcome_recorded = False
         try:
             logger.info("Calling Claude API...")
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2000,
-                temperature=0.3,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            timeout = breaker.timeout() if breaker is not None else None
+            with self.provider.slot():
+                start_time = time.time()
+                try:
+                    if timeout is not None:
+                        raw_response = self.client.messages.create(**params, timeout=timeout)
+                    else:
+                        raw_response = self.client.messages.create(**params)
+                except Exception as e:
+                    if breaker is not None:
+                        elapsed = time.time() - start_time
+                        breaker.record_failure(e, elapsed, timed_out=elapsed >= timeout * 0.95)
+                    outcome_recorded = True
+                    raise
+                latency = time.time() - start_time
+            if breaker is not None:
+                breaker.record_success(latency)
+            outcome_recorded = True
             
-            # Newer anthropic library format
-            if hasattr(response.content[0], 'text'):
-                return response.content[0].text
-            else:
-                return str(response.content[0])
+            # Araç çağrısı varsa girdisi zaten yapılandırılmış karardır
+            tool_name = (params.get("tool_choice") or {}).get("name")
+            return self.provider.to_response(raw_response, latency, params["model"], tool_name)
             
         except Exception as e:
             logger.error(f"Claude API call failed: {e}")
             raise
+        finally:
+            # Yuva beklenirken vb. çıkılırsa deneme isteği kilitli kalmasın
+            if breaker is not None and not outcome_recorded:
+                breaker.release()
+    
+    def estimate_call_cost(self, usage, tier=FAST_TIER):
+        """Katmanın token fiyatlarıyla çağrı maliyeti (USD)"""
+        if tier == STRONG_TIER:
+            return estimate_cost(usage, self.settings.ai_strong_input_cost_per_mtok,
+                                 self.settings.ai_strong_output_cost_per_mtok)
+        return estimate_cost(usage, self.settings.ai_input_cost_per_mtok, self.settings.ai_output_cost_per_mtok)
+    
+    def get_cache_stats(self):
+        """Karar önbelleği isabet oranı ve önlenen maliyet"""
+        return self.decision_cache.stats() if self.decision_cache is not None else {}
+    
+    def get_token_stats(self):
+        """Claude çağrılarının token, gecikme ve maliyet toplamları"""
+        return self.token_tally.stats()
+    
+    def get_similarity_stats(self):
+        """Benzer karar yeniden kullanım oranı ve arama süresi"""
+        return self.similarity_index.stats() if self.similarity_index is not None else {}
+    
+    def get_cassette_stats(self):
+        """Kayıt/tekrar oynatma isabetleri"""
+        return self.cassette.stats() if self.cassette is not None else {}
+    
+    def get_circuit_stats(self):
+        """Devre durumu (state_value: 0 kapalı, 1 yarı açık, 2 açık), atlanan çağrılar ve zaman aşımı"""
+        return self.circuit_breaker.stats() if self.circuit_breaker is not None else {}
+    
+    def get_routing_stats(self):
+        """Model katmanı başına gecikme, maliyet ve SUT ile anlaşmazlık"""
+        return self.model_router.stats.stats()
+    
+    def get_parse_stats(self):
+        """Yanıt ayrıştırma yöntemleri ve hata oranı"""
+        return self.parse_metrics.stats()
     
     def _combine_analyses(self, sut_recommendation, claude_response, prescription_data):
         """SUT ve Claude analizlerini birleştirir"""
         try:
-            # Claude yanıtından JSON çıkar
-            claude_data = self._parse_claude_response(claude_response)
+            # Claude yanıtından JSON çıkar (önbellekten gelen yanıt zaten ayrıştırılmış)
+            if isinstance(claude_response, dict):
+                claude_data = claude_response
+            else:
+                claude_data = self._parse_claude_response(claude_response)
             
             # Kararları karşılaştır
             sut_action = sut_recommendation.get("action", "hold")
@@ -245,56 +583,25 @@ class ClaudePrescriptionAnalyzer:
                 "timestamp": datetime.now().isoformat()
             }
     
-    def _parse_claude_response(self, response_text):
-        """Claude yanıtını parse eder"""
+    def _parse_claude_response(self, response):
+        """
+        Claude yanıtını doğrulanmış karara çevirir
+        
+        Araç girdisi (dict) doğrudan, metin yanıt ilk tam JSON nesnesiyle doğrulanır.
+        Şemaya uymayan yanıt sayaçlara hata olarak işlenir ve manuel incelemeye düşer.
+        """
         try:
-            # JSON kısmını bul
-            import re
-            json_match = re.search(r'```json\\s*({.*?})\\s*```', response_text, re.DOTALL)
-            
-            if not json_match:
-                # Alternatif format dene
-                json_match = re.search(r'{.*}', response_text, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(1) if '```' in response_text else json_match.group(0)
-                return json.loads(json_str)
-            
-            else:
-                # JSON bulunamadı, text analiz et
-                return self._extract_decision_from_text(response_text)
-                
-        except Exception as e:
+            return parse_decision(response, self.parse_metrics)
+        except DecisionValidationError as e:
             logger.error(f"Claude response parsing error: {e}")
             return {
                 "action": "hold",
                 "confidence": 0.3,
                 "reason": "Claude yanıtı parse edilemedi",
-                "error": str(e)
+                "error": str(e),
+                "parse_error": True
             }
     
-    def _extract_decision_from_text(self, text):
-        """Text'ten karar çıkarmaya çalışır"""
-        text_lower = text.lower()
-        
-        # Karar kelimelerini ara
-        if "approve" in text_lower or "onay" in text_lower:
-            action = "approve"
-            confidence = 0.7
-        elif "reject" in text_lower or "red" in text_lower:
-            action = "reject" 
-            confidence = 0.7
-        else:
-            action = "hold"
-            confidence = 0.5
-        
-        return {
-            "action": action,
-            "confidence": confidence,
-            "reason": f"Text-based analysis: {text[:200]}...",
-            "full_response": text
-        }
-    
     def _determine_final_action(self, sut_action, claude_action):
         """İki analiz sonucunu birleştirerek nihai karar verir"""
         
@@ -373,6 +680,31 @@ Ortalama Guven: {avg_confidence:.2f}
 Claude Kullanim: {"YES" if self.claude_enabled else "NO"}
         """)
         
+        cache_stats = self.get_cache_stats()
+        if cache_stats.get("lookups"):
+            print(f"Karar Onbellegi: {cache_stats['hits']}/{cache_stats['lookups']} isabet "
+                  f"(%{cache_stats['hit_rate']*100:.1f}), onlenen maliyet ${cache_stats['avoided_cost']:.4f}")
+        
+        similarity_stats = self.get_similarity_stats()
+        if similarity_stats.get("lookups"):
+            print(f"Benzer Karar: {similarity_stats['reuses']}/{similarity_stats['lookups']} yeniden kullanildi "
+                  f"(%{similarity_stats['reuse_rate']*100:.1f}), ort. arama {similarity_stats['avg_search_ms']:.2f} ms")
+        
+        token_stats = self.get_token_stats()
+        if token_stats["calls"]:
+            print(f"Token Kullanimi: {token_stats['calls']} cagri, ort. {token_stats['avg_input_tokens']:.0f} girdi / "
+                  f"{token_stats['avg_output_tokens']:.0f} cikti token, ort. {token_stats['avg_latency_seconds']:.2f}s, "
+                  f"toplam ${token_stats['cost']:.4f}")
+        
+        for tier, tier_stats in sorted(self.get_routing_stats().items()):
+            print(f"Model Katmani {tier}: {tier_stats['calls']} cagri, ort. {tier_stats['avg_latency_seconds']:.2f}s, "
+                  f"${tier_stats['cost']:.4f}, SUT ile farkli karar %{tier_stats['disagreement_rate']*100:.1f}")
+        
+        parse_stats = self.get_parse_stats()
+        if parse_stats["total"]:
+            print(f"Yanit Ayristirma: {parse_stats['by_method']}, {parse_stats['failures']} hata "
+                  f"(%{parse_stats['failure_rate']*100:.1f})")
+        
         # En riskli reçeteler
         risky_prescriptions = [r for r in results if r['action'] in ['reject', 'hold']]
         if risky_prescriptions:
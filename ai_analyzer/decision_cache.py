@@ -0,0 +1,325 @@
+"""
+AI Karar Önbelleği
+Aynı analiz girdisi için Claude/OpenAI kararlarını kalıcı olarak saklar. Anahtar,
+analizi etkileyen alanların (kanonik ilaçlar, kutu miktarları, miktarlar, ICD kodları,
+mesaj kodları, rapor geçerliliği, hasta yaşı, genel SUT kontrolleri, kural sürümü) kanonik
+özetidir; hasta adı, TC ve doğum tarihinin kendisi dahil edilmez.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Mapping, Optional
+from loguru import logger
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.drug_names import canonicalize_drug_name
+from utils.icd10 import normalize_icd_code
+from utils.message_codes import get_prescription_message_codes, message_code_list
+
+# Özete hiçbir zaman girmeyen kimlik alanları
+IDENTITY_FIELDS = frozenset({
+    "recete_no", "hasta_ad", "hasta_soyad", "hasta_ad_soyad", "hasta_tc", "dogum_tarihi",
+    "id", "patient_name", "patient_tc", "index", "extraction_time"
+})
+
+# Reçete düzeyinde rapor geçerliliğini belirleyen alanlar
+REPORT_DATE_FIELDS = ("rapor_tarihi", "baslangic_tarihi", "bitis_tarihi")
+
+# İlaç miktarı alanları (ilk dolu olan kullanılır)
+QUANTITY_FIELDS = ("adet", "miktar", "quantity", "kutu")
+
+# Doğum tarihi alanları (özete sadece yaş girer)
+BIRTH_DATE_FIELDS = ("dogum_tarihi", "hasta_dogum_tarihi")
+
+_DATE_FORMATS = ("%d/%m/%Y", "%d.%m.%Y", "%Y-%m-%d")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def _drug_entries(drugs: Iterable[Any]):
+    """İlaç listesini sırasız, kanonik (ilaç, kutu miktarı, miktar, mesaj kodları) girdilerine çevirir"""
+    entries = []
+    for drug in drugs or []:
+        if isinstance(drug, dict):
+            name = drug.get("ilac_adi") or drug.get("name") or ""
+            quantity = next((str(drug[field]).strip() for field in QUANTITY_FIELDS if drug.get(field)), "")
+            messages = sorted(message_code_list([drug.get(field) for field in
+                                                 ("mesaj_kodlari", "message_codes", "ilac_mesajlari")
+                                                 if drug.get(field)]))
+            canonical = canonicalize_drug_name(name)
+            entries.append([canonical.key, canonical.pack_size, quantity, messages])
+        else:
+            canonical = canonicalize_drug_name(str(drug))
+            entries.append([canonical.key, canonical.pack_size, "", []])
+    return sorted(entries)
+
+
+def _diagnosis_codes(prescription_data: Mapping) -> list:
+    """Rapor ve reçetedeki tanı kodlarını normalize eder"""
+    codes = []
+    report = prescription_data.get("report_details") or {}
+    diagnoses = list(report.get("tani_bilgileri", []) if isinstance(report, dict) else [])
+    diagnoses += list(prescription_data.get("tani_kodlari") or prescription_data.get("diagnosis_codes") or [])
+    for diagnosis in diagnoses:
+        code = diagnosis.get("tani_kodu", "") if isinstance(diagnosis, dict) else diagnosis
+        if code:
+            codes.append(normalize_icd_code(code))
+    return sorted(set(codes))
+
+
+def _report_validity(prescription_data: Mapping) -> Dict[str, Any]:
+    """Rapor numarasının varlığı ve geçerlilik tarihleri (numaranın kendisi değil)"""
+    report = prescription_data.get("report_details") or {}
+    if not isinstance(report, dict):
+        report = {}
+    return {
+        "has_report": bool(prescription_data.get("rapor_no") or report.get("rapor_numarasi")),
+        **{field: str(prescription_data.get(field) or report.get(field) or "") for field in REPORT_DATE_FIELDS}
+    }
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    text = str(value or "").strip()
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def _patient_age(prescription_data: Mapping) -> Optional[int]:
+    """Reçete tarihindeki (yoksa bugünkü) hasta yaşı; doğum tarihi yoksa None"""
+    birth = next((_parse_date(prescription_data.get(field)) for field in BIRTH_DATE_FIELDS
+                  if prescription_data.get(field)), None)
+    if birth is None:
+        return None
+    on = _parse_date(prescription_data.get("recete_tarihi")) or datetime.now()
+    return on.year - birth.year - ((on.month, on.day) < (birth.month, birth.day))
+
+
+def _general_checks(prescription_data: Mapping, general_compliance: Optional[Mapping]) -> Dict[str, Any]:
+    """
+    Genel SUT kontrollerinin (TC, reçete yaşı) sonucu
+
+    Sonuç verilmezse reçete tarihi ve TC varlığı anahtara girer. Bulgulardaki
+    sayılar (gün sayısı) normalize edilir, böylece aynı sonuç aynı anahtarı verir.
+    """
+    if general_compliance is None:
+        return {"has_tc": bool(prescription_data.get("hasta_tc")),
+                "prescription_date": str(prescription_data.get("recete_tarihi") or "")}
+    return {
+        "compliant": bool(general_compliance.get("compliant", True)),
+        "issues": sorted(_DIGITS_RE.sub("#", str(issue)) for issue in general_compliance.get("issues", []) or [])
+    }
+
+
+def prescription_fingerprint(prescription_data: Mapping, rule_version: Optional[str] = None,
+                             extra: Optional[Mapping[str, Any]] = None,
+                             general_compliance: Optional[Mapping] = None) -> str:
+    """
+    Analizi etkileyen alanların SHA-256 özeti
+
+    Args:
+        prescription_data: Reçete verisi
+        rule_version: Kararın dayandığı SUT kural snapshot'ı
+        extra: Çağırana özgü ek alanlar (model adı, sağlayıcı vb.)
+        general_compliance: SUT genel kural sonucu (verilmezse reçete tarihi ve TC varlığı kullanılır)
+
+    Returns:
+        str: Hex özet
+    """
+    payload = {
+        "drugs": _drug_entries(prescription_data.get("drugs", [])),
+        "icd": _diagnosis_codes(prescription_data),
+        "messages": sorted(message.code for message in get_prescription_message_codes(prescription_data)),
+        "report": _report_validity(prescription_data),
+        "patient_age": _patient_age(prescription_data),
+        "general": _general_checks(prescription_data, general_compliance),
+        "rule_version": rule_version or "",
+        "extra": {key: value for key, value in (extra or {}).items() if key not in IDENTITY_FIELDS}
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+# Prompt önbelleği fiyat çarpanları (normal girdi fiyatına göre)
+CACHE_WRITE_COST_FACTOR = 1.25
+CACHE_READ_COST_FACTOR = 0.1
+
+
+def estimate_cost(usage: Any, input_cost_per_mtok: float, output_cost_per_mtok: float) -> float:
+    """API yanıtındaki token kullanımından USD maliyet tahmini (prompt önbelleği dahil)"""
+    if usage is None:
+        return 0.0
+    if isinstance(usage, Mapping):
+        input_tokens = usage.get("input_tokens", usage.get("prompt_tokens", 0))
+        output_tokens = usage.get("output_tokens", usage.get("completion_tokens", 0))
+        cache_write = usage.get("cache_creation_input_tokens", 0)
+        cache_read = usage.get("cache_read_input_tokens", 0)
+    else:
+        input_tokens = getattr(usage, "input_tokens", getattr(usage, "prompt_tokens", 0))
+        output_tokens = getattr(usage, "output_tokens", getattr(usage, "completion_tokens", 0))
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0)
+        cache_read = getattr(usage, "cache_read_input_tokens", 0)
+    input_equivalent = ((input_tokens or 0) + (cache_write or 0) * CACHE_WRITE_COST_FACTOR
+                        + (cache_read or 0) * CACHE_READ_COST_FACTOR)
+    return (input_equivalent * input_cost_per_mtok + (output_tokens or 0) * output_cost_per_mtok) / 1_000_000
+
+
+class DecisionCache:
+    """
+    SQLite tabanlı kalıcı AI karar önbelleği
+
+    Kayıtlar ttl_seconds sonra geçersiz olur; kayıt sayısı max_entries'i aşınca
+    en uzun süredir kullanılmayanlar silinir.
+    """
+
+    def __init__(self, db_path: str = "database/ai_decision_cache.db", ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 50000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0,
+                       "avoided_cost": 0.0, "spent_cost": 0.0}
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_database()
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["DecisionCache"]:
+        """Ayarlardan önbellek oluşturur (AI_DECISION_CACHE=false ise None)"""
+        if not getattr(settings, "ai_decision_cache_enabled", True):
+            return None
+        try:
+            return cls(
+                db_path=getattr(settings, "ai_decision_cache_path", "database/ai_decision_cache.db"),
+                ttl_seconds=getattr(settings, "ai_decision_cache_ttl_hours", 168) * 3600,
+                max_entries=getattr(settings, "ai_decision_cache_max_entries", 50000)
+            )
+        except Exception as e:
+            logger.error(f"AI karar önbelleği açılamadı, önbelleksiz devam ediliyor: {e}")
+            return None
+
+    def _init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_decision_cache (
+                    fingerprint TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    decision TEXT NOT NULL,
+                    cost REAL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_decision_cache_access ON ai_decision_cache (last_access)")
+            conn.commit()
+
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Geçerli kayıt varsa kararı döndürür ve isabeti kaydeder"""
+        now = time.time()
+        try:
+            with self._lock, sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT decision, cost, created_at FROM ai_decision_cache WHERE fingerprint = ?",
+                    (fingerprint,)
+                ).fetchone()
+
+                if row is not None and now - row[2] > self.ttl_seconds:
+                    conn.execute("DELETE FROM ai_decision_cache WHERE fingerprint = ?", (fingerprint,))
+                    self._stats["expired"] += 1
+                    row = None
+
+                if row is None:
+                    self._stats["misses"] += 1
+                    return None
+
+                conn.execute(
+                    "UPDATE ai_decision_cache SET last_access = ?, hits = hits + 1 WHERE fingerprint = ?",
+                    (now, fingerprint)
+                )
+                self._stats["hits"] += 1
+                self._stats["avoided_cost"] += row[1] or 0.0
+                return json.loads(row[0])
+
+        except Exception as e:
+            logger.error(f"AI karar önbelleği okuma hatası: {e}")
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, fingerprint: str, decision: Dict[str, Any], cost: float = 0.0, namespace: str = "default") -> bool:
+        """Kararı kaydeder; gerekirse süresi dolan ve en eski kayıtları siler"""
+        now = time.time()
+        try:
+            with self._lock, sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO ai_decision_cache
+                    (fingerprint, namespace, decision, cost, created_at, last_access, hits)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)
+                ''', (fingerprint, namespace, json.dumps(decision, ensure_ascii=False, default=str), cost, now, now))
+                self._stats["stores"] += 1
+                self._stats["spent_cost"] += cost
+
+                expired = conn.execute(
+                    "DELETE FROM ai_decision_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+                ).rowcount
+                self._stats["expired"] += expired
+
+                overflow = conn.execute("SELECT COUNT(*) FROM ai_decision_cache").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    conn.execute('''
+                        DELETE FROM ai_decision_cache WHERE fingerprint IN (
+                            SELECT fingerprint FROM ai_decision_cache ORDER BY last_access ASC LIMIT ?
+                        )
+                    ''', (overflow,))
+                    self._stats["evictions"] += overflow
+                conn.commit()
+                return True
+
+        except Exception as e:
+            logger.error(f"AI karar önbelleği yazma hatası: {e}")
+            return False
+
+    def clear(self) -> bool:
+        """Tüm kayıtları siler"""
+        try:
+            with self._lock, sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM ai_decision_cache")
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"AI karar önbelleği temizleme hatası: {e}")
+            return False
+
+    def __len__(self) -> int:
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return conn.execute("SELECT COUNT(*) FROM ai_decision_cache").fetchone()[0]
+        except Exception as e:
+            logger.error(f"AI karar önbelleği sayım hatası: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """İsabet oranı ve önlenen API maliyeti"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "lookups": lookups,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avoided_cost": round(self._stats["avoided_cost"], 6),
+            "spent_cost": round(self._stats["spent_cost"], 6),
+            "entries": len(self)
+        }
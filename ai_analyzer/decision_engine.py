@@ -1,14 +1,17 @@
 """
 AI Karar Verme Motoru
-OpenAI API kullanarak reçete değerlendirmesi yapar
+Claude veya OpenAI (ortak sağlayıcı katmanı üzerinden) ile reçete değerlendirmesi yapar
 """
 
-import openai
-import json
 from loguru import logger
 from datetime import datetime, timedelta
-import re
-import anthropic
+
+from ai_analyzer.ai_providers import AIRequest, get_provider
+from ai_analyzer.decision_cache import DecisionCache, estimate_cost, prescription_fingerprint
+from ai_analyzer.decision_schema import DecisionValidationError, ParseMetrics, anthropic_tool, parse_decision
+
+# Karar motoru prompt'una giren, hasta kimliği dışındaki alanlar
+DECISION_FIELDS = ('doctor_name', 'hospital', 'prescription_date', 'total_amount', 'status')
 
 
 class DecisionEngine:
@@ -17,15 +20,10 @@ class DecisionEngine:
     def __init__(self, settings):
         self.settings = settings
         
-        # AI Provider seçimi
+        # AI Provider seçimi (istemci süreç genelinde paylaşılır, ilk çağrıda oluşturulur)
         self.ai_provider = getattr(settings, 'ai_provider', 'openai').lower()
-        
-        if self.ai_provider == 'claude':
-            self.client = anthropic.Anthropic(api_key=settings.claude_api_key)
-            self.model = getattr(settings, 'ai_model', 'claude-3-sonnet-20240229')
-        else:
-            self.client = openai.OpenAI(api_key=settings.openai_api_key)
-            self.model = settings.openai_model
+        self.provider = get_provider(self.ai_provider, settings)
+        self.model = self.provider.config.model
         
         # Karar kriterleri
         self.approval_criteria = {
@@ -36,6 +34,13 @@ class DecisionEngine:
             'prescription_completeness': True
         }
         
+        # Aynı analiz girdisi için kalıcı karar önbelleği
+        self.decision_cache = DecisionCache.from_settings(settings)
+        
+        # Yanıtlar araç/fonksiyon çağrısıyla yapılandırılmış gelir
+        self.structured_output = getattr(settings, 'ai_structured_output', True)
+        self.parse_metrics = ParseMetrics()
+        
         logger.info(f"AI Karar Motoru başlatıldı - Provider: {self.ai_provider}, Model: {self.model}")
     
     def analyze_prescription(self, prescription_data):
@@ -43,17 +48,31 @@ class DecisionEngine:
         try:
             logger.info(f"Reçete analiz ediliyor - ID: {prescription_data['id']}")
             
-            # AI prompt'u hazırla
-            prompt = self._create_analysis_prompt(prescription_data)
+            # Aynı girdi için önceki karar (hasta adı/TC hariç özet)
+            fingerprint = prescription_fingerprint(prescription_data, extra={
+                **{field: prescription_data.get(field) for field in DECISION_FIELDS},
+                'provider': self.ai_provider,
+                'model': self.model
+            })
+            decision = self.decision_cache.get(fingerprint) if self.decision_cache is not None else None
             
-            # AI API'sine istek gönder
-            if self.ai_provider == 'claude':
-                response = self._call_claude_api(prompt)
+            if decision is not None:
+                decision['timestamp'] = datetime.now().isoformat()
+                decision['cache_hit'] = True
             else:
-                response = self._call_openai_api(prompt)
-            
-            # Yanıtı parse et
-            decision = self._parse_ai_response(response)
+                # AI prompt'u hazırla
+                prompt = self._create_analysis_prompt(prescription_data)
+                
+                # AI API'sine istek gönder
+                response = self._call_ai_api(prompt)
+                
+                # Yanıtı parse et
+                decision = self._parse_ai_response(response.content)
+                
+                # Güvenlik kontrollerinden önceki ham karar saklanır
+                if self.decision_cache is not None and not decision.get('parse_error'):
+                    self.decision_cache.put(fingerprint, decision, self._estimate_call_cost(response.usage),
+                                            namespace=f"decision_engine:{self.ai_provider}")
             
             # Güvenlik kontrolleri
             decision = self._apply_safety_checks(prescription_data, decision)
@@ -117,88 +136,34 @@ class DecisionEngine:
         Bu reçete için kararını ver ve gerekçelendir.
         """
     
-    def _call_claude_api(self, prompt):
-        """Claude API'yi çağırır"""
+    def _call_ai_api(self, prompt):
+        """Seçili sağlayıcıyı çağırır; içerik ve token kullanımıyla AIResponse döndürür"""
         try:
-            system_prompt = self._get_system_prompt()
-            
-            response = self.client.messages.create(
+            response = self.provider.complete(AIRequest(
+                prompt=prompt,
+                system=self._get_system_prompt(),
                 model=self.model,
                 max_tokens=getattr(self.settings, 'openai_max_tokens', 1000),
                 temperature=getattr(self.settings, 'openai_temperature', 0.3),
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
-            
-            return response.content[0].text
-            
-        except Exception as e:
-            logger.error(f"Claude API hatası: {e}")
-            raise
-    
-    def _call_openai_api(self, prompt):
-        """OpenAI API'yi çağırır"""
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": self._get_system_prompt()
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                temperature=getattr(self.settings, 'openai_temperature', 0.3),
-                max_tokens=getattr(self.settings, 'openai_max_tokens', 1000)
-            )
+                tool=anthropic_tool() if self.structured_output else None
+            ))
             
-            return response.choices[0].message.content
+            return response
             
         except Exception as e:
-            logger.error(f"OpenAI API hatası: {e}")
+            logger.error(f"{self.ai_provider} API hatası: {e}")
             raise
 
-    def _parse_ai_response(self, response_text):
-        """AI yanıtını parse eder"""
+    def _parse_ai_response(self, response):
+        """AI yanıtını (araç girdisi veya metin) doğrulanmış karara çevirir"""
         try:
-            # JSON formatını bulmaya çalış
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(0)
-                decision_data = json.loads(json_str)
+            decision_data = parse_decision(response, self.parse_metrics)
+            decision_data['timestamp'] = datetime.now().isoformat()
+            return decision_data
                 
-                # Gerekli alanları kontrol et
-                required_fields = ['action', 'reason', 'confidence']
-                for field in required_fields:
-                    if field not in decision_data:
-                        raise KeyError(f"Gerekli alan eksik: {field}")
-                
-                # Timestamp ekle
-                decision_data['timestamp'] = datetime.now().isoformat()
-                
-                # Varsayılan değerler
-                if 'risk_factors' not in decision_data:
-                    decision_data['risk_factors'] = []
-                if 'recommendations' not in decision_data:
-                    decision_data['recommendations'] = []
-                
-                return decision_data
-            
-            else:
-                raise ValueError("JSON formatı bulunamadı")
-                
-        except Exception as e:
+        except DecisionValidationError as e:
             logger.error(f"AI yanıtı parse edilemedi: {e}")
-            logger.debug(f"Ham yanıt: {response_text}")
+            logger.debug(f"Ham yanıt: {response}")
             
             # Varsayılan karar
             return {
@@ -207,7 +172,8 @@ class DecisionEngine:
                 'confidence': 0.0,
                 'risk_factors': ['AI parsing hatası'],
                 'recommendations': ['Manuel inceleme yapın'],
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                'parse_error': True
             }
     
     def _apply_safety_checks(self, prescription_data, decision):
@@ -270,6 +236,20 @@ class DecisionEngine:
             decision['reason'] += f' (Güvenlik kontrolü hatası: {str(e)})'
             return decision
     
+    def _estimate_call_cost(self, usage):
+        """API çağrısının tahmini maliyeti (USD)"""
+        return estimate_cost(usage,
+                             getattr(self.settings, 'ai_input_cost_per_mtok', 0.0),
+                             getattr(self.settings, 'ai_output_cost_per_mtok', 0.0))
+    
+    def get_cache_stats(self):
+        """Karar önbelleği isabet oranı ve önlenen maliyet"""
+        return self.decision_cache.stats() if self.decision_cache is not None else {}
+    
+    def get_parse_stats(self):
+        """Yanıt ayrıştırma yöntemleri ve hata oranı"""
+        return self.parse_metrics.stats()
+    
     def get_decision_statistics(self):
         """Karar istatistiklerini döndürür"""
         # Bu method gelecekte karar geçmişini takip etmek için kullanılabilir
@@ -0,0 +1,222 @@
+"""
+Yapılandırılmış AI Karar Şeması
+Claude/OpenAI araç (tool/function) çağrısı için karar şeması, yanıttan araç girdisinin
+alınması, hızlı doğrulama ve ayrıştırma hatası metrikleri
+"""
+
+import json
+import threading
+from collections import Counter, deque
+from typing import Any, Dict, List, Mapping, Optional
+
+DECISION_TOOL_NAME = "record_prescription_decision"
+PACKED_DECISION_TOOL_NAME = "record_prescription_decisions"
+
+VALID_ACTIONS = ("approve", "reject", "hold")
+LIST_FIELDS = ("risk_factors", "recommendations", "key_findings")
+TEXT_FIELDS = ("clinical_assessment", "sut_compliance")
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+DECISION_PROPERTIES = {
+    "action": {"type": "string", "enum": list(VALID_ACTIONS)},
+    "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+    "reason": {"type": "string"},
+    "clinical_assessment": {"type": "string"},
+    "sut_compliance": {"type": "string"},
+    "risk_factors": _STRING_LIST,
+    "recommendations": _STRING_LIST,
+    "key_findings": _STRING_LIST,
+}
+
+# Tüm alanlar zorunlu ve ek alan yok: OpenAI strict modu bunu gerektirir
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": DECISION_PROPERTIES,
+    "required": list(DECISION_PROPERTIES),
+    "additionalProperties": False,
+}
+
+PACKED_DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decisions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"recete_no": {"type": "string"}, **DECISION_PROPERTIES},
+                "required": ["recete_no", *DECISION_PROPERTIES],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["decisions"],
+    "additionalProperties": False,
+}
+
+
+class DecisionValidationError(ValueError):
+    """AI kararı şemaya uymuyor"""
+
+
+def anthropic_tool(name: str = DECISION_TOOL_NAME, schema: Mapping = DECISION_SCHEMA) -> Dict[str, Any]:
+    """Messages API araç tanımı"""
+    return {
+        "name": name,
+        "description": "Reçete değerlendirme kararını kaydeder.",
+        "input_schema": schema,
+    }
+
+
+def anthropic_tool_choice(name: str = DECISION_TOOL_NAME) -> Dict[str, Any]:
+    """Modeli araç çağrısına zorlar"""
+    return {"type": "tool", "name": name}
+
+
+def openai_tool(name: str = DECISION_TOOL_NAME, schema: Mapping = DECISION_SCHEMA) -> Dict[str, Any]:
+    """Chat Completions strict function tanımı"""
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": "Reçete değerlendirme kararını kaydeder.",
+            "parameters": schema,
+            "strict": True,
+        },
+    }
+
+
+def openai_tool_choice(name: str = DECISION_TOOL_NAME) -> Dict[str, Any]:
+    return {"type": "function", "function": {"name": name}}
+
+
+def extract_tool_input(response: Any, name: str = DECISION_TOOL_NAME) -> Optional[Dict[str, Any]]:
+    """
+    Yanıttaki araç çağrısının girdisi (Anthropic tool_use veya OpenAI tool_calls)
+
+    Returns:
+        Optional[Dict]: Araç çağrısı yoksa None
+    """
+    for block in getattr(response, "content", None) or []:
+        if getattr(block, "type", None) == "tool_use" and getattr(block, "name", name) == name:
+            return dict(block.input)
+
+    choices = getattr(response, "choices", None)
+    if choices:
+        for call in getattr(choices[0].message, "tool_calls", None) or []:
+            if call.function.name == name:
+                return json.loads(call.function.arguments)
+
+    return None
+
+
+def response_text(response: Any) -> str:
+    """Yanıttaki düz metin (araç çağrısı olmadığında)"""
+    choices = getattr(response, "choices", None)
+    if choices:
+        return choices[0].message.content or ""
+    return "".join(getattr(block, "text", "") for block in getattr(response, "content", None) or [])
+
+
+def validate_decision(data: Any) -> Dict[str, Any]:
+    """
+    Kararı doğrular ve eksik isteğe bağlı alanları doldurur
+
+    Raises:
+        DecisionValidationError: action/confidence/reason geçersizse
+    """
+    if not isinstance(data, dict):
+        raise DecisionValidationError(f"karar nesne değil: {type(data).__name__}")
+
+    action = data.get("action")
+    if action not in VALID_ACTIONS:
+        raise DecisionValidationError(f"geçersiz action: {action!r}")
+
+    confidence = data.get("confidence")
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        raise DecisionValidationError(f"geçersiz confidence: {confidence!r}")
+
+    reason = data.get("reason")
+    if not isinstance(reason, str):
+        raise DecisionValidationError("reason eksik")
+
+    decision = dict(data)
+    decision["confidence"] = float(confidence)
+    for field in LIST_FIELDS:
+        value = decision.get(field)
+        if value is None:
+            decision[field] = []
+        elif not isinstance(value, list):
+            raise DecisionValidationError(f"{field} liste değil")
+    for field in TEXT_FIELDS:
+        decision.setdefault(field, "")
+    return decision
+
+
+def decode_json_object(text: str) -> Any:
+    """
+    Metindeki ilk tam JSON nesnesini çözer
+
+    Açgözlü regex yerine ilk '{' konumundan itibaren tek bir nesne okunur;
+    bulunamazsa DecisionValidationError.
+    """
+    decoder = json.JSONDecoder()
+    position = (text or "").find("{")
+    while position != -1:
+        try:
+            return decoder.raw_decode(text, position)[0]
+        except ValueError:
+            position = text.find("{", position + 1)
+    raise DecisionValidationError("yanıtta JSON nesnesi yok")
+
+
+def parse_decision(response: Any, metrics: Optional["ParseMetrics"] = None) -> Dict[str, Any]:
+    """
+    Araç girdisini (dict) veya düz metin yanıtı doğrulanmış karara çevirir
+
+    Raises:
+        DecisionValidationError: Yanıt şemaya uymuyorsa (metrics'e hata olarak işlenir)
+    """
+    method = "tool_use" if isinstance(response, dict) else "json_text"
+    try:
+        data = response if isinstance(response, dict) else decode_json_object(str(response or ""))
+        decision = validate_decision(data)
+    except DecisionValidationError as e:
+        if metrics is not None:
+            metrics.record("failed", f"{method}: {e}")
+        raise
+    if metrics is not None:
+        metrics.record(method)
+    return decision
+
+
+class ParseMetrics:
+    """Karar ayrıştırma yöntemi ve hata sayaçları"""
+
+    def __init__(self, keep_errors: int = 20):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._errors = deque(maxlen=keep_errors)
+
+    def record(self, method: str, error: Optional[str] = None):
+        """method: tool_use, json_text veya failed"""
+        with self._lock:
+            self._counts["total"] += 1
+            self._counts[method] += 1
+            if error:
+                self._counts["failures"] += 1
+                self._errors.append(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            errors: List[str] = list(self._errors)
+        total = counts.pop("total", 0)
+        failures = counts.pop("failures", 0)
+        return {
+            "total": total,
+            "failures": failures,
+            "failure_rate": round(failures / total, 4) if total else 0.0,
+            "by_method": counts,
+            "recent_errors": errors,
+        }
@@ -0,0 +1,292 @@
+"""
+Yerel Sahte Claude Messages API Sunucusu
+Ağ olmadan yük testi için /v1/messages uç noktasını taklit eder: ayarlanabilir
+gecikme, hata oranı ve 429 (hız/eşzamanlılık sınırı) davranışı. Hata enjeksiyonu
+tohum ve istek sırasına bağlıdır, aynı ayarlarla aynı istekler aynı sonucu verir.
+
+Gerçek SDK ile kullanım: AI_BASE_URL=http://127.0.0.1:<port>
+"""
+
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from ai_analyzer.ai_replay import message_from_dict
+from ai_analyzer.decision_schema import PACKED_DECISION_TOOL_NAME
+
+DEFAULT_DECISION = {"action": "approve", "confidence": 0.9, "reason": "Yerel sahte sunucu yanıtı"}
+
+
+def default_responder(params: Dict[str, Any]) -> Any:
+    """Araç isteğine karar, paket isteğine reçete başına karar, diğerlerine JSON metin döndürür"""
+    tool_name = (params.get("tool_choice") or {}).get("name")
+    if tool_name == PACKED_DECISION_TOOL_NAME:
+        content = str(params["messages"][-1]["content"])
+        ids = [line.split(":", 1)[1].strip() for line in content.splitlines() if line.startswith("Reçete:")]
+        return {"decisions": [dict(DEFAULT_DECISION, recete_no=recete_no) for recete_no in ids]}
+    if tool_name:
+        return dict(DEFAULT_DECISION)
+    return json.dumps(DEFAULT_DECISION, ensure_ascii=False)
+
+
+class APIStatusError(Exception):
+    """Sahte sunucudan gelen HTTP hatası"""
+
+    def __init__(self, status_code: int, error_type: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code} {error_type}: {message}")
+        self.status_code = status_code
+        self.error_type = error_type
+        self.retry_after = retry_after
+
+
+class FakeClaudeServer:
+    """
+    Arka plan iş parçacığında çalışan sahte Messages API
+
+    Args:
+        latency: Yanıt başına sabit gecikme (saniye)
+        latency_jitter: Gecikmeye eklenen 0..jitter arası rastgele süre
+        error_rate: 500/529 döndürülen isteklerin oranı
+        rate_limit_per_second: Saniyede kabul edilen istek (aşılırsa 429, None: sınırsız)
+        max_in_flight: Aynı anda işlenen istek sınırı (aşılırsa 429, None: sınırsız)
+        retry_after: 429 yanıtlarındaki retry-after başlığı (saniye)
+        responder: params -> karar (dict, araç girdisi) veya metin
+        seed: Gecikme ve hata enjeksiyonu tohumu
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_per_second: Optional[float] = None,
+                 max_in_flight: Optional[int] = None, retry_after: float = 1.0,
+                 responder: Callable[[Dict[str, Any]], Any] = default_responder, seed: int = 0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_per_second = rate_limit_per_second
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.responder = responder
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._in_flight = 0
+        self._bucket = float(rate_limit_per_second or 0)
+        self._bucket_time = time.monotonic()
+        self.statuses = Counter()
+        self.peak_in_flight = 0
+        self.received = []
+
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeClaudeServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Sahte Claude sunucusu başladı: {self.url}")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeClaudeServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": self._sequence, "statuses": dict(self.statuses), "peak_in_flight": self.peak_in_flight}
+
+    def _admit(self) -> tuple:
+        """(sıra numarası, None) veya reddedilen istek için (sıra numarası, (durum, hata tipi, mesaj))"""
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+            if self.rate_limit_per_second:
+                now = time.monotonic()
+                self._bucket = min(self.rate_limit_per_second,
+                                   self._bucket + (now - self._bucket_time) * self.rate_limit_per_second)
+                self._bucket_time = now
+                if self._bucket < 1:
+                    return sequence, (429, "rate_limit_error", "Number of requests has exceeded your rate limit")
+                self._bucket -= 1
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                return sequence, (429, "rate_limit_error", "Too many concurrent requests")
+            self._in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        return sequence, None
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _handle(self, params: Dict[str, Any]):
+        """(durum, gövde, başlıklar)"""
+        sequence, rejected = self._admit()
+        if rejected:
+            status, error_type, message = rejected
+            return status, _error_body(error_type, message), {"retry-after": str(self.retry_after)}
+
+        try:
+            # Her isteğin rastgeleliği tohum ve sıra numarasından türetilir
+            rng = random.Random(f"{self.seed}:{sequence}")
+            time.sleep(self.latency + rng.random() * self.latency_jitter)
+            if rng.random() < self.error_rate:
+                if rng.random() < 0.5:
+                    return 529, _error_body("overloaded_error", "Overloaded"), {}
+                return 500, _error_body("api_error", "Internal server error"), {}
+
+            with self._lock:
+                self.received.append(params)
+            result = self.responder(params)
+            return 200, _message_body(params, result), {}
+        except Exception as e:
+            return 500, _error_body("api_error", str(e)), {}
+        finally:
+            self._release()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length") or 0)
+                try:
+                    params = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    status, body, headers = 400, _error_body("invalid_request_error", "Invalid JSON"), {}
+                else:
+                    if self.path.rstrip("/") != "/v1/messages":
+                        status, body, headers = 404, _error_body("not_found_error", self.path), {}
+                    else:
+                        status, body, headers = server._handle(params)
+
+                with server._lock:
+                    server.statuses[status] += 1
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _error_body(error_type: str, message: str) -> Dict[str, Any]:
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+def _message_body(params: Dict[str, Any], result: Any) -> Dict[str, Any]:
+    if isinstance(result, dict):
+        tool_name = (params.get("tool_choice") or {}).get("name", "")
+        content = [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:20]}", "name": tool_name, "input": result}]
+        output = json.dumps(result, ensure_ascii=False)
+        stop_reason = "tool_use"
+    else:
+        output = str(result)
+        content = [{"type": "text", "text": output}]
+        stop_reason = "end_turn"
+
+    prompt = json.dumps([params.get("system", ""), params.get("messages", [])], ensure_ascii=False)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", ""),
+        "content": content,
+        "stop_reason": stop_reason,
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": max(1, len(output) // 4)},
+    }
+
+
+class _Messages:
+    def __init__(self, client: "LocalMessagesClient"):
+        self._client = client
+
+    def create(self, timeout: Optional[float] = None, **params):
+        return self._client.post("/v1/messages", params, timeout)
+
+
+class LocalMessagesClient:
+    """
+    Sahte sunucu için bağımlılıksız istemci (client.messages.create)
+
+    Yeniden deneme yapmaz; 429/5xx yanıtları APIStatusError olarak yükselir.
+    """
+
+    def __init__(self, base_url: str, api_key: str = "test", timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.messages = _Messages(self)
+
+    def post(self, path: str, params: Dict[str, Any], timeout: Optional[float] = None):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(params, ensure_ascii=False).encode("utf-8"),
+            headers={"content-type": "application/json", "x-api-key": self.api_key,
+                     "anthropic-version": "2023-06-01"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return message_from_dict(json.loads(response.read()))
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read()).get("error", {})
+            except ValueError:
+                error = {}
+            retry_after = e.headers.get("retry-after")
+            raise APIStatusError(e.code, error.get("type", "api_error"), error.get("message", str(e)),
+                                 float(retry_after) if retry_after else None) from None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Yerel sahte Claude Messages API sunucusu")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None, help="saniyede istek")
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeClaudeServer(port=args.port, latency=args.latency, latency_jitter=args.jitter,
+                            error_rate=args.error_rate, rate_limit_per_second=args.rate_limit,
+                            max_in_flight=args.max_in_flight, seed=args.seed).start()
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Sahte Claude sunucusu: {fake.stats()}")
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,182 @@
+"""
+Claude Message Batches İstemcisi
+Yapay zeka gerektiren reçeteleri tek bir Message Batches isteğinde gönderir,
+tamamlanmasını bekler ve sonuçları custom_id ile eşler
+"""
+
+import json
+import re
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple
+from loguru import logger
+
+from ai_analyzer.decision_schema import DECISION_TOOL_NAME
+
+# Message Batches çağrıları senkron çağrının yarı fiyatına faturalanır
+BATCH_COST_FACTOR = 0.5
+
+# API sınırı: istek başına en fazla 100.000 mesaj
+MAX_REQUESTS_PER_BATCH = 100000
+
+_CUSTOM_ID_INVALID = re.compile(r"[^A-Za-z0-9_-]")
+
+
+class BatchResult(NamedTuple):
+    """Tek bir batch isteğinin sonucu"""
+    custom_id: str
+    succeeded: bool
+    text: str = ""
+    usage: Any = None
+    error: str = ""
+    tool_input: Any = None
+
+    @property
+    def response(self) -> Any:
+        """Araç çağrısı girdisi varsa o, yoksa metin"""
+        return self.tool_input if self.tool_input is not None else self.text
+
+
+def make_custom_id(index: int, prescription_id: Any = "") -> str:
+    """custom_id üretir (API kuralı: 1-64 karakter, sadece harf, rakam, _ ve -)"""
+    suffix = _CUSTOM_ID_INVALID.sub("_", str(prescription_id or ""))
+    return f"rx-{index:06d}-{suffix}"[:64].rstrip("-")
+
+
+class MessageBatchRunner:
+    """
+    Message Batches isteğini gönderir, bitene kadar yoklar ve sonuçları toplar
+
+    client, anthropic.Anthropic ile aynı arayüzü (client.messages.batches)
+    sağlayan herhangi bir nesne olabilir.
+    """
+
+    def __init__(self, client, poll_interval: float = 60.0, timeout: float = 24 * 3600,
+                 max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_requests_per_batch = max_requests_per_batch
+        self._sleep = sleep
+        self.last_batch_ids: List[str] = []
+
+    def run(self, requests: Dict[str, Dict[str, Any]]) -> Dict[str, BatchResult]:
+        """
+        İstekleri gönderir ve tüm sonuçlar gelene kadar bekler
+
+        Args:
+            requests: custom_id -> Messages API parametreleri
+
+        Returns:
+            Dict[str, BatchResult]: custom_id -> sonuç (sonucu gelmeyen istekler başarısız sayılır)
+        """
+        if not requests:
+            return {}
+
+        batches = self.client.messages.batches
+        items = [{"custom_id": custom_id, "params": params} for custom_id, params in requests.items()]
+        chunks = [items[i:i + self.max_requests_per_batch] for i in range(0, len(items), self.max_requests_per_batch)]
+
+        self.last_batch_ids = [batches.create(requests=chunk).id for chunk in chunks]
+        logger.info(f"Message batch gönderildi: {len(items)} istek, {len(self.last_batch_ids)} batch")
+
+        results: Dict[str, BatchResult] = {}
+        deadline = time.monotonic() + self.timeout
+        for batch_id in self.last_batch_ids:
+            self._wait_until_ended(batch_id, deadline)
+            for entry in batches.results(batch_id):
+                results[entry.custom_id] = self._to_result(entry)
+
+        for custom_id in requests:
+            if custom_id not in results:
+                results[custom_id] = BatchResult(custom_id, False, error="missing result")
+
+        succeeded = sum(result.succeeded for result in results.values())
+        logger.info(f"Message batch tamamlandı: {succeeded}/{len(requests)} başarılı")
+        return results
+
+    def _wait_until_ended(self, batch_id: str, deadline: float):
+        batches = self.client.messages.batches
+        batch = batches.retrieve(batch_id)
+        while batch.processing_status != "ended":
+            if time.monotonic() > deadline:
+                batches.cancel(batch_id)
+                raise TimeoutError(f"Message batch {batch_id} zaman aşımına uğradı")
+            self._sleep(self.poll_interval)
+            batch = batches.retrieve(batch_id)
+
+    @staticmethod
+    def _to_result(entry) -> BatchResult:
+        result = entry.result
+        if result.type == "succeeded":
+            message = result.message
+            text = "".join(getattr(block, "text", "") for block in message.content)
+            tool_input = next((dict(block.input) for block in message.content
+                               if getattr(block, "type", None) == "tool_use"), None)
+            return BatchResult(entry.custom_id, True, text, getattr(message, "usage", None), tool_input=tool_input)
+
+        error = getattr(result, "error", None)
+        detail = getattr(getattr(error, "error", error), "message", None) or result.type
+        return BatchResult(entry.custom_id, False, error=str(detail))
+
+
+class LocalMessageBatchClient:
+    """
+    Yerel sahte Message Batches uç noktası (testler ve kuru çalıştırma için)
+
+    responder(params) bir metin veya araç girdisi (dict) döndürür ya da hata fırlatır. Batch, ended_after_polls
+    yoklamadan sonra tamamlanmış görünür.
+    """
+
+    def __init__(self, responder: Callable[[Dict[str, Any]], Any], ended_after_polls: int = 1):
+        self.responder = responder
+        self.ended_after_polls = ended_after_polls
+        self.created: List[Dict[str, Any]] = []
+        self.polls = 0
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self.messages = SimpleNamespace(batches=self)
+
+    def create(self, requests: List[Dict[str, Any]]):
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = {"requests": list(requests), "polls": 0, "canceled": False}
+        self.created.append({"id": batch_id, "requests": list(requests)})
+        return SimpleNamespace(id=batch_id, processing_status="in_progress")
+
+    def retrieve(self, batch_id: str):
+        batch = self._batches[batch_id]
+        batch["polls"] += 1
+        self.polls += 1
+        ended = batch["canceled"] or batch["polls"] > self.ended_after_polls
+        return SimpleNamespace(id=batch_id, processing_status="ended" if ended else "in_progress")
+
+    def cancel(self, batch_id: str):
+        self._batches[batch_id]["canceled"] = True
+        return SimpleNamespace(id=batch_id, processing_status="canceling")
+
+    def results(self, batch_id: str) -> Iterator[Any]:
+        batch = self._batches[batch_id]
+        for request in batch["requests"]:
+            if batch["canceled"]:
+                yield SimpleNamespace(custom_id=request["custom_id"], result=SimpleNamespace(type="canceled"))
+                continue
+            try:
+                text = self.responder(request["params"])
+            except Exception as e:
+                error = SimpleNamespace(type="error", error=SimpleNamespace(type="api_error", message=str(e)))
+                yield SimpleNamespace(custom_id=request["custom_id"], result=SimpleNamespace(type="errored", error=error))
+                continue
+
+            prompt = " ".join(str(message.get("content", "")) for message in request["params"].get("messages", []))
+            if isinstance(text, dict):
+                tool_name = (request["params"].get("tool_choice") or {}).get("name", DECISION_TOOL_NAME)
+                block = SimpleNamespace(type="tool_use", name=tool_name, input=text)
+                text = json.dumps(text)
+            else:
+                block = SimpleNamespace(type="text", text=text)
+            message = SimpleNamespace(
+                content=[block],
+                usage=SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4)
+            )
+            yield SimpleNamespace(custom_id=request["custom_id"], result=SimpleNamespace(type="succeeded", message=message))
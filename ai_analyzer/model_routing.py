@@ -0,0 +1,144 @@
+"""
+Karmaşıklığa Göre Model Yönlendirme
+Basit ve kurallarla tutarlı reçeteler hızlı modele, raporlu veya çok ilaçlı olup
+SUT sinyalleri çelişen reçeteler güçlü modele gönderilir
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+
+from loguru import logger
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+# Karmaşıklık puanı üst sınırı
+MAX_COMPLEXITY = 5
+
+
+def prescription_complexity(prescription: Mapping) -> int:
+    """Reçetenin işlem karmaşıklığı (1-5): ilaç sayısı, rapor, mesaj kodu ve hasta bilgisi"""
+    complexity = 1  # Base complexity
+
+    # More drugs = higher complexity
+    complexity += len(prescription.get("drugs", []) or [])
+
+    # Report requirements add complexity
+    if prescription.get("report_details") or prescription.get("rapor_no"):
+        complexity += 2
+
+    # Message codes add complexity
+    if prescription.get("ilac_mesajlari"):
+        complexity += 1
+
+    # Patient age considerations (if available)
+    if prescription.get("hasta_tc"):
+        complexity += 1
+
+    return min(complexity, MAX_COMPLEXITY)
+
+
+class RouteDecision(NamedTuple):
+    """Yönlendirme kararı"""
+    tier: str
+    complexity: int
+    reasons: List[str]
+
+
+class ModelRouter:
+    """
+    Reçeteyi hızlı veya güçlü model katmanına yönlendirir
+
+    Güçlü katman için reçetenin hem karmaşık (raporlu veya çok ilaçlı) olması hem de
+    SUT sinyallerinin çelişmesi gerekir; diğer tüm reçeteler hızlı katmana gider.
+    """
+
+    def __init__(self, enabled: bool = True, strong_min_complexity: int = 4,
+                 min_sut_confidence: float = 0.7):
+        self.enabled = enabled
+        self.strong_min_complexity = strong_min_complexity
+        self.min_sut_confidence = min_sut_confidence
+        self.stats = TierStats()
+
+    @classmethod
+    def from_settings(cls, settings) -> "ModelRouter":
+        return cls(
+            enabled=settings.ai_model_routing,
+            strong_min_complexity=settings.ai_routing_strong_complexity,
+            min_sut_confidence=settings.ai_routing_min_sut_confidence,
+        )
+
+    def conflicts(self, prescription: Mapping, sut_analysis: Optional[Mapping],
+                  sut_recommendation: Optional[Mapping]) -> List[str]:
+        """Kural sonuçlarının birbiriyle veya reçeteyle çeliştiği noktalar"""
+        sut_analysis = sut_analysis or {}
+        sut_recommendation = sut_recommendation or {}
+        has_report = bool(prescription.get("report_details") or prescription.get("rapor_no"))
+        compliant = sut_analysis.get("overall_compliance", True)
+        conflicts = []
+
+        if has_report and not compliant:
+            conflicts.append("report_but_sut_noncompliant")
+        if compliant and sut_analysis.get("issues"):
+            conflicts.append("compliant_with_issues")
+        if sut_recommendation.get("action") == "hold":
+            conflicts.append("sut_hold")
+        elif sut_recommendation.get("confidence", 1.0) < self.min_sut_confidence:
+            conflicts.append("low_sut_confidence")
+        return conflicts
+
+    def route(self, prescription: Mapping, sut_analysis: Optional[Mapping] = None,
+              sut_recommendation: Optional[Mapping] = None) -> RouteDecision:
+        complexity = prescription_complexity(prescription)
+        if not self.enabled:
+            return RouteDecision(FAST_TIER, complexity, ["routing_disabled"])
+
+        drug_count = len(prescription.get("drugs", []) or [])
+        has_report = bool(prescription.get("report_details") or prescription.get("rapor_no"))
+        if complexity < self.strong_min_complexity or not (has_report or drug_count > 1):
+            return RouteDecision(FAST_TIER, complexity, ["simple"])
+
+        conflicts = self.conflicts(prescription, sut_analysis, sut_recommendation)
+        if not conflicts:
+            return RouteDecision(FAST_TIER, complexity, ["rule_consistent"])
+        return RouteDecision(STRONG_TIER, complexity, conflicts)
+
+
+class TierStats:
+    """Katman başına çağrı, gecikme, maliyet ve SUT ile anlaşmazlık sayaçları"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = defaultdict(lambda: {"calls": 0, "latency_seconds": 0.0, "cost": 0.0, "disagreements": 0})
+
+    def record(self, tier: str, latency: float = 0.0, cost: float = 0.0,
+               ai_action: Optional[str] = None, sut_action: Optional[str] = None):
+        with self._lock:
+            entry = self._tiers[tier]
+            entry["calls"] += 1
+            entry["latency_seconds"] += latency
+            entry["cost"] += cost
+            if ai_action and sut_action and ai_action != sut_action:
+                entry["disagreements"] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            tiers = {tier: dict(entry) for tier, entry in self._tiers.items()}
+        result = {}
+        for tier, entry in tiers.items():
+            calls = entry["calls"]
+            result[tier] = {
+                "calls": calls,
+                "avg_latency_seconds": round(entry["latency_seconds"] / calls, 4) if calls else 0.0,
+                "cost": round(entry["cost"], 6),
+                "avg_cost": round(entry["cost"] / calls, 6) if calls else 0.0,
+                "disagreements": entry["disagreements"],
+                "disagreement_rate": round(entry["disagreements"] / calls, 4) if calls else 0.0,
+            }
+        return result
+
+    def log(self):
+        for tier, entry in sorted(self.stats().items()):
+            logger.info(f"Model tier {tier}: {entry['calls']} calls, avg latency {entry['avg_latency_seconds']:.2f}s, "
+                        f"cost ${entry['cost']:.4f}, SUT disagreement {entry['disagreement_rate']*100:.1f}%")
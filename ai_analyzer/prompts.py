@@ -0,0 +1,197 @@
+"""
+Claude Prompt Şablonları
+Değişmeyen talimatlar önbelleklenebilir sistem bloğunda, reçeteye özgü veriler
+kısa bir yükte gönderilir. Hasta adı ve TC numarası gönderilmez.
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+from typing import Any, Dict, List, Mapping, Optional
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.icd10 import format_diagnosis_codes
+
+# Prompt biçimi değişince önbellekteki kararlar yeniden kullanılmaz
+PROMPT_VERSION = "compact-v1"
+
+_INSTRUCTIONS = (
+    "Sen uzman bir eczane müdürüsün. Reçeteleri SGK SUT kurallarına göre değerlendir: "
+    "ilaç-tanı (ICD) uyumu, raporlu ilaçlarda rapor, ilaç mesaj kodları (1013, 1301, 1038, 1002), "
+    "doz ve süre limitleri, hasta güvenliği (etkileşim, kontrendikasyon).\n"
+    "Kararlar: approve = tamamen uygun; reject = ciddi sorun, reddedilmeli; "
+    "hold = belirsizlik var, manuel inceleme gerekli.\n"
+)
+
+_DECISION_FIELDS = (
+    '"action": "approve|reject|hold", "confidence": 0.0-1.0, "reason": "kısa gerekçe", '
+    '"clinical_assessment": "", "sut_compliance": "", "risk_factors": [], '
+    '"recommendations": [], "key_findings": []'
+)
+
+SYSTEM_PROMPT = (
+    _INSTRUCTIONS
+    + "Sadece JSON döndür:\n"
+    + "{" + _DECISION_FIELDS + "}\n"
+    + "Listelerde en fazla 3 kısa madde kullan."
+)
+
+# Birden fazla reçete tek istekte gönderildiğinde
+PACK_SEPARATOR = "###"
+
+PACKED_SYSTEM_PROMPT = (
+    _INSTRUCTIONS
+    + f"Reçeteler '{PACK_SEPARATOR}' satırlarıyla ayrılmış gelir; her biri için ayrı karar ver.\n"
+    + "Sadece JSON dizisi döndür, her eleman reçete numarasını içersin:\n"
+    + '[{"recete_no": "...", ' + _DECISION_FIELDS + "}]\n"
+    + "Listelerde en fazla 3 kısa madde kullan."
+)
+
+# Yükte gösterilecek en fazla SUT bulgusu ve mesaj metni uzunluğu
+MAX_FINDINGS = 5
+MAX_MESSAGE_CHARS = 400
+
+# Yerel token tahmini için ortalama karakter/token (Türkçe metin)
+CHARS_PER_TOKEN = 3.5
+
+
+def _diagnosis_codes(prescription_data: Mapping) -> List[str]:
+    codes = []
+    report = prescription_data.get("report_details") or {}
+    for tani in report.get("tani_bilgileri", []) if isinstance(report, dict) else []:
+        codes.append(tani.get("tani_kodu", "") if isinstance(tani, dict) else str(tani))
+    return [code for code in codes if code]
+
+
+def _findings(label: str, items: List[str]) -> str:
+    if not items:
+        return ""
+    shown = "; ".join(str(item) for item in items[:MAX_FINDINGS])
+    more = f" (+{len(items) - MAX_FINDINGS})" if len(items) > MAX_FINDINGS else ""
+    return f"\n{label}: {shown}{more}"
+
+
+def compact_prescription_payload(prescription_data: Mapping, sut_analysis: Optional[Mapping] = None) -> str:
+    """
+    Reçetenin modele gönderilen kısa özeti
+
+    Sadece karar için gereken alanlar yer alır: ilaçlar ve adetleri, tanılar,
+    mesajlar, rapor varlığı/tarihleri ve SUT bulguları.
+    """
+    sut_analysis = sut_analysis or {}
+    lines = [f"Reçete: {prescription_data.get('recete_no', 'N/A')}"
+             f" | Tarih: {prescription_data.get('recete_tarihi') or 'N/A'}"]
+
+    drugs = prescription_data.get("drugs", [])
+    lines.append("İlaçlar:" if drugs else "İlaçlar: yok")
+    for i, drug in enumerate(drugs, 1):
+        if isinstance(drug, dict):
+            lines.append(f"{i}. {drug.get('ilac_adi', 'N/A')} x{drug.get('adet', '?')}")
+        else:
+            lines.append(f"{i}. {drug}")
+
+    lines.append(f"ICD: {format_diagnosis_codes(_diagnosis_codes(prescription_data)) or 'yok'}")
+
+    messages = str(prescription_data.get("ilac_mesajlari") or "").strip()
+    lines.append(f"Mesajlar: {messages[:MAX_MESSAGE_CHARS] or 'yok'}")
+
+    report = prescription_data.get("report_details") or {}
+    has_report = bool(prescription_data.get("rapor_no") or (isinstance(report, dict) and report.get("rapor_numarasi")))
+    report_date = prescription_data.get("rapor_tarihi") or ""
+    lines.append(f"Rapor: {'var' if has_report else 'yok'}{f' ({report_date})' if has_report and report_date else ''}")
+
+    lines.append(f"SUT: {'uyumlu' if sut_analysis.get('overall_compliance') else 'uyumsuz'}"
+                 + _findings("Sorunlar", sut_analysis.get("issues", []))
+                 + _findings("Uyarılar", sut_analysis.get("warnings", [])))
+
+    return "\n".join(lines)
+
+
+def pack_payloads(payloads: List[str]) -> str:
+    """Birden fazla reçete yükünü tek mesajda birleştirir"""
+    return f"\n{PACK_SEPARATOR}\n".join(payloads)
+
+
+def estimate_tokens(text: str) -> int:
+    """API'ye gitmeden yaklaşık token sayısı"""
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def estimate_params_tokens(params: Mapping[str, Any]) -> int:
+    """Messages API parametrelerinin (sistem + mesajlar + araç şeması) yaklaşık girdi token sayısı"""
+    system = params.get("system") or ""
+    if isinstance(system, list):
+        system = "".join(block.get("text", "") for block in system)
+    content = "".join(str(message.get("content", "")) for message in params.get("messages", []))
+    tools = json.dumps(params["tools"], ensure_ascii=False) if params.get("tools") else ""
+    return estimate_tokens(system) + estimate_tokens(content) + estimate_tokens(tools)
+
+
+def usage_to_dict(usage: Any) -> Dict[str, int]:
+    """Anthropic/OpenAI usage nesnesini sade sayılara çevirir"""
+    fields = {
+        "input_tokens": ("input_tokens", "prompt_tokens"),
+        "output_tokens": ("output_tokens", "completion_tokens"),
+        "cache_creation_input_tokens": ("cache_creation_input_tokens",),
+        "cache_read_input_tokens": ("cache_read_input_tokens",),
+    }
+    result = {}
+    for name, keys in fields.items():
+        value = 0
+        for key in keys:
+            value = usage.get(key) if isinstance(usage, Mapping) else getattr(usage, key, None)
+            if value:
+                break
+        result[name] = int(value or 0)
+    return result
+
+
+class TokenTally:
+    """Karar başına ve toplam token, gecikme ve maliyet sayacı"""
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._totals = {"calls": 0, "estimated_input_tokens": 0, "latency_seconds": 0.0, "cost": 0.0,
+                            **{field: 0 for field in self.FIELDS}}
+
+    def record(self, usage: Any, estimated_input_tokens: int = 0, latency: float = 0.0,
+               cost: float = 0.0) -> Dict[str, Any]:
+        """Bir çağrıyı kaydeder ve karara eklenecek kullanım özetini döndürür"""
+        entry = {
+            **usage_to_dict(usage),
+            "estimated_input_tokens": estimated_input_tokens,
+            "latency_seconds": round(latency, 4),
+            "cost": round(cost, 6)
+        }
+        with self._lock:
+            self._totals["calls"] += 1
+            for key in (*self.FIELDS, "estimated_input_tokens"):
+                self._totals[key] += entry[key]
+            self._totals["latency_seconds"] += latency
+            self._totals["cost"] += cost
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """Toplamlar ve çağrı başına ortalamalar"""
+        with self._lock:
+            totals = dict(self._totals)
+        calls = totals["calls"]
+        return {
+            **totals,
+            "latency_seconds": round(totals["latency_seconds"], 4),
+            "cost": round(totals["cost"], 6),
+            "avg_input_tokens": round(totals["input_tokens"] / calls, 1) if calls else 0.0,
+            "avg_output_tokens": round(totals["output_tokens"] / calls, 1) if calls else 0.0,
+            "avg_latency_seconds": round(totals["latency_seconds"] / calls, 4) if calls else 0.0,
+            "avg_cost": round(totals["cost"] / calls, 6) if calls else 0.0
+        }
@@ -0,0 +1,308 @@
+"""
+Benzer Reçete Karar İndeksi
+Geçmiş AI kararlarının kanonik reçete özelliklerini (ilaçlar, ICD kodları, mesaj kodları,
+rapor varlığı) hash'lenmiş TF-IDF vektörleri olarak NumPy dizilerinde tutar. Sadece tarih
+veya miktarı değişen kronik tekrar reçetelerde, deterministik kontroller de aynıysa
+önceki karar API çağrısı yapılmadan yeniden kullanılabilir.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+import numpy as np
+from loguru import logger
+
+from ai_analyzer.ai_gating import sut_findings
+from ai_analyzer.decision_cache import _DIGITS_RE, _diagnosis_codes, _drug_entries, _report_validity
+from utils.message_codes import get_prescription_message_codes
+
+# Dizi kapasitesi bu boyuttan başlar ve gerektikçe ikiye katlanır
+INITIAL_CAPACITY = 256
+
+
+def similarity_features(prescription_data: Mapping) -> List[str]:
+    """
+    Reçetenin benzerlik özellikleri
+
+    Miktar, kutu boyutu (ilaç adındaki "28 TABLET" gibi) ve tarihler bilerek dahil
+    edilmez; bunlar deterministik kontrollerin (doz/SUT) imzasıyla karşılaştırılır.
+    """
+    features = []
+    for name, _pack_size, _quantity, messages in _drug_entries(prescription_data.get("drugs", [])):
+        features.append(f"drug:{name}")
+        features.extend(f"drug_msg:{name}:{code}" for code in messages)
+    for code in _diagnosis_codes(prescription_data):
+        features.append(f"icd:{code}")
+        features.append(f"icd3:{code[:3]}")
+    features.extend(f"msg:{message.code}" for message in get_prescription_message_codes(prescription_data))
+    features.append(f"report:{'yes' if _report_validity(prescription_data)['has_report'] else 'no'}")
+    return features
+
+
+def canonical_drug_set(prescription_data: Mapping) -> List[str]:
+    """Reçetedeki kanonik ilaç adları (sıralı, tekrarsız; miktar ve kutu boyutu hariç)"""
+    return sorted({entry[0] for entry in _drug_entries(prescription_data.get("drugs", []))})
+
+
+def deterministic_signature(sut_analysis: Optional[Mapping], sut_recommendation: Optional[Mapping],
+                            extra: Optional[Mapping[str, Any]] = None, drugs: Iterable[str] = ()) -> str:
+    """
+    Yeniden kullanım için birebir eşleşmesi gereken kural sonuçları
+
+    SUT kararı, sürüm, tüm bulgular (ilaç uyarıları, eksik mesaj kodları, genel
+    uyumluluk) ve kanonik ilaç kümesi imzaya girer: benzerlik ne kadar yüksek olursa
+    olsun farklı ilaçlar için verilmiş karar kullanılmaz. Genel bulgulardaki sayılar
+    (reçete yaşı) normalize edilir.
+    """
+    sut_analysis = sut_analysis or {}
+    sut_recommendation = sut_recommendation or {}
+    general = sut_analysis.get("general_compliance")
+    payload = {
+        "action": sut_recommendation.get("action"),
+        "compliance": sut_analysis.get("overall_compliance"),
+        "general_compliant": bool(general.get("compliant", True)) if general else None,
+        "findings": sorted(_DIGITS_RE.sub("#", finding) if finding.startswith("general: ") else finding
+                           for finding in sut_findings(sut_analysis)),
+        "rule_version": sut_analysis.get("rule_version") or "",
+        "drugs": sorted(set(drugs)),
+        "extra": dict(extra or {})
+    }
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class Neighbour(NamedTuple):
+    """Arama sonucu"""
+    key: str
+    similarity: float
+    payload: Dict[str, Any]
+    signature: str
+    created_at: float
+
+
+class SimilarityIndex:
+    """
+    Artımlı güncellenen hash'lenmiş TF-IDF indeksi
+
+    Satırlar ham özellik sayılarıdır; IDF ağırlıkları arama anında belge frekanslarından
+    hesaplanır, böylece ekleme O(dim) kalır; satırların kareleri norm hesabı için ayrıca tutulur. Kapasite dolunca en eski kayıt silinir.
+    """
+
+    def __init__(self, dim: int = 1024, max_entries: int = 20000, path: Optional[str] = None,
+                 ttl_seconds: float = 7 * 24 * 3600, threshold: float = 0.92, top_k: int = 5,
+                 save_every: int = 25):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.top_k = top_k
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((min(INITIAL_CAPACITY, max_entries), dim), dtype=np.float32)
+        self._squared = np.zeros_like(self._matrix)
+        self._created = np.zeros(len(self._matrix), dtype=np.float64)
+        self._df = np.zeros(dim, dtype=np.int64)
+        self._keys: List[str] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._signatures: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._unsaved = 0
+        self._stats = {"lookups": 0, "reuses": 0, "below_threshold": 0, "signature_mismatch": 0,
+                       "search_seconds": 0.0}
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["SimilarityIndex"]:
+        """Ayarlardan indeks oluşturur (karar önbelleği veya AI_SIMILARITY_REUSE kapalıysa None)"""
+        if not (getattr(settings, "ai_decision_cache_enabled", True) and getattr(settings, "ai_similarity_reuse", True)):
+            return None
+        try:
+            return cls(
+                dim=settings.ai_similarity_dim,
+                max_entries=settings.ai_similarity_max_entries,
+                path=settings.ai_similarity_index_path,
+                ttl_seconds=settings.ai_decision_cache_ttl_hours * 3600,
+                threshold=settings.ai_similarity_threshold
+            )
+        except Exception as e:
+            logger.error(f"Benzerlik indeksi açılamadı, indeks olmadan devam ediliyor: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _vector(self, features: Iterable[str]) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        return vector
+
+    def _free_row(self) -> int:
+        """Yeni kayıt için satır (gerekirse büyütür veya en eski kaydı siler)"""
+        size = len(self._keys)
+        if size < len(self._matrix):
+            return size
+        if size < self.max_entries:
+            capacity = min(len(self._matrix) * 2, self.max_entries)
+            self._matrix = np.resize(self._matrix, (capacity, self.dim))
+            self._matrix[size:] = 0
+            self._squared = np.resize(self._squared, (capacity, self.dim))
+            self._squared[size:] = 0
+            self._created = np.resize(self._created, capacity)
+            return size
+
+        row = int(np.argmin(self._created[:size]))
+        self._df -= self._matrix[row] > 0
+        del self._rows[self._keys[row]]
+        return row
+
+    def add(self, key: str, features: Iterable[str], payload: Dict[str, Any], signature: str):
+        """Kararı indekse ekler (aynı anahtar varsa günceller)"""
+        vector = self._vector(features)
+        if not vector.any():
+            return
+
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._df -= self._matrix[row] > 0
+            else:
+                row = self._free_row()
+                if row == len(self._keys):
+                    self._keys.append(key)
+                    self._payloads.append(payload)
+                    self._signatures.append(signature)
+
+            self._matrix[row] = vector
+            self._squared[row] = np.square(vector)
+            self._df += vector > 0
+            self._created[row] = time.time()
+            self._keys[row], self._payloads[row], self._signatures[row] = key, payload, signature
+            self._rows[key] = row
+            self._unsaved += 1
+            autosave = bool(self.path) and self._unsaved >= self.save_every
+
+        if autosave:
+            self.save()
+
+    def search(self, features: Iterable[str], k: Optional[int] = None) -> List[Neighbour]:
+        """Kosinüs benzerliğine göre en yakın k kayıt"""
+        query = self._vector(features)
+        k = k or self.top_k
+        start = time.perf_counter()
+
+        with self._lock:
+            size = len(self._keys)
+            if size == 0 or not query.any():
+                return []
+            matrix = self._matrix[:size]
+            idf = (np.log((1.0 + size) / (1.0 + self._df)) + 1.0).astype(np.float32)
+            weighted_query = query * idf
+            dots = matrix @ (weighted_query * idf)
+            norms = np.sqrt(self._squared[:size] @ np.square(idf)) * np.linalg.norm(weighted_query)
+            similarities = dots / np.maximum(norms, 1e-12)
+
+            if size > k:
+                top = np.argpartition(-similarities, k)[:k]
+            else:
+                top = np.arange(size)
+            top = top[np.argsort(-similarities[top])]
+            result = [Neighbour(self._keys[row], float(similarities[row]), self._payloads[row],
+                                self._signatures[row], float(self._created[row])) for row in top]
+            self._stats["search_seconds"] += time.perf_counter() - start
+        return result
+
+    def find_reusable(self, features: Iterable[str], signature: str) -> Optional[Neighbour]:
+        """
+        Kararı yeniden kullanılabilecek en yakın kayıt
+
+        Benzerlik eşiği aşılmalı, deterministik imza birebir aynı olmalı ve kayıt
+        süresi dolmamış olmalı.
+        """
+        neighbours = self.search(features)
+        now = time.time()
+        with self._lock:
+            self._stats["lookups"] += 1
+            close = [n for n in neighbours if n.similarity >= self.threshold and now - n.created_at <= self.ttl_seconds]
+            if not close:
+                self._stats["below_threshold"] += 1
+                return None
+            for neighbour in close:
+                if neighbour.signature == signature:
+                    self._stats["reuses"] += 1
+                    return neighbour
+            self._stats["signature_mismatch"] += 1
+        return None
+
+    def save(self, path: Optional[str] = None):
+        """İndeksi .npz dosyasına yazar"""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            size = len(self._keys)
+            meta = json.dumps({"keys": self._keys, "payloads": self._payloads, "signatures": self._signatures},
+                              ensure_ascii=False, default=str)
+            arrays = {"matrix": self._matrix[:size].copy(), "created": self._created[:size].copy(),
+                      "df": self._df.copy(), "meta": np.array(meta)}
+            self._unsaved = 0
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{path}.tmp.npz"
+            np.savez_compressed(temp_path, **arrays)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.error(f"Benzerlik indeksi kaydedilemedi: {e}")
+
+    def load(self, path: str):
+        """Kaydedilmiş indeksi yükler (boyut uyuşmazsa yok sayılır)"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                matrix = data["matrix"]
+                if matrix.shape[1] != self.dim:
+                    logger.warning(f"Benzerlik indeksi boyutu farklı ({matrix.shape[1]} != {self.dim}), yok sayıldı")
+                    return
+                meta = json.loads(str(data["meta"]))
+                created, df = data["created"], data["df"]
+        except Exception as e:
+            logger.error(f"Benzerlik indeksi yüklenemedi: {e}")
+            return
+
+        size = min(len(meta["keys"]), self.max_entries)
+        with self._lock:
+            capacity = max(size, min(INITIAL_CAPACITY, self.max_entries))
+            self._matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            self._matrix[:size] = matrix[:size]
+            self._squared = np.square(self._matrix)
+            self._created = np.zeros(capacity, dtype=np.float64)
+            self._created[:size] = created[:size]
+            self._df = df.astype(np.int64) if size == len(meta["keys"]) else (self._matrix[:size] > 0).sum(axis=0)
+            self._keys = list(meta["keys"][:size])
+            self._payloads = list(meta["payloads"][:size])
+            self._signatures = list(meta["signatures"][:size])
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+        logger.info(f"Benzerlik indeksi yüklendi: {size} karar")
+
+    def stats(self) -> Dict[str, Any]:
+        """Yeniden kullanım oranı ve ortalama arama süresi"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._keys)
+        lookups = stats["lookups"]
+        search_seconds = stats.pop("search_seconds")
+        return {
+            **stats,
+            "entries": entries,
+            "reuse_rate": round(stats["reuses"] / lookups, 4) if lookups else 0.0,
+            "avg_search_ms": round(search_seconds * 1000 / lookups, 3) if lookups else 0.0
+        }
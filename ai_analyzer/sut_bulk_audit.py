@@ -0,0 +1,354 @@
+"""
+Toplu SUT Denetimi
+Deterministik SUT kontrollerini (rapor zorunluluğu, tanı uyumu, mesaj kodu,
+reçete yaşı) çok sayıda reçete üzerinde numpy indeks/maske işlemleriyle çalıştırır
+"""
+
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.drug_names import canonicalize_drug_name
+from utils.icd10 import normalize_icd_code
+from utils.message_codes import extract_message_codes
+from ai_analyzer.sut_rule_engine import SUTRuleSnapshot, get_rule_snapshot
+
+# get_sut_analysis_for_prescription ile aynı bulgu kategorileri ve önem dereceleri
+ISSUE_CATEGORIES = {
+    "diagnosis_mismatch": "issue",
+    "report_required": "issue",
+    "drug_not_found": "warning",
+    "missing_message_code": "message",
+    "patient_tc_missing": "general",
+    "prescription_too_old": "general",
+    "invalid_prescription_date": "general",
+}
+
+PRESCRIPTION_COLUMNS = ("recete_no", "hasta_tc", "recete_tarihi", "ilac_mesajlari")
+
+ISSUE_COLUMNS = ["recete_no", "drug_name", "category", "severity", "detail"]
+
+SUMMARY_COLUMNS = ["recete_no", "overall_compliance", "issue_count", "warning_count"]
+
+
+def explode_prescriptions(prescriptions: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> Dict[str, pd.DataFrame]:
+    """
+    Reçeteleri düz tablolara açar
+
+    Args:
+        prescriptions: Reçete dict listesi veya aynı alanlara sahip DataFrame
+
+    Returns:
+        Dict: prescriptions (rx_id, recete_no, hasta_tc, recete_tarihi,
+            ilac_mesajlari, rapor_numarasi), drug_lines (rx_id, drug_name),
+            diagnoses (rx_id, code)
+    """
+    if isinstance(prescriptions, pd.DataFrame):
+        records = prescriptions.to_dict("records")
+    else:
+        records = prescriptions if isinstance(prescriptions, list) else list(prescriptions)
+
+    # Her reçete sözlüğü tek geçişte okunur; tablolar sonda bir kez kurulur
+    columns = {column: [] for column in (*PRESCRIPTION_COLUMNS, "rapor_numarasi")}
+    recete_nos, tcs, dates, messages, report_numbers = (columns[column].append for column in columns)
+    line_rx, names, diagnosis_rx, codes = [], [], [], []
+    for rx_id, record in enumerate(records):
+        get = record.get
+        recete_nos(get("recete_no"))
+        tcs(get("hasta_tc"))
+        dates(get("recete_tarihi"))
+        messages(get("ilac_mesajlari"))
+
+        report = get("report_details")
+        if isinstance(report, dict):
+            report_numbers(report.get("rapor_numarasi") or "")
+            for tani in report.get("tani_bilgileri") or ():
+                code = tani.get("tani_kodu") if isinstance(tani, dict) else (tani if isinstance(tani, str) else None)
+                if code is not None:
+                    diagnosis_rx.append(rx_id)
+                    codes.append(str(code))
+        else:
+            report_numbers("")
+
+        drugs = get("drugs")
+        if isinstance(drugs, list):
+            for drug in drugs:
+                line_rx.append(rx_id)
+                names.append(drug.get("ilac_adi", "") if isinstance(drug, dict) else str(drug))
+
+    frame = pd.DataFrame({column: pd.Series(values, dtype=object) for column, values in columns.items()})
+    frame.insert(0, "rx_id", np.arange(len(frame), dtype=np.int64))
+    return {
+        "prescriptions": frame,
+        "drug_lines": pd.DataFrame({"rx_id": np.asarray(line_rx, dtype=np.int64),
+                                    "drug_name": pd.Series(names, dtype=object)}),
+        "diagnoses": pd.DataFrame({"rx_id": np.asarray(diagnosis_rx, dtype=np.int64),
+                                   "code": pd.Series(codes, dtype=object)}),
+    }
+
+
+def _object_array(values) -> np.ndarray:
+    """Listeyi tek boyutlu object dizisine çevirir"""
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _rule_tables(snapshot: SUTRuleSnapshot) -> Dict[str, Any]:
+    """Snapshot'taki ilaç kurallarını kural indeksine göre dizilere çevirir"""
+    rule_keys = list(snapshot.drugs_by_canonical)
+    report_required = np.zeros(len(rule_keys) + 1, dtype=bool)
+    requires_diagnosis = np.zeros(len(rule_keys) + 1, dtype=bool)
+    requirement_ids: Dict[str, int] = {}
+    diagnoses, message_codes = [], []
+    for rule_id, rule_key in enumerate(rule_keys):
+        requirements = snapshot.drugs_by_canonical[rule_key]
+        required = requirements.get("required_diagnosis", ())
+        report_required[rule_id] = bool(requirements.get("report_required", False))
+        requires_diagnosis[rule_id] = bool(required)
+        for code in required:
+            requirement_id = requirement_ids.setdefault(normalize_icd_code(code), len(requirement_ids))
+            diagnoses.append((rule_id, requirement_id))
+        message_codes.extend((rule_id, int(code)) for code in requirements.get("message_codes", ()))
+
+    # Son indeks (len(rule_keys)) kuralı bulunmayan ilaç satırları içindir
+    return {
+        "rule_keys": _object_array(rule_keys + [None]),
+        "rule_ids": {rule_key: rule_id for rule_id, rule_key in enumerate(rule_keys)},
+        "report_required": report_required,
+        "requires_diagnosis": requires_diagnosis,
+        "requirement_ids": requirement_ids,
+        "diagnoses": _grouped_values(diagnoses, len(rule_keys) + 1),
+        "message_codes": _grouped_values(message_codes, len(rule_keys) + 1),
+    }
+
+
+def _grouped_values(pairs, group_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(grup indeksi, tamsayı değer) çiftlerini CSR biçimine çevirir: (grup başlangıç ofsetleri, değerler)"""
+    group_ids = np.fromiter((group_id for group_id, _ in pairs), dtype=np.int64, count=len(pairs))
+    values = np.fromiter((value for _, value in pairs), dtype=np.int64, count=len(pairs))
+    offsets = np.zeros(group_count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(group_ids, minlength=group_count))
+    return offsets, values[np.argsort(group_ids, kind="stable")]
+
+
+def _expand(rows: np.ndarray, group_ids: np.ndarray, grouped: Tuple[np.ndarray, np.ndarray]
+            ) -> Tuple[np.ndarray, np.ndarray]:
+    """Her satırı grubunun değerleriyle çoğaltır (merge yerine): (satır, değer) dizileri"""
+    offsets, values = grouped
+    starts = offsets[group_ids]
+    counts = offsets[group_ids + 1] - starts
+    # Satırın grup dilimindeki sırası: 0..count-1
+    within = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(rows, counts), values[np.repeat(starts, counts) + within]
+
+
+def _map_unique(values, func) -> np.ndarray:
+    """Fonksiyonu sadece tekil değerlere uygular (ilaç adı, ICD kodu ve tarih çok tekrarlanır)"""
+    codes, uniques = pd.factorize(values)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(value) for value in uniques]
+    return mapped[codes]
+
+
+def _required_prefixes(code: str, requirement_ids: Dict[str, int]) -> tuple:
+    """Tanı kodunun kurallarda gerekli olan önekleri ("E11.9" -> E11 gerekliliği)"""
+    normalized = normalize_icd_code(code)
+    prefixes = (normalized[:length] for length in range(1, len(normalized) + 1))
+    return tuple(requirement_ids[prefix] for prefix in prefixes if prefix in requirement_ids)
+
+
+def _prescription_age(date_text: str, as_of: datetime):
+    """GG/AA/YYYY reçete tarihinin gün cinsinden yaşı; kontrol dışıysa None, geçersizse "invalid" """
+    date_parts = date_text.split("/") if date_text else ()
+    if len(date_parts) != 3:
+        return None
+    try:
+        day, month, year = date_parts
+        return (as_of - datetime(int(year), int(month), int(day))).days
+    except ValueError:
+        return "invalid"
+
+
+def _factorize_text(frame: pd.DataFrame, column: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sütunu metin olarak tekilleştirir, eksik değerler boş metin sayılır: (kodlar, tekil metinler)"""
+    codes, uniques = pd.factorize(frame[column].to_numpy(dtype=object))
+    texts = [str(value) for value in uniques]
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(texts), codes)
+        texts.append("")
+    return codes, _object_array(texts)
+
+
+def _issues(rx_ids: np.ndarray, category: str, detail, drug_names: Optional[np.ndarray] = None
+            ) -> Tuple[str, np.ndarray, np.ndarray, np.ndarray]:
+    """Bir kategorinin bulguları: (kategori, rx_id, ilaç adı, açıklama) dizileri"""
+    if drug_names is None:
+        drug_names = np.full(len(rx_ids), "", dtype=object)
+    details = detail if isinstance(detail, np.ndarray) else np.full(len(rx_ids), detail, dtype=object)
+    return category, rx_ids.astype(np.int64, copy=False), drug_names, details
+
+
+def audit_exploded(tables: Dict[str, pd.DataFrame], snapshot: Optional[SUTRuleSnapshot] = None,
+                   as_of: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Düz tablolar (explode_prescriptions çıktısı) üzerinde SUT kontrollerini çalıştırır
+
+    Args:
+        tables: prescriptions, drug_lines ve diagnoses tabloları (rx_id 0..n-1)
+        snapshot: Kural snapshot'ı (varsayılan: aktif snapshot)
+        as_of: Reçete yaşı için referans tarih (varsayılan: şimdi)
+
+    Returns:
+        Dict: rule_version, issues ve prescriptions DataFrame'leri
+    """
+    snapshot = snapshot or get_rule_snapshot()
+    as_of = as_of or datetime.now()
+    rules = _rule_tables(snapshot)
+
+    frame = tables["prescriptions"]
+    rx_count = len(frame)
+    if not rx_count:
+        return {
+            "rule_version": snapshot.snapshot_id,
+            "issues": pd.DataFrame(columns=ISSUE_COLUMNS),
+            "prescriptions": pd.DataFrame(columns=SUMMARY_COLUMNS)
+        }
+
+    # Kontroller pandas sütunları yerine numpy dizileri üzerinde çalışır
+    line_rx = tables["drug_lines"]["rx_id"].to_numpy(dtype=np.int64)
+    line_names = tables["drug_lines"]["drug_name"].to_numpy(dtype=object)
+    no_rule = len(rules["rule_keys"]) - 1
+
+    # İlaç satırı -> kural indeksi (tekil ilaç adı başına bir kez kanonikleştirilir)
+    rule_ids = _map_unique(line_names, lambda name: rules["rule_ids"].get(
+        snapshot.find_drug_rule_key(canonicalize_drug_name(name).brand), no_rule)).astype(np.int64)
+    found = []
+
+    # Kuralı olmayan ilaçlar
+    missing = np.flatnonzero(rule_ids == no_rule)
+    found.append(_issues(line_rx[missing], "drug_not_found",
+                         _map_unique(line_names[missing], "Drug {} not found in SUT database".format),
+                         line_names[missing]))
+
+    # Tanı uyumu: gerekli kodlardan biri reçete tanılarından birinin öneki olmalı (hiyerarşik eşleşme)
+    required = np.flatnonzero(rules["requires_diagnosis"][rule_ids])
+    candidate_lines, candidate_codes = _expand(required, rule_ids[required], rules["diagnoses"])
+    requirement_ids = rules["requirement_ids"]
+    width = len(requirement_ids) + 1
+
+    # Reçete tanıları -> karşıladıkları gereklilikler (tekil tanı kodu başına bir kez hesaplanır)
+    diagnoses = tables["diagnoses"]
+    code_ids, unique_codes = pd.factorize(diagnoses["code"].to_numpy(dtype=object))
+    prefixes = [(code_id, requirement_id) for code_id, code in enumerate(unique_codes)
+                for requirement_id in _required_prefixes(code, requirement_ids)]
+    covering_rx, covering_ids = _expand(diagnoses["rx_id"].to_numpy(dtype=np.int64), code_ids,
+                                        _grouped_values(prefixes, len(unique_codes)))
+    covering_keys = covering_rx * width + covering_ids
+    candidate_keys = line_rx[candidate_lines] * width + candidate_codes
+    covered = np.zeros(len(line_rx), dtype=bool)
+    covered[candidate_lines[np.isin(candidate_keys, covering_keys)]] = True
+    mismatched = required[~covered[required]]
+    found.append(_issues(line_rx[mismatched], "diagnosis_mismatch",
+                         _map_unique(rules["rule_keys"][rule_ids[mismatched]],
+                                     "Required diagnoses for {} not found".format),
+                         line_names[mismatched]))
+
+    # Rapor zorunluluğu
+    report_numbers = frame["rapor_numarasi"].to_numpy(dtype=object)
+    report_needed = np.flatnonzero(rules["report_required"][rule_ids])
+    without_report = report_needed[report_numbers[line_rx[report_needed]] == ""]
+    found.append(_issues(line_rx[without_report], "report_required",
+                         _map_unique(line_names[without_report], "Report required for {} but not found".format),
+                         line_names[without_report]))
+
+    # Mesaj kodları: tekil mesaj metni başına bir kez çıkarılır, beklenen kodlar metin kimliğiyle aranır
+    text_ids, unique_texts = _factorize_text(frame, "ilac_mesajlari")
+    present_keys = np.fromiter(
+        (text_id * 10000 + int(code) for text_id, text in enumerate(unique_texts)
+         for code, _, _ in extract_message_codes(text)),
+        dtype=np.int64
+    )
+    matched = np.flatnonzero(rule_ids != no_rule)
+    expected_lines, expected_codes = _expand(matched, rule_ids[matched], rules["message_codes"])
+    absent = ~np.isin(text_ids[line_rx[expected_lines]] * 10000 + expected_codes, present_keys)
+    absent_lines = expected_lines[absent]
+    found.append(_issues(line_rx[absent_lines], "missing_message_code",
+                         _map_unique(expected_codes[absent], "Missing message code {}".format),
+                         line_names[absent_lines]))
+
+    # Genel kurallar
+    rx_ids = np.arange(rx_count, dtype=np.int64)
+    tc_ids, unique_tcs = _factorize_text(frame, "hasta_tc")
+    found.append(_issues(rx_ids[(unique_tcs == "")[tc_ids]], "patient_tc_missing", "Patient TC number missing"))
+
+    date_ids, unique_dates = _factorize_text(frame, "recete_tarihi")
+    unique_ages = [_prescription_age(date_text, as_of) for date_text in unique_dates]
+    invalid = np.array([age == "invalid" for age in unique_ages], dtype=bool)[date_ids]
+    found.append(_issues(rx_ids[invalid], "invalid_prescription_date", "Invalid prescription date format"))
+
+    ages = np.array([age if isinstance(age, int) else -1 for age in unique_ages], dtype=np.int64)[date_ids]
+    old = np.flatnonzero(ages > snapshot.rules["general_rules"]["max_prescription_age_days"])
+    found.append(_issues(old, "prescription_too_old",
+                         _map_unique(ages[old], "Prescription too old: {} days".format)))
+
+    # Bulguları tek tabloda, reçete sırasıyla birleştir
+    categories, rx_arrays, drug_arrays, detail_arrays = zip(*found)
+    issue_rx = np.concatenate(rx_arrays)
+    order = np.argsort(issue_rx, kind="stable")
+    sizes = [len(rx_array) for rx_array in rx_arrays]
+    issues = pd.DataFrame({
+        "recete_no": frame["recete_no"].to_numpy(dtype=object)[issue_rx[order]],
+        "drug_name": np.concatenate(drug_arrays)[order],
+        "category": np.repeat(np.array(categories, dtype=object), sizes)[order],
+        "severity": np.repeat(np.array([ISSUE_CATEGORIES[c] for c in categories], dtype=object), sizes)[order],
+        "detail": np.concatenate(detail_arrays)[order],
+    }, columns=ISSUE_COLUMNS, dtype=object)
+
+    def count_by_severity(severity):
+        selected = [rx_array for category, rx_array in zip(categories, rx_arrays)
+                    if ISSUE_CATEGORIES[category] == severity]
+        return np.bincount(np.concatenate(selected), minlength=rx_count)
+
+    issue_count = count_by_severity("issue")
+    summary = pd.DataFrame({
+        "recete_no": frame["recete_no"].to_numpy(dtype=object),
+        "overall_compliance": issue_count == 0,
+        "issue_count": issue_count,
+        "warning_count": count_by_severity("warning")
+    })
+
+    logger.info(f"Toplu SUT denetimi: {rx_count} reçete, {len(line_rx)} ilaç satırı, "
+                f"{len(issues)} bulgu (sürüm: {snapshot.snapshot_id})")
+    return {
+        "rule_version": snapshot.snapshot_id,
+        "issues": issues,
+        "prescriptions": summary
+    }
+
+
+def audit_prescriptions(prescriptions: Union[pd.DataFrame, Iterable[Dict[str, Any]]],
+                        snapshot: Optional[SUTRuleSnapshot] = None,
+                        as_of: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Deterministik SUT kontrollerini toplu olarak çalıştırır
+
+    Args:
+        prescriptions: Reçete dict listesi veya aynı alanlara sahip DataFrame
+        snapshot: Kural snapshot'ı (varsayılan: aktif snapshot)
+        as_of: Reçete yaşı için referans tarih (varsayılan: şimdi)
+
+    Returns:
+        Dict: rule_version, issues (DataFrame: recete_no, drug_name, category,
+            severity, detail), prescriptions (DataFrame: recete_no,
+            overall_compliance, issue_count, warning_count)
+    """
+    return audit_exploded(explode_prescriptions(prescriptions), snapshot, as_of)
@@ -0,0 +1,270 @@
+"""
+Derlenmiş SUT Kural Motoru
+SUT kurallarını harici veri dosyasından yükler, arama indekslerine derler ve
+süreç genelinde değiştirilemez bir snapshot olarak paylaşır
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+from loguru import logger
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.drug_names import fold_turkish
+from utils.icd10 import ICDPrefixIndex
+from utils.text_matching import AhoCorasick, PrefixTrie
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / "data" / "sut_rules.json"
+SUPPORTED_SCHEMA_VERSIONS = (1,)
+DRUG_RULE_CACHE_SIZE = 16384  # Snapshot başına çözülmüş kanonik marka sayısı
+
+
+def _freeze(value):
+    """Dict/list yapılarını salt okunur karşılıklarına çevirir"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class SUTRuleSnapshot:
+    """
+    Derlenmiş, değiştirilemez SUT kural snapshot'ı
+
+    Kural verisi ve indeksler yükleme anında bir kez kurulur. Hot reload
+    yeni bir snapshot oluşturur; eski snapshot'ı tutan analizler kendi
+    sürümleriyle tamamlanır.
+    """
+
+    def __init__(self, document: Dict[str, Any], source_path: Optional[Path] = None, content_hash: str = "",
+                 source_text: Optional[str] = None):
+        schema_version = document.get("schema_version", 1)
+        if schema_version not in SUPPORTED_SCHEMA_VERSIONS:
+            raise ValueError(f"Unsupported SUT rules schema version: {schema_version}")
+
+        self.version = str(document.get("version", "unknown"))
+        self.snapshot_id = f"{self.version}-{content_hash[:12]}" if content_hash else self.version
+        self.source_path = source_path
+        self.source_text = source_text  # Sürüm geçmişi ve diff için ham kural dosyası
+        self.loaded_at = datetime.now().isoformat()
+
+        self.rules = _freeze(document.get("rules", {}))
+        self.drug_diagnosis_mapping = _freeze(document.get("drugs", {}))
+        self.message_codes = _freeze(document.get("message_codes", {}))
+
+        self.drugs_by_canonical, self.drugs_by_message_code = self._compile_indexes()
+        self.drug_matcher, self.drug_prefix_trie = self._compile_drug_matchers()
+
+        # Gerekli tanı listesi -> hiyerarşik ICD indeksi (aynı listeyi paylaşan ilaçlar tek indeks kullanır)
+        self.diagnosis_indexes: Dict[Tuple[str, ...], ICDPrefixIndex] = {}
+        for requirements in self.drug_diagnosis_mapping.values():
+            required = requirements.get("required_diagnosis")
+            if required and required not in self.diagnosis_indexes:
+                self.diagnosis_indexes[required] = ICDPrefixIndex({code: code for code in required})
+
+        # Kanonik marka -> (kural anahtarı, gereksinimler); serbest metinden geldiği için sınırlı LRU
+        self.drug_rule = lru_cache(maxsize=DRUG_RULE_CACHE_SIZE)(self._resolve_drug_rule)
+
+    def _compile_indexes(self) -> Tuple[Mapping, Mapping]:
+        """Kanonik ilaç ve mesaj kodu indekslerini kurar"""
+        by_canonical = {}
+        by_message_code: Dict[str, list] = {}
+
+        for drug_key, requirements in self.drug_diagnosis_mapping.items():
+            canonical_key = fold_turkish(drug_key)
+            by_canonical[canonical_key] = requirements
+
+            for message_code in requirements.get("message_codes", ()):
+                by_message_code.setdefault(str(message_code), []).append(canonical_key)
+
+        return (
+            MappingProxyType(by_canonical),
+            MappingProxyType({key: tuple(value) for key, value in by_message_code.items()})
+        )
+
+    def _compile_drug_matchers(self) -> Tuple[AhoCorasick, PrefixTrie]:
+        """Kısmi ilaç adı eşleştirmesi için otomat ve önek ağacını kurar"""
+        matcher = AhoCorasick()
+        prefix_trie = PrefixTrie()
+
+        for canonical_key in self.drugs_by_canonical:
+            matcher.add(canonical_key)
+            prefix_trie.insert(canonical_key)
+
+        return matcher.build(), prefix_trie
+
+    def match_drug(self, text: str) -> Optional[str]:
+        """
+        Kısmi ilaç adı eşleştirmesi (metin uzunluğu ile doğrusal)
+
+        Önce metin içinde geçen en uzun kural anahtarı, bulunamazsa metinle
+        başlayan en kısa kural anahtarı döndürülür (kısaltılmış Medula adları).
+
+        Args:
+            text: Kanonik marka adı veya kelimesi
+
+        Returns:
+            Optional[str]: Eşleşen kanonik kural anahtarı
+        """
+        if not text:
+            return None
+
+        match = self.drug_matcher.longest_match(text)
+        if match:
+            return match[2]
+
+        return self.drug_prefix_trie.first_with_prefix(text)
+
+    def find_drug_rule_key(self, brand: str) -> Optional[str]:
+        """Kanonik marka adına göre eşleşen kural anahtarını bulur (tam ad, ilk kelime, kısmi eşleşme)"""
+        if not brand:
+            return None
+
+        if brand in self.drugs_by_canonical:
+            return brand
+
+        first_word = brand.split()[0]
+        if first_word in self.drugs_by_canonical:
+            return first_word
+
+        # Partial match: derlenmiş otomat ile ilk kelime içinde/önünde geçen kural
+        return self.match_drug(first_word)
+
+    def _resolve_drug_rule(self, brand: str) -> Tuple[Optional[str], Optional[Mapping]]:
+        """Kanonik marka için (kural anahtarı, gereksinimler); bulunamazsa (None, None)"""
+        rule_key = self.find_drug_rule_key(brand)
+        return (rule_key, self.get_drug(rule_key)) if rule_key else (None, None)
+
+    def diagnosis_index(self, required_diagnoses) -> ICDPrefixIndex:
+        """Gerekli tanı listesi için derlenmiş hiyerarşik ICD indeksi"""
+        key = tuple(required_diagnoses)
+        index = self.diagnosis_indexes.get(key)
+        if index is None:
+            index = ICDPrefixIndex({code: code for code in key})
+            self.diagnosis_indexes[key] = index
+        return index
+
+    def get_drug(self, canonical_brand: str) -> Optional[Mapping]:
+        """Kanonik marka adıyla ilaç kuralını döndürür"""
+        return self.drugs_by_canonical.get(canonical_brand)
+
+    def summary(self) -> Dict[str, Any]:
+        """Snapshot özet bilgisi"""
+        return {
+            "version": self.version,
+            "snapshot_id": self.snapshot_id,
+            "source": str(self.source_path) if self.source_path else None,
+            "loaded_at": self.loaded_at,
+            "drugs": len(self.drug_diagnosis_mapping),
+            "message_codes": len(self.message_codes),
+            "diagnosis_indexes": len(self.diagnosis_indexes)
+        }
+
+
+def load_rule_snapshot(path: Optional[Path] = None) -> SUTRuleSnapshot:
+    """
+    Kural dosyasını okuyup derlenmiş snapshot oluşturur
+
+    Args:
+        path: JSON kural dosyası (varsayılan: SUT_RULES_FILE ortam değişkeni veya data/sut_rules.json)
+
+    Returns:
+        SUTRuleSnapshot: Derlenmiş snapshot
+    """
+    rules_path = Path(path or os.getenv("SUT_RULES_FILE") or DEFAULT_RULES_PATH)
+
+    with open(rules_path, "rb") as f:
+        content = f.read()
+
+    snapshot = snapshot_from_text(content.decode("utf-8"), rules_path)
+
+    logger.info(f"SUT kural snapshot'ı derlendi: {snapshot.snapshot_id} "
+                f"({len(snapshot.drug_diagnosis_mapping)} ilaç, {len(snapshot.message_codes)} mesaj kodu)")
+    return snapshot
+
+
+def snapshot_from_text(source_text: str, source_path: Optional[Path] = None) -> SUTRuleSnapshot:
+    """Ham kural metninden snapshot oluşturur (aynı metin her zaman aynı snapshot_id'yi verir)"""
+    content_hash = hashlib.sha256(source_text.encode("utf-8")).hexdigest()
+    return SUTRuleSnapshot(json.loads(source_text), source_path, content_hash, source_text)
+
+
+# Süreç genelinde paylaşılan snapshot
+_current_snapshot: Optional[SUTRuleSnapshot] = None
+_snapshot_lock = threading.Lock()
+_snapshot_mtime: Optional[float] = None
+
+
+def get_rule_snapshot() -> SUTRuleSnapshot:
+    """Aktif kural snapshot'ını döndürür (ilk çağrıda yüklenir, okuma kilitsizdir)"""
+    snapshot = _current_snapshot
+    if snapshot is not None:
+        return snapshot
+
+    with _snapshot_lock:
+        if _current_snapshot is None:
+            _install_snapshot(load_rule_snapshot())
+        return _current_snapshot
+
+
+def reload_rule_snapshot(path: Optional[Path] = None) -> SUTRuleSnapshot:
+    """
+    Kural dosyasını yeniden derleyip aktif snapshot'ı atomik olarak değiştirir
+
+    Derleme kilit dışında yapılır; devam eden analizler ellerindeki eski
+    snapshot ile çalışmaya devam eder. Derleme hatasında aktif snapshot
+    değişmez ve hata yükseltilir.
+    """
+    new_snapshot = load_rule_snapshot(path)
+
+    with _snapshot_lock:
+        previous = _current_snapshot
+        _install_snapshot(new_snapshot)
+
+    logger.info(f"SUT kuralları yeniden yüklendi: "
+                f"{previous.snapshot_id if previous else '-'} -> {new_snapshot.snapshot_id}")
+    return new_snapshot
+
+
+def reload_rule_snapshot_if_changed() -> bool:
+    """Kural dosyası değiştiyse yeniden yükler (zamanlanmış kontroller için)"""
+    snapshot = get_rule_snapshot()
+    if snapshot.source_path is None:
+        return False
+
+    try:
+        mtime = os.path.getmtime(snapshot.source_path)
+    except OSError as e:
+        logger.error(f"SUT kural dosyası okunamadı: {e}")
+        return False
+
+    if _snapshot_mtime is not None and mtime <= _snapshot_mtime:
+        return False
+
+    try:
+        reload_rule_snapshot(snapshot.source_path)
+        return True
+    except Exception as e:
+        logger.error(f"SUT kuralları yeniden yüklenemedi, mevcut snapshot korunuyor: {e}")
+        return False
+
+
+def _install_snapshot(snapshot: SUTRuleSnapshot):
+    """Snapshot'ı aktif yapar (_snapshot_lock altında çağrılmalı)"""
+    global _current_snapshot, _snapshot_mtime
+    _current_snapshot = snapshot
+
+    try:
+        _snapshot_mtime = os.path.getmtime(snapshot.source_path) if snapshot.source_path else None
+    except OSError:
+        _snapshot_mtime = None
@@ -0,0 +1,219 @@
+"""
+SUT Kural Sürüm Geçmişi
+Kural snapshot'larını saklar, sürümler arası farkı çıkarır ve kural değişikliğinden
+etkilenen kayıtlı reçeteleri normalize kural anahtarları üzerinden seçer
+"""
+
+import os
+import sys
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Set
+from loguru import logger
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.icd10 import normalize_icd_code
+from ai_analyzer.sut_rule_engine import SUTRuleSnapshot, snapshot_from_text
+
+# Değişmesi tüm kayıtlı kararları etkileyen kural bölümleri dışında kalanlar
+TARGETED_RULE_SECTIONS = ("report_requirements",)
+
+
+def _thaw(value):
+    """Snapshot'taki salt okunur yapıları karşılaştırma için düz dict/list'e çevirir"""
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def _diff_mapping(old, new) -> Dict[str, List[str]]:
+    """İki eşleme arasında eklenen, silinen ve değişen anahtarlar"""
+    return {
+        "added": sorted(key for key in new if key not in old),
+        "removed": sorted(key for key in old if key not in new),
+        "changed": sorted(key for key in new if key in old and _thaw(old[key]) != _thaw(new[key]))
+    }
+
+
+def diff_rule_snapshots(old: SUTRuleSnapshot, new: SUTRuleSnapshot) -> Dict[str, Any]:
+    """
+    İki kural snapshot'ı arasındaki farkı çıkarır
+
+    İlaçlar kanonik kural anahtarına göre karşılaştırılır. Sonuçtaki
+    affected_keys kayıtlı kararların rule_keys alanıyla birebir, affected_icd_prefixes
+    ise hiyerarşik (önek) olarak eşleştirilir. general_rules gibi tüm reçetelere
+    uygulanan bölümlerdeki değişiklik full_reevaluation ile işaretlenir.
+
+    Args:
+        old: Önceki snapshot
+        new: Yeni snapshot
+
+    Returns:
+        Dict: from, to, drugs, message_codes, rule_sections, affected_keys,
+            affected_icd_prefixes, full_reevaluation
+    """
+    drugs = _diff_mapping(old.drugs_by_canonical, new.drugs_by_canonical)
+    message_codes = _diff_mapping(old.message_codes, new.message_codes)
+    rule_sections = _diff_mapping(old.rules, new.rules)
+
+    affected_keys: Set[str] = set()
+    for drug_key in drugs["removed"] + drugs["changed"]:
+        affected_keys.add(f"drug:{drug_key}")
+
+    for code in message_codes["added"] + message_codes["removed"] + message_codes["changed"]:
+        affected_keys.add(f"message_code:{code}")
+        # Kodu gerektiren ilaçlar (eski veya yeni sürümde)
+        for snapshot in (old, new):
+            for drug_key in snapshot.drugs_by_message_code.get(str(code), ()):
+                affected_keys.add(f"drug:{drug_key}")
+
+    # Rapor gereksinimleri ICD kod grupları üzerinden hedeflenir
+    affected_icd_prefixes: Set[str] = set()
+    report_changes = {"added": [], "removed": [], "changed": []}
+    changed_sections = sorted(set().union(*rule_sections.values()))
+    if "report_requirements" in changed_sections:
+        old_reports = old.rules.get("report_requirements", MappingProxyType({}))
+        new_reports = new.rules.get("report_requirements", MappingProxyType({}))
+        report_changes = _diff_mapping(old_reports, new_reports)
+        for name in set().union(*report_changes.values()):
+            for reports in (old_reports, new_reports):
+                for icd_code in reports.get(name, {}).get("icd_codes", ()):
+                    affected_icd_prefixes.add(normalize_icd_code(icd_code))
+
+    return {
+        "from": old.snapshot_id,
+        "to": new.snapshot_id,
+        "drugs": drugs,
+        "message_codes": message_codes,
+        "rule_sections": changed_sections,
+        "report_requirements": report_changes,
+        "affected_keys": sorted(affected_keys),
+        "affected_icd_prefixes": sorted(affected_icd_prefixes),
+        "full_reevaluation": any(section not in TARGETED_RULE_SECTIONS for section in changed_sections)
+    }
+
+
+def has_changes(diff: Dict[str, Any]) -> bool:
+    """Farkın herhangi bir kural değişikliği içerip içermediği"""
+    return bool(diff["full_reevaluation"] or diff["affected_keys"] or diff["affected_icd_prefixes"]
+                or diff["drugs"]["added"])
+
+
+class RuleVersionStore:
+    """Kural snapshot'larını ve karar başına kural sürümü/anahtarlarını SQLite'ta tutar"""
+
+    def __init__(self, database):
+        self.database = database
+        self._recorded_snapshots: Set[str] = set()
+
+    def record_snapshot(self, snapshot: SUTRuleSnapshot) -> bool:
+        """Snapshot içeriğini (sürüm başına bir kez) kaydeder"""
+        if snapshot.snapshot_id in self._recorded_snapshots:
+            return True
+        if snapshot.source_text is None:
+            logger.warning(f"Kural snapshot'ı ham içerik olmadan kaydedilemez: {snapshot.snapshot_id}")
+            return False
+
+        if self.database.save_rule_snapshot(snapshot.snapshot_id, snapshot.version, snapshot.source_text):
+            self._recorded_snapshots.add(snapshot.snapshot_id)
+            return True
+        return False
+
+    def load_snapshot(self, snapshot_id: str) -> Optional[SUTRuleSnapshot]:
+        """Kayıtlı snapshot'ı yeniden derler (aynı içerik aynı snapshot_id'yi verir)"""
+        content = self.database.get_rule_snapshot_content(snapshot_id)
+        if content is None:
+            return None
+        return snapshot_from_text(content)
+
+    def record_decision(self, recete_no: str, snapshot_id: str, rule_keys: List[str]) -> bool:
+        """Kararın değerlendirildiği kural sürümünü ve dokunduğu kural anahtarlarını kaydeder"""
+        if not recete_no or not snapshot_id:
+            return False
+        return self.database.save_decision_rule_keys(recete_no, snapshot_id, rule_keys or [])
+
+    def find_affected_prescriptions(self, diff: Dict[str, Any], new_snapshot: SUTRuleSnapshot,
+                                    old_snapshot: Optional[SUTRuleSnapshot] = None) -> List[str]:
+        """
+        diff['from'] sürümüyle değerlendirilmiş ve değişen kurallarla kesişen reçeteler
+
+        Eklenen ilaç kuralları, daha önce eşleşmeyen ve kısmi eşleşen (ör. GLIFIX
+        kuralına düşen GLIFIX PLUS) ilaç adları yeni snapshot'ın eşleştiricisiyle
+        yeniden çözülerek hedeflenir; kural anahtarı değişen adlar seçilir.
+
+        Args:
+            diff: diff_rule_snapshots çıktısı
+            new_snapshot: Yeni kural snapshot'ı
+            old_snapshot: diff['from'] snapshot'ı (varsayılan: kayıtlı içerikten derlenir)
+
+        Returns:
+            List[str]: Yeniden değerlendirilecek reçete numaraları
+        """
+        snapshot_id = diff["from"]
+        if diff["full_reevaluation"]:
+            return self.database.find_prescriptions_by_rule_version(snapshot_id)
+
+        exact_keys = set(diff["affected_keys"])
+        if diff["drugs"]["added"]:
+            added = set(diff["drugs"]["added"])
+            for rule_key in self.database.get_rule_keys_with_prefix(snapshot_id, "unmatched_drug:"):
+                brand = rule_key.split(":", 1)[1]
+                if new_snapshot.find_drug_rule_key(brand) in added:
+                    exact_keys.add(rule_key)
+
+            # Eski snapshot bilinmiyorsa kısmi eşleşen tüm adlar yeniden değerlendirilir
+            old_snapshot = old_snapshot or self.load_snapshot(snapshot_id)
+            for rule_key in self.database.get_rule_keys_with_prefix(snapshot_id, "drug_brand:"):
+                brand = rule_key.split(":", 1)[1]
+                old_key = old_snapshot.find_drug_rule_key(brand) if old_snapshot is not None else None
+                if old_key is None or new_snapshot.find_drug_rule_key(brand) != old_key:
+                    exact_keys.add(rule_key)
+
+        prefixes = [f"icd:{prefix}" for prefix in diff["affected_icd_prefixes"]]
+        if not exact_keys and not prefixes:
+            return []
+
+        return self.database.find_prescriptions_by_rule_keys(snapshot_id, sorted(exact_keys), prefixes)
+
+    def plan_reevaluation(self, current: SUTRuleSnapshot, previous_snapshot_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Güncel snapshot'a göre yeniden değerlendirilmesi gereken reçeteleri belirler
+
+        Args:
+            current: Güncel kural snapshot'ı
+            previous_snapshot_id: Sadece bu sürümle değerlendirilmiş kararlar (varsayılan: güncel olmayan tüm sürümler)
+
+        Returns:
+            Dict: diffs (sürüm başına fark) ve prescriptions (reçete numaraları)
+        """
+        self.record_snapshot(current)
+        if previous_snapshot_id:
+            previous_ids = [previous_snapshot_id]
+        else:
+            previous_ids = self.database.get_decision_rule_versions(exclude_snapshot_id=current.snapshot_id)
+
+        diffs = []
+        prescriptions: Dict[str, None] = {}  # sıralı, tekrarsız
+        for snapshot_id in previous_ids:
+            if snapshot_id == current.snapshot_id:
+                continue
+
+            previous = self.load_snapshot(snapshot_id)
+            if previous is None:
+                # İçeriği bilinmeyen sürüm: fark çıkarılamaz, tüm kararları yeniden değerlendir
+                logger.warning(f"Kural snapshot'ı bulunamadı, tam yeniden değerlendirme: {snapshot_id}")
+                diff = {"from": snapshot_id, "to": current.snapshot_id, "full_reevaluation": True}
+                affected = self.database.find_prescriptions_by_rule_version(snapshot_id)
+            else:
+                diff = diff_rule_snapshots(previous, current)
+                affected = self.find_affected_prescriptions(diff, current, previous) if has_changes(diff) else []
+
+            diff["affected_prescriptions"] = len(affected)
+            diffs.append(diff)
+            prescriptions.update(dict.fromkeys(affected))
+
+        logger.info(f"Kural değişikliği planı: {len(diffs)} sürüm, {len(prescriptions)} reçete yeniden değerlendirilecek")
+        return {"to": current.snapshot_id, "diffs": diffs, "prescriptions": list(prescriptions)}
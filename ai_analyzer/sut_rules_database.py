@@ -4,189 +4,83 @@ Reçete analizi için kritik kuralları içerir
 """
 
 import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from loguru import logger
 
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.drug_names import canonicalize_drug_name
+from utils.icd10 import format_diagnosis_codes, get_icd10_catalog, normalize_icd_code
+from utils.message_codes import get_prescription_message_codes
+from utils.rule_profiler import NULL_RULE_TIMER, get_rule_profiler
+from ai_analyzer.sut_rule_engine import get_rule_snapshot
+
 class SUTRulesDatabase:
     """SUT kuralları ve ilaç-tanı eşleştirmelerini yöneten sınıf"""
     
     def __init__(self):
-        self.rules = self._load_sut_rules()
-        self.drug_diagnosis_mapping = self._load_drug_diagnosis_mapping()
-        self.message_codes = self._load_message_codes()
-        logger.info("SUT Kuralları veritabanı yüklendi")
+        # Kurallar data/sut_rules.json'dan bir kez derlenir ve tüm örneklerle paylaşılır
+        self._local = threading.local()
+        self.profiler = None  # enable_profiling() ile kural bazında ölçüm
+        snapshot = get_rule_snapshot()
+        logger.info(f"SUT Kuralları veritabanı yüklendi (sürüm: {snapshot.snapshot_id})")
     
-    def _load_sut_rules(self):
-        """Temel SUT kurallarını yükler"""
-        return {
-            "general_rules": {
-                "max_prescription_age_days": 30,
-                "max_total_amount": 5000,
-                "require_doctor_signature": True,
-                "require_patient_tc": True
-            },
-            "age_restrictions": {
-                "pediatric_max_age": 18,
-                "geriatric_min_age": 65,
-                "special_monitoring_required": ["morphine", "codeine", "tramadol"]
-            },
-            "dosage_limits": {
-                "daily_max": {
-                    "paracetamol": 4000,  # mg
-                    "ibuprofen": 2400,    # mg
-                    "diclofenac": 150,    # mg
-                    "morphine": 30        # mg
-                }
-            },
-            "report_requirements": {
-                "chronic_hepatitis_b": {
-                    "required": True,
-                    "icd_codes": ["B18.1", "06.01"],
-                    "max_duration_months": 12,
-                    "required_drugs": ["TENOFOVIR", "ENTECAVIR"]
-                },
-                "diabetes": {
-                    "required": True,
-                    "icd_codes": ["E11", "E10"],
-                    "max_duration_months": 6,
-                    "required_drugs": ["METFORMIN", "INSULIN"]
-                },
-                "hypertension": {
-                    "required": False,
-                    "icd_codes": ["I10", "I15"],
-                    "drugs": ["ACE", "ARB", "BETA_BLOCKER"]
-                },
-                "psychiatric": {
-                    "required": True,
-                    "icd_codes": ["F20", "F25", "F31"],
-                    "max_duration_months": 3,
-                    "required_drugs": ["ANTIPSYCHOTIC", "MOOD_STABILIZER"]
-                }
-            }
-        }
+    @property
+    def snapshot(self):
+        """Aktif kural snapshot'ı (analiz sırasında sabitlenmiş olan önceliklidir)"""
+        pinned = getattr(self._local, "snapshot", None)
+        return pinned if pinned is not None else get_rule_snapshot()
     
-    def _load_drug_diagnosis_mapping(self):
-        """İlaç-tanı eşleştirmelerini yükler"""
-        return {
-            # Kronik Hepatit B
-            "VEMLIDY": {
-                "active_ingredient": "TENOFOVIR ALAFENAMID",
-                "required_diagnosis": ["B18.1", "06.01"],
-                "category": "antiviral",
-                "report_required": True,
-                "message_codes": ["1013"],
-                "max_duration_months": 12,
-                "monitoring_required": ["liver_function", "kidney_function"]
-            },
-            "BARACLUDE": {
-                "active_ingredient": "ENTECAVIR",
-                "required_diagnosis": ["B18.1", "06.01"],
-                "category": "antiviral",
-                "report_required": True,
-                "message_codes": ["1013"],
-                "max_duration_months": 12
-            },
-            
-            # Prostat büyümesi
-            "XALFU": {
-                "active_ingredient": "ALFUZOSIN",
-                "required_diagnosis": ["N40", "N42"],
-                "category": "alpha_blocker",
-                "report_required": False,
-                "message_codes": ["1301"],
-                "contraindications": ["hypotension"]
-            },
-            
-            # Diyabet
-            "GLIFIX": {
-                "active_ingredient": "PIOGLITAZONE",
-                "required_diagnosis": ["E11", "E10"],
-                "category": "antidiabetic",
-                "report_required": True,
-                "message_codes": ["1038"],
-                "contraindications": ["heart_failure", "bladder_cancer"]
-            },
-            
-            # Antipsikotik
-            "RISPERDAL": {
-                "active_ingredient": "RISPERIDONE",
-                "required_diagnosis": ["F20", "F25", "F31"],
-                "category": "antipsychotic",
-                "report_required": True,
-                "message_codes": ["1002"],
-                "max_duration_months": 3,
-                "monitoring_required": ["movement_disorders", "metabolic_syndrome"]
-            },
-            "SOLIAN": {
-                "active_ingredient": "AMISULPRIDE",
-                "required_diagnosis": ["F20", "F25"],
-                "category": "antipsychotic",
-                "report_required": True,
-                "message_codes": ["1002"],
-                "contraindications": ["prolactinoma", "breast_cancer"]
-            },
-            
-            # Proton pompası inhibitörü
-            "NEXIUM": {
-                "active_ingredient": "ESOMEPRAZOLE",
-                "category": "ppi",
-                "report_required": False,
-                "max_duration_days": 56,
-                "drug_interactions": ["clopidogrel", "warfarin"]
-            },
-            "PANTO": {
-                "active_ingredient": "PANTOPRAZOLE", 
-                "category": "ppi",
-                "report_required": False,
-                "max_duration_days": 56
-            }
-        }
+    @property
+    def rules(self):
+        return self.snapshot.rules
     
-    def _load_message_codes(self):
-        """İlaç mesaj kodlarını yükler"""
-        return {
-            "1013": {
-                "description": "Kronik Hepatit B tedavisi",
-                "sut_section": "4.2.13.1",
-                "report_required": True,
-                "max_duration": "12 months",
-                "monitoring": "3 monthly liver function tests"
-            },
-            "1301": {
-                "description": "Prostat tedavisi - Alfuzosin grubu",
-                "sut_section": "EK-4/E Madde 13",
-                "report_required": False,
-                "contraindications": ["severe_hypotension"]
-            },
-            "1038": {
-                "description": "Diyabet tedavisi kuralları",
-                "sut_section": "4.2.38",
-                "report_required": True,
-                "hba1c_requirement": ">7%",
-                "combination_rules": "metformin_first_line"
-            },
-            "1002": {
-                "description": "Antipsikotik kullanım ilkeleri",
-                "sut_section": "4.2.2",
-                "report_required": True,
-                "max_duration": "3 months",
-                "renewal_criteria": "clinical_improvement"
-            }
-        }
+    @property
+    def drug_diagnosis_mapping(self):
+        return self.snapshot.drug_diagnosis_mapping
     
-    def get_drug_requirements(self, drug_name):
-        """İlaç gereksinimlerini döndürür"""
-        drug_name_clean = drug_name.upper().split()[0]  # İlk kelimeyi al
-        
-        if drug_name_clean in self.drug_diagnosis_mapping:
-            return self.drug_diagnosis_mapping[drug_name_clean]
-        
-        # Partial match dene
-        for drug_key in self.drug_diagnosis_mapping.keys():
-            if drug_key in drug_name_clean or drug_name_clean in drug_key:
-                return self.drug_diagnosis_mapping[drug_key]
+    @property
+    def message_codes(self):
+        return self.snapshot.message_codes
+    
+    @contextmanager
+    def pin_snapshot(self):
+        """Analiz boyunca aynı kural sürümünün kullanılmasını sağlar (hot reload'a karşı)"""
+        if getattr(self._local, "snapshot", None) is not None:
+            yield self._local.snapshot
+            return
         
-        return None
+        self._local.snapshot = get_rule_snapshot()
+        try:
+            yield self._local.snapshot
+        finally:
+            self._local.snapshot = None
+    
+    def enable_profiling(self, profiler=None):
+        """Kural bazında değerlendirme/tetiklenme/süre ölçümünü açar (varsayılan: paylaşılan profilleyici)"""
+        self.profiler = profiler or get_rule_profiler()
+        return self.profiler
+    
+    def disable_profiling(self):
+        self.profiler = None
+    
+    def _rule(self, rule):
+        """Profilleme açıksa kural ölçüm nesnesi, değilse boş nesne döndürür"""
+        profiler = self.profiler
+        return profiler.rule(rule) if profiler is not None else NULL_RULE_TIMER
+    
+    def get_drug_requirements(self, drug_name):
+        """İlaç gereksinimlerini döndürür (kanonik marka ile snapshot'ın LRU cache'inden)"""
+        return self.get_drug_rule(drug_name)[1]
+    
+    def get_drug_rule(self, drug_name):
+        """(Kural anahtarı, gereksinimler) çiftini döndürür; bulunamazsa (None, None)"""
+        return self.snapshot.drug_rule(canonicalize_drug_name(drug_name).brand)
     
     def check_drug_diagnosis_compatibility(self, drug_name, diagnosis_codes):
         """İlaç-tanı uyumluluğunu kontrol eder"""
@@ -204,20 +98,23 @@ class SUTRulesDatabase:
                 "reason": "No specific diagnosis requirement"
             }
         
-        required_diagnoses = drug_req["required_diagnosis"]
+        required_diagnoses = list(drug_req["required_diagnosis"])
         
-        # Tanı kodları eşleşmesini kontrol et
-        for diagnosis in diagnosis_codes:
-            if diagnosis in required_diagnoses:
-                return {
-                    "compatible": True,
-                    "reason": f"Diagnosis {diagnosis} matches requirement",
-                    "matched_diagnosis": diagnosis
-                }
+        # Hiyerarşik eşleşme: "E11" gerekliliği "E11.9" tanısını kapsar
+        covering = self.snapshot.diagnosis_index(required_diagnoses).find_covering(diagnosis_codes)
+        if covering:
+            diagnosis, required_code = covering
+            return {
+                "compatible": True,
+                "reason": f"Diagnosis {diagnosis} matches requirement {required_code}",
+                "matched_diagnosis": diagnosis,
+                "matched_requirement": required_code,
+                "diagnosis_description": get_icd10_catalog().describe(diagnosis)
+            }
         
         return {
             "compatible": False,
-            "reason": f"Required diagnoses {required_diagnoses} not found in {diagnosis_codes}",
+            "reason": f"Required diagnoses {format_diagnosis_codes(required_diagnoses)} not found in {diagnosis_codes}",
             "required": required_diagnoses,
             "found": diagnosis_codes
         }
@@ -249,10 +146,27 @@ class SUTRulesDatabase:
         }
     
     def get_sut_analysis_for_prescription(self, prescription_data):
-        """Reçete için kapsamlı SUT analizi yapar"""
+        """Reçete için kapsamlı SUT analizi yapar (tek bir kural sürümüyle)"""
+        with self.pin_snapshot() as snapshot:
+            return self._build_sut_analysis(prescription_data, snapshot)
+    
+    def bulk_audit(self, prescriptions, as_of=None):
+        """
+        Çok sayıda reçete için deterministik SUT kontrollerini toplu (vektörel) çalıştırır
+        
+        Bkz. ai_analyzer.sut_bulk_audit.audit_prescriptions
+        """
+        from ai_analyzer.sut_bulk_audit import audit_prescriptions  # pandas sadece toplu denetimde gerekli
+        
+        with self.pin_snapshot() as snapshot:
+            return audit_prescriptions(prescriptions, snapshot, as_of)
+    
+    def _build_sut_analysis(self, prescription_data, snapshot):
+        """Sabitlenmiş snapshot ile SUT analizini oluşturur"""
         analysis = {
             "prescription_id": prescription_data.get("recete_no", ""),
             "analysis_timestamp": datetime.now().isoformat(),
+            "rule_version": snapshot.snapshot_id,
             "overall_compliance": True,
             "issues": [],
             "warnings": [],
@@ -290,8 +204,42 @@ class SUTRulesDatabase:
         general_check = self._check_general_sut_rules(prescription_data)
         analysis["general_compliance"] = general_check
         
+        # Kural değişikliğinde hedefli yeniden değerlendirme için dokunulan kural anahtarları
+        analysis["rule_keys"] = self._collect_rule_keys(drugs, diagnosis_codes, message_analysis)
+        
         return analysis
     
+    def _collect_rule_keys(self, drugs, diagnosis_codes, message_analysis):
+        """
+        Analizin dayandığı normalize kural anahtarları
+        
+        drug:<kural>, drug_brand:<kanonik marka>, unmatched_drug:<kanonik marka>,
+        icd:<normalize kod>, message_code:<kod>
+        """
+        rule_keys = set()
+        for drug in drugs:
+            drug_name = drug.get("ilac_adi", "")
+            rule_key, _ = self.get_drug_rule(drug_name)
+            brand = canonicalize_drug_name(drug_name).brand
+            if rule_key:
+                rule_keys.add(f"drug:{rule_key}")
+                # Kısmi eşleşen marka: daha özel bir kural eklendiğinde yeniden çözülür
+                if brand and brand != rule_key:
+                    rule_keys.add(f"drug_brand:{brand}")
+            elif brand:
+                rule_keys.add(f"unmatched_drug:{brand}")
+        
+        for code in diagnosis_codes:
+            normalized = normalize_icd_code(code)
+            if normalized:
+                rule_keys.add(f"icd:{normalized}")
+        
+        # Bilinmeyen kodlar da kaydedilir: kural eklendiğinde bu reçeteler hedeflenir
+        for code in message_analysis.get("valid_codes", []) + message_analysis.get("invalid_codes", []):
+            rule_keys.add(f"message_code:{code}")
+        
+        return sorted(rule_keys)
+    
     def _analyze_single_drug(self, drug, diagnosis_codes, prescription_data):
         """Tek bir ilacın SUT uyumluluğunu analiz eder"""
         drug_name = drug.get("ilac_adi", "")
@@ -303,25 +251,33 @@ class SUTRulesDatabase:
         }
         
         # İlaç gereksinimlerini kontrol et
-        drug_req = self.get_drug_requirements(drug_name)
+        with self._rule("drug_lookup") as rule:
+            rule_key, drug_req = self.get_drug_rule(drug_name)
+            rule.fired = drug_req is None
         
         if drug_req:
             # Tanı uyumluluğu
             if "required_diagnosis" in drug_req:
-                compatibility = self.check_drug_diagnosis_compatibility(drug_name, diagnosis_codes)
-                if not compatibility.get("compatible", True):
-                    analysis["compliant"] = False
-                    analysis["issues"].append(f"Diagnosis mismatch: {compatibility['reason']}")
+                with self._rule(f"required_diagnosis:{rule_key}") as rule:
+                    compatibility = self.check_drug_diagnosis_compatibility(drug_name, diagnosis_codes)
+                    if not compatibility.get("compatible", True):
+                        rule.fired = True
+                        analysis["compliant"] = False
+                        analysis["issues"].append(f"Diagnosis mismatch: {compatibility['reason']}")
             
             # Rapor gerekliliği
             if drug_req.get("report_required", False):
-                if not prescription_data.get("report_details", {}).get("rapor_numarasi"):
-                    analysis["compliant"] = False
-                    analysis["issues"].append(f"Report required for {drug_name} but not found")
+                with self._rule(f"report_required:{rule_key}") as rule:
+                    if not prescription_data.get("report_details", {}).get("rapor_numarasi"):
+                        rule.fired = True
+                        analysis["compliant"] = False
+                        analysis["issues"].append(f"Report required for {drug_name} but not found")
             
             # Kontrendikasyonlar
             if "contraindications" in drug_req:
-                analysis["warnings"].append(f"Check contraindications: {drug_req['contraindications']}")
+                with self._rule(f"contraindications:{rule_key}") as rule:
+                    rule.fired = True
+                    analysis["warnings"].append(f"Check contraindications: {list(drug_req['contraindications'])}")
         
         else:
             analysis["warnings"].append(f"Drug {drug_name} not found in SUT database")
@@ -333,31 +289,37 @@ class SUTRulesDatabase:
         message_analysis = {
             "valid_codes": [],
             "invalid_codes": [],
-            "missing_codes": []
+            "missing_codes": [],
+            "parsed_codes": []
         }
         
-        # Mevcut mesaj kodlarını çıkar
-        message_text = prescription_data.get("ilac_mesajlari", "")
-        found_codes = []
-        
-        for code in self.message_codes.keys():
-            if code in message_text:
-                found_codes.append(code)
-                message_analysis["valid_codes"].append(code)
+        # Mevcut mesaj kodlarını çıkar (kod, adet, SUT maddesi)
+        with self._rule("message_code_scan") as rule:
+            parsed_codes = get_prescription_message_codes(prescription_data)
+            for message in parsed_codes:
+                message_analysis["parsed_codes"].append(message._asdict())
+                if message.code in self.message_codes:
+                    message_analysis["valid_codes"].append(message.code)
+                else:
+                    message_analysis["invalid_codes"].append(message.code)
+            rule.fired = bool(message_analysis["valid_codes"])
+        found_codes = {message.code for message in parsed_codes}
         
         # Her ilaç için gerekli mesaj kodlarını kontrol et
         drugs = prescription_data.get("drugs", [])
         for drug in drugs:
             drug_name = drug.get("ilac_adi", "")
-            drug_req = self.get_drug_requirements(drug_name)
+            rule_key, drug_req = self.get_drug_rule(drug_name)
             
             if drug_req and "message_codes" in drug_req:
-                for required_code in drug_req["message_codes"]:
-                    if required_code not in found_codes:
-                        message_analysis["missing_codes"].append({
-                            "drug": drug_name,
-                            "missing_code": required_code
-                        })
+                with self._rule(f"message_codes:{rule_key}") as rule:
+                    for required_code in drug_req["message_codes"]:
+                        if required_code not in found_codes:
+                            rule.fired = True
+                            message_analysis["missing_codes"].append({
+                                "drug": drug_name,
+                                "missing_code": required_code
+                            })
         
         return message_analysis
     
@@ -369,32 +331,38 @@ class SUTRulesDatabase:
         }
         
         # TC kimlik kontrolü
-        if not prescription_data.get("hasta_tc"):
-            compliance["compliant"] = False
-            compliance["issues"].append("Patient TC number missing")
+        with self._rule("general:patient_tc") as rule:
+            if not prescription_data.get("hasta_tc"):
+                rule.fired = True
+                compliance["compliant"] = False
+                compliance["issues"].append("Patient TC number missing")
         
         # Reçete tarihi kontrolü
         prescription_date = prescription_data.get("recete_tarihi")
         if prescription_date:
-            try:
-                # Tarih formatını parse et (örn: "22/05/2025")
-                date_parts = prescription_date.split("/")
-                if len(date_parts) == 3:
-                    day, month, year = date_parts
-                    prescription_datetime = datetime(int(year), int(month), int(day))
-                    
-                    # 30 günden eski mi?
-                    age_days = (datetime.now() - prescription_datetime).days
-                    if age_days > self.rules["general_rules"]["max_prescription_age_days"]:
-                        compliance["issues"].append(f"Prescription too old: {age_days} days")
-            except:
-                compliance["issues"].append("Invalid prescription date format")
+            with self._rule("general:prescription_age") as rule:
+                try:
+                    # Tarih formatını parse et (örn: "22/05/2025")
+                    date_parts = prescription_date.split("/")
+                    if len(date_parts) == 3:
+                        day, month, year = date_parts
+                        prescription_datetime = datetime(int(year), int(month), int(day))
+                        
+                        # 30 günden eski mi?
+                        age_days = (datetime.now() - prescription_datetime).days
+                        if age_days > self.rules["general_rules"]["max_prescription_age_days"]:
+                            rule.fired = True
+                            compliance["issues"].append(f"Prescription too old: {age_days} days")
+                except:
+                    rule.fired = True
+                    compliance["issues"].append("Invalid prescription date format")
         
         return compliance
     
     def get_recommendation_for_prescription(self, prescription_data):
         """Reçete için öneri döndürür"""
-        analysis = self.get_sut_analysis_for_prescription(prescription_data)
+        with self.pin_snapshot():
+            analysis = self.get_sut_analysis_for_prescription(prescription_data)
         
         if analysis["overall_compliance"]:
             if not analysis.get("warnings", []):
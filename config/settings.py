@@ -38,6 +38,34 @@ class Settings:
         self.ANTHROPIC_API_KEY = os.getenv('CLAUDE_API_KEY', '')  # Compatibility
         self.ai_provider = os.getenv('AI_PROVIDER', 'claude')  # Claude aktif!
         self.ai_model = os.getenv('AI_MODEL', 'claude-3-sonnet-20240229')  # Claude model
+        self.ai_fast_model = os.getenv('AI_FAST_MODEL', 'claude-3-haiku-20240307')  # Reçete analizörü modeli
+        self.ai_strong_model = os.getenv('AI_STRONG_MODEL', self.ai_model)  # Karmaşık/çelişkili reçeteler
+        
+        # Karmaşıklığa göre model yönlendirme (hızlı / güçlü katman)
+        self.ai_model_routing = os.getenv('AI_MODEL_ROUTING', 'true').lower() == 'true'
+        self.ai_routing_strong_complexity = int(os.getenv('AI_ROUTING_STRONG_COMPLEXITY', '4'))  # 1-5
+        self.ai_routing_min_sut_confidence = float(os.getenv('AI_ROUTING_MIN_SUT_CONFIDENCE', '0.7'))
+        
+        # AI Sağlayıcı Bağlantıları (tüm istemciler için ortak, süreç başına tek havuz)
+        self.ai_request_timeout = float(os.getenv('AI_REQUEST_TIMEOUT', '60'))  # saniye
+        self.ai_max_retries = int(os.getenv('AI_MAX_RETRIES', '2'))
+        self.ai_max_concurrency = int(os.getenv('AI_MAX_CONCURRENCY', '8'))  # sağlayıcı başına eşzamanlı istek
+        self.ai_keepalive_seconds = float(os.getenv('AI_KEEPALIVE_SECONDS', '30'))
+        self.ai_base_url = os.getenv('AI_BASE_URL', '')  # Boş: sağlayıcının varsayılan adresi (yerel sahte sunucu için)
+        
+        # Devre kesici ve uyarlanabilir zaman aşımı (API yavaş/hatalıyken AI atlanır)
+        self.ai_circuit_breaker = os.getenv('AI_CIRCUIT_BREAKER', 'true').lower() == 'true'
+        self.ai_circuit_failure_threshold = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '5'))  # art arda hata
+        self.ai_circuit_cooldown_seconds = float(os.getenv('AI_CIRCUIT_COOLDOWN_SECONDS', '30'))  # sonra deneme isteği
+        self.ai_circuit_slow_call_seconds = float(os.getenv('AI_CIRCUIT_SLOW_CALL_SECONDS', '20'))  # p95 üstü açar, 0 kapatır
+        self.ai_adaptive_timeout = os.getenv('AI_ADAPTIVE_TIMEOUT', 'true').lower() == 'true'
+        self.ai_timeout_p95_multiplier = float(os.getenv('AI_TIMEOUT_P95_MULTIPLIER', '2.0'))
+        self.ai_min_request_timeout = float(os.getenv('AI_MIN_REQUEST_TIMEOUT', '5'))  # üst sınır: AI_REQUEST_TIMEOUT
+        
+        # AI Kayıt / Tekrar Oynatma (çevrimdışı benchmark)
+        self.ai_cassette_mode = os.getenv('AI_CASSETTE_MODE', 'off').lower()  # off, record, replay, auto
+        self.ai_cassette_path = os.getenv('AI_CASSETTE_PATH', 'database/ai_cassettes/claude_messages.jsonl')
+        self.ai_cassette_replay_latency = os.getenv('AI_CASSETTE_REPLAY_LATENCY', 'false').lower() == 'true'  # Kayıtlı gecikmeyi uygula
         
         # Logging Ayarları
         self.log_level = os.getenv('LOG_LEVEL', 'INFO')
@@ -47,6 +75,49 @@ class Settings:
         self.check_interval = int(os.getenv('CHECK_INTERVAL', '60'))  # saniye
         self.max_retry_attempts = int(os.getenv('MAX_RETRY_ATTEMPTS', '3'))
         self.auto_approve_threshold = float(os.getenv('AUTO_APPROVE_THRESHOLD', '0.8'))
+        self.sut_rule_profiling = os.getenv('SUT_RULE_PROFILING', 'false').lower() == 'true'
+        self.sut_rule_profile_dir = os.getenv('SUT_RULE_PROFILE_DIR', 'reports/rule_profiles')
+        self.sut_rules_reload_seconds = float(os.getenv('SUT_RULES_RELOAD_SECONDS', '30'))  # Kural dosyası kontrolü, 0 kapatır
+        
+        # AI Karar Önbelleği (aynı analiz girdisi için API tekrar çağrılmaz)
+        self.ai_decision_cache_enabled = os.getenv('AI_DECISION_CACHE', 'true').lower() == 'true'
+        self.ai_decision_cache_path = os.getenv('AI_DECISION_CACHE_PATH', 'database/ai_decision_cache.db')
+        self.ai_decision_cache_ttl_hours = float(os.getenv('AI_DECISION_CACHE_TTL_HOURS', '168'))
+        self.ai_decision_cache_max_entries = int(os.getenv('AI_DECISION_CACHE_MAX_ENTRIES', '50000'))
+        self.ai_input_cost_per_mtok = float(os.getenv('AI_INPUT_COST_PER_MTOK', '0.25'))  # USD / 1M input token
+        self.ai_output_cost_per_mtok = float(os.getenv('AI_OUTPUT_COST_PER_MTOK', '1.25'))  # USD / 1M output token
+        self.ai_strong_input_cost_per_mtok = float(os.getenv('AI_STRONG_INPUT_COST_PER_MTOK', '3.0'))  # Güçlü model
+        self.ai_strong_output_cost_per_mtok = float(os.getenv('AI_STRONG_OUTPUT_COST_PER_MTOK', '15.0'))
+        
+        # Benzer reçete karar yeniden kullanımı (karar önbelleği açıkken)
+        self.ai_similarity_reuse = os.getenv('AI_SIMILARITY_REUSE', 'true').lower() == 'true'
+        self.ai_similarity_threshold = float(os.getenv('AI_SIMILARITY_THRESHOLD', '0.92'))  # kosinüs benzerliği
+        self.ai_similarity_dim = int(os.getenv('AI_SIMILARITY_DIM', '1024'))  # hash'lenmiş özellik boyutu
+        self.ai_similarity_max_entries = int(os.getenv('AI_SIMILARITY_MAX_ENTRIES', '20000'))
+        self.ai_similarity_index_path = os.getenv('AI_SIMILARITY_INDEX_PATH', 'database/ai_similarity_index.npz')
+        
+        # Prompt boyutu ve token sayımı
+        self.ai_max_output_tokens = int(os.getenv('AI_MAX_OUTPUT_TOKENS', '600'))
+        self.ai_prompt_caching = os.getenv('AI_PROMPT_CACHING', 'true').lower() == 'true'  # Sabit sistem bloğu önbelleklenir
+        self.ai_token_count_api = os.getenv('AI_TOKEN_COUNT_API', 'false').lower() == 'true'  # false: yerel tahmin
+        self.ai_structured_output = os.getenv('AI_STRUCTURED_OUTPUT', 'true').lower() == 'true'  # Karar araç çağrısıyla (tool use) döner
+        
+        # Çoklu reçete paketleme (tek istekte N reçete)
+        self.ai_pack_size = int(os.getenv('AI_PACK_SIZE', '8'))
+        self.ai_pack_token_budget = int(os.getenv('AI_PACK_TOKEN_BUDGET', '8000'))  # Girdi + beklenen çıktı
+        self.ai_pack_output_tokens_per_item = int(os.getenv('AI_PACK_OUTPUT_TOKENS_PER_ITEM', '250'))
+        self.ai_pack_max_output_tokens = int(os.getenv('AI_PACK_MAX_OUTPUT_TOKENS', '4096'))
+        self.ai_pack_max_attempts = int(os.getenv('AI_PACK_MAX_ATTEMPTS', '2'))  # Sonra tekli çağrı
+        
+        # Deterministik AI kapısı: doz/SUT kesin karar verdiğinde Claude çağrılmaz
+        self.ai_gating_enabled = os.getenv('AI_GATING', 'true').lower() == 'true'
+        self.ai_gating_skip_on_reject = os.getenv('AI_GATING_SKIP_ON_REJECT', 'true').lower() == 'true'
+        self.ai_gating_sut_approve_confidence = float(os.getenv('AI_GATING_SUT_APPROVE_CONFIDENCE', '0.95'))  # >1 kapatır
+        
+        # Message Batches modu (zamanlanmış gece işleri)
+        self.ai_batch_mode = os.getenv('AI_BATCH_MODE', 'false').lower() == 'true'
+        self.ai_batch_poll_seconds = float(os.getenv('AI_BATCH_POLL_SECONDS', '60'))
+        self.ai_batch_timeout_hours = float(os.getenv('AI_BATCH_TIMEOUT_HOURS', '24'))
         
         # Güvenlik Ayarları
         self.enable_screenshots = os.getenv('ENABLE_SCREENSHOTS', 'true').lower() == 'true'
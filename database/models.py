@@ -320,6 +320,38 @@ class DatabaseManager:
             cursor.execute('SELECT * FROM medications WHERE barcode = ?', (barcode,))
             return cursor.fetchone()
     
+    def add_prescription_item(self, prescription_id, medication_barcode, quantity,
+                              usage_instruction=None, unit_price=None, total_price=None):
+        """Reçeteye ilaç kalemi ekler"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO prescription_items
+                (prescription_id, medication_barcode, quantity, usage_instruction, unit_price, total_price)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (prescription_id, medication_barcode, quantity, usage_instruction, unit_price, total_price))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def get_active_medications(self, patient_tc, days=90, exclude_prescription_id=None):
+        """Hastanın son günlerdeki (reddedilmemiş) reçetelerindeki aktif ilaçları getirir"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT pi.medication_barcode AS barcode,
+                       m.name, m.active_ingredient,
+                       p.prescription_id, p.prescription_date
+                FROM prescription_items pi
+                JOIN prescriptions p ON pi.prescription_id = p.prescription_id
+                LEFT JOIN medications m ON m.barcode = pi.medication_barcode
+                WHERE p.patient_tc = ?
+                  AND p.status != 'rejected'
+                  AND p.prescription_date >= date('now', ?)
+                  AND p.prescription_id != ?
+                ORDER BY p.prescription_date DESC
+            ''', (patient_tc, f"-{int(days)} days", exclude_prescription_id or ""))
+            return cursor.fetchall()
+    
     # AI Karar işlemleri
     def save_ai_decision(self, prescription_id, decision, reason, confidence,
                         risk_factors=None, recommendations=None, ai_model="gpt-4"):
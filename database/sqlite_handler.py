@@ -48,6 +48,35 @@ class SQLiteHandler:
                 )
             """)
             
+            # Kural sürüm geçmişi ve karar başına dokunulan kural anahtarları
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rule_snapshots (
+                    snapshot_id TEXT PRIMARY KEY,
+                    version TEXT,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS decision_rule_versions (
+                    recete_no TEXT PRIMARY KEY,
+                    snapshot_id TEXT NOT NULL,
+                    evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS decision_rule_keys (
+                    recete_no TEXT NOT NULL,
+                    rule_key TEXT NOT NULL,
+                    PRIMARY KEY (recete_no, rule_key)
+                )
+            """)
+            
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_decision_rule_keys_rule_key ON decision_rule_keys (rule_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_decision_rule_versions_snapshot ON decision_rule_versions (snapshot_id)")
+            
             conn.commit()
     
     def execute_query(self, query, params=None):
@@ -129,4 +158,122 @@ class SQLiteHandler:
                 """, (recete_no, action, details))
                 conn.commit()
         except Exception as e:
-            logger.error(f"Logging error: {e}")
\ No newline at end of file
+            logger.error(f"Logging error: {e}")
+    
+    def save_rule_snapshot(self, snapshot_id, version, content):
+        """Save rule snapshot content (once per snapshot id)"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    INSERT OR IGNORE INTO rule_snapshots (snapshot_id, version, content)
+                    VALUES (?, ?, ?)
+                """, (snapshot_id, version, content))
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Rule snapshot save error: {e}")
+            return False
+    
+    def get_rule_snapshot_content(self, snapshot_id):
+        """Get stored rule snapshot content"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT content FROM rule_snapshots WHERE snapshot_id = ?",
+                    (snapshot_id,)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Rule snapshot get error: {e}")
+            return None
+    
+    def save_decision_rule_keys(self, recete_no, snapshot_id, rule_keys):
+        """Replace the rule version and touched rule keys of a decision"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO decision_rule_versions (recete_no, snapshot_id, evaluated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                """, (recete_no, snapshot_id))
+                conn.execute("DELETE FROM decision_rule_keys WHERE recete_no = ?", (recete_no,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO decision_rule_keys (recete_no, rule_key) VALUES (?, ?)",
+                    [(recete_no, rule_key) for rule_key in rule_keys]
+                )
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Decision rule keys save error: {e}")
+            return False
+    
+    def get_decision_rule_versions(self, exclude_snapshot_id=None):
+        """Get distinct rule snapshot ids that stored decisions were evaluated with"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    "SELECT DISTINCT snapshot_id FROM decision_rule_versions WHERE snapshot_id != ?",
+                    (exclude_snapshot_id or "",)
+                ).fetchall()
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Decision rule versions get error: {e}")
+            return []
+    
+    def get_rule_keys_with_prefix(self, snapshot_id, prefix):
+        """Get distinct rule keys starting with prefix for decisions of a snapshot"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute("""
+                    SELECT DISTINCT k.rule_key FROM decision_rule_keys k
+                    JOIN decision_rule_versions v ON v.recete_no = k.recete_no
+                    WHERE v.snapshot_id = ? AND k.rule_key >= ? AND k.rule_key < ?
+                """, (snapshot_id, prefix, prefix + "\uffff")).fetchall()
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Rule keys get error: {e}")
+            return []
+    
+    def find_prescriptions_by_rule_version(self, snapshot_id):
+        """Get recete_no of all decisions evaluated with a snapshot"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    "SELECT recete_no FROM decision_rule_versions WHERE snapshot_id = ? ORDER BY recete_no",
+                    (snapshot_id,)
+                ).fetchall()
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Rule version search error: {e}")
+            return []
+    
+    def find_prescriptions_by_rule_keys(self, snapshot_id, rule_keys, prefixes=()):
+        """
+        Get recete_no of decisions of a snapshot touching any rule key
+        
+        rule_keys match exactly, prefixes match hierarchically (icd:E11 -> icd:E119).
+        Both use the rule_key index via equality/range conditions.
+        """
+        conditions = []
+        params = [snapshot_id]
+        if rule_keys:
+            conditions.append(f"k.rule_key IN ({', '.join('?' * len(rule_keys))})")
+            params.extend(rule_keys)
+        for prefix in prefixes:
+            conditions.append("(k.rule_key >= ? AND k.rule_key < ?)")
+            params.extend((prefix, prefix + "\uffff"))
+        
+        if not conditions:
+            return []
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(f"""
+                    SELECT DISTINCT k.recete_no FROM decision_rule_keys k
+                    JOIN decision_rule_versions v ON v.recete_no = k.recete_no
+                    WHERE v.snapshot_id = ? AND ({' OR '.join(conditions)})
+                    ORDER BY k.recete_no
+                """, params).fetchall()
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Rule key search error: {e}")
+            return []
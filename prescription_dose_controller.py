@@ -11,13 +11,16 @@ import time
 from datetime import datetime
 from pathlib import Path
 from loguru import logger
-from typing import Dict, List, Optional, Tuple
+from itertools import groupby
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 from dataclasses import dataclass
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(__file__))
 
 from database.sqlite_handler import SQLiteHandler
+from utils.drug_names import canonical_drug_key, cache_hit_rate_report
+from utils.message_codes import message_code_list
 from medula_automation.browser import MedulaBrowser
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -34,6 +37,7 @@ class DrugInfo:
     msj_status: str = ""
     dose_compliant: Optional[bool] = None
     dose_check_details: str = ""
+    awaiting_data: bool = False
 
 @dataclass
 class DoseControlResult:
@@ -55,6 +59,143 @@ class DoseControlResult:
         if self.control_notes is None:
             self.control_notes = []
 
+class FastDrugResult(NamedTuple):
+    """Fast-path ilaç sonucu (DrugInfo yerine kompakt tuple)"""
+    drug_name: str
+    report_code: str
+    active_ingredient: str
+    report_dose: str
+    dose_compliant: Optional[bool]
+
+class FastDoseResult(NamedTuple):
+    """Fast-path reçete sonucu (DoseControlResult yerine kompakt tuple)"""
+    prescription_id: str
+    overall_decision: str
+    total_drugs: int
+    reported_drugs: int
+    dose_compliant_drugs: int
+    dose_violations: int
+    drugs: Tuple[FastDrugResult, ...]
+
+_REPORT_CODE_FIELDS = ('rapor_kodu', 'report_code', 'rapor', 'kod')
+_NUMERIC_DOSE_RE = re.compile(r'\d+(?:\.\d+)?')
+
+class FastDoseEngine:
+    """
+    Bellek içi indekslerle çalışan hızlı doz kontrol motoru
+
+    Cache tabloları bir kez okunur; reçete başına SQLite sorgusu, Medula
+    erişimi, DrugInfo nesnesi ve not string'i üretilmez. Log sadece
+    enable_logging=True iken yazılır.
+    """
+
+    def __init__(self, database: Optional[SQLiteHandler] = None, enable_logging: bool = False):
+        self.database = database
+        self.enable_logging = enable_logging
+
+        # Kanonik ilaç anahtarı (marka + güç) -> etken madde
+        self.active_ingredients: Dict[str, str] = {}
+        # (rapor kodu, etken madde) -> (rapor dozu, sayısal doz)
+        self.report_doses: Dict[Tuple[str, str], Tuple[str, Optional[float]]] = {}
+
+    def load_indexes(self) -> int:
+        """drug_cache ve report_dose_cache tablolarını belleğe yükler"""
+        if self.database is None:
+            return 0
+
+        ingredient_rows = self.database.execute_query(
+            "SELECT drug_name, active_ingredient FROM drug_cache WHERE active_ingredient IS NOT NULL"
+        ) or []
+        dose_rows = self.database.execute_query(
+            "SELECT report_code, active_ingredient, report_dose FROM report_dose_cache "
+            "WHERE report_dose IS NOT NULL"
+        ) or []
+
+        for drug_name, ingredient in ingredient_rows:
+            self.update_active_ingredient(drug_name, ingredient)
+        for report_code, ingredient, dose in dose_rows:
+            self.update_report_dose(report_code, ingredient, dose)
+
+        logger.info(f"⚡ Fast dose engine indexes loaded: {len(self.active_ingredients)} ingredients, "
+                    f"{len(self.report_doses)} report doses")
+        return len(self.active_ingredients) + len(self.report_doses)
+
+    def update_active_ingredient(self, drug_name: str, active_ingredient: str):
+        """İndekse etken madde ekler/günceller (kanonik anahtar ile)"""
+        self.active_ingredients[canonical_drug_key(drug_name)] = active_ingredient
+
+    def update_report_dose(self, report_code: str, active_ingredient: str, report_dose: str):
+        """İndekse rapor dozu ekler/günceller (sayısal değer önceden parse edilir)"""
+        self.report_doses[(report_code, active_ingredient)] = (report_dose, _parse_numeric_dose(report_dose))
+
+    def control(self, prescription_data: Dict) -> FastDoseResult:
+        """Reçete doz kontrolü - sadece bellek içi indeksler"""
+        ingredients = self.active_ingredients
+        report_doses = self.report_doses
+        drug_results = []
+        reported = compliant = violations = 0
+
+        for drug_dict in prescription_data.get('drugs') or ():
+            drug_name = drug_dict.get('ilac_adi', '').strip()
+            report_code = _extract_report_code_fast(drug_dict)
+
+            if not report_code:
+                drug_results.append(FastDrugResult(drug_name, '', '', '', None))
+                continue
+
+            reported += 1
+            ingredient = ingredients.get(canonical_drug_key(drug_name), '')
+            report_dose, report_numeric = report_doses.get((report_code, ingredient), ('', None))
+            dose_compliant = None
+
+            if report_numeric is not None:
+                prescription_numeric = _parse_numeric_dose(drug_dict.get('adet', '1'))
+                if prescription_numeric is not None:
+                    dose_compliant = prescription_numeric <= report_numeric
+                    if dose_compliant:
+                        compliant += 1
+                    else:
+                        violations += 1
+
+            drug_results.append(FastDrugResult(drug_name, report_code, ingredient, report_dose, dose_compliant))
+
+        if not drug_results:
+            decision = "pending"
+        elif violations:
+            decision = "reject"
+        elif reported and compliant == reported:
+            decision = "approve"
+        else:
+            decision = "hold"
+
+        result = FastDoseResult(
+            prescription_data.get('recete_no', 'UNKNOWN'), decision,
+            len(drug_results), reported, compliant, violations, tuple(drug_results)
+        )
+
+        if self.enable_logging:
+            logger.debug(f"⚡ Fast dose control {result.prescription_id}: {decision} "
+                         f"({reported} reported, {violations} violations)")
+
+        return result
+
+def _extract_report_code_fast(drug_dict: Dict) -> str:
+    """Rapor kodunu alanlardan çıkarır (PrescriptionDoseController._extract_report_code ile aynı alanlar)"""
+    for field in _REPORT_CODE_FIELDS:
+        value = drug_dict.get(field)
+        if value:
+            code = str(value).strip()
+            if code and code.lower() != 'none':
+                return code
+    return ''
+
+def _parse_numeric_dose(dose_str) -> Optional[float]:
+    """String'den sayısal doz değerini çıkarır"""
+    if not dose_str:
+        return None
+    match = _NUMERIC_DOSE_RE.search(str(dose_str).replace(',', '.'))
+    return float(match.group()) if match else None
+
 class PrescriptionDoseController:
     """Reçete doz kontrol sistemi"""
     
@@ -63,7 +204,8 @@ class PrescriptionDoseController:
         self.browser = None
         self.wait = None
         
-        # Control mode: "fast" or "detailed"
+        # Control mode: "fast", "detailed" or "deferred"
+        # deferred: detailed mode, ancak cache miss'ler Medula'ya batch sonunda tek seferde sorulur
         self.control_mode = control_mode
         
         # Cache systems
@@ -71,6 +213,15 @@ class PrescriptionDoseController:
         self.report_dose_cache = {}        # Rapor kodu + etken madde -> Doz
         self.message_cache = {}            # İlaç adı -> Mesaj kodları
         
+        # Fast mode bellek içi indeksleri (ilk kullanımda yüklenir)
+        self.fast_engine = None
+        
+        # Deferred mode bekleyen Medula sorguları
+        self.pending_ingredient_lookups: Dict[str, Dict] = {}         # Kanonik ilaç anahtarı -> {drug_name, report_codes, prescriptions}
+        self.pending_dose_lookups: Dict[Tuple[str, str], Set[str]] = {}  # (rapor kodu, etken madde) -> reçeteler
+        self.fetched_lookups: Set[Tuple] = set()                       # Bu batch'te Medula'ya sorulanlar
+        self.batch_lookup_stats = {}
+        
         logger.info(f"Prescription Dose Controller initialized (mode: {control_mode})")
     
     def initialize_browser(self, browser_instance=None):
@@ -88,10 +239,21 @@ class PrescriptionDoseController:
             logger.error(f"❌ Browser initialization error: {e}")
             return False
     
+    def get_fast_engine(self) -> FastDoseEngine:
+        """Fast dose engine'i döndürür (cache tabloları ilk çağrıda belleğe alınır)"""
+        if self.fast_engine is None:
+            self.fast_engine = FastDoseEngine(self.database)
+            self.fast_engine.load_indexes()
+        return self.fast_engine
+    
     # =========================================================================
     # MAIN DOSE CONTROL METHODS
     # =========================================================================
     
+    def control_prescription_doses_fast(self, prescription_data: Dict) -> FastDoseResult:
+        """Fast-path doz kontrolü - kompakt tuple sonuç döndürür"""
+        return self.get_fast_engine().control(prescription_data)
+    
     def control_prescription_doses(self, prescription_data: Dict) -> DoseControlResult:
         """Ana reçete doz kontrol fonksiyonu"""
         try:
@@ -119,11 +281,16 @@ class PrescriptionDoseController:
                 try:
                     if self.control_mode == "fast":
                         drug_info = self._analyze_single_drug_fast(drug_dict, prescription_data)
+                    elif self.control_mode == "deferred":
+                        drug_info = self._analyze_single_drug_deferred(drug_dict, prescription_data)
                     else:  # detailed mode
                         drug_info = self._analyze_single_drug(drug_dict, prescription_data)
                     
                     result.drug_details.append(drug_info)
                     
+                    if drug_info.awaiting_data:
+                        result.control_notes.append(f"⏳ AWAITING DATA: {drug_info.drug_name}")
+                    
                     # İstatistikleri güncelle
                     if drug_info.report_code:
                         result.reported_drugs += 1
@@ -146,6 +313,8 @@ class PrescriptionDoseController:
             # Overall decision belirle
             if result.dose_violations > 0:
                 result.overall_decision = "reject"
+            elif any(drug.awaiting_data for drug in result.drug_details):
+                result.overall_decision = "awaiting_data"
             elif result.reported_drugs > 0 and result.dose_compliant_drugs == result.reported_drugs:
                 result.overall_decision = "approve"
             else:
@@ -241,17 +410,18 @@ class PrescriptionDoseController:
             # 2. MSJ durumu kontrolü  
             drug_info.msj_status = self._extract_msj_status(drug_dict)
             
-            # 3. Sadece cache'den etken madde ve doz kontrolü
+            # 3. Sadece bellek içi indeksten etken madde ve doz kontrolü
             if drug_info.report_code:
-                # Cache'den etken madde al (Medula'ya gitme)
-                drug_info.active_ingredient = self._get_cached_active_ingredient(drug_name) or "Bilinmiyor"
+                engine = self.get_fast_engine()
+                
+                # İndeksten etken madde al (Medula'ya ve SQLite'a gitme)
+                drug_info.active_ingredient = engine.active_ingredients.get(canonical_drug_key(drug_name)) or "Bilinmiyor"
                 
                 if drug_info.active_ingredient != "Bilinmiyor":
-                    # Cache'den rapor dozu al
-                    drug_info.report_dose = self._get_cached_report_dose(
-                        drug_info.report_code, 
-                        drug_info.active_ingredient
-                    ) or "Bilinmiyor"
+                    # İndeksten rapor dozu al
+                    drug_info.report_dose = engine.report_doses.get(
+                        (drug_info.report_code, drug_info.active_ingredient), ("",)
+                    )[0] or "Bilinmiyor"
                     
                     if drug_info.report_dose != "Bilinmiyor":
                         # Doz karşılaştırması yap
@@ -273,6 +443,187 @@ class PrescriptionDoseController:
             logger.error(f"❌ Fast drug analysis error: {e}")
             return DrugInfo(drug_name=drug_dict.get('ilac_adi', 'UNKNOWN'))
     
+    # =========================================================================
+    # DEFERRED (BATCHED) MEDULA LOOKUPS
+    # =========================================================================
+    
+    def _analyze_single_drug_deferred(self, drug_dict: Dict, prescription_data: Dict) -> DrugInfo:
+        """Detaylı ilaç analizi - cache miss'leri Medula'ya gitmeden bekleyen sorgu olarak kaydeder"""
+        try:
+            drug_name = drug_dict.get('ilac_adi', '').strip()
+            prescription_id = prescription_data.get('recete_no', 'UNKNOWN')
+            
+            drug_info = DrugInfo(
+                drug_name=drug_name,
+                prescription_dose=drug_dict.get('adet', '1')
+            )
+            drug_info.report_code = self._extract_report_code(drug_dict)
+            drug_info.msj_status = self._extract_msj_status(drug_dict)
+            
+            if not drug_info.report_code:
+                drug_info.dose_check_details = "Raporlu ilaç değil - doz kontrolü gerekli değil"
+                return drug_info
+            
+            # Etken madde (sadece bellek ve database cache)
+            drug_info.active_ingredient = self._lookup_active_ingredient(drug_name)
+            if not drug_info.active_ingredient:
+                drug_key = canonical_drug_key(drug_name)
+                if ('ingredient', drug_key) not in self.fetched_lookups:
+                    pending = self.pending_ingredient_lookups.setdefault(
+                        drug_key, {"drug_name": drug_name, "report_codes": set(), "prescriptions": set()}
+                    )
+                    pending["report_codes"].add(drug_info.report_code)
+                    pending["prescriptions"].add(prescription_id)
+                    drug_info.awaiting_data = True
+                    drug_info.dose_check_details = "Veri bekleniyor: etken madde Medula'dan alınacak"
+                else:
+                    drug_info.dose_check_details = "Etken madde bulunamadı"
+                return drug_info
+            
+            # Rapor dozu (sadece bellek ve database cache)
+            dose_key = (drug_info.report_code, drug_info.active_ingredient)
+            drug_info.report_dose = self._lookup_report_dose(*dose_key)
+            if not drug_info.report_dose:
+                if ('dose',) + dose_key not in self.fetched_lookups:
+                    self.pending_dose_lookups.setdefault(dose_key, set()).add(prescription_id)
+                    drug_info.awaiting_data = True
+                    drug_info.dose_check_details = "Veri bekleniyor: rapor dozu Medula'dan alınacak"
+                else:
+                    drug_info.dose_check_details = "Rapor dozu bulunamadı"
+                return drug_info
+            
+            drug_info.dose_compliant, drug_info.dose_check_details = self._compare_doses(
+                drug_info.prescription_dose,
+                drug_info.report_dose,
+                drug_name
+            )
+            return drug_info
+            
+        except Exception as e:
+            logger.error(f"❌ Deferred drug analysis error: {e}")
+            return DrugInfo(drug_name=drug_dict.get('ilac_adi', 'UNKNOWN'))
+    
+    def _lookup_active_ingredient(self, drug_name: str) -> str:
+        """Etken maddeyi sadece bellek ve database cache'inden al"""
+        drug_key = canonical_drug_key(drug_name)
+        if drug_key in self.active_ingredient_cache:
+            return self.active_ingredient_cache[drug_key]
+        
+        cached_ingredient = self._get_cached_active_ingredient(drug_name)
+        if cached_ingredient:
+            self.active_ingredient_cache[drug_key] = cached_ingredient
+            return cached_ingredient
+        
+        return ""
+    
+    def _lookup_report_dose(self, report_code: str, active_ingredient: str) -> str:
+        """Rapor dozunu sadece bellek ve database cache'inden al"""
+        cache_key = f"{report_code}_{active_ingredient}"
+        if cache_key in self.report_dose_cache:
+            return self.report_dose_cache[cache_key]
+        
+        cached_dose = self._get_cached_report_dose(report_code, active_ingredient)
+        if cached_dose:
+            self.report_dose_cache[cache_key] = cached_dose
+            return cached_dose
+        
+        return ""
+    
+    def resolve_pending_lookups(self) -> Set[str]:
+        """
+        Bekleyen tüm Medula sorgularını tek bir tarama ile çözer
+        
+        Önce etken maddeler (İlaç Bilgileri sayfası, alfabetik), ardından rapor
+        dozları (Rapor sayfası, rapor koduna göre gruplu) çekilir. Aynı sorgu
+        bir batch içinde ikinci kez Medula'ya gönderilmez.
+        
+        Returns:
+            Set[str]: Yeniden değerlendirilmesi gereken reçete numaraları
+        """
+        affected = set()
+        stats = self.batch_lookup_stats
+        
+        # 1. Etken maddeler
+        for drug_key in sorted(self.pending_ingredient_lookups):
+            pending = self.pending_ingredient_lookups[drug_key]
+            affected |= pending["prescriptions"]
+            
+            lookup_key = ('ingredient', drug_key)
+            if lookup_key in self.fetched_lookups:
+                continue
+            self.fetched_lookups.add(lookup_key)
+            
+            ingredient = self._extract_active_ingredient_from_medula(pending["drug_name"]) if self.browser else ""
+            stats["ingredient_fetches"] = stats.get("ingredient_fetches", 0) + 1
+            if not ingredient:
+                continue
+            
+            self.active_ingredient_cache[drug_key] = ingredient
+            self._save_active_ingredient_to_cache(pending["drug_name"], ingredient)
+            
+            # Bu etken madde için gereken rapor dozlarını aynı taramaya ekle
+            for report_code in pending["report_codes"]:
+                dose_key = (report_code, ingredient)
+                if not self._lookup_report_dose(*dose_key):
+                    self.pending_dose_lookups.setdefault(dose_key, set()).update(pending["prescriptions"])
+        
+        # 2. Rapor dozları (aynı rapor sayfası ardışık ziyaret edilsin)
+        for report_code, dose_keys in groupby(sorted(self.pending_dose_lookups), key=lambda key: key[0]):
+            for dose_key in dose_keys:
+                affected |= self.pending_dose_lookups[dose_key]
+                
+                lookup_key = ('dose',) + dose_key
+                if lookup_key in self.fetched_lookups:
+                    continue
+                self.fetched_lookups.add(lookup_key)
+                
+                dose = self._extract_report_dose_from_medula(*dose_key) if self.browser else ""
+                stats["dose_fetches"] = stats.get("dose_fetches", 0) + 1
+                if dose:
+                    self.report_dose_cache[f"{report_code}_{dose_key[1]}"] = dose
+                    self._save_report_dose_to_cache(report_code, dose_key[1], dose)
+        
+        self.pending_ingredient_lookups.clear()
+        self.pending_dose_lookups.clear()
+        return affected
+    
+    def control_batch_doses(self, prescriptions: List[Dict]) -> List[DoseControlResult]:
+        """
+        Deferred mode batch doz kontrolü
+        
+        Tüm reçeteler cache ile değerlendirilir, eksik veriler tek bir Medula
+        taramasında toplanır ve sadece etkilenen reçeteler yeniden çalıştırılır.
+        """
+        previous_mode = self.control_mode
+        self.control_mode = "deferred"
+        self.pending_ingredient_lookups.clear()
+        self.pending_dose_lookups.clear()
+        self.fetched_lookups.clear()
+        self.batch_lookup_stats = {"ingredient_fetches": 0, "dose_fetches": 0, "rerun_prescriptions": 0}
+        
+        try:
+            results = [self.control_prescription_doses(p) for p in prescriptions]
+            
+            if self.pending_ingredient_lookups or self.pending_dose_lookups:
+                logger.info(f"⏳ Resolving {len(self.pending_ingredient_lookups)} ingredient and "
+                            f"{len(self.pending_dose_lookups)} report dose lookups in one sweep")
+                affected = self.resolve_pending_lookups()
+                
+                for index, prescription in enumerate(prescriptions):
+                    if prescription.get('recete_no', 'UNKNOWN') in affected:
+                        results[index] = self.control_prescription_doses(prescription)
+                        self.batch_lookup_stats["rerun_prescriptions"] += 1
+                
+                # Yeniden çalıştırmada kalan miss'ler zaten sorulmuş olanlardır
+                self.pending_ingredient_lookups.clear()
+                self.pending_dose_lookups.clear()
+            
+            logger.info(f"✅ Deferred batch dose control completed: {self.batch_lookup_stats}")
+            return results
+            
+        finally:
+            self.control_mode = previous_mode
+    
     # =========================================================================
     # REPORT CODE AND MSJ DETECTION
     # =========================================================================
@@ -340,15 +691,18 @@ class PrescriptionDoseController:
     def _get_active_ingredient(self, drug_name: str) -> str:
         """Etken madde al (cache'den veya Medula'dan)"""
         try:
+            # Cache anahtarı kanonik marka + güç (kutu miktarı/yazım farkları aynı kayda düşer)
+            drug_key = canonical_drug_key(drug_name)
+            
             # Cache'de var mı kontrol et
-            if drug_name in self.active_ingredient_cache:
+            if drug_key in self.active_ingredient_cache:
                 logger.debug(f"📦 Active ingredient from cache: {drug_name}")
-                return self.active_ingredient_cache[drug_name]
+                return self.active_ingredient_cache[drug_key]
             
             # Database'den kontrol et
             cached_ingredient = self._get_cached_active_ingredient(drug_name)
             if cached_ingredient:
-                self.active_ingredient_cache[drug_name] = cached_ingredient
+                self.active_ingredient_cache[drug_key] = cached_ingredient
                 return cached_ingredient
             
             # Medula'dan çek
@@ -356,7 +710,7 @@ class PrescriptionDoseController:
                 ingredient = self._extract_active_ingredient_from_medula(drug_name)
                 if ingredient:
                     # Cache'e ve database'e kaydet
-                    self.active_ingredient_cache[drug_name] = ingredient
+                    self.active_ingredient_cache[drug_key] = ingredient
                     self._save_active_ingredient_to_cache(drug_name, ingredient)
                     return ingredient
             
@@ -370,13 +724,15 @@ class PrescriptionDoseController:
     def _get_cached_active_ingredient(self, drug_name: str) -> Optional[str]:
         """Database'den cached etken madde al"""
         try:
-            # SQLite'dan etken madde sorgula
+            # SQLite'dan etken madde sorgula (kanonik anahtar, eski kayıtlar için ham ad)
+            drug_key = canonical_drug_key(drug_name)
             query = """
             SELECT active_ingredient FROM drug_cache 
-            WHERE drug_name = ? AND active_ingredient IS NOT NULL
+            WHERE drug_name IN (?, ?) AND active_ingredient IS NOT NULL
+            ORDER BY drug_name = ? DESC
             """
             
-            result = self.database.execute_query(query, (drug_name,))
+            result = self.database.execute_query(query, (drug_key, drug_name, drug_key))
             if result and len(result) > 0:
                 ingredient = result[0][0]
                 logger.debug(f"📦 Active ingredient from database: {drug_name} -> {ingredient}")
@@ -478,7 +834,9 @@ class PrescriptionDoseController:
             VALUES (?, ?, ?)
             """
             
-            self.database.execute_query(query, (drug_name, active_ingredient, datetime.now().isoformat()))
+            self.database.execute_query(query, (canonical_drug_key(drug_name), active_ingredient, datetime.now().isoformat()))
+            if self.fast_engine is not None:
+                self.fast_engine.update_active_ingredient(drug_name, active_ingredient)
             logger.debug(f"💾 Active ingredient cached: {drug_name} -> {active_ingredient}")
             
         except Exception as e:
@@ -637,6 +995,8 @@ class PrescriptionDoseController:
             
             self.database.execute_query(query, 
                 (report_code, active_ingredient, dose, datetime.now().isoformat()))
+            if self.fast_engine is not None:
+                self.fast_engine.update_report_dose(report_code, active_ingredient, dose)
             logger.debug(f"💾 Report dose cached: {report_code} - {active_ingredient} -> {dose}")
             
         except Exception as e:
@@ -720,15 +1080,10 @@ class PrescriptionDoseController:
             
             # Check if there are message details in prescription data
             if 'drug_messages' in prescription_data:
-                for message in prescription_data['drug_messages']:
-                    if isinstance(message, dict) and 'kod' in message:
-                        messages.append(message['kod'])
-                    elif isinstance(message, str):
-                        parsed = self._parse_message_codes(message)
-                        messages.extend(parsed)
+                messages.extend(self._parse_message_codes(prescription_data['drug_messages']))
             
             # Remove duplicates and filter known codes
-            unique_messages = list(set(messages))
+            unique_messages = list(dict.fromkeys(messages))
             filtered_messages = [msg for msg in unique_messages if self._is_valid_message_code(msg)]
             
             logger.debug(f"📨 Messages found: {filtered_messages}")
@@ -739,30 +1094,9 @@ class PrescriptionDoseController:
             return []
     
     def _parse_message_codes(self, message_data) -> List[str]:
-        """Parse message codes from various formats"""
+        """Parse message codes from various formats (see utils.message_codes)"""
         try:
-            messages = []
-            
-            if isinstance(message_data, str):
-                # Extract codes like "1013(1)", "1301", "1038", "1002"
-                import re
-                pattern = r'\b(\d{4})\b'
-                matches = re.findall(pattern, message_data)
-                messages.extend(matches)
-                
-            elif isinstance(message_data, list):
-                for item in message_data:
-                    if isinstance(item, str):
-                        messages.extend(self._parse_message_codes(item))
-                    elif isinstance(item, dict) and 'kod' in item:
-                        messages.append(str(item['kod']))
-                        
-            elif isinstance(message_data, dict):
-                for key, value in message_data.items():
-                    if 'kod' in key.lower() or 'message' in key.lower():
-                        messages.extend(self._parse_message_codes(value))
-            
-            return messages
+            return message_code_list(message_data)
             
         except Exception as e:
             logger.error(f"❌ Message parsing error: {e}")
@@ -790,7 +1124,7 @@ class PrescriptionDoseController:
         """Get cached drug messages"""
         try:
             query = "SELECT message_codes FROM drug_message_cache WHERE drug_name = ?"
-            result = self.database.execute_query(query, (drug_name,))
+            result = self.database.execute_query(query, (canonical_drug_key(drug_name),))
             
             if result:
                 message_str = result[0][0]
@@ -813,7 +1147,7 @@ class PrescriptionDoseController:
             VALUES (?, ?, datetime('now'))
             """
             
-            self.database.execute_query(query, (drug_name, message_str))
+            self.database.execute_query(query, (canonical_drug_key(drug_name), message_str))
             logger.debug(f"💾 Drug messages cached: {drug_name} -> {messages}")
             
         except Exception as e:
@@ -878,6 +1212,35 @@ class PrescriptionDoseController:
             logger.error(f"❌ Interaction check error: {e}")
             return False
     
+    # =========================================================================
+    # CACHE HIT RATE REPORT
+    # =========================================================================
+    
+    def report_canonical_hit_rate(self, limit: int = 10000) -> Dict:
+        """Kayıtlı reçete geçmişinde ham ad vs kanonik anahtar cache isabet oranını raporlar"""
+        try:
+            rows = self.database.execute_query(
+                "SELECT prescription_data FROM prescriptions ORDER BY created_at ASC LIMIT ?", (limit,)
+            ) or []
+            
+            drug_names = []
+            for (prescription_json,) in rows:
+                try:
+                    prescription = json.loads(prescription_json or "{}")
+                except ValueError:
+                    continue
+                drug_names.extend(drug.get('ilac_adi', '') for drug in prescription.get('drugs', [])
+                                  if isinstance(drug, dict))
+            
+            report = cache_hit_rate_report(drug_names)
+            logger.info(f"📈 Canonical drug key hit rate: {report['raw_hit_rate']:.1%} -> "
+                        f"{report['canonical_hit_rate']:.1%} ({report['lookups']} lookups)")
+            return report
+            
+        except Exception as e:
+            logger.error(f"❌ Hit rate report error: {e}")
+            return {}
+    
     # =========================================================================
     # DATABASE CACHE SETUP
     # =========================================================================
@@ -7,13 +7,28 @@ Based on domain expert knowledge from 09 Eylül 2025
 
 import sys
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent))
 
+from utils.barcode_groups import BarcodeGroupTable, get_barcode_group_table
+from utils.text_matching import AhoCorasick
+
+# Keyword list attribute for each group, in classification priority order
+GROUP_KEYWORD_LISTS = (
+    ("temp_protection", "temporary_protection_keywords"),
+    ("C_blood", "blood_product_keywords"),
+    ("A", "report_required_keywords"),
+    ("C", "sequential_distribution_keywords"),
+)
+
+# Drug fields that are still scanned when every drug was resolved by barcode
+DRUG_MESSAGE_FIELDS = ("ilac_mesajlari", "mesaj", "message")
+
 @dataclass
 class PrescriptionGroup:
     """Prescription group classification result"""
@@ -22,11 +37,15 @@ class PrescriptionGroup:
     reason: str
     confidence: float
     details: List[str]
+    keyword_hits: Dict[str, List[str]] = field(default_factory=dict)
+    barcode_hits: Dict[str, List[str]] = field(default_factory=dict)
 
 class PrescriptionGroupClassifier:
     """Classifies prescriptions into the correct groups"""
     
-    def __init__(self):
+    def __init__(self, barcode_table: Optional[BarcodeGroupTable] = None):
+        # Barcode -> group attributes, loaded once per process (data/barcode_groups.json)
+        self.barcode_table = barcode_table if barcode_table is not None else get_barcode_group_table()
         self.load_classification_rules()
         
     def load_classification_rules(self):
@@ -62,6 +81,71 @@ class PrescriptionGroupClassifier:
             'kimlik belgesi', '99', 'koruma statü'
         ]
         
+        self._compile_keyword_matcher()
+        
+    def _compile_keyword_matcher(self):
+        """Compile all group keyword lists into one Aho-Corasick automaton"""
+        
+        keyword_groups: Dict[str, List[str]] = {}
+        for group_id, attribute in GROUP_KEYWORD_LISTS:
+            for keyword in getattr(self, attribute):
+                groups = keyword_groups.setdefault(keyword.lower(), [])
+                if group_id not in groups:
+                    groups.append(group_id)
+                    
+        self._keyword_matcher = AhoCorasick()
+        for keyword, groups in keyword_groups.items():
+            self._keyword_matcher.add(keyword, (keyword, tuple(groups)))
+        self._keyword_matcher.build()
+        
+    def find_keyword_hits(self, full_text: str) -> Dict[str, List[str]]:
+        """
+        Find every group keyword in the text in a single pass
+        
+        Keywords must start at a word boundary, so Turkish suffixes still match
+        ('rapor' -> 'raporlu'). Numeric keywords must match a whole token, so
+        '99' does not match inside '1999' or a phone number.
+        
+        Returns:
+            Dictionary with group_id as keys and matched keywords as values
+        """
+        
+        hits: Dict[str, List[str]] = {}
+        for start, end, (keyword, groups) in self._keyword_matcher.iter_matches(full_text):
+            if start > 0 and full_text[start - 1].isalnum():
+                continue
+            if keyword.isdigit() and end < len(full_text) and full_text[end].isalnum():
+                continue
+            for group_id in groups:
+                group_hits = hits.setdefault(group_id, [])
+                if keyword not in group_hits:
+                    group_hits.append(keyword)
+                    
+        return hits
+        
+    def find_barcode_hits(self, prescription_data: Dict) -> Tuple[Dict[str, List[str]], bool]:
+        """
+        Look up every drug barcode in the barcode group table
+        
+        Returns:
+            Tuple of (group_id -> matched barcodes, whether every drug was resolved by barcode)
+        """
+        
+        hits: Dict[str, List[str]] = {}
+        drugs = prescription_data.get('drugs') or []
+        resolved = 0
+        
+        for drug in drugs:
+            barcode = drug.get('barkod') if isinstance(drug, dict) else None
+            attributes = self.barcode_table.lookup(barcode)
+            if attributes is None:
+                continue
+            resolved += 1
+            for group_id in attributes.groups:
+                hits.setdefault(group_id, []).append(str(barcode).strip())
+                
+        return hits, bool(drugs) and resolved == len(drugs)
+        
     def classify_prescription(self, prescription_data: Dict) -> PrescriptionGroup:
         """
         Classify a prescription into the correct group
@@ -73,48 +157,66 @@ class PrescriptionGroupClassifier:
             PrescriptionGroup: Classification result
         """
         
-        # Extract relevant text for analysis
-        full_text = self._extract_text_for_analysis(prescription_data)
+        # Barcode table first: one hash lookup per drug
+        barcode_hits, all_resolved = self.find_barcode_hits(prescription_data)
+        
+        # Patient, message and report text is always scanned; drug names only
+        # when some drug has no known barcode
+        full_text = self._extract_text_for_analysis(prescription_data, include_drug_names=not all_resolved)
+        keyword_hits = self.find_keyword_hits(full_text)
+            
+        hits = {
+            group_id: barcode_hits.get(group_id, []) + keyword_hits.get(group_id, [])
+            for group_id in {*barcode_hits, *keyword_hits}
+        }
         
         # Check for temporary protection first (most specific)
-        if self._is_temporary_protection(prescription_data, full_text):
+        if self._is_temporary_protection(prescription_data, hits):
             return PrescriptionGroup(
                 group_id="temp_protection",
                 group_name="Geçici Koruma",
                 reason="Geçici koruma statüsü tespit edildi",
                 confidence=0.95,
-                details=["Mülteci/Suriyeli hasta", "Özel sosyal güvenlik"]
+                details=["Mülteci/Suriyeli hasta", "Özel sosyal güvenlik"],
+                keyword_hits=keyword_hits,
+                barcode_hits=barcode_hits
             )
             
         # Check for blood products (C_blood)
-        if self._contains_blood_products(prescription_data, full_text):
+        if self._contains_blood_products(prescription_data, hits):
             return PrescriptionGroup(
                 group_id="C_blood",
                 group_name="C Grubu - Kan Ürünleri",
                 reason="Kan ürünü tespit edildi",
                 confidence=0.90,
-                details=["Sıralı dağıtım gerekli", "En hassas kategori"]
+                details=["Sıralı dağıtım gerekli", "En hassas kategori"],
+                keyword_hits=keyword_hits,
+                barcode_hits=barcode_hits
             )
             
         # Check for report-required drugs (A Group)
         # CRITICAL: Even ONE report-required drug makes entire prescription A Group
-        if self._contains_report_required_drugs(prescription_data, full_text):
+        if self._contains_report_required_drugs(prescription_data, hits):
             return PrescriptionGroup(
                 group_id="A",
                 group_name="A Grubu - Raporlu İlaçlar",
                 reason="Bir veya daha fazla raporlu ilaç tespit edildi",
                 confidence=0.85,
-                details=["Tek raporlu ilaç bile tüm reçeteyi A yapar", "Rapor kontrolü gerekli"]
+                details=["Tek raporlu ilaç bile tüm reçeteyi A yapar", "Rapor kontrolü gerekli"],
+                keyword_hits=keyword_hits,
+                barcode_hits=barcode_hits
             )
             
         # Check for sequential distribution/quota limited (C Group)
-        if self._contains_sequential_distribution_drugs(prescription_data, full_text):
+        if self._contains_sequential_distribution_drugs(prescription_data, hits):
             return PrescriptionGroup(
                 group_id="C",
                 group_name="C Grubu - Sıralı Dağıtım",
                 reason="Sıralı dağıtım/kotalı ilaç tespit edildi",
                 confidence=0.80,
-                details=["Özel dağıtım kuralları", "Kota kontrolü gerekli"]
+                details=["Özel dağıtım kuralları", "Kota kontrolü gerekli"],
+                keyword_hits=keyword_hits,
+                barcode_hits=barcode_hits
             )
             
         # Default to B Group (normal drugs)
@@ -123,30 +225,44 @@ class PrescriptionGroupClassifier:
             group_name="B Grubu - Normal İlaçlar",
             reason="Normal raporsuz ilaçlar",
             confidence=0.75,
-            details=["Standart SGK ilaçları", "En yaygın grup"]
+            details=["Standart SGK ilaçları", "En yaygın grup"],
+            keyword_hits=keyword_hits,
+            barcode_hits=barcode_hits
         )
         
-    def _extract_text_for_analysis(self, prescription_data: Dict) -> str:
-        """Extract all relevant text from prescription for analysis"""
+    def _extract_text_for_analysis(self, prescription_data: Dict, include_drug_names: bool = True) -> str:
+        """
+        Extract all relevant text from prescription for analysis
+        
+        Args:
+            prescription_data: Prescription dictionary
+            include_drug_names: False when every drug was classified by barcode;
+                drug names and details are then skipped but drug messages are kept
+        """
         
         text_parts = []
         
         # Patient information
-        if 'hasta_ad_soyad' in prescription_data:
-            text_parts.append(prescription_data['hasta_ad_soyad'])
+        for key in ('hasta_ad_soyad', 'hasta_turu'):
+            if isinstance(prescription_data.get(key), str):
+                text_parts.append(prescription_data[key])
+                
+        # Prescription-level drug messages
+        if isinstance(prescription_data.get('ilac_mesajlari'), str):
+            text_parts.append(prescription_data['ilac_mesajlari'])
             
         # Drug information
         if 'drugs' in prescription_data:
             for drug in prescription_data['drugs']:
                 if isinstance(drug, dict):
                     for key, value in drug.items():
-                        if isinstance(value, str):
+                        if isinstance(value, str) and (include_drug_names or key in DRUG_MESSAGE_FIELDS):
                             text_parts.append(value)
-                elif isinstance(drug, str):
+                elif isinstance(drug, str) and include_drug_names:
                     text_parts.append(drug)
                     
         # Drug details
-        if 'drug_details' in prescription_data:
+        if 'drug_details' in prescription_data and include_drug_names:
             details = prescription_data['drug_details']
             if isinstance(details, dict):
                 for key, value in details.items():
@@ -175,9 +291,10 @@ class PrescriptionGroupClassifier:
                             if isinstance(item, str):
                                 text_parts.append(item)
         
-        return ' '.join(text_parts).lower()
+        # 'İ'.lower() adds a combining dot that would break keyword matches
+        return ' '.join(text_parts).replace('İ', 'i').lower()
         
-    def _is_temporary_protection(self, prescription_data: Dict, full_text: str) -> bool:
+    def _is_temporary_protection(self, prescription_data: Dict, hits: Dict[str, List[str]]) -> bool:
         """Check if prescription is for temporary protection status"""
         
         # Check TC ID pattern (temporary protection often starts with 99)
@@ -185,43 +302,19 @@ class PrescriptionGroupClassifier:
         if tc_id.startswith('99'):
             return True
             
-        # Check for keywords
-        for keyword in self.temporary_protection_keywords:
-            if keyword in full_text:
-                return True
-                
-        return False
+        return bool(hits.get('temp_protection'))
         
-    def _contains_blood_products(self, prescription_data: Dict, full_text: str) -> bool:
+    def _contains_blood_products(self, prescription_data: Dict, hits: Dict[str, List[str]]) -> bool:
         """Check if prescription contains blood products"""
         
-        for keyword in self.blood_product_keywords:
-            if keyword in full_text:
-                return True
-                
-        # Check specific drug codes or names that are blood products
-        if 'drugs' in prescription_data:
-            for drug in prescription_data['drugs']:
-                drug_text = str(drug).lower()
-                if any(blood_kw in drug_text for blood_kw in self.blood_product_keywords):
-                    return True
-                    
-        return False
+        return bool(hits.get('C_blood'))
         
-    def _contains_report_required_drugs(self, prescription_data: Dict, full_text: str) -> bool:
+    def _contains_report_required_drugs(self, prescription_data: Dict, hits: Dict[str, List[str]]) -> bool:
         """Check if prescription contains ANY report-required drugs"""
         
-        # Check for report keywords in text
-        for keyword in self.report_required_keywords:
-            if keyword in full_text:
-                return True
-                
-        # Check drug messages for report indicators
-        if 'drug_messages' in prescription_data:
-            for message in prescription_data['drug_messages']:
-                message_text = str(message).lower()
-                if 'rapor' in message_text or 'endikasyon' in message_text:
-                    return True
+        # Report keywords in drug names, messages and report details
+        if hits.get('A'):
+            return True
                     
         # Check if there's report_details section (indicates reports exist)
         if 'report_details' in prescription_data:
@@ -231,34 +324,82 @@ class PrescriptionGroupClassifier:
                 
         return False
         
-    def _contains_sequential_distribution_drugs(self, prescription_data: Dict, full_text: str) -> bool:
+    def _contains_sequential_distribution_drugs(self, prescription_data: Dict, hits: Dict[str, List[str]]) -> bool:
         """Check if prescription contains sequential distribution drugs"""
         
-        for keyword in self.sequential_distribution_keywords:
-            if keyword in full_text:
-                return True
-                
-        # Check drug messages for sequential distribution indicators
-        if 'drug_messages' in prescription_data:
-            for message in prescription_data['drug_messages']:
-                message_text = str(message).lower()
-                if any(seq_kw in message_text for seq_kw in self.sequential_distribution_keywords):
-                    return True
-                    
-        return False
+        return bool(hits.get('C'))
         
-    def classify_batch_prescriptions(self, prescriptions: List[Dict]) -> Dict[str, List[Dict]]:
+    def classify_batch_prescriptions(self, prescriptions: List[Dict], workers: int = 1, shard_size: int = 500,
+                                     on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+                                     ) -> Tuple[Dict[str, List[Dict]], List[Dict]]:
         """
         Classify multiple prescriptions and group them
         
         Args:
             prescriptions: List of prescription dictionaries
+            workers: Number of worker processes (1 = classify in this process)
+            shard_size: Prescriptions per shard sent to a worker
+            on_progress: Called with the running grouped dict and stats after each shard
             
         Returns:
-            Dictionary with group_id as keys and prescription lists as values
+            Dictionary with group_id as keys and prescription lists as values,
+            and the per-prescription classification results
+        """
+        
+        progress = {'grouped': self._empty_groups(), 'results': []}
+        for progress in self.iter_classify_batches(prescriptions, workers, shard_size):
+            if on_progress:
+                on_progress(progress)
+                
+        return progress['grouped'], progress['results']
+        
+    def iter_classify_batches(self, prescriptions: List[Dict], workers: int = 1,
+                              shard_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Classify prescriptions shard by shard, yielding running results
+        
+        Shards are classified in worker processes when workers > 1. Results
+        are merged in input order, so the grouped lists match a sequential run.
+        
+        Yields:
+            Dictionary with processed/total counts, the running grouped dict,
+            classification results and group statistics
         """
         
-        grouped_prescriptions = {
+        grouped_prescriptions = self._empty_groups()
+        classification_results = []
+        shards = [prescriptions[i:i + shard_size] for i in range(0, len(prescriptions), max(1, shard_size))]
+        processed = 0
+        
+        if workers > 1 and len(shards) > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(self,))
+            shard_outputs = executor.map(_classify_shard, shards)
+        else:
+            executor = None
+            shard_outputs = (self._classify_shard(shard) for shard in shards)
+            
+        try:
+            for shard, outputs in zip(shards, shard_outputs):
+                for prescription, (classification, result) in zip(shard, outputs):
+                    prescription['classification'] = classification
+                    grouped_prescriptions[classification['group_id']].append(prescription)
+                    if result is not None:
+                        classification_results.append(result)
+                        
+                processed += len(shard)
+                yield {
+                    'processed': processed,
+                    'total': len(prescriptions),
+                    'grouped': grouped_prescriptions,
+                    'results': classification_results,
+                    'stats': self.get_group_statistics(grouped_prescriptions)
+                }
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+                
+    def _empty_groups(self) -> Dict[str, List[Dict]]:
+        return {
             "A": [],
             "B": [],
             "C": [],
@@ -266,43 +407,39 @@ class PrescriptionGroupClassifier:
             "temp_protection": []
         }
         
-        classification_results = []
+    def _classify_shard(self, shard: List[Dict]) -> List[Tuple[Dict, Optional[Dict]]]:
+        """Classify a shard; returns (classification dict, result) per prescription"""
         
-        for prescription in prescriptions:
+        outputs = []
+        for prescription in shard:
             try:
                 classification = self.classify_prescription(prescription)
-                
-                # Add prescription to appropriate group
-                group_id = classification.group_id
-                if group_id in grouped_prescriptions:
-                    prescription['classification'] = {
-                        'group_id': classification.group_id,
-                        'group_name': classification.group_name,
-                        'reason': classification.reason,
-                        'confidence': classification.confidence,
-                        'details': classification.details
-                    }
-                    grouped_prescriptions[group_id].append(prescription)
-                    
-                classification_results.append({
+                outputs.append(({
+                    'group_id': classification.group_id,
+                    'group_name': classification.group_name,
+                    'reason': classification.reason,
+                    'confidence': classification.confidence,
+                    'details': classification.details,
+                    'keyword_hits': classification.keyword_hits,
+                    'barcode_hits': classification.barcode_hits
+                }, {
                     'prescription_id': prescription.get('recete_no', 'unknown'),
                     'patient': prescription.get('hasta_ad_soyad', 'unknown'),
                     'classification': classification
-                })
+                }))
                 
             except Exception as e:
                 print(f"Classification error for prescription: {e}")
                 # Default to B group on error
-                prescription['classification'] = {
+                outputs.append(({
                     'group_id': 'B',
                     'group_name': 'B Grubu - Normal İlaçlar',
                     'reason': f'Classification error: {e}',
                     'confidence': 0.5,
                     'details': ['Error in classification']
-                }
-                grouped_prescriptions['B'].append(prescription)
+                }, None))
                 
-        return grouped_prescriptions, classification_results
+        return outputs
         
     def get_group_statistics(self, grouped_prescriptions: Dict[str, List[Dict]]) -> Dict:
         """Get statistics about grouped prescriptions"""
@@ -326,6 +463,16 @@ class PrescriptionGroupClassifier:
                 
         return stats
 
+# Worker process state for sharded batch classification
+_worker_classifier: Optional[PrescriptionGroupClassifier] = None
+
+def _init_batch_worker(classifier: PrescriptionGroupClassifier):
+    global _worker_classifier
+    _worker_classifier = classifier
+
+def _classify_shard(shard: List[Dict]) -> List[Tuple[Dict, Optional[Dict]]]:
+    return _worker_classifier._classify_shard(shard)
+
 def test_prescription_classifier():
     """Test the prescription classifier"""
     
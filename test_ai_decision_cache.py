@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+AI Decision Cache Test
+Reçete parmak izinin kimlik alanlarını dışladığını, TTL/boyut sınırını ve API çağrısı tasarrufunu kontrol eder
+"""
+
+import sys
+import os
+import copy
+import re
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.decision_cache import DecisionCache, estimate_cost, prescription_fingerprint
+from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+PRESCRIPTION = {
+    "recete_no": "3GP25RF", "hasta_ad": "YALÇIN", "hasta_soyad": "DURDAĞI", "hasta_tc": "11916110202",
+    "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "3"},
+              {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+    "rapor_no": "1992805", "rapor_tarihi": "22/05/2025",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}
+}
+
+class _Usage:
+    input_tokens = 1200
+    output_tokens = 300
+
+class _Response:
+    usage = _Usage()
+
+    class _Text:
+        text = '{"action": "approve", "confidence": 0.9, "reason": "Uygun"}'
+
+    content = [_Text()]
+
+class _FakeMessages:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return _Response()
+
+class _FakeClient:
+    def __init__(self):
+        self.messages = _FakeMessages()
+
+class _SizedMessages:
+    """Reçete numarasına göre farklı token kullanımı döndüren sahte Messages API"""
+
+    def create(self, **params):
+        recete_no = re.search(r"^Reçete: (\S+)", params["messages"][0]["content"], re.MULTILINE).group(1)
+        response = _Response()
+        response.usage = {"input_tokens": 1000 * int(recete_no[1:]), "output_tokens": 100}
+        return response
+
+def test_fingerprint():
+    """Kimlik alanları özete girmemeli, analiz alanları girmeli"""
+    print("\n--- FINGERPRINT ---")
+
+    base = prescription_fingerprint(PRESCRIPTION, "v1")
+
+    other_patient = dict(PRESCRIPTION, recete_no="X1", hasta_ad="AHMET", hasta_tc="22222222222")
+    assert prescription_fingerprint(other_patient, "v1") == base
+
+    # İlaç sırası ve yazımı (kanonik anahtar) özeti değiştirmez
+    reordered = dict(PRESCRIPTION, drugs=[{"ilac_adi": "VEMLİDY 25 MG 30 FILM KAPLI TABLET", "adet": "1"},
+                                          {"ilac_adi": "PANTO 40 MG 28 TABLET", "adet": "3"}])
+    assert prescription_fingerprint(reordered, "v1") == base
+
+    changes = {
+        "quantity": dict(PRESCRIPTION, drugs=[dict(PRESCRIPTION["drugs"][0], adet="4"), PRESCRIPTION["drugs"][1]]),
+        "icd": dict(PRESCRIPTION, report_details={"rapor_numarasi": "1992805", "tani_bilgileri": ["K21.0"]}),
+        "message": dict(PRESCRIPTION, ilac_mesajlari="1038(1) - 4.2.13"),
+        "report": dict(PRESCRIPTION, rapor_no="", report_details={"tani_bilgileri": [{"tani_kodu": "B18.1"}]}),
+    }
+    for name, changed in changes.items():
+        assert prescription_fingerprint(changed, "v1") != base, name
+
+    # Kutu miktarı, reçete tarihi/genel kontroller ve hasta yaşı anahtara girer
+    vemlidy_30 = dict(PRESCRIPTION, recete_tarihi="01/06/2025",
+                      drugs=[{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "3"}])
+    vemlidy_90 = dict(vemlidy_30, recete_tarihi="01/06/2022",
+                      drugs=[{"ilac_adi": "VEMLIDY 25MG 90 FILM KAPLI TABLET", "adet": "3"}])
+    assert prescription_fingerprint(vemlidy_30, "v1") != prescription_fingerprint(vemlidy_90, "v1")
+    assert prescription_fingerprint(vemlidy_30, "v1") != prescription_fingerprint(
+        dict(vemlidy_30, recete_tarihi="01/06/2022"), "v1")
+
+    compliant = {"compliant": True, "issues": []}
+    too_old = {"compliant": True, "issues": ["Prescription too old: 1022 days"]}
+    assert prescription_fingerprint(vemlidy_30, "v1", general_compliance=compliant) == prescription_fingerprint(
+        dict(vemlidy_30, recete_tarihi="02/06/2025"), "v1", general_compliance=compliant)
+    assert prescription_fingerprint(vemlidy_30, "v1", general_compliance=compliant) != prescription_fingerprint(
+        vemlidy_30, "v1", general_compliance=too_old)
+    assert prescription_fingerprint(vemlidy_30, "v1", general_compliance=too_old) == prescription_fingerprint(
+        vemlidy_30, "v1", general_compliance={"compliant": True, "issues": ["Prescription too old: 1023 days"]})
+
+    child = dict(vemlidy_30, dogum_tarihi="15/03/2015")
+    adult = dict(vemlidy_30, dogum_tarihi="15/03/1980")
+    assert prescription_fingerprint(child, "v1") != prescription_fingerprint(adult, "v1")
+    assert prescription_fingerprint(adult, "v1") == prescription_fingerprint(
+        dict(vemlidy_30, hasta_dogum_tarihi="1980-01-20"), "v1")
+    assert prescription_fingerprint(PRESCRIPTION, "v2") != base
+    assert prescription_fingerprint(PRESCRIPTION, "v1", extra={"model": "m"}) != base
+
+    return True
+
+def test_ttl_and_eviction(tmp_dir):
+    """Süresi dolan kayıtlar ıskalanmalı, sınır aşılınca en eski kullanılan silinmeli"""
+    print("\n--- TTL / EVICTION ---")
+
+    cache = DecisionCache(os.path.join(tmp_dir, "evict.db"), ttl_seconds=3600, max_entries=2)
+    cache.put("a", {"action": "approve"}, cost=0.01)
+    cache.put("b", {"action": "hold"}, cost=0.02)
+    time.sleep(0.01)
+    assert cache.get("a") == {"action": "approve"}  # a yeni kullanıldı
+    cache.put("c", {"action": "reject"}, cost=0.03)
+    assert cache.get("b") is None and cache.get("a") is not None and len(cache) == 2
+
+    stats = cache.stats()
+    print(f"  {stats}")
+    assert stats["evictions"] == 1 and stats["hits"] == 2 and stats["misses"] == 1
+    assert abs(stats["avoided_cost"] - 0.02) < 1e-9
+
+    expired = DecisionCache(os.path.join(tmp_dir, "ttl.db"), ttl_seconds=0.05)
+    expired.put("a", {"action": "approve"})
+    time.sleep(0.1)
+    assert expired.get("a") is None and expired.stats()["expired"] == 1
+
+    # Kalıcılık: yeni örnek aynı dosyadan okur
+    assert DecisionCache(os.path.join(tmp_dir, "evict.db")).get("c") == {"action": "reject"}
+
+    assert estimate_cost({"input_tokens": 1_000_000, "output_tokens": 0}, 0.25, 1.25) == 0.25
+    assert estimate_cost(None, 0.25, 1.25) == 0.0
+
+    return True
+
+def test_analyzer_skips_repeat_calls(tmp_dir):
+    """Aynı reçete ikinci kez işlendiğinde Claude çağrılmamalı"""
+    print("\n--- ANALYZER CACHE ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE_PATH"] = os.path.join(tmp_dir, "analyzer.db")
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = _FakeClient()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+
+    first = analyzer.analyze_prescription_with_claude(copy.deepcopy(PRESCRIPTION))
+    second = analyzer.analyze_prescription_with_claude(dict(copy.deepcopy(PRESCRIPTION), recete_no="OTHER"))
+    assert analyzer.client.messages.calls == 1
+    assert not first["cache_hit"] and second["cache_hit"]
+    assert second["action"] == first["action"] and second["prescription_id"] == "OTHER"
+
+    stats = analyzer.get_cache_stats()
+    print(f"  hit rate {stats['hit_rate']}, avoided ${stats['avoided_cost']}")
+    assert stats["hit_rate"] == 0.5 and stats["avoided_cost"] > 0
+
+    return True
+
+def test_concurrent_call_costs(tmp_dir):
+    """Paylaşılan analizörde eşzamanlı çağrıların maliyeti kendi reçetesine yazılmalı"""
+    print("\n--- CONCURRENT COSTS ---")
+
+    os.environ["AI_DECISION_CACHE_PATH"] = os.path.join(tmp_dir, "concurrent.db")
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": _SizedMessages()})()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+
+    # Tüm çağrılar yanıt aldıktan sonra devam eder: paylaşılan "son çağrı" değeri olsaydı hepsi aynısını okurdu
+    prescriptions = [dict(copy.deepcopy(PRESCRIPTION), recete_no=f"C{i}", ilac_mesajlari=f"10{i:02d}(1) - 4.2.{i}")
+                     for i in range(1, 5)]
+    barrier = threading.Barrier(len(prescriptions))
+    call_api = analyzer._call_claude_api
+
+    def call_and_wait(*args, **kwargs):
+        response = call_api(*args, **kwargs)
+        barrier.wait(timeout=5)
+        return response
+
+    analyzer._call_claude_api = call_and_wait
+    threads = [threading.Thread(target=analyzer.analyze_prescription_with_claude, args=(copy.deepcopy(p),))
+               for p in prescriptions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for prescription in prescriptions:
+        before = analyzer.get_cache_stats()["avoided_cost"]
+        assert analyzer.analyze_prescription_with_claude(copy.deepcopy(prescription))["cache_hit"]
+        avoided = analyzer.get_cache_stats()["avoided_cost"] - before
+        expected = analyzer.estimate_call_cost({"input_tokens": 1000 * int(prescription["recete_no"][1:]),
+                                                "output_tokens": 100})
+        print(f"  {prescription['recete_no']}: avoided ${avoided:.6f}")
+        assert abs(avoided - expected) < 1e-6
+
+    return True
+
+if __name__ == "__main__":
+    print("=== AI DECISION CACHE TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = (test_fingerprint() and test_ttl_and_eviction(tmp_dir)
+                   and test_analyzer_skips_repeat_calls(tmp_dir) and test_concurrent_call_costs(tmp_dir))
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+AI Gating Test
+Doz/SUT kesin karar verdiğinde Claude çağrısının atlandığını, nihai kararın
+değişmediğini ve batch başına atlanan çağrıların raporlandığını kontrol eder
+"""
+
+import sys
+import os
+import copy
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.ai_gating import AIGatingPolicy, summarize_ai_gating, sut_findings
+
+COMPLIANT = {
+    "recete_no": "G1", "hasta_ad": "YALÇIN", "hasta_soyad": "DURDAĞI", "hasta_tc": "11916110202",
+    "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "3"}],
+    "ilac_mesajlari": "",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "K21.0"}]}
+}
+
+# Raporlu ilaç, rapor yok ve tanı uyumsuz -> SUT "hold", AI gerekli
+UNCERTAIN = {
+    "recete_no": "U1", "hasta_tc": "11916110202",
+    "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi"
+}
+
+def _stage(action, confidence, **analysis):
+    return {"recommendation": {"action": action, "confidence": confidence, "reason": action},
+            "analysis": analysis, "processing_time": 0.0}
+
+class _Text:
+    text = '{"action": "approve", "confidence": 0.9, "reason": "Uygun"}'
+
+class _Response:
+    content = [_Text()]
+    usage = None
+
+class _SlowMessages:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return _Response()
+
+def test_policy():
+    """Kural bazında atlama kararları"""
+    print("\n--- POLICY ---")
+
+    policy = AIGatingPolicy()
+    clean_sut = _stage("approve", 0.95, overall_compliance=True, warnings=[], issues=[], drug_analyses=[],
+                       message_code_analysis={"missing_codes": []}, general_compliance={"compliant": True, "issues": []})
+
+    assert policy.evaluate(_stage("reject", 0.95, violations=1), clean_sut).rule == "dose_reject"
+    assert policy.evaluate(_stage("hold", 0.5), _stage("reject", 0.9, issues=["a", "b", "c"])).rule == "sut_reject"
+
+    gate = policy.evaluate(_stage("hold", 0.5, violations=0), clean_sut)
+    assert gate.rule == "sut_approve" and gate.action == "approve"
+
+    # Belirsiz veya çelişkili durumlar AI'ye gider
+    warned = _stage("approve", 0.8, overall_compliance=True, warnings=["w"], issues=[])
+    assert policy.evaluate(_stage("hold", 0.5), warned) is None
+    assert policy.evaluate(_stage("hold", 0.5), _stage("hold", 0.6, issues=["x"])) is None
+    assert policy.evaluate(_stage("awaiting_data", 0.5), clean_sut) is None
+    assert policy.evaluate(_stage("hold", 0.5), dict(clean_sut, error="boom")) is None
+
+    # Yapılandırma
+    assert AIGatingPolicy(enabled=False).evaluate(_stage("reject", 0.95), clean_sut) is None
+    assert AIGatingPolicy(skip_on_reject=False).evaluate(_stage("reject", 0.95), clean_sut) is None
+    assert AIGatingPolicy(sut_approve_min_confidence=1.1).evaluate(_stage("hold", 0.5), clean_sut) is None
+
+    # Genel kural sonucu olmayan analiz doğrulanmış sayılmaz
+    assert policy.evaluate(_stage("hold", 0.5), _stage("approve", 0.95, overall_compliance=True)) is None
+
+    ai_result = AIGatingPolicy.to_ai_result(gate)
+    assert ai_result["gated"] and ai_result["result"]["gate_rule"] == "sut_approve"
+    return True
+
+def test_real_sut_findings():
+    """Gerçek SUTRulesDatabase çıktısında ilaç, mesaj kodu ve genel kural bulguları AI'yı atlatmamalı"""
+    print("\n--- REAL SUT OUTPUT ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from ai_analyzer.sut_rules_database import SUTRulesDatabase
+
+    sut_db = SUTRulesDatabase()
+    policy = AIGatingPolicy()
+    dose_hold = _stage("hold", 0.5, violations=0)
+
+    def gate(prescription):
+        sut_result = {"analysis": sut_db.get_sut_analysis_for_prescription(prescription),
+                      "recommendation": sut_db.get_recommendation_for_prescription(prescription)}
+        return sut_result, policy.evaluate(dose_hold, sut_result)
+
+    sut_result, decision = gate(copy.deepcopy(COMPLIANT))
+    assert decision is not None and decision.rule == "sut_approve"
+
+    old_date = (datetime.now() - timedelta(days=1022)).strftime("%d/%m/%Y")
+    cases = {
+        "unknown drug, no TC, old date": {"recete_no": "X1", "recete_tarihi": old_date,
+                                          "drugs": [{"ilac_adi": "BILINMEYEN ILAC 10 MG", "adet": "1"}]},
+        "unknown drug": dict(copy.deepcopy(COMPLIANT), drugs=[{"ilac_adi": "BILINMEYEN ILAC 10 MG", "adet": "1"}]),
+        "old date": dict(copy.deepcopy(COMPLIANT), recete_tarihi=old_date),
+        "no TC": {key: value for key, value in COMPLIANT.items() if key != "hasta_tc"},
+        "missing message code": dict(copy.deepcopy(UNCERTAIN), ilac_mesajlari="",
+                                     report_details={"rapor_numarasi": "1", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}),
+    }
+    for name, prescription in cases.items():
+        sut_result, decision = gate(prescription)
+        print(f"  {name}: SUT {sut_result['recommendation']['action']} "
+              f"{sut_result['recommendation']['confidence']}, findings {sut_findings(sut_result['analysis'])}")
+        assert sut_findings(sut_result["analysis"]), name
+        assert decision is None or decision.rule != "sut_approve", name
+
+    # Doz aşaması çöktüyse "hold" çelişkisiz sayılmaz
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    processor = UnifiedPrescriptionProcessor()
+    processor.dose_controller = None
+    dose_result = processor._perform_dose_control(copy.deepcopy(COMPLIANT))
+    assert dose_result["error"] and policy.evaluate(dose_result, gate(copy.deepcopy(COMPLIANT))[0]) is None
+    return True
+
+def test_processor_skips_ai():
+    """Kesin reçetelerde Claude çağrılmamalı, nihai karar kapısız çalışmayla aynı olmalı"""
+    print("\n--- PROCESSOR ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    processor = UnifiedPrescriptionProcessor()
+    processor.ai_analyzer.model = "test-model"
+    processor.ai_analyzer.claude_enabled = True
+    processor.ai_analyzer.client = type("Client", (), {"messages": _SlowMessages(0.05)})()
+
+    prescriptions = [dict(copy.deepcopy(COMPLIANT), recete_no=f"G{i}") for i in range(6)]
+    prescriptions += [dict(copy.deepcopy(UNCERTAIN), recete_no=f"U{i}") for i in range(2)]
+
+    def run(policy):
+        processor.ai_gating = policy
+        processor.ai_analyzer.client.messages.calls = 0
+        start = time.perf_counter()
+        results = [processor.process_single_prescription(copy.deepcopy(p)) for p in prescriptions]
+        return results, processor.ai_analyzer.client.messages.calls, time.perf_counter() - start
+
+    ungated, ungated_calls, ungated_time = run(AIGatingPolicy(enabled=False))
+    gated, gated_calls, gated_time = run(AIGatingPolicy())
+
+    print(f"  AI calls {ungated_calls} -> {gated_calls}, {ungated_time:.2f}s -> {gated_time:.2f}s")
+    assert ungated_calls == len(prescriptions) and gated_calls == 2
+    assert [r["final_decision"] for r in gated] == [r["final_decision"] for r in ungated]
+    assert "error" not in [r["final_decision"] for r in gated]
+    assert gated[0]["ai_analysis"]["gate_rule"] == "sut_approve" and not gated[-1]["ai_analysis"]["gated"]
+    assert gated[0]["dose_analysis"]["action"] == "hold"
+
+    summary = summarize_ai_gating(gated)
+    print(f"  {summary}")
+    assert summary["ai_calls_avoided"] == 6 and summary["ai_calls"] == 2
+    assert summary["by_rule"] == {"sut_approve": 6}
+    assert summary["avg_time_ai"] > summary["avg_time_gated"] and summary["estimated_time_saved"] > 0
+    assert summarize_ai_gating(ungated)["ai_calls_avoided"] == 0
+    return True
+
+if __name__ == "__main__":
+    print("=== AI GATING TEST ===")
+
+    success = test_policy() and test_real_sut_findings() and test_processor_skips_ai()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+AI Provider Test
+Sağlayıcı kütüphanelerinin tembel yüklendiğini, istemcinin süreç genelinde
+paylaşıldığını, ortak istek/yanıt tipini ve eşzamanlılık sınırını kontrol eder
+"""
+
+import sys
+import os
+import json
+import threading
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+    os.environ.setdefault(key, "test")
+os.environ["AI_DECISION_CACHE"] = "false"
+
+from ai_analyzer.ai_providers import (AIRequest, AnthropicProvider, OpenAIProvider, ProviderConfig,
+                                      close_providers, get_provider)
+from ai_analyzer.decision_schema import DECISION_TOOL_NAME, anthropic_tool
+from config.settings import Settings
+
+DECISION = {"action": "approve", "confidence": 0.95, "reason": "Uygun"}
+
+class _Messages:
+    """Eşzamanlı istek sayısını ölçen sahte Messages API"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.params = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def create(self, **params):
+        with self._lock:
+            self.params.append(params)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        return SimpleNamespace(
+            model=params["model"],
+            content=[SimpleNamespace(type="tool_use", name=DECISION_TOOL_NAME, input=dict(DECISION))],
+            usage=SimpleNamespace(input_tokens=120, output_tokens=30)
+        )
+
+def test_lazy_and_shared():
+    """Modül yüklemek SDK'yı içe aktarmamalı, aynı anahtar için tek sağlayıcı olmalı"""
+    print("\n--- LAZY / SHARED ---")
+
+    from ai_analyzer import decision_engine  # noqa: F401  (openai/anthropic olmadan yüklenebilmeli)
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    assert "openai" not in sys.modules and "anthropic" not in sys.modules
+
+    first, second = UnifiedPrescriptionProcessor(), UnifiedPrescriptionProcessor()
+    assert first.ai_analyzer.provider is second.ai_analyzer.provider
+    assert first.ai_analyzer.provider is get_provider("anthropic", Settings())
+    assert get_provider("openai", Settings()) is not first.ai_analyzer.provider
+    assert first.ai_analyzer.model == Settings().ai_fast_model
+
+    engine = decision_engine.DecisionEngine(Settings())
+    assert engine.provider is first.ai_analyzer.provider and engine.model == Settings().ai_model
+
+    # Bağlantı ayarı değişen Settings yeni istemci alır
+    settings = Settings()
+    settings.ai_base_url = "http://127.0.0.1:8765"
+    local = get_provider("anthropic", settings)
+    assert local is not first.ai_analyzer.provider and local.config.base_url == "http://127.0.0.1:8765"
+    assert get_provider("anthropic", settings) is local
+    settings.ai_request_timeout = 5.0
+    assert get_provider("anthropic", settings).config.timeout == 5.0
+
+    close_providers()
+    assert get_provider("claude", Settings()) is not first.ai_analyzer.provider
+    return True
+
+def test_request_translation():
+    """Ortak istek her sağlayıcının parametrelerine çevrilmeli"""
+    print("\n--- REQUEST ---")
+
+    config = ProviderConfig(name="anthropic", api_key="k", model="default-model")
+    request = AIRequest(prompt="Reçete: X", system="sistem", max_tokens=300, tool=anthropic_tool(),
+                        cache_system=True)
+
+    params = AnthropicProvider(config).build_params(request)
+    assert params["model"] == "default-model" and params["max_tokens"] == 300
+    assert params["system"] == [{"type": "text", "text": "sistem", "cache_control": {"type": "ephemeral"}}]
+    assert params["tool_choice"] == {"type": "tool", "name": DECISION_TOOL_NAME}
+
+    params = OpenAIProvider(config._replace(name="openai")).build_params(request._replace(model="gpt-x"))
+    assert params["model"] == "gpt-x" and [m["role"] for m in params["messages"]] == ["system", "user"]
+    assert params["tools"][0]["function"]["parameters"] == anthropic_tool()["input_schema"]
+    assert params["tool_choice"] == {"type": "function", "function": {"name": DECISION_TOOL_NAME}}
+    assert "tools" not in AnthropicProvider(config).build_params(request._replace(tool=None))
+    return True
+
+def test_complete_and_concurrency():
+    """Yanıt ortak tipe çevrilmeli, eşzamanlı istek sayısı sınırı aşılmamalı"""
+    print("\n--- COMPLETE / CONCURRENCY ---")
+
+    messages = _Messages(latency=0.03)
+    provider = AnthropicProvider(ProviderConfig(name="anthropic", api_key="k", model="m", max_concurrency=2),
+                                 client=SimpleNamespace(messages=messages))
+
+    response = provider.complete(AIRequest(prompt="x", tool=anthropic_tool()))
+    assert response.content == DECISION and response.usage["input_tokens"] == 120
+    assert response.provider == "anthropic" and response.model == "m" and response.latency > 0
+    assert json.loads(json.dumps(response.usage))
+
+    threads = [threading.Thread(target=provider.complete, args=(AIRequest(prompt=str(i)),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"  max in flight: {messages.max_in_flight}")
+    assert len(messages.params) == 9 and messages.max_in_flight == 2
+
+    # Karar motoru aynı katman üzerinden çalışır
+    from ai_analyzer.decision_engine import DecisionEngine
+
+    engine = DecisionEngine(Settings())
+    engine.provider = provider
+    response = engine._call_ai_api("Reçete")
+    decision = engine._parse_ai_response(response.content)
+    assert decision["action"] == "approve" and response.usage["output_tokens"] == 30
+    assert messages.params[-1]["model"] == engine.model
+    return True
+
+if __name__ == "__main__":
+    print("=== AI PROVIDER TEST ===")
+
+    success = test_lazy_and_shared() and test_request_translation() and test_complete_and_concurrency()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+AI Replay Test
+Yerel sahte Messages API sunucusunun gecikme, hata oranı ve 429 davranışını,
+kasetin istek/yanıt çiftlerini kaydedip ağ olmadan tekrar oynattığını kontrol eder
+"""
+
+import sys
+import os
+import copy
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+    os.environ.setdefault(key, "test")
+os.environ["AI_DECISION_CACHE"] = "false"
+
+from ai_analyzer.ai_providers import AIRequest, AnthropicProvider, ProviderConfig
+from ai_analyzer.ai_replay import Cassette, CassetteClient, CassetteMiss, request_key
+from ai_analyzer.decision_schema import anthropic_tool
+from ai_analyzer.fake_claude_server import APIStatusError, FakeClaudeServer, LocalMessagesClient
+
+PRESCRIPTIONS = [
+    {"recete_no": f"R{i}", "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": str(i + 1)}],
+     "report_details": {"rapor_numarasi": "1", "tani_bilgileri": [{"tani_kodu": "K21.0"}]}}
+    for i in range(3)
+]
+
+def _statuses(server, count):
+    client = LocalMessagesClient(server.url)
+    statuses = []
+    for i in range(count):
+        try:
+            client.messages.create(model="m", max_tokens=10, messages=[{"role": "user", "content": str(i)}])
+            statuses.append(200)
+        except APIStatusError as e:
+            statuses.append(e.status_code)
+    return statuses
+
+def test_fake_server():
+    """Yanıt biçimi, deterministik hata enjeksiyonu, 429 ve gecikme"""
+    print("\n--- FAKE SERVER ---")
+
+    with FakeClaudeServer(latency=0.02) as server:
+        provider = AnthropicProvider(ProviderConfig(name="anthropic", api_key="k", model="m"),
+                                     client=LocalMessagesClient(server.url))
+        response = provider.complete(AIRequest(prompt="Reçete: X", tool=anthropic_tool()))
+        assert response.content["action"] == "approve" and response.usage["input_tokens"] > 0
+        assert response.latency >= 0.02 and server.received[0]["tool_choice"]["name"] == anthropic_tool()["name"]
+
+    # Aynı tohum -> aynı hata dizisi
+    runs = []
+    for _ in range(2):
+        with FakeClaudeServer(error_rate=0.3, seed=7) as server:
+            runs.append(_statuses(server, 30))
+    print(f"  error pattern: {runs[0]}")
+    assert runs[0] == runs[1] and set(runs[0]) <= {200, 500, 529}
+    assert 3 <= sum(status != 200 for status in runs[0]) <= 18
+
+    # Hız sınırı: kova boşalınca 429 ve retry-after
+    with FakeClaudeServer(rate_limit_per_second=5, retry_after=2) as server:
+        statuses = _statuses(server, 8)
+        try:
+            LocalMessagesClient(server.url).messages.create(model="m", messages=[])
+        except APIStatusError as e:
+            assert e.status_code == 429 and e.retry_after == 2.0 and e.error_type == "rate_limit_error"
+    print(f"  rate limit: {statuses}")
+    assert statuses[:5] == [200] * 5 and 429 in statuses
+
+    # Eşzamanlılık sınırı
+    with FakeClaudeServer(latency=0.1, max_in_flight=2) as server:
+        results = []
+        threads = [threading.Thread(target=lambda: results.extend(_statuses(server, 1))) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"  concurrency: {sorted(results)}, {server.stats()}")
+        assert results.count(200) >= 2 and 429 in results and server.peak_in_flight == 2
+    return True
+
+def test_cassette(tmp_dir):
+    """Kayıt, tekrar oynatma, eksik kayıt ve analizörle çevrimdışı çalışma"""
+    print("\n--- CASSETTE ---")
+
+    path = os.path.join(tmp_dir, "cassette.jsonl")
+    os.environ["AI_CASSETTE_MODE"] = "off"
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    with FakeClaudeServer(latency=0.05) as server:
+        recorder = ClaudePrescriptionAnalyzer()
+        recorder.client = CassetteClient(Cassette(path, "record"), LocalMessagesClient(server.url))
+        recorder.claude_enabled = True
+        recorded = [recorder.analyze_prescription_with_claude(copy.deepcopy(p)) for p in PRESCRIPTIONS]
+        assert len(server.received) == 3
+
+    # Kayıt sunucu kapalıyken ve SDK olmadan oynatılır
+    os.environ["AI_CASSETTE_MODE"] = "replay"
+    os.environ["AI_CASSETTE_PATH"] = path
+    replayer = ClaudePrescriptionAnalyzer()
+    assert replayer.claude_enabled and len(replayer.cassette) == 3
+
+    start = time.time()
+    replayed = [replayer.analyze_prescription_with_claude(copy.deepcopy(p)) for p in PRESCRIPTIONS]
+    elapsed = time.time() - start
+    print(f"  replay: {elapsed*1000:.1f} ms, {replayer.get_cassette_stats()}")
+    for before, after in zip(recorded, replayed):
+        assert before["analysis_details"]["claude_analysis"] == after["analysis_details"]["claude_analysis"]
+        assert before["token_usage"]["input_tokens"] == after["token_usage"]["input_tokens"]
+    assert replayer.get_cassette_stats()["hits"] == 3
+
+    # Kayıtlı gecikme istenirse uygulanır
+    cassette = Cassette(path, "replay", replay_latency=True)
+    params = next(iter(cassette._entries.values()))["request"]
+    start = time.time()
+    CassetteClient(cassette).messages.create(**params)
+    assert time.time() - start >= 0.05
+
+    # Kayıtta olmayan istek hata verir, auto modunda kaydedilir
+    params = dict(params, max_tokens=params["max_tokens"] + 1)
+    try:
+        CassetteClient(cassette).messages.create(**params)
+        assert False, "CassetteMiss expected"
+    except CassetteMiss:
+        pass
+    with FakeClaudeServer() as server:
+        auto = CassetteClient(Cassette(path, "auto"), LocalMessagesClient(server.url))
+        auto.messages.create(**params)
+        auto.messages.create(**params)
+        assert len(server.received) == 1
+    assert request_key(params) in Cassette(path, "replay")._entries
+
+    os.environ["AI_CASSETTE_MODE"] = "off"
+    return True
+
+if __name__ == "__main__":
+    print("=== AI REPLAY TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = test_fake_server() and test_cassette(tmp_dir)
+
+    sys.exit(0 if success else 1)
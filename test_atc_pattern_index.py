@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+ATC Pattern Index Test
+Derlenmiş ATC desen indeksini eski desen-desen eşleştirmeyle karşılaştırır
+"""
+
+import sys
+import os
+import re
+import time
+import random
+import string
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sut_rules import SUTRules, ATCPatternIndex
+
+def _legacy_match(drug_code, pattern):
+    """Eski _match_atc_pattern: her çağrıda regex üretir"""
+    if "*" in pattern:
+        return bool(re.match(pattern.replace("*", ".*"), drug_code))
+    return drug_code == pattern
+
+def _random_atc(rng):
+    return (rng.choice("ABCDGHJLMNPRSV") + f"{rng.randint(1, 16):02d}"
+            + "".join(rng.choice(string.ascii_uppercase[:8]) for _ in range(2)) + f"{rng.randint(1, 20):02d}")
+
+def test_index_matches_legacy_semantics():
+    """İndeks sonuçları eski eşleştirme ile aynı olmalı"""
+    print("\n--- INDEX vs LEGACY SEMANTICS ---")
+
+    rules = {"prefix": ["C09*", "C0*"], "exact": ["A10BA02"], "inner": ["N0*A*"], "all": ["*"]}
+    index = ATCPatternIndex()
+    for rule_key, patterns in rules.items():
+        index.add_rules(rule_key, patterns)
+
+    for drug_code in ("C09AA01", "C08CA01", "A10BA02", "A10BA03", "N06AB03", "N05BA01", "J07BB"):
+        expected = {key for key, patterns in rules.items() if any(_legacy_match(drug_code, p) for p in patterns)}
+        assert index.match(drug_code) == expected, (drug_code, index.match(drug_code), expected)
+    print("  prefix/exact/inner wildcard [OK]")
+
+    checker = SUTRules()
+    age = checker.check_age_restrictions(10, ["C02AC01", "N06AB03"])
+    assert age["inappropriate"] == ["C02AC01"] and age["appropriate"] == ["N06AB03"], age
+    contra = checker.check_contraindications(["pregnancy", "kidney_failure"], ["C09AA01", "A10BA02", "N02BE01"])
+    assert [c["drug"] for c in contra["contraindicated"]] == ["C09AA01", "A10BA02"]
+    assert contra["safe"] == ["N02BE01"]
+    print("  SUTRules age/contraindication checks [OK]")
+
+    return True
+
+def benchmark_large_rule_set(rule_count=5000, drug_count=500):
+    """Büyük ATC kural setinde ilaç başına eşleşen kuralların bulunması"""
+    print("\n--- LARGE ATC RULE SET BENCHMARK ---")
+
+    rng = random.Random(11)
+    rules = {}
+    for i in range(rule_count):
+        code = _random_atc(rng)
+        cut = rng.choice((1, 3, 4, 5, 7))
+        rules[f"rule_{i}"] = [code[:cut] + "*" if cut < 7 else code]
+
+    drug_codes = [_random_atc(rng) for _ in range(drug_count)]
+
+    start = time.perf_counter()
+    index = ATCPatternIndex()
+    for rule_key, patterns in rules.items():
+        index.add_rules(rule_key, patterns)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    indexed = [index.match(code) for code in drug_codes]
+    index_us = (time.perf_counter() - start) * 1e6 / drug_count
+
+    sample = drug_codes[:50]
+    start = time.perf_counter()
+    legacy = [{key for key, patterns in rules.items() if any(_legacy_match(code, p) for p in patterns)}
+              for code in sample]
+    legacy_us = (time.perf_counter() - start) * 1e6 / len(sample)
+
+    assert indexed[:50] == legacy
+    print(f"  {rule_count} rules compiled in {compile_ms:.0f} ms")
+    print(f"  legacy per-pattern regex: {legacy_us:10.1f} µs/drug")
+    print(f"  compiled index:           {index_us:10.1f} µs/drug  ({legacy_us / index_us:.0f}x)")
+
+    return True
+
+if __name__ == "__main__":
+    print("=== ATC PATTERN INDEX TEST ===")
+
+    success = test_index_matches_legacy_semantics() and benchmark_large_rule_set()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Barcode Group Classification Test
+Barkod tablosu ile grup sınıflandırmasını, anahtar kelime yedeğini ve paralel toplu sınıflandırmayı kontrol eder
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.barcode_groups import BarcodeGroupTable, get_barcode_group_table
+from prescription_group_classifier import PrescriptionGroupClassifier
+
+TABLE = BarcodeGroupTable({
+    "8698760090229": {"name": "VEMLIDY", "report_required": True},
+    "8699516042257": {"name": "PANTO"},
+    "8690000000011": {"name": "ALBUMIN", "blood_product": True},
+    "8690000000028": {"name": "KOTALI", "sequential_distribution": True},
+}, version="test")
+
+def _prescription(index, barcodes, name="PARACETAMOL 500MG"):
+    return {"recete_no": f"B{index:05d}", "hasta_ad_soyad": "TEST HASTA", "hasta_tc": "12345678901",
+            "drugs": [{"ilac_adi": name, "barkod": barcode} for barcode in barcodes],
+            "drug_messages": [], "report_details": {}}
+
+def test_barcode_lookup():
+    """Barkod özellikleri gruplara çevrilmeli, bilinmeyen barkodlar anahtar kelimeye düşmeli"""
+    print("\n--- BARCODE LOOKUP ---")
+
+    default_table = get_barcode_group_table()
+    assert default_table.lookup("8698760090229").report_required
+    assert default_table.lookup(" 8699516042257 ").groups == []
+    assert default_table.lookup("") is None and "0000000000000" not in default_table
+
+    classifier = PrescriptionGroupClassifier(barcode_table=TABLE)
+
+    # Tüm barkodlar tabloda: ilaç adındaki anahtar kelimeler taranmaz
+    result = classifier.classify_prescription(_prescription(1, ["8699516042257", "8698760090229"], "RAPORLU"))
+    assert result.group_id == "A" and result.barcode_hits == {"A": ["8698760090229"]}
+    assert result.keyword_hits == {}
+
+    blood = classifier.classify_prescription(_prescription(2, ["8690000000011", "8698760090229"]))
+    assert blood.group_id == "C_blood"
+
+    normal = classifier.classify_prescription(_prescription(3, ["8699516042257"], "KAN ÜRÜNÜ"))
+    assert normal.group_id == "B"
+
+    # Bilinmeyen barkod: anahtar kelime taramasına düşülür
+    fallback = classifier.classify_prescription(_prescription(4, ["8699516042257", "123"], "KAN ÜRÜNÜ"))
+    print(f"  fallback: {fallback.group_id} {fallback.keyword_hits}")
+    assert fallback.group_id == "C_blood" and fallback.keyword_hits == {"C_blood": ["kan ürünü"]}
+
+    # Barkodlar çözülse de hasta ve mesaj metni taranır
+    refugee = _prescription(5, ["8699516042257"])
+    refugee.update(hasta_ad_soyad="SURİYELİ GEÇİCİ KORUMA HASTA", hasta_tc="98765432109")
+    assert classifier.classify_prescription(refugee).group_id == "temp_protection"
+
+    quota = _prescription(6, ["8699516042257"])
+    quota["drug_messages"] = ["Sıralı dağıtım kapsamında kotalı ilaç"]
+    result = classifier.classify_prescription(quota)
+    assert result.group_id == "C" and result.keyword_hits == {"C": ["sıralı dağıtım", "kotalı"]}
+
+    quota = _prescription(7, ["8699516042257"])
+    quota["drugs"][0]["ilac_mesajlari"] = "Sıralı dağıtım - kotalı"
+    assert classifier.classify_prescription(quota).group_id == "C"
+
+    # Barkodsuz ilaç listesi eski davranışla aynı
+    assert classifier.classify_prescription({"drugs": ["Kotalı ilaç"]}).group_id == "C"
+
+    return True
+
+def test_parallel_batch():
+    """Paralel toplu sınıflandırma sıralı çalışmayla aynı sonucu vermeli ve ara sonuç bildirmeli"""
+    print("\n--- PARALLEL BATCH ---")
+
+    classifier = PrescriptionGroupClassifier(barcode_table=TABLE)
+    barcode_sets = [["8698760090229"], ["8699516042257"], ["8690000000011"], ["8690000000028"], ["999"]]
+
+    def build():
+        return [_prescription(i, barcode_sets[i % len(barcode_sets)]) for i in range(1000)]
+
+    sequential, sequential_results = classifier.classify_batch_prescriptions(build())
+
+    progress = []
+    parallel, parallel_results = classifier.classify_batch_prescriptions(
+        build(), workers=2, shard_size=100, on_progress=lambda update: progress.append(
+            (update["processed"], update["stats"]["total_prescriptions"]))
+    )
+    print(f"  progress: {progress[:3]} ... {progress[-1]}")
+
+    assert len(progress) == 10 and progress[0] == (100, 100) and progress[-1] == (1000, 1000)
+    assert {group: [p["recete_no"] for p in items] for group, items in parallel.items()} == \
+           {group: [p["recete_no"] for p in items] for group, items in sequential.items()}
+    assert [r["prescription_id"] for r in parallel_results] == [r["prescription_id"] for r in sequential_results]
+    assert classifier.get_group_statistics(parallel)["group_counts"] == {
+        "A": 200, "B": 400, "C": 200, "C_blood": 200, "temp_protection": 0
+    }
+    assert parallel["A"][0]["classification"]["barcode_hits"] == {"A": ["8698760090229"]}
+
+    # Boş girdi
+    empty, empty_results = classifier.classify_batch_prescriptions([], workers=2)
+    assert all(not items for items in empty.values()) and empty_results == []
+
+    return True
+
+if __name__ == "__main__":
+    print("=== BARCODE GROUP CLASSIFICATION TEST ===")
+
+    success = test_barcode_lookup() and test_parallel_batch()
+
+    sys.exit(0 if success else 1)
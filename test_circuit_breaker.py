@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit Breaker Test
+Art arda hatalarda ve yüksek gecikmede devrenin açıldığını, bekleme süresinde
+AI'ın denenmeden atlandığını, deneme isteğiyle kapandığını ve zaman aşımının
+p95 gecikmeden uyarlandığını kontrol eder
+"""
+
+import sys
+import os
+import copy
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+    os.environ.setdefault(key, "test")
+os.environ["AI_DECISION_CACHE"] = "false"
+
+from ai_analyzer.ai_replay import CassetteMiss
+from ai_analyzer.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_transient_error
+from ai_analyzer.fake_claude_server import APIStatusError, FakeClaudeServer, LocalMessagesClient
+
+PRESCRIPTION = {"recete_no": "R", "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "1"}]}
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker():
+    """Durum geçişleri, geçici olmayan hatalar, yavaş çağrılar ve zaman aşımı"""
+    print("\n--- BREAKER ---")
+
+    clock = _Clock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=10, clock=clock)
+    server_error = APIStatusError(529, "overloaded_error", "Overloaded")
+
+    # 4xx istek hataları, programlama ve kaset hataları devreyi açmaz
+    for error in (APIStatusError(400, "invalid_request_error", "bad"), TypeError("bad params"),
+                  CassetteMiss("no entry"), KeyError("model"), ValueError("bad json")):
+        for _ in range(3):
+            assert breaker.allow_request()
+            breaker.record_failure(error)
+    assert breaker.state == CLOSED
+
+    # SDK zaman aşımı/bağlantı hataları tip adından tanınır
+    APIConnectionError = type("APIConnectionError", (Exception,), {})
+    APITimeoutError = type("APITimeoutError", (APIConnectionError,), {})
+    for error in (TimeoutError(), ConnectionResetError(), APIConnectionError(), APITimeoutError(),
+                  APIStatusError(429, "rate_limit_error", "slow down"), server_error):
+        assert is_transient_error(error), error
+
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure(server_error)
+    assert breaker.state == OPEN and not breaker.allow_request() and not breaker.allow_request()
+
+    # Bekleme sonrası tek deneme isteği; başarısızsa yeniden açılır
+    clock.now = 10
+    assert breaker.state == HALF_OPEN and breaker.allow_request() and not breaker.allow_request()
+    breaker.record_failure(TimeoutError("timed out"))
+    assert breaker.state == OPEN
+    clock.now = 20
+    assert breaker.allow_request()
+    breaker.record_success(0.3)
+    assert breaker.state == CLOSED and breaker.allow_request()
+
+    stats = breaker.stats()
+    print(f"  {stats}")
+    assert stats["opened"] == 2 and stats["probes"] == 2 and stats["short_circuited"] == 3
+    assert stats["state_value"] == 0 and stats["consecutive_failures"] == 0
+
+    # p95 gecikme eşiği aşılırsa devre açılır
+    slow = CircuitBreaker(slow_call_seconds=1.0, min_samples=5, clock=clock)
+    for latency in (0.2, 0.3, 0.2, 2.5, 2.5):
+        slow.record_success(latency)
+    assert slow.state == OPEN and "p95" in slow.stats()["open_reason"]
+
+    # Zaman aşımı p95'ten uyarlanır, zaman aşımına uğrayan çağrılar p95'i yükseltir
+    adaptive = CircuitBreaker(min_samples=10, min_timeout=0.5, max_timeout=60, timeout_multiplier=2, clock=clock)
+    assert adaptive.timeout() == 60
+    for _ in range(10):
+        adaptive.record_success(1.0)
+    assert adaptive.timeout() == 2.0
+    for _ in range(2):
+        adaptive.record_failure(TimeoutError(), latency=2.0, timed_out=True)
+    assert adaptive.timeout() == 4.0
+    assert CircuitBreaker(adaptive_timeout=False, max_timeout=30).timeout() == 30
+    return True
+
+def test_analyzer_circuit():
+    """Hatalı API'de çağrılar atlanmalı, iyileşince deneme isteğiyle geri dönmeli"""
+    print("\n--- ANALYZER ---")
+
+    os.environ["AI_CIRCUIT_FAILURE_THRESHOLD"] = "3"
+    os.environ["AI_CIRCUIT_COOLDOWN_SECONDS"] = "0.3"
+    os.environ["AI_MIN_REQUEST_TIMEOUT"] = "0.2"
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    with FakeClaudeServer(latency=0.02, error_rate=1.0) as server:
+        analyzer = ClaudePrescriptionAnalyzer()
+        analyzer.client = LocalMessagesClient(server.url)
+        analyzer.claude_enabled = True
+
+        start = time.time()
+        decisions = [analyzer.analyze_prescription_with_claude(dict(copy.deepcopy(PRESCRIPTION), recete_no=f"R{i}"))
+                     for i in range(10)]
+        elapsed = time.time() - start
+        print(f"  failing API: {server.stats()['requests']} requests in {elapsed:.2f}s, {analyzer.get_circuit_stats()}")
+        assert server.stats()["requests"] == 3
+        assert [d.get("ai_skipped") for d in decisions] == [None] * 3 + ["circuit_open"] * 7
+        assert all(d["analysis_method"] == "sut_only" for d in decisions)
+        assert analyzer.get_circuit_stats()["state_value"] == 2
+
+        # API iyileşti: bekleme sonrası deneme isteği devreyi kapatır
+        server.error_rate = 0.0
+        time.sleep(0.35)
+        decisions = [analyzer.analyze_prescription_with_claude(dict(copy.deepcopy(PRESCRIPTION), recete_no=f"H{i}"))
+                     for i in range(10)]
+        stats = analyzer.get_circuit_stats()
+        assert all(d["claude_available"] for d in decisions) and stats["state"] == CLOSED
+        assert stats["probes"] == 1 and stats["p95_latency_seconds"] is not None
+
+        # Gecikme fırlayınca istek SDK varsayılanını değil uyarlanmış zaman aşımını bekler
+        print(f"  adaptive timeout: {stats['timeout_seconds']}s")
+        assert stats["timeout_seconds"] == 0.2
+        server.latency = 2.0
+        start = time.time()
+        decision = analyzer.analyze_prescription_with_claude(dict(copy.deepcopy(PRESCRIPTION), recete_no="SLOW"))
+        elapsed = time.time() - start
+        print(f"  slow call gave up after {elapsed:.2f}s")
+        assert decision["analysis_method"] == "sut_only" and elapsed < 1.0
+        assert analyzer.get_circuit_stats()["consecutive_failures"] == 1
+
+    # Parametre hazırlığı veya yuva hatası deneme isteğini kilitlememeli
+    clock = _Clock()
+    analyzer.circuit_breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=10, clock=clock)
+    analyzer.circuit_breaker.record_failure(TimeoutError())
+    clock.now = 10
+
+    def broken_params(prompt):
+        raise TypeError("bad params")
+
+    analyzer.build_message_params = broken_params
+    for _ in range(2):
+        try:
+            analyzer._call_claude_api("prompt")
+            assert False, "TypeError expected"
+        except TypeError:
+            pass
+    assert analyzer.circuit_breaker.state == HALF_OPEN and analyzer.circuit_breaker.stats()["probes"] == 0
+    del analyzer.build_message_params
+
+    def broken_slot():
+        raise RuntimeError("no slot")
+
+    analyzer.provider.slot = broken_slot
+    try:
+        analyzer._call_claude_api("prompt")
+        assert False, "RuntimeError expected"
+    except RuntimeError:
+        pass
+    assert analyzer.circuit_breaker.state == HALF_OPEN and analyzer.circuit_breaker.allow_request()
+
+    # Kapatılabilir
+    os.environ["AI_CIRCUIT_BREAKER"] = "false"
+    assert ClaudePrescriptionAnalyzer().get_circuit_stats() == {}
+    return True
+
+if __name__ == "__main__":
+    print("=== CIRCUIT BREAKER TEST ===")
+
+    success = test_breaker() and test_analyzer_circuit()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred Dose Lookup Test
+Deferred mode'da cache miss'lerin tek taramada ve tekrarsız çözüldüğünü doğrular
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from prescription_dose_controller import PrescriptionDoseController
+from database.sqlite_handler import SQLiteHandler
+
+MEDULA_INGREDIENTS = {
+    "VEMLIDY 25MG 30 FILM KAPLI TABLET": "TENOFOVIR ALAFENAMID",
+    "BARACLUDE 0.5MG 30 TABLET": "ENTECAVIR",
+}
+MEDULA_REPORT_DOSES = {
+    ("R100001", "TENOFOVIR ALAFENAMID"): "30",
+    ("R100002", "ENTECAVIR"): "30",
+}
+
+def create_deferred_controller(db_path):
+    """Medula çağrılarını sayan sahte tarayıcılı controller"""
+    controller = PrescriptionDoseController(control_mode="deferred")
+    controller.database = SQLiteHandler(db_path)
+    controller.setup_cache_tables()
+    controller.browser = object()
+    controller.medula_calls = []
+
+    def fake_ingredient(drug_name):
+        controller.medula_calls.append(("ingredient", drug_name))
+        return MEDULA_INGREDIENTS.get(drug_name, "")
+
+    def fake_report_dose(report_code, active_ingredient):
+        controller.medula_calls.append(("dose", report_code, active_ingredient))
+        return MEDULA_REPORT_DOSES.get((report_code, active_ingredient), "")
+
+    controller._extract_active_ingredient_from_medula = fake_ingredient
+    controller._extract_report_dose_from_medula = fake_report_dose
+    return controller
+
+def test_deferred_batch_lookups(controller):
+    """Aynı etken madde/doz batch içinde bir kez sorulmalı, sadece etkilenen reçeteler yeniden çalışmalı"""
+    print("\n--- DEFERRED BATCH LOOKUPS ---")
+
+    prescriptions = [
+        {"recete_no": "DEF_001", "drugs": [
+            {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "30", "rapor_kodu": "R100001"}]},
+        {"recete_no": "DEF_002", "drugs": [
+            {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "60", "rapor_kodu": "R100001"},
+            {"ilac_adi": "BARACLUDE 0.5MG 30 TABLET", "adet": "30", "rapor_kodu": "R100002"}]},
+        {"recete_no": "DEF_003", "drugs": [
+            {"ilac_adi": "BILINMEYEN 10MG", "adet": "1", "rapor_kodu": "R100003"}]},
+        {"recete_no": "DEF_004", "drugs": [
+            {"ilac_adi": "PARACETAMOL 500mg", "adet": "20", "rapor_kodu": ""}]},
+    ]
+
+    # İlk geçiş: tüm raporlu ilaçlar veri bekliyor, Medula'ya gidilmedi
+    controller.control_mode = "deferred"
+    first_pass = controller.control_prescription_doses(prescriptions[0])
+    assert first_pass.overall_decision == "awaiting_data", first_pass
+    assert controller.medula_calls == []
+    controller.pending_ingredient_lookups.clear()
+
+    results = controller.control_batch_doses(prescriptions)
+    decisions = {r.prescription_id: r.overall_decision for r in results}
+    print(f"  Decisions: {decisions}")
+    print(f"  Medula calls: {controller.medula_calls}")
+    print(f"  Stats: {controller.batch_lookup_stats}")
+
+    assert decisions == {"DEF_001": "approve", "DEF_002": "reject", "DEF_003": "hold", "DEF_004": "hold"}
+    assert len(controller.medula_calls) == len(set(controller.medula_calls)), "duplicate Medula fetch"
+    assert [c for c in controller.medula_calls if c[0] == "ingredient"] == sorted(
+        c for c in controller.medula_calls if c[0] == "ingredient")
+    assert controller.batch_lookup_stats["rerun_prescriptions"] == 3
+
+    # İkinci batch: her şey cache'de, Medula'ya gidilmemeli
+    controller.medula_calls.clear()
+    controller.control_batch_doses(prescriptions[:2])
+    assert controller.medula_calls == []
+    print("  Second batch served from cache [OK]")
+
+    return True
+
+if __name__ == "__main__":
+    print("=== DEFERRED DOSE LOOKUP TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = test_deferred_batch_lookups(create_deferred_controller(os.path.join(tmp_dir, "deferred.db")))
+
+    sys.exit(0 if success else 1)
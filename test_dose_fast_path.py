@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Fast-Path Dose Engine Test
+FastDoseEngine sonuçlarını fast mode ile karşılaştırır ve reçete başına gecikmeyi ölçer
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from prescription_dose_controller import PrescriptionDoseController, FastDoseEngine
+from database.sqlite_handler import SQLiteHandler
+
+def create_test_controller(db_path):
+    """Geçici veritabanı ve örnek cache kayıtlarıyla fast mode controller oluşturur"""
+    controller = PrescriptionDoseController(control_mode="fast")
+    controller.database = SQLiteHandler(db_path)
+    controller.setup_cache_tables()
+
+    controller._save_active_ingredient_to_cache("VEMLIDY 25MG 30 FILM KAPLI TABLET", "TENOFOVIR ALAFENAMID")
+    controller._save_active_ingredient_to_cache("PANTO 40 MG 28 TABLET", "PANTOPRAZOLE")
+    controller._save_report_dose_to_cache("R100001", "TENOFOVIR ALAFENAMID", "30 adet")
+    controller._save_report_dose_to_cache("R100002", "PANTOPRAZOLE", "1")
+
+    return controller
+
+def create_test_prescriptions(count=1000):
+    """Farklı senaryolardan oluşan reçete listesi üretir"""
+    templates = [
+        # Uygun doz
+        [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "30", "rapor_kodu": "R100001", "msj": "var"}],
+        # Doz ihlali + raporsuz ilaç
+        [{"ilac_adi": "PANTO 40 MG 28 TABLET", "adet": "2", "rapor_kodu": "R100002"},
+         {"ilac_adi": "PARACETAMOL 500mg", "adet": "20", "rapor_kodu": ""}],
+        # Cache'de olmayan raporlu ilaç
+        [{"ilac_adi": "BILINMEYEN ILAC 10MG", "adet": "1", "rapor_kodu": "R999999"}],
+        # Raporsuz ilaçlar
+        [{"ilac_adi": "ASPIRIN 100 MG", "adet": "1"}, {"ilac_adi": "ARVELES 25 MG", "adet": "2"}],
+    ]
+
+    return [
+        {"recete_no": f"FAST_{i:05d}", "drugs": templates[i % len(templates)]}
+        for i in range(count)
+    ]
+
+def test_fast_engine_matches_fast_mode(controller):
+    """Fast engine kararları fast mode ile aynı olmalı"""
+    print("\n--- FAST ENGINE vs FAST MODE ---")
+
+    engine = FastDoseEngine(controller.database)
+    engine.load_indexes()
+
+    for prescription in create_test_prescriptions(4):
+        legacy = controller.control_prescription_doses(prescription)
+        fast = engine.control(prescription)
+
+        assert fast.overall_decision == legacy.overall_decision, (prescription["recete_no"], fast, legacy)
+        assert fast.reported_drugs == legacy.reported_drugs
+        assert fast.dose_violations == legacy.dose_violations
+        assert [d.dose_compliant for d in fast.drugs] == [d.dose_compliant for d in legacy.drug_details]
+        print(f"  {fast.prescription_id}: {fast.overall_decision} [OK]")
+
+    return True
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def benchmark_fast_path(controller, count=5000):
+    """Reçete başına gecikme: fast engine vs fast mode"""
+    print("\n--- FAST PATH BENCHMARK ---")
+
+    prescriptions = create_test_prescriptions(count)
+    engine = controller.get_fast_engine()
+
+    for label, func, sample in (
+        ("fast engine", engine.control, prescriptions),
+        ("fast mode (DrugInfo)", controller.control_prescription_doses, prescriptions[:500]),
+    ):
+        timings = []
+        for prescription in sample:
+            start = time.perf_counter()
+            func(prescription)
+            timings.append((time.perf_counter() - start) * 1e6)
+
+        print(f"  {label:22s} n={len(sample):5d}  "
+              f"mean={sum(timings) / len(timings):8.1f}µs  "
+              f"p50={_percentile(timings, 0.50):8.1f}µs  "
+              f"p99={_percentile(timings, 0.99):8.1f}µs")
+
+    return True
+
+if __name__ == "__main__":
+    print("=== FAST-PATH DOSE ENGINE TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        controller = create_test_controller(os.path.join(tmp_dir, "fast_path.db"))
+        success = test_fast_engine_matches_fast_mode(controller) and benchmark_fast_path(controller)
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Drug Interaction Graph Test
+Etkileşim grafının tekrarsız sonuçlarını ve hasta bazlı aktif ilaç kontrolünü doğrular
+"""
+
+import sys
+import os
+import tempfile
+from datetime import date, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.drug_interactions import get_interaction_graph
+from utils.sut_rules import SUTRules
+from database.models import DatabaseManager
+
+def test_prescription_interactions():
+    """Aynı çift bir kez, ad/ATC/marka farkı gözetmeksizin raporlanmalı"""
+    print("\n--- PRESCRIPTION INTERACTIONS ---")
+
+    graph = get_interaction_graph()
+    assert graph.resolve("B01AA03") == "warfarin"
+    assert graph.resolve("COUMADIN 5 MG 28 TABLET") == "warfarin"
+    assert graph.resolve("PARACETAMOL") is None
+
+    checker = SUTRules()
+    result = checker.check_drug_interactions(["warfarin", "aspirin", "ECOPIRIN 100 MG", "N02BE01"])
+    pairs = [tuple(i["ingredients"]) for i in result["interactions"]]
+    assert pairs == [("warfarin", "aspirin")], pairs
+    assert result["severity"] == "major" and result["score"] == 0.0
+    print(f"  {result['warnings']} [OK]")
+
+    assert checker.check_drug_interactions(["aspirin", "ibuprofen"])["interactions"] == []
+
+    return True
+
+def test_patient_active_medications(db_path):
+    """Yeni ilaçlar hastanın aktif ilaçlarıyla kontrol edilmeli"""
+    print("\n--- PATIENT ACTIVE MEDICATIONS ---")
+
+    db = DatabaseManager(db_path)
+    db.add_patient("11111111110", "Test Hasta")
+    db.add_doctor("D1", "Test Doktor")
+    db.add_medication("8690000000001", "COUMADIN 5 MG 28 TABLET", active_ingredient="WARFARIN")
+    db.add_medication("8690000000002", "LANOXIN 0.25 MG", active_ingredient="DIGOXIN")
+
+    recent = (date.today() - timedelta(days=10)).isoformat()
+    old = (date.today() - timedelta(days=400)).isoformat()
+    db.add_prescription("RX_ACTIVE", "11111111110", "D1", "Hastane", recent)
+    db.add_prescription_item("RX_ACTIVE", "8690000000001", 1)
+    db.add_prescription("RX_OLD", "11111111110", "D1", "Hastane", old)
+    db.add_prescription_item("RX_OLD", "8690000000002", 1)
+
+    checker = SUTRules(db_manager=db)
+    result = checker.check_patient_drug_interactions("11111111110", ["CIPROXIN 500 MG", "ISOPTIN 80 MG"])
+    print(f"  active: {result['active_medications']}  warnings: {result['warnings']}")
+
+    assert result["active_medications"] == ["WARFARIN"]
+    assert [(i["ingredients"], i["source"]) for i in result["interactions"]] == [
+        (["warfarin", "ciprofloxacin"], "active_medication")]
+
+    comprehensive = checker.comprehensive_check({"patient_tc": "11111111110", "drug_codes": ["J01MA02"]})
+    assert comprehensive["checks"]["drug_interactions"]["interactions"], comprehensive
+    print("  comprehensive_check uses patient mode [OK]")
+
+    return True
+
+if __name__ == "__main__":
+    print("=== DRUG INTERACTION GRAPH TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = (test_prescription_interactions()
+                   and test_patient_active_medications(os.path.join(tmp_dir, "interactions.db")))
+
+    sys.exit(0 if success else 1)
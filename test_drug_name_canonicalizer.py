@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Drug Name Canonicalizer Test
+Medula ilaç adlarının kanonik anahtarlarını ve cache isabet kazancını kontrol eder
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.drug_names import canonicalize_drug_name, canonical_drug_key, cache_hit_rate_report
+
+def test_canonical_components():
+    """Marka, güç, form ve kutu miktarı ayrıştırması"""
+    print("\n--- CANONICAL COMPONENTS ---")
+
+    cases = {
+        "VEMLIDY 25MG 30 FILM KAPLI TABLET": ("VEMLIDY", "25MG", "FILM KAPLI TABLET", "30"),
+        "PANTO 40 MG.28 TABLET": ("PANTO", "40MG", "TABLET", "28"),
+        "GLIFIX PLUS 15/1000 MG 30 FTB": ("GLIFIX PLUS", "15/1000MG", "FILM TABLET", "30"),
+        "CARDOPAN PLUS 320/12,5 MG 28 FTB": ("CARDOPAN PLUS", "320/12.5MG", "FILM TABLET", "28"),
+        "BELOC-ZOK 25 MG 20 KONT SAL FTB (BETA BLOKOR)": ("BELOC-ZOK", "25MG", "KONT SAL FILM TABLET", "20"),
+        "INSULIN GLARGINE 100IU/ml": ("INSULIN GLARGINE", "100IU/ML", "", ""),
+        # Marka içindeki rakamlar güç sayılmaz
+        "MAGNE B6 30 TABLET": ("MAGNE B6", "", "TABLET", "30"),
+        "MAGNE B6 470 MG 30 TABLET": ("MAGNE B6", "470MG", "TABLET", "30"),
+        "3TC 150 MG 60 FTB": ("3TC", "150MG", "FILM TABLET", "60"),
+        "CALCIUM D3 500 MG/400 IU 30 TB": ("CALCIUM D3", "500MG/400IU", "TABLET", "30"),
+        # Birimsiz güç: kutu miktarından önceki sayı
+        "3TC 150 60 FTB": ("3TC", "150", "FILM TABLET", "60"),
+        "ZYRTEC 10 20 TABLET": ("ZYRTEC", "10", "TABLET", "20"),
+        "GLIFIX PLUS 15/1000 30 FTB": ("GLIFIX PLUS", "15/1000", "FILM TABLET", "30"),
+        "A-FERIN 20 TB": ("A-FERIN", "", "TABLET", "20"),
+        # Ardından form/ambalaj kelimesi gelmeyen tek birimsiz sayı güçtür
+        "PANTO 40 28": ("PANTO", "40", "", "28"),
+        "L-THYROXIN 100": ("L-THYROXIN", "100", "", ""),
+        # U/IU birimleri
+        "LANTUS 100 U/ML": ("LANTUS", "100U/ML", "", ""),
+        "LANTUS SOLOSTAR 100 IU/ML 5 KALEM": ("LANTUS SOLOSTAR", "100IU/ML", "KALEM", "5"),
+    }
+
+    for name, expected in cases.items():
+        canonical = canonicalize_drug_name(name)
+        actual = (canonical.brand, canonical.strength, canonical.form, canonical.pack_size)
+        assert actual == expected, (name, actual)
+        print(f"  {name} -> {canonical.key} [OK]")
+
+    return True
+
+def test_same_product_same_key():
+    """Farklı kutu miktarı, yazım ve Türkçe karakterler aynı anahtara düşmeli"""
+    print("\n--- SAME PRODUCT, SAME KEY ---")
+
+    variants = [
+        "VEMLIDY 25MG 30 FILM KAPLI TABLET",
+        "vemlidy 25 mg 90 film kaplı tablet",
+        "VEMLİDY 25 MG.30 FTB",
+    ]
+    keys = {canonical_drug_key(name) for name in variants}
+    assert keys == {"VEMLIDY 25"}, keys
+
+    # Birimli ve birimsiz yazım aynı ürün
+    assert canonical_drug_key("PANTO 40 28") == canonical_drug_key("PANTO 40 MG 28 TABLET") == "PANTO 40"
+    assert canonical_drug_key("LANTUS 100 U/ML") == canonical_drug_key("LANTUS 100 IU/ML 10 ML FLAKON") == "LANTUS 100"
+
+    # Farklı güç farklı anahtar olmalı
+    assert canonical_drug_key("PANTO 20 MG 28 TABLET") != canonical_drug_key("PANTO 40 MG 28 TABLET")
+    assert canonical_drug_key("ZYRTEC 10 20 TABLET") != canonical_drug_key("ZYRTEC 5 20 TABLET")
+    assert canonical_drug_key("MAGNE B6 30 TABLET") != canonical_drug_key("MAGNE B12 30 TABLET")
+    assert canonical_drug_key("L-THYROXIN 100") != canonical_drug_key("L-THYROXIN 50")
+    print(f"  {variants} -> {keys.pop()} [OK]")
+
+    return True
+
+def test_hit_rate_on_stored_history():
+    """Kayıtlı reçete dosyalarında isabet oranı kazancı"""
+    print("\n--- HIT RATE ON STORED HISTORY ---")
+
+    drug_names = []
+    for history_file in ("manual_detailed_prescriptions.json", "test_prescriptions.json"):
+        if os.path.exists(history_file):
+            with open(history_file, 'r', encoding='utf-8') as f:
+                for prescription in json.load(f):
+                    drug_names.extend(d.get("ilac_adi", "") for d in prescription.get("drugs", [])
+                                      if isinstance(d, dict))
+
+    # Aynı ürünlerin farklı kutu/yazımları ile tekrarlanan geçmiş
+    drug_names += [name.replace(" 30 ", " 90 ").lower() for name in drug_names]
+
+    report = cache_hit_rate_report(drug_names)
+    print(f"  {json.dumps(report)}")
+    assert report["canonical_hit_rate"] >= report["raw_hit_rate"]
+
+    return True
+
+if __name__ == "__main__":
+    print("=== DRUG NAME CANONICALIZER TEST ===")
+
+    success = (test_canonical_components()
+               and test_same_product_same_key()
+               and test_hit_rate_on_stored_history())
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Drug Rule Matcher Test
+SUT kural anahtarlarında kısmi ilaç adı eşleştirmesini doğrular ve
+20k kural ile doğrusal tarama ile karşılaştırır
+"""
+
+import sys
+import os
+import time
+import random
+import string
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.sut_rule_engine import SUTRuleSnapshot, get_rule_snapshot
+from utils.text_matching import AhoCorasick, PrefixTrie
+
+def _linear_partial_match(drug_keys, word):
+    """Eski get_drug_requirements kısmi eşleştirme döngüsü"""
+    for drug_key in drug_keys:
+        if drug_key in word or word in drug_key:
+            return drug_key
+    return None
+
+def _synthetic_snapshot(count=20000, seed=42):
+    """Rastgele marka adlarıyla büyük kural snapshot'ı oluşturur"""
+    rng = random.Random(seed)
+    drugs = {}
+    while len(drugs) < count:
+        name = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(6, 10)))
+        drugs[name] = {"active_ingredient": name.lower(), "report_required": rng.random() < 0.5}
+    return SUTRuleSnapshot({"schema_version": 1, "version": "bench", "drugs": drugs})
+
+def test_text_matching_primitives():
+    """Aho-Corasick ve önek ağacı temel davranışı"""
+    print("\n--- TEXT MATCHING PRIMITIVES ---")
+
+    matcher = AhoCorasick()
+    for pattern in ("HE", "SHE", "HIS", "HERS"):
+        matcher.add(pattern)
+    matches = sorted(matcher.iter_matches("USHERS"))
+    assert matches == [(1, 4, "SHE"), (2, 4, "HE"), (2, 6, "HERS")], matches
+    assert matcher.longest_match("USHERS")[2] == "HERS"
+    assert matcher.longest_match("99 KUTU", word_boundary=True) is None
+
+    trie = PrefixTrie()
+    for key in ("E11", "E119", "E10", "B18"):
+        trie.insert(key)
+    assert trie.longest_prefix("E1190")[0] == "E119"
+    assert trie.first_with_prefix("E1") == "E11"
+    assert trie.first_with_prefix("K") is None
+    print("  automaton/trie [OK]")
+
+    return True
+
+def test_partial_match_on_curated_rules():
+    """Gerçek kural dosyasında kısmi eşleşmeler"""
+    print("\n--- PARTIAL MATCH ON CURATED RULES ---")
+
+    snapshot = get_rule_snapshot()
+    assert snapshot.match_drug("NOVOVEMLIDY") == "VEMLIDY"   # anahtar kelime içinde
+    assert snapshot.match_drug("BARAC") == "BARACLUDE"       # kısaltılmış ad
+    assert snapshot.match_drug("ZZZ") is None
+    print("  VEMLIDY/BARACLUDE partial matches [OK]")
+
+    return True
+
+def benchmark_20k_rules(queries=2000):
+    """20k kural ile kısmi eşleştirme: doğrusal tarama vs otomat"""
+    print("\n--- 20K RULE BENCHMARK ---")
+
+    start = time.perf_counter()
+    snapshot = _synthetic_snapshot()
+    print(f"  compile: {(time.perf_counter() - start) * 1000:.0f} ms for {len(snapshot.drugs_by_canonical)} rules")
+
+    rng = random.Random(7)
+    keys = list(snapshot.drugs_by_canonical)
+    words = []
+    for i in range(queries):
+        key = rng.choice(keys)
+        words.append(("X" + key) if i % 3 == 0 else key[:5] if i % 3 == 1 else "QQQQQQQQQQQ")
+
+    start = time.perf_counter()
+    automaton = [snapshot.match_drug(word) for word in words]
+    automaton_us = (time.perf_counter() - start) * 1e6 / len(words)
+
+    sample = words[:200]
+    start = time.perf_counter()
+    linear = [_linear_partial_match(keys, word) for word in sample]
+    linear_us = (time.perf_counter() - start) * 1e6 / len(sample)
+
+    # Eşleşme olan/olmayan kararları aynı olmalı
+    assert [m is None for m in automaton[:200]] == [m is None for m in linear]
+    # Eşleşen anahtar gerçekten kelimenin içinde veya önünde olmalı
+    for word, key in zip(words, automaton):
+        assert key is None or key in word or key.startswith(word), (word, key)
+
+    print(f"  linear scan: {linear_us:10.1f} µs/lookup")
+    print(f"  automaton:   {automaton_us:10.1f} µs/lookup  ({linear_us / automaton_us:.0f}x)")
+
+    return True
+
+if __name__ == "__main__":
+    print("=== DRUG RULE MATCHER TEST ===")
+
+    success = (test_text_matching_primitives()
+               and test_partial_match_on_curated_rules()
+               and benchmark_20k_rules())
+
+    sys.exit(0 if success else 1)
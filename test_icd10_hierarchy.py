@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+ICD-10 Hierarchy Test
+Hiyerarşik tanı eşleştirmesini ve kod açıklamalarını her iki SUT modülünde kontrol eder
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.icd10 import ICDPrefixIndex, get_icd10_catalog, format_diagnosis_codes
+from utils.sut_rules import SUTRules
+from ai_analyzer.sut_rules_database import SUTRulesDatabase
+
+def test_prefix_index_and_catalog():
+    """Önek indeksi ve katalog açıklamaları"""
+    print("\n--- PREFIX INDEX & CATALOG ---")
+
+    index = ICDPrefixIndex({"E11": "diabetes", "B18.1": "hepatitis_b"})
+    assert index.best_match("E11.9") == "diabetes"
+    assert index.best_match("E119") == "diabetes"
+    assert index.best_match("B18.1") == "hepatitis_b"
+    assert index.best_match("B18.2") is None      # kardeş kod kapsanmaz
+    assert index.best_match("E1") is None         # üst kod alt kuralı karşılamaz
+
+    catalog = get_icd10_catalog()
+    assert catalog.describe("E11.9").endswith("komplikasyon olmadan")
+    assert catalog.describe("E11.65") == catalog.describe("E11.6")   # katalogda olmayan alt kod
+    assert catalog.ancestors("E11.9") == ["E11", "E11.9"]
+    print(f"  {format_diagnosis_codes(['B18.1', 'E11.9', '06.01'])}")
+
+    return True
+
+def test_sut_database_hierarchical_compatibility():
+    """SUTRulesDatabase: E11 gerektiren ilaç E11.9 raporunu kabul etmeli"""
+    print("\n--- SUT DATABASE ---")
+
+    sut_db = SUTRulesDatabase()
+    result = sut_db.check_drug_diagnosis_compatibility("GLIFIX PLUS 15/1000 MG 30 FTB", ["E11.9"])
+    assert result["compatible"] is True, result
+    assert result["matched_requirement"] == "E11"
+    print(f"  {result['reason']} [OK]")
+
+    result = sut_db.check_drug_diagnosis_compatibility("VEMLIDY 25MG 30 FILM KAPLI TABLET", ["B18.2"])
+    assert result["compatible"] is False
+    print(f"  {result['reason']} [OK]")
+
+    return True
+
+def test_sut_rules_hierarchical_compatibility():
+    """SUTRules: E11 kuralı E11.9 tanısında uygulanmalı"""
+    print("\n--- SUT RULES ---")
+
+    sut_rules = SUTRules()
+    result = sut_rules.check_diagnosis_drug_compatibility("E11.9", ["A10BA02", "N06AB03"])
+    assert result["compatible"] == ["A10BA02"], result
+    assert result["incompatible"] == ["N06AB03"]
+    print(f"  E11.9 ({result['diagnosis_description']}): score={result['score']} [OK]")
+
+    return True
+
+if __name__ == "__main__":
+    print("=== ICD-10 HIERARCHY TEST ===")
+
+    success = (test_prefix_index_and_catalog()
+               and test_sut_database_hierarchical_compatibility()
+               and test_sut_rules_hierarchical_compatibility())
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Message Batches Test
+Batch isteğinin yoklandığını, sonuçların custom_id ile eşlendiğini ve
+işlemcinin yapay zeka gerektiren reçeteleri tek batch'te gönderdiğini kontrol eder
+"""
+
+import sys
+import os
+import copy
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.ai_gating import AIGatingPolicy
+from ai_analyzer.message_batches import LocalMessageBatchClient, MessageBatchRunner, make_custom_id
+
+PRESCRIPTION = {
+    "recete_no": "3GP25RF", "hasta_ad": "YALÇIN", "hasta_soyad": "DURDAĞI", "hasta_tc": "11916110202",
+    "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "3"}],
+    "ilac_mesajlari": "",
+    "rapor_no": "1992805", "rapor_tarihi": "22/05/2025",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "K21.0"}]}
+}
+
+APPROVE = '{"action": "approve", "confidence": 0.9, "reason": "Uygun"}'
+
+def _responder(params):
+    content = params["messages"][0]["content"]
+    if "FAIL" in content:
+        raise RuntimeError("overloaded")
+    return APPROVE
+
+def test_runner():
+    """Yoklama, custom_id eşlemesi, hatalı sonuç ve parçalama"""
+    print("\n--- RUNNER ---")
+
+    client = LocalMessageBatchClient(_responder, ended_after_polls=2)
+    sleeps = []
+    runner = MessageBatchRunner(client, poll_interval=5, max_requests_per_batch=2, sleep=sleeps.append)
+
+    requests = {make_custom_id(i, rx): {"messages": [{"role": "user", "content": rx}]}
+                for i, rx in enumerate(["RX/1", "RX 2", "FAIL", "RX4", "RX5"])}
+    results = runner.run(requests)
+
+    print(f"  {len(client.created)} batches, {client.polls} polls")
+    assert list(requests)[0] == "rx-000000-RX_1" and len(make_custom_id(1, "X" * 100)) == 64
+    assert len(client.created) == 3 and len(runner.last_batch_ids) == 3
+    assert set(results) == set(requests)
+    assert results[make_custom_id(2, "FAIL")].error == "overloaded"
+    assert sum(result.succeeded for result in results.values()) == 4
+    assert all(results[custom_id].text == APPROVE for custom_id in requests if "FAIL" not in custom_id)
+    assert sleeps == [5] * 6
+    assert runner.run({}) == {}
+
+    # Zaman aşımında batch iptal edilir
+    slow = LocalMessageBatchClient(_responder, ended_after_polls=10)
+    try:
+        MessageBatchRunner(slow, poll_interval=0, timeout=-1, sleep=lambda _: None).run(requests)
+        assert False, "timeout expected"
+    except TimeoutError:
+        pass
+
+    return True
+
+def test_processor_batch_mode(tmp_dir):
+    """İşlemci yapay zeka isteklerini tek batch'te göndermeli, önbellekteki reçeteleri göndermemeli"""
+    print("\n--- PROCESSOR ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE_PATH"] = os.path.join(tmp_dir, "batch_cache.db")
+
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    processor = UnifiedPrescriptionProcessor()
+    processor.ai_analyzer.model = "test-model"
+    processor.ai_analyzer.claude_enabled = True
+    processor.ai_gating = AIGatingPolicy(enabled=False)  # SUT uyumlu reçeteler de batch'e girsin
+
+    # _combine_analysis_results'a verilen AI sonuçlarını yakala
+    combined = {}
+    combine = processor._combine_analysis_results
+    def _capture(prescription_data, sut_result, ai_result, *args):
+        combined[prescription_data["recete_no"]] = ai_result
+        return combine(prescription_data, sut_result, ai_result, *args)
+    processor._combine_analysis_results = _capture
+
+    prescriptions = [
+        dict(copy.deepcopy(PRESCRIPTION), recete_no="A1"),
+        dict(copy.deepcopy(PRESCRIPTION), recete_no="A2",
+             drugs=[{"ilac_adi": "NEXIUM 40 MG 28 TABLET", "adet": "1"}]),
+        {"hasta_ad": "EKSIK"},
+    ]
+
+    client = LocalMessageBatchClient(lambda params: APPROVE)
+    runner = MessageBatchRunner(client, poll_interval=0, sleep=lambda _: None)
+    results = processor.process_with_message_batches(prescriptions, runner=runner)
+
+    assert [result["prescription_id"] for result in results] == ["A1", "A2", "UNKNOWN"]
+    assert len(client.created) == 1
+    assert [request["custom_id"] for request in client.created[0]["requests"]] == ["rx-000000-A1", "rx-000001-A2"]
+    assert combined["A1"]["message_batch_id"] == "rx-000000-A1"
+    assert combined["A1"]["result"]["action"] == "approve" and not combined["A1"]["result"]["cache_hit"]
+    assert results[0]["ai_analysis"]["action"] == "approve" and results[0]["final_decision"] != "error"
+    assert results[2]["final_decision"] == "error"
+    json.dumps(results, default=str)
+
+    # İkinci gece aynı reçeteler önbellekten gelir, batch gönderilmez
+    client = LocalMessageBatchClient(lambda params: APPROVE)
+    processor.process_with_message_batches(prescriptions[:2], runner=MessageBatchRunner(client, sleep=lambda _: None))
+    assert not client.created
+    assert combined["A2"]["result"]["cache_hit"] and "message_batch_id" not in combined["A2"]
+
+    print(f"  decisions: {[result['final_decision'] for result in results]}")
+    return True
+
+if __name__ == "__main__":
+    print("=== MESSAGE BATCHES TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = test_runner() and test_processor_batch_mode(tmp_dir)
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Message Codes Test
+Ortak mesaj kodu ayrıştırıcısının kod/adet/SUT maddesi çıkarımını ve modüllerdeki kullanımını kontrol eder
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.message_codes import (MessageCode, extract_message_codes, get_prescription_message_codes,
+                                 message_code_list, parse_message_codes)
+from ai_analyzer.sut_rules_database import SUTRulesDatabase
+
+def test_extract_structured_codes():
+    """Kod, adet ve SUT maddesi tek geçişte ayrıştırılmalı"""
+    print("\n--- STRUCTURED EXTRACTION ---")
+
+    text = "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi; 1038(2) - 4.2.13 Kronik hepatit, 1301"
+    codes = extract_message_codes(text)
+    print(f"  {codes}")
+    assert codes == (
+        MessageCode("1013", 1, "4.2.13.1"),
+        MessageCode("1038", 2, "4.2.13"),
+        MessageCode("1301", 1, ""),
+    )
+
+    # Tekrarlanan kodun adetleri toplanır
+    assert extract_message_codes("1013(1) - 4.2.13.1 ilk\n1013(2) tekrar") == (MessageCode("1013", 3, "4.2.13.1"),)
+
+    # Başka sayıların içindeki dört haneler kod sayılmaz
+    for text in ("Rapor 11013 numaralı", "Tarih 22/05/2025", "Doz 1013.5 mg", "Rapor no: 19928051"):
+        assert extract_message_codes(text) == (), text
+    assert message_code_list("Kod: 1013") == ["1013"]
+
+    # Köşeli parantez, tırnak ve kod listesindeki eğik çizgi ayırıcıdır
+    assert message_code_list("[1013]") == ["1013"]
+    assert message_code_list('"1013"') == ["1013"] and message_code_list("'1013'") == ["1013"]
+    assert message_code_list("1013/1038") == ["1013", "1038"]
+    assert extract_message_codes("[1013(2) - 4.2.13]/1038(1)") == (MessageCode("1013", 2, "4.2.13"),
+                                                                   MessageCode("1038", 1, ""))
+    for text in ("Tarih 2025/05/22", "Ay 05/2025", "Kod 1013/05"):
+        assert extract_message_codes(text) == (), text
+
+    # Metin başına önbellek
+    extract_message_codes.cache_clear()
+    extract_message_codes(text)
+    extract_message_codes(text)
+    assert extract_message_codes.cache_info().hits == 1
+
+    return True
+
+def test_parse_formats():
+    """Dose controller'ın desteklediği biçimler ortak ayrıştırıcıda da çalışmalı"""
+    print("\n--- MESSAGE FORMATS ---")
+
+    assert message_code_list(["1013(1) - 4.2.13.1", {"kod": 1038}, {"aciklama": "1301"}]) == ["1013", "1038"]
+    assert message_code_list({"mesaj_kodu": "1002", "aciklama": "1020"}) == ["1002"]
+    assert message_code_list(1020) == ["1020"]
+    assert parse_message_codes(None) == ()
+
+    prescription = {"ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi"}
+    assert get_prescription_message_codes(prescription) == (MessageCode("1013", 1, "4.2.13.1"),)
+    assert get_prescription_message_codes({}) == ()
+
+    return True
+
+def test_sut_analysis_uses_parsed_codes():
+    """SUT analizi alt dize yerine ayrıştırılmış kodları kullanmalı"""
+    print("\n--- SUT MESSAGE ANALYSIS ---")
+
+    sut_db = SUTRulesDatabase()
+    base = {"recete_no": "M1", "hasta_tc": "11916110202",
+            "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET"}],
+            "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}}
+
+    valid = dict(base, ilac_mesajlari="1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi")
+    analysis = sut_db.get_sut_analysis_for_prescription(valid)["message_code_analysis"]
+    assert "1013" in analysis["valid_codes"]
+    assert analysis["parsed_codes"][0] == {"code": "1013", "count": 1, "section": "4.2.13.1"}
+    assert not any(item["missing_code"] == "1013" for item in analysis["missing_codes"])
+
+    # "11013" eskiden "1013" olarak eşleşiyordu
+    embedded = dict(base, ilac_mesajlari="Rapor 11013 numaralı")
+    analysis = sut_db.get_sut_analysis_for_prescription(embedded)["message_code_analysis"]
+    print(f"  embedded: {analysis}")
+    assert analysis["valid_codes"] == [] and analysis["invalid_codes"] == []
+    assert any(item["missing_code"] == "1013" for item in analysis["missing_codes"])
+
+    # Kural veritabanında olmayan kodlar ayrıca raporlanır ve kural anahtarına girer
+    unknown = dict(base, ilac_mesajlari="9999(1) - 1.1 Bilinmeyen")
+    result = sut_db.get_sut_analysis_for_prescription(unknown)
+    assert result["message_code_analysis"]["invalid_codes"] == ["9999"]
+    assert "message_code:9999" in result["rule_keys"]
+
+    return True
+
+if __name__ == "__main__":
+    print("=== MESSAGE CODES TEST ===")
+
+    success = (test_extract_structured_codes() and test_parse_formats()
+               and test_sut_analysis_uses_parsed_codes())
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Model Routing Test
+Basit/tutarlı reçetelerin hızlı modele, raporlu veya çok ilaçlı ve SUT sinyalleri
+çelişen reçetelerin güçlü modele gittiğini ve katman metriklerini kontrol eder
+"""
+
+import sys
+import os
+import copy
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.model_routing import FAST_TIER, STRONG_TIER, ModelRouter, prescription_complexity
+
+PANTO = {"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "1"}
+VEMLIDY = {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}
+HEPATIT_B = "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi"
+
+# Raporlu, iki ilaçlı; rapordaki tanı VEMLIDY için uyumsuz -> SUT çelişkili
+CONFLICTING = {"recete_no": "C1", "hasta_tc": "11916110202", "drugs": [PANTO, VEMLIDY],
+               "ilac_mesajlari": HEPATIT_B,
+               "report_details": {"rapor_numarasi": "1", "tani_bilgileri": [{"tani_kodu": "K21.0"}]}}
+
+# Aynı karmaşıklık, tanı uyumlu -> kurallarla tutarlı
+CONSISTENT = dict(copy.deepcopy(CONFLICTING), recete_no="K1",
+                  report_details={"rapor_numarasi": "1", "tani_bilgileri": [{"tani_kodu": "B18.1"}]})
+
+SIMPLE = {"recete_no": "S1", "drugs": [PANTO]}
+
+DECISION = {"action": "approve", "confidence": 0.9, "reason": "Uygun"}
+
+class _Messages:
+    def __init__(self):
+        self.models = []
+
+    def create(self, **params):
+        self.models.append(params["model"])
+        content = params["messages"][0]["content"]
+        if params["tool_choice"]["name"] == "record_prescription_decisions":
+            ids = [line.split()[1] for line in content.splitlines() if line.startswith("Reçete:")]
+            tool_input = {"decisions": [dict(DECISION, recete_no=recete_no) for recete_no in ids]}
+        else:
+            tool_input = dict(DECISION)
+        return type("Response", (), {
+            "content": [type("Block", (), {"type": "tool_use", "name": params["tool_choice"]["name"],
+                                           "input": tool_input})()],
+            "usage": {"input_tokens": 1000, "output_tokens": 100}
+        })()
+
+def _analyzer():
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": _Messages()})()
+    analyzer.model = "fast-model"
+    analyzer.strong_model = "strong-model"
+    analyzer.claude_enabled = True
+    return analyzer
+
+def test_router():
+    """Karmaşıklık puanı ve katman kararları"""
+    print("\n--- ROUTER ---")
+
+    assert prescription_complexity(SIMPLE) == 2 and prescription_complexity(CONFLICTING) == 5
+    assert prescription_complexity({}) == 1
+
+    router = ModelRouter()
+    sut_hold = ({"overall_compliance": False, "issues": ["mismatch"]}, {"action": "hold", "confidence": 0.6})
+    sut_clean = ({"overall_compliance": True, "issues": []}, {"action": "approve", "confidence": 0.95})
+
+    route = router.route(CONFLICTING, *sut_hold)
+    assert route.tier == STRONG_TIER and "report_but_sut_noncompliant" in route.reasons and "sut_hold" in route.reasons
+    assert router.route(CONFLICTING, *sut_clean) == (FAST_TIER, 5, ["rule_consistent"])
+    assert router.route(SIMPLE, *sut_hold).tier == FAST_TIER
+
+    low_confidence = ({"overall_compliance": True, "issues": []}, {"action": "approve", "confidence": 0.5})
+    assert router.route(CONFLICTING, *low_confidence).reasons == ["low_sut_confidence"]
+    assert ModelRouter(enabled=False).route(CONFLICTING, *sut_hold).tier == FAST_TIER
+    assert ModelRouter(strong_min_complexity=6).route(CONFLICTING, *sut_hold).tier == FAST_TIER
+    return True
+
+def test_analyzer_routing():
+    """Analizör yönlendirilen modeli çağırmalı, katman başına metrik tutmalı"""
+    print("\n--- ANALYZER ---")
+
+    analyzer = _analyzer()
+    decisions = [analyzer.analyze_prescription_with_claude(copy.deepcopy(p))
+                 for p in (SIMPLE, CONFLICTING, CONSISTENT)]
+
+    assert analyzer.client.messages.models == ["fast-model", "strong-model", "fast-model"]
+    assert [d["model_routing"]["tier"] for d in decisions] == [FAST_TIER, STRONG_TIER, FAST_TIER]
+    assert decisions[1]["model_routing"]["model"] == "strong-model"
+
+    stats = analyzer.get_routing_stats()
+    print(f"  {json.dumps(stats)}")
+    assert stats[FAST_TIER]["calls"] == 2 and stats[STRONG_TIER]["calls"] == 1
+    # Güçlü model pahalı fiyatlanır, SUT "hold" iken Claude "approve" anlaşmazlık sayılır
+    assert stats[STRONG_TIER]["avg_cost"] > stats[FAST_TIER]["avg_cost"] * 5
+    assert stats[STRONG_TIER]["disagreement_rate"] == 1.0
+    assert stats[FAST_TIER]["disagreements"] == 0
+
+    # Paketler modele göre ayrılır
+    analyzer = _analyzer()
+    prescriptions = [dict(copy.deepcopy(p), recete_no=f"{p['recete_no']}-{i}")
+                     for i in range(2) for p in (SIMPLE, CONFLICTING)]
+    decisions = analyzer.analyze_prescriptions_packed(prescriptions, max_items=8)
+    assert sorted(analyzer.client.messages.models) == ["fast-model", "strong-model"]
+    assert [d["model_routing"]["tier"] for d in decisions] == [FAST_TIER, STRONG_TIER] * 2
+    return True
+
+if __name__ == "__main__":
+    print("=== MODEL ROUTING TEST ===")
+
+    success = test_router() and test_analyzer_routing()
+
+    sys.exit(0 if success else 1)
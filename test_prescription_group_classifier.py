@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Prescription Group Classifier Test
+Tek geçişli anahtar kelime eşleştiricisinin grup isabetlerini ve kelime sınırlarını kontrol eder
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from prescription_group_classifier import PrescriptionGroupClassifier
+
+def test_single_pass_hits():
+    """Tek geçişte tüm grupların isabetleri döndürülmeli"""
+    print("\n--- KEYWORD HITS ---")
+
+    classifier = PrescriptionGroupClassifier()
+    hits = classifier.find_keyword_hits(
+        "raporlu ilaç taze donmuş plazma kotalı dağıtım suriyeli hasta"
+    )
+    print(f"  {hits}")
+    assert hits["A"] == ["rapor", "raporlu"]
+    assert "plazma" in hits["C_blood"] and "taze donmuş plazma" in hits["C_blood"]
+    assert hits["C"] == ["kotalı"]
+    assert hits["temp_protection"] == ["suriyeli"]
+
+    # Kelime başı sınırı: ek almış kelimeler eşleşir, kelime ortası eşleşmez
+    assert classifier.find_keyword_hits("faktörü eksik").get("C_blood") == ["faktör"]
+    assert classifier.find_keyword_hits("koraporlama").get("A") is None
+
+    # '99' sadece bağımsız bir belirteç olarak eşleşir
+    assert classifier.find_keyword_hits("doğum 1999, tel 0532 990 11 22") == {}
+    assert classifier.find_keyword_hits("kimlik no 99 ile başlar")["temp_protection"] == ["99"]
+
+    return True
+
+def test_classification_priority():
+    """Grup önceliği korunmalı ve sonuç tüm isabetleri taşımalı"""
+    print("\n--- CLASSIFICATION ---")
+
+    classifier = PrescriptionGroupClassifier()
+    result = classifier.classify_prescription({
+        "recete_no": "G1", "hasta_ad_soyad": "TEST HASTA", "hasta_tc": "12345678901",
+        "drugs": [{"ilac_adi": "ALBUMİN %20 50 ML"}, {"ilac_adi": "HERCEPTIN"}],
+        "drug_messages": ["Rapor gerekli"], "report_details": {}
+    })
+    print(f"  {result.group_id}: {result.keyword_hits}")
+    assert result.group_id == "C_blood"
+    assert result.keyword_hits["C_blood"] == ["albumin"] and result.keyword_hits["A"] == ["rapor"]
+
+    # Doğum yılındaki '99' artık geçici koruma sayılmaz
+    normal = classifier.classify_prescription({
+        "recete_no": "G2", "hasta_ad_soyad": "HASTA 1999", "hasta_tc": "12345678901",
+        "drugs": ["PARACETAMOL 500MG"], "drug_messages": [], "report_details": {}
+    })
+    assert normal.group_id == "B" and normal.keyword_hits == {}
+
+    refugee = classifier.classify_prescription({"hasta_tc": "99000000001", "drugs": ["Antibiyotik"]})
+    assert refugee.group_id == "temp_protection"
+
+    grouped, results = classifier.classify_batch_prescriptions([{"recete_no": "G3", "drugs": ["Kotalı ilaç"]}])
+    assert grouped["C"][0]["classification"]["keyword_hits"] == {"C": ["kotalı"]}
+
+    return True
+
+if __name__ == "__main__":
+    print("=== PRESCRIPTION GROUP CLASSIFIER TEST ===")
+
+    success = test_single_pass_hits() and test_classification_priority()
+
+    sys.exit(0 if success else 1)
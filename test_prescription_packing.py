@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Prescription Packing Test
+Birden fazla reçetenin tek Claude isteğinde analiz edildiğini, bozuk/eksik yanıtların
+yeniden kuyruğa alındığını ve tekli çağrıya göre verim kazancını kontrol eder
+"""
+
+import sys
+import os
+import copy
+import json
+import re
+import threading
+import time
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.prompts import PACKED_SYSTEM_PROMPT
+
+PRESCRIPTION = {
+    "recete_no": "R0", "hasta_tc": "11916110202", "recete_tarihi": "22/05/2025",
+    "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "1"},
+              {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}
+}
+
+DECISION = {"action": "approve", "confidence": 0.9, "reason": "Uygun"}
+
+class _Text:
+    def __init__(self, text):
+        self.text = text
+
+class _Response:
+    def __init__(self, text, input_tokens, output_tokens):
+        self.content = [_Text(text)]
+        self.usage = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+class _FakeMessages:
+    """Sabit gecikmeli sahte Messages API; paketli isteklere JSON dizisi döndürür"""
+
+    def __init__(self, latency=0.02, drop=(), drop_always=(), truncate=False):
+        self.latency = latency
+        self.drop = set(drop)
+        self.drop_always = set(drop_always)
+        self.truncate = truncate
+        self.calls = []
+
+    def create(self, **params):
+        time.sleep(self.latency)
+        content = params["messages"][0]["content"]
+        packed = params["system"][0]["text"] == PACKED_SYSTEM_PROMPT
+        ids = re.findall(r"^Reçete: (\S+)", content, re.MULTILINE)
+        self.calls.append({"packed": packed, "ids": ids, "max_tokens": params["max_tokens"]})
+
+        if not packed:
+            return _Response(json.dumps(DECISION), len(content) // 4, 30)
+
+        items = []
+        for recete_no in ids:
+            if recete_no in self.drop_always or recete_no in self.drop:
+                self.drop.discard(recete_no)
+                continue
+            items.append(dict(DECISION, recete_no=recete_no))
+        text = "Kararlar:\n```json\n" + json.dumps(items, ensure_ascii=False) + "\n```"
+        if self.truncate:
+            text = text[:len(text) * 2 // 3]
+        return _Response(text, len(content) // 4, 30 * len(items))
+
+class _SizedPackMessages(_FakeMessages):
+    """Paket büyüklüğüne göre farklı token kullanımı ve gecikme döndürür"""
+
+    def create(self, **params):
+        response = super().create(**params)
+        size = len(re.findall(r"^Reçete: ", params["messages"][0]["content"], re.MULTILINE))
+        time.sleep(0.02 * size)
+        response.usage = {"input_tokens": 1000 * size * size, "output_tokens": 10 * size * size}
+        return response
+
+def _analyzer(messages):
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": messages})()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+    return analyzer
+
+def _prescriptions(count):
+    return [dict(copy.deepcopy(PRESCRIPTION), recete_no=f"R{i}") for i in range(count)]
+
+def test_parse_packed_response():
+    """Yarım kalmış veya bozuk yanıttan sadece geçerli kararlar alınmalı"""
+    print("\n--- PARSE ---")
+
+    analyzer = _analyzer(_FakeMessages())
+    expected = {"A": None, "B": None, "C": None, "D": None}
+    text = ('[{"recete_no": "A", "action": "approve", "confidence": 0.9, "reason": "a"}, '
+            '{"recete_no": "B", "action": "maybe", "confidence": 0.9, "reason": "b"}, '
+            '{"recete_no": "X", "action": "reject", "confidence": 0.9, "reason": "x"}, '
+            'çöp {"recete_no": "A", "action": "reject", "confidence": 0.1, "reason": "a"}, '
+            '{"recete_no": "C", "action": "hold", "confidence": 0.5, "reason": "c"}, '
+            '{"recete_no": "D", "action": "rej')
+    items = analyzer._parse_packed_response(text, expected)
+    assert set(items) == {"A", "C"} and items["A"]["action"] == "approve" and "recete_no" not in items["A"]
+    assert analyzer._parse_packed_response("yanıt yok", expected) == {}
+    return True
+
+def test_packing_and_requeue():
+    """Eksik kalan reçeteler sonraki pakete, sürekli eksik olanlar tekli çağrıya gitmeli"""
+    print("\n--- PACKING / REQUEUE ---")
+
+    messages = _FakeMessages(latency=0, drop={"R2"}, drop_always={"R5"})
+    analyzer = _analyzer(messages)
+    decisions = analyzer.analyze_prescriptions_packed(_prescriptions(10), max_items=4)
+
+    print(f"  calls: {[(c['packed'], c['ids']) for c in messages.calls]}")
+    assert [d["prescription_id"] for d in decisions] == [f"R{i}" for i in range(10)]
+    assert all(d["analysis_method"] == "sut_plus_claude" for d in decisions)
+    assert messages.calls[0]["ids"] == ["R0", "R1", "R2", "R3"] and messages.calls[0]["max_tokens"] == 1000
+    single = [c for c in messages.calls if not c["packed"]]
+    assert [c["ids"] for c in single] == [["R5"]]
+    assert sum("R2" in c["ids"] for c in messages.calls) == 2
+    assert decisions[0]["token_usage"]["input_tokens"] > 0
+
+    # Yarım kalan yanıt: tamamlanan kararlar kullanılır, kalanlar yeniden denenir
+    messages = _FakeMessages(latency=0, truncate=True)
+    decisions = _analyzer(messages).analyze_prescriptions_packed(_prescriptions(6), max_items=6)
+    assert all(d["action"] for d in decisions) and len(messages.calls) > 1
+
+    # Token bütçesi küçüldükçe paket küçülür
+    messages = _FakeMessages(latency=0)
+    _analyzer(messages).analyze_prescriptions_packed(_prescriptions(8), max_items=8, token_budget=1200)
+    sizes = [len(c["ids"]) for c in messages.calls]
+    print(f"  pack sizes with small budget: {sizes}")
+    assert 1 < len(sizes) < 8 and sum(sizes) == 8
+
+    # Aynı reçete numarası aynı pakete girmez
+    messages = _FakeMessages(latency=0)
+    duplicated = _prescriptions(2) + _prescriptions(2)
+    decisions = _analyzer(messages).analyze_prescriptions_packed(duplicated, max_items=8)
+    assert [len(c["ids"]) for c in messages.calls] == [2, 2] and all(decisions)
+    return True
+
+def test_concurrent_pack_usage():
+    """Eşzamanlı paketlerde token paylaşımı ve gecikme her paketin kendi yanıtından gelmeli"""
+    print("\n--- CONCURRENT PACKS ---")
+
+    analyzer = _analyzer(_SizedPackMessages(latency=0))
+    barrier = threading.Barrier(2)
+    call_api = analyzer._call_claude_api
+
+    def call_and_wait(*args, **kwargs):
+        response = call_api(*args, **kwargs)
+        barrier.wait(timeout=5)
+        return response
+
+    analyzer._call_claude_api = call_and_wait
+    prescriptions = _prescriptions(6)
+    results = {}
+
+    def analyze(name, batch):
+        results[name] = analyzer.analyze_prescriptions_packed(batch, max_items=8)
+
+    threads = [threading.Thread(target=analyze, args=("small", prescriptions[:2])),
+               threading.Thread(target=analyze, args=("large", prescriptions[2:]))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name, size in (("small", 2), ("large", 4)):
+        usages = [d["token_usage"] for d in results[name]]
+        print(f"  {name}: {usages[0]['input_tokens']} in/decision, {usages[0]['latency_seconds']}s")
+        assert all(u["input_tokens"] == 1000 * size and u["output_tokens"] == 10 * size for u in usages)
+        assert all(u["latency_seconds"] >= 0.02 * size for u in usages)
+    assert results["small"][0]["token_usage"]["latency_seconds"] < results["large"][0]["token_usage"]["latency_seconds"]
+    return True
+
+def test_throughput():
+    """Paketleme, reçete başına tek çağrıdan belirgin şekilde hızlı olmalı"""
+    print("\n--- THROUGHPUT ---")
+
+    prescriptions = _prescriptions(24)
+
+    messages = _FakeMessages(latency=0.03)
+    analyzer = _analyzer(messages)
+    start = time.perf_counter()
+    for prescription in prescriptions:
+        analyzer.analyze_prescription_with_claude(prescription)
+    single_time, single_calls = time.perf_counter() - start, len(messages.calls)
+
+    messages = _FakeMessages(latency=0.03)
+    analyzer = _analyzer(messages)
+    start = time.perf_counter()
+    decisions = analyzer.analyze_prescriptions_packed(prescriptions, max_items=8)
+    packed_time, packed_calls = time.perf_counter() - start, len(messages.calls)
+
+    print(f"  single: {single_calls} calls {single_time:.2f}s ({len(prescriptions) / single_time:.0f} rx/s)  "
+          f"packed: {packed_calls} calls {packed_time:.2f}s ({len(prescriptions) / packed_time:.0f} rx/s)")
+    assert single_calls == 24 and packed_calls == 3 and len(decisions) == 24
+    assert packed_time * 2 < single_time
+    return True
+
+def test_processor_packing():
+    """İşlemci kapıdan geçemeyen reçeteleri paketleyerek göndermeli"""
+    print("\n--- PROCESSOR ---")
+
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    processor = UnifiedPrescriptionProcessor()
+    messages = _FakeMessages(latency=0)
+    processor.ai_analyzer = _analyzer(messages)
+
+    # Raporu olmayan reçeteler belirsiz (AI gerekir), raporlu olan kapıdan döner
+    uncertain = [{key: value for key, value in p.items() if key != "report_details"} for p in _prescriptions(4)]
+    # Kapı SUT yaş sınırını da kontrol eder: kapıdan dönecek reçete güncel tarihli olmalı
+    current = dict(copy.deepcopy(PRESCRIPTION), recete_no="G", recete_tarihi=datetime.now().strftime("%d/%m/%Y"))
+    prescriptions = uncertain + [current] + [{"hasta_ad": "EKSIK"}]
+    results = processor.process_with_packing(prescriptions, max_items=8)
+
+    assert [r["prescription_id"] for r in results] == ["R0", "R1", "R2", "R3", "G", "UNKNOWN"]
+    assert len(messages.calls) == 1 and messages.calls[0]["ids"] == ["R0", "R1", "R2", "R3"]
+    assert results[0]["ai_analysis"]["claude_used"] and results[4]["ai_analysis"]["gated"]
+    assert results[-1]["final_decision"] == "error"
+    return True
+
+if __name__ == "__main__":
+    print("=== PRESCRIPTION PACKING TEST ===")
+
+    success = (test_parse_packed_response() and test_packing_and_requeue() and test_concurrent_pack_usage()
+               and test_throughput() and test_processor_packing())
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt Compaction Test
+Kısa reçete yükünün hasta kimliği içermediğini, sistem bloğunun önbelleklendiğini
+ve karar başına token/gecikme/maliyet sayımını kontrol eder
+"""
+
+import sys
+import os
+import copy
+import re
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.decision_cache import estimate_cost
+from ai_analyzer.prompts import SYSTEM_PROMPT, TokenTally, compact_prescription_payload, estimate_tokens
+
+PRESCRIPTION = {
+    "recete_no": "3GP25RF", "hasta_ad": "YALÇIN", "hasta_soyad": "DURDAĞI", "hasta_tc": "11916110202",
+    "recete_tarihi": "22/05/2025",
+    "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "3"},
+              {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+    "rapor_no": "1992805", "rapor_tarihi": "22/05/2025",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}
+}
+
+class _Usage:
+    input_tokens = 90
+    output_tokens = 120
+    cache_creation_input_tokens = 0
+    cache_read_input_tokens = 210
+
+class _Text:
+    text = '{"action": "approve", "confidence": 0.9, "reason": "Uygun"}'
+
+class _Response:
+    content = [_Text()]
+    usage = _Usage()
+
+class _Messages:
+    def __init__(self):
+        self.params = []
+
+    def create(self, **kwargs):
+        self.params.append(kwargs)
+        return _Response()
+
+class _SizedMessages:
+    """Reçete numarasına göre farklı token kullanımı ve gecikme döndüren sahte Messages API"""
+
+    def create(self, **kwargs):
+        recete_no = re.search(r"^Reçete: (\S+)", kwargs["messages"][0]["content"], re.MULTILINE).group(1)
+        index = int(recete_no[1:])
+        time.sleep(0.02 * index)
+        response = _Response()
+        response.usage = {"input_tokens": 100 * index, "output_tokens": index}
+        return response
+
+def test_payload():
+    """Yük kısa olmalı ve hasta adı/TC içermemeli"""
+    print("\n--- PAYLOAD ---")
+
+    sut_analysis = {"overall_compliance": False, "issues": [f"issue {i}" for i in range(8)], "warnings": []}
+    payload = compact_prescription_payload(PRESCRIPTION, sut_analysis)
+    print(payload)
+
+    for secret in ("YALÇIN", "DURDAĞI", "11916110202", "1992805"):
+        assert secret not in payload, secret
+    assert "3GP25RF" in payload and "VEMLIDY 25MG 30 FILM KAPLI TABLET x1" in payload and "B18.1" in payload
+    assert "Rapor: var (22/05/2025)" in payload and "(+3)" in payload and "issue 5" not in payload
+    assert estimate_tokens(payload) < 150 and estimate_tokens(SYSTEM_PROMPT) < 200
+
+    empty = compact_prescription_payload({"recete_no": "X"})
+    assert "İlaçlar: yok" in empty and "Rapor: yok" in empty
+    return True
+
+def test_token_accounting():
+    """Önbellekli okumalar ucuz fiyatlanmalı, sayaç karar başına kullanım döndürmeli"""
+    print("\n--- TOKEN TALLY ---")
+
+    plain = estimate_cost({"input_tokens": 1000, "output_tokens": 0}, 1.0, 5.0)
+    cached = estimate_cost({"input_tokens": 0, "cache_read_input_tokens": 1000, "output_tokens": 0}, 1.0, 5.0)
+    written = estimate_cost({"input_tokens": 0, "cache_creation_input_tokens": 1000}, 1.0, 5.0)
+    assert abs(cached - plain * 0.1) < 1e-12 and abs(written - plain * 1.25) < 1e-12
+
+    tally = TokenTally()
+    entry = tally.record(_Usage(), estimated_input_tokens=300, latency=0.5, cost=0.001)
+    tally.record({"prompt_tokens": 10, "completion_tokens": 4}, latency=0.1)
+    stats = tally.stats()
+    print(f"  {stats}")
+    assert entry["cache_read_input_tokens"] == 210 and entry["estimated_input_tokens"] == 300
+    assert stats["calls"] == 2 and stats["input_tokens"] == 100 and stats["output_tokens"] == 124
+    assert stats["avg_latency_seconds"] == 0.3
+    return True
+
+def test_analyzer_request():
+    """İstek sistem bloğu, önbellek işareti ve düşük max_tokens ile gönderilmeli"""
+    print("\n--- ANALYZER ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": _Messages()})()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+
+    decision = analyzer.analyze_prescription_with_claude(copy.deepcopy(PRESCRIPTION))
+    params = analyzer.client.messages.params[0]
+
+    assert params["max_tokens"] == analyzer.settings.ai_max_output_tokens < 2000
+    assert params["system"][0]["text"] == SYSTEM_PROMPT
+    assert params["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert "11916110202" not in params["messages"][0]["content"]
+
+    usage = decision["token_usage"]
+    print(f"  {usage}")
+    assert usage["input_tokens"] == 90 and usage["cache_read_input_tokens"] == 210
+    assert usage["estimated_input_tokens"] > 0 and usage["cost"] > 0
+    assert analyzer.get_token_stats()["calls"] == 1
+
+    analyzer.settings.ai_prompt_caching = False
+    assert "cache_control" not in analyzer.build_message_params("x")["system"][0]
+    return True
+
+def test_concurrent_token_usage():
+    """Paylaşılan analizörde her kararın token kullanımı kendi çağrısından gelmeli"""
+    print("\n--- CONCURRENT TOKEN USAGE ---")
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": _SizedMessages()})()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+
+    # Tüm çağrılar yanıt aldıktan sonra kararlar kaydedilir
+    prescriptions = [dict(copy.deepcopy(PRESCRIPTION), recete_no=f"T{i}") for i in range(1, 5)]
+    barrier = threading.Barrier(len(prescriptions))
+    call_api = analyzer._call_claude_api
+
+    def call_and_wait(*args, **kwargs):
+        response = call_api(*args, **kwargs)
+        barrier.wait(timeout=5)
+        return response
+
+    analyzer._call_claude_api = call_and_wait
+    decisions = {}
+
+    def analyze(prescription):
+        decisions[prescription["recete_no"]] = analyzer.analyze_prescription_with_claude(prescription)
+
+    threads = [threading.Thread(target=analyze, args=(p,)) for p in prescriptions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = []
+    for recete_no, decision in sorted(decisions.items()):
+        index = int(recete_no[1:])
+        usage = decision["token_usage"]
+        print(f"  {recete_no}: {usage['input_tokens']} in, {usage['latency_seconds']}s")
+        assert usage["input_tokens"] == 100 * index and usage["output_tokens"] == index
+        assert usage["latency_seconds"] >= 0.02 * index
+        latencies.append(usage["latency_seconds"])
+    assert latencies == sorted(set(latencies))
+    assert analyzer.get_token_stats()["input_tokens"] == 100 * (1 + 2 + 3 + 4)
+    return True
+
+if __name__ == "__main__":
+    print("=== PROMPT COMPACTION TEST ===")
+
+    success = (test_payload() and test_token_accounting() and test_analyzer_request()
+               and test_concurrent_token_usage())
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Rule Profiler Test
+SUT analizinde kural bazında değerlendirme/tetiklenme/süre istatistiklerini kontrol eder
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.rule_profiler import RuleProfiler
+from utils.sut_rules import SUTRules
+from ai_analyzer.sut_rules_database import SUTRulesDatabase
+
+BATCH = [
+    {"recete_no": "P1", "hasta_tc": "11916110202",
+     "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET"}],
+     "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+     "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}},
+    {"recete_no": "P2", "hasta_tc": "",
+     "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET"}, {"ilac_adi": "PARACETAMOL 500MG"}],
+     "ilac_mesajlari": ""},
+]
+
+def test_sut_database_profile(tmp_dir):
+    """Her kural için değerlendirme ve tetiklenme sayıları"""
+    print("\n--- SUT DATABASE PROFILE ---")
+
+    sut_db = SUTRulesDatabase()
+    profiler = sut_db.enable_profiling(RuleProfiler())
+    for prescription in BATCH * 10:
+        sut_db.get_sut_analysis_for_prescription(prescription)
+
+    rows = {row["rule"]: row for row in profiler.report()}
+    print(profiler.format_report(sort_by="evaluations"))
+
+    assert rows["drug_lookup"]["evaluations"] == 30 and rows["drug_lookup"]["fires"] == 10
+    assert rows["report_required:VEMLIDY"]["evaluations"] == 20
+    assert rows["report_required:VEMLIDY"]["fires"] == 10
+    assert rows["general:patient_tc"]["fire_rate"] == 0.5
+    assert "general:patient_tc" not in profiler.dead_rules()
+
+    ordered = profiler.report(sort_by="evaluations")
+    assert ordered[0]["evaluations"] >= ordered[-1]["evaluations"]
+
+    dump_path = profiler.dump(os.path.join(tmp_dir, "profile.json"), sort_by="fires")
+    with open(dump_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)["sort_by"] == "fires"
+
+    # Profilleme kapalıyken istatistik toplanmamalı
+    sut_db.disable_profiling()
+    profiler.reset()
+    sut_db.get_sut_analysis_for_prescription(BATCH[0])
+    assert profiler.report() == []
+
+    return True
+
+def test_comprehensive_check_profile():
+    """SUTRules.comprehensive_check kontrol bazında ölçülmeli"""
+    print("\n--- COMPREHENSIVE CHECK PROFILE ---")
+
+    checker = SUTRules()
+    profiler = checker.enable_profiling(RuleProfiler())
+    checker.comprehensive_check({"diagnosis_code": "I10", "drug_codes": ["C09AA01"], "patient_age": 40})
+    checker.comprehensive_check({"diagnosis_code": "I10", "drug_codes": ["warfarin", "aspirin"], "patient_age": 40})
+
+    rows = {row["rule"]: row for row in profiler.report()}
+    assert rows["sut_rules:drug_interactions"]["evaluations"] == 2
+    assert rows["sut_rules:drug_interactions"]["fires"] == 1
+    assert "sut_rules:dosage_limits" in profiler.dead_rules()
+    print(profiler.format_report())
+
+    return True
+
+if __name__ == "__main__":
+    print("=== RULE PROFILER TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = test_sut_database_profile(tmp_dir) and test_comprehensive_check_profile()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Similarity Index Test
+Sadece tarih/miktarı farklı tekrar reçetelerde önceki AI kararının API çağrısı
+olmadan yeniden kullanıldığını, farklı ilaç veya kural sonucunda kullanılmadığını
+ve indeksin artımlı güncelleme, kalıcılık ve arama süresini kontrol eder
+"""
+
+import sys
+import os
+import copy
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.similarity_index import (SimilarityIndex, canonical_drug_set, deterministic_signature,
+                                          similarity_features)
+
+CHRONIC = {
+    "recete_no": "K1", "hasta_tc": "11916110202", "recete_tarihi": "22/05/2025",
+    "drugs": [{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "1"},
+              {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}
+}
+
+# Aynı rejim: farklı tarih, miktar ve reçete numarası
+REPEAT = dict(copy.deepcopy(CHRONIC), recete_no="K2", recete_tarihi="21/06/2025",
+              drugs=[{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "2"},
+                     {"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}])
+
+OTHER = dict(copy.deepcopy(CHRONIC), recete_no="O1",
+             drugs=[{"ilac_adi": "PANTO 40 MG.28 TABLET", "adet": "1"}],
+             report_details={"rapor_numarasi": "5", "tani_bilgileri": [{"tani_kodu": "K21.0"}]})
+
+# Çok ilaçlı/tanılı reçetede tek ilacın değişmesi benzerliği eşiğin altına düşürmez
+POLYPHARMACY = {
+    "recete_no": "P1", "hasta_tc": "11916110202", "recete_tarihi": "22/05/2025",
+    "drugs": [{"ilac_adi": name, "adet": "1"} for name in (
+        "PANTO 40 MG 28 TABLET", "VEMLIDY 25MG 30 FILM KAPLI TABLET", "GLIFIX 850 MG 100 FILM TABLET",
+        "NEXIUM 40 MG 28 TABLET", "CONCOR 5 MG 30 TABLET", "LIPITOR 20 MG 30 TABLET",
+        "CRESTOR 10 MG 28 TABLET", "DIOVAN 160 MG 28 TABLET")],
+    "report_details": {"rapor_numarasi": "77", "tani_bilgileri": [{"tani_kodu": code} for code in (
+        "B18.1", "E11.9", "I10", "E78.0", "K21.0", "I25.1", "N18.3", "J45.9")]}
+}
+SWAPPED = dict(copy.deepcopy(POLYPHARMACY), recete_no="P2",
+               drugs=POLYPHARMACY["drugs"][:-1] + [{"ilac_adi": "ZYPREXA 10 MG 28 TABLET", "adet": "1"}])
+
+DECISION = {"action": "approve", "confidence": 0.9, "reason": "Uygun"}
+
+class _Messages:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **params):
+        self.calls += 1
+        block = type("Block", (), {"type": "tool_use", "name": params["tool_choice"]["name"],
+                                   "input": dict(DECISION)})()
+        return type("Response", (), {"content": [block], "usage": {"input_tokens": 300, "output_tokens": 60}})()
+
+def test_index(tmp_dir):
+    """Arama, eşik, imza, artımlı güncelleme, silme ve kalıcılık"""
+    print("\n--- INDEX ---")
+
+    path = os.path.join(tmp_dir, "index.npz")
+    index = SimilarityIndex(dim=512, max_entries=3, path=path, threshold=0.9, save_every=100)
+    signature = deterministic_signature({"overall_compliance": True, "rule_version": "v1"}, {"action": "approve"})
+
+    index.add("chronic", similarity_features(CHRONIC), {"action": "approve"}, signature)
+    index.add("other", similarity_features(OTHER), {"action": "hold"}, signature)
+
+    neighbours = index.search(similarity_features(REPEAT))
+    print(f"  {[(n.key, round(n.similarity, 3)) for n in neighbours]}")
+    assert neighbours[0].key == "chronic" and neighbours[0].similarity > 0.999
+    assert neighbours[1].similarity < 0.9
+
+    assert index.find_reusable(similarity_features(REPEAT), signature).payload == {"action": "approve"}
+    other_signature = deterministic_signature({"overall_compliance": False, "rule_version": "v1"}, {"action": "hold"})
+    assert index.find_reusable(similarity_features(REPEAT), other_signature) is None
+    # İlaç uyarıları, eksik mesaj kodları ve genel uyumluluk imzaya girer
+    base = {"overall_compliance": True, "rule_version": "v1", "drug_analyses": [{"issues": [], "warnings": []}],
+            "message_code_analysis": {"missing_codes": []}, "general_compliance": {"compliant": True, "issues": []}}
+
+    def variant(**changes):
+        return deterministic_signature(dict(copy.deepcopy(base), **changes), {"action": "approve"})
+
+    variants = {
+        variant(),
+        variant(drug_analyses=[{"issues": [], "warnings": ["Drug X not found in SUT database"]}]),
+        variant(message_code_analysis={"missing_codes": [{"drug": "VEMLIDY", "missing_code": "1013"}]}),
+        variant(general_compliance={"compliant": False, "issues": ["Patient TC number missing"]}),
+        variant(general_compliance={"compliant": True, "issues": ["Prescription too old: 35 days"]}),
+    }
+    assert len(variants) == 5
+    assert variant(general_compliance={"compliant": True, "issues": ["Prescription too old: 35 days"]}) == \
+        variant(general_compliance={"compliant": True, "issues": ["Prescription too old: 64 days"]})
+
+    # İlaç kümesi imzaya girer: miktar farkı aynı imza, farklı ilaç farklı imza
+    assert canonical_drug_set(CHRONIC) == canonical_drug_set(REPEAT) != canonical_drug_set(OTHER)
+    assert deterministic_signature({}, {}, drugs=canonical_drug_set(POLYPHARMACY)) != \
+        deterministic_signature({}, {}, drugs=canonical_drug_set(SWAPPED))
+
+    only_panto = dict(CHRONIC, drugs=CHRONIC["drugs"][:1])
+    assert index.find_reusable(similarity_features(only_panto), signature) is None
+    stats = index.stats()
+    assert stats["reuses"] == 1 and stats["signature_mismatch"] == 1 and stats["below_threshold"] == 1
+
+    # Aynı anahtar güncellenir, kapasite dolunca en eski kayıt silinir
+    index.add("chronic", similarity_features(CHRONIC), {"action": "reject"}, signature)
+    assert len(index) == 2 and index.search(similarity_features(CHRONIC))[0].payload == {"action": "reject"}
+    index.add("x", ["drug:x"], {}, signature)
+    index.add("y", ["drug:y"], {}, signature)
+    assert len(index) == 3 and "other" not in [n.key for n in index.search(["drug:x", "drug:y"], k=3)]
+
+    index.save()
+    reloaded = SimilarityIndex(dim=512, max_entries=3, path=path)
+    assert len(reloaded) == 3 and reloaded.search(similarity_features(REPEAT))[0].key == "chronic"
+    assert len(SimilarityIndex(dim=256, path=path)) == 0
+    return True
+
+def test_search_speed():
+    """Binlerce kayıtta top-k arama milisaniyeler içinde bitmeli"""
+    print("\n--- SPEED ---")
+
+    index = SimilarityIndex(dim=1024, max_entries=20000)
+    signature = deterministic_signature({}, {})
+    start = time.perf_counter()
+    for i in range(20000):
+        index.add(f"rx{i}", [f"drug:{i % 1500}", f"drug:{(i * 7) % 1500}", f"icd:{i % 300}",
+                             f"icd3:{i % 40}", "report:yes"], {"i": i}, signature)
+    build_time = time.perf_counter() - start
+
+    queries = [[f"drug:{q}", f"drug:{(q * 7) % 1500}", f"icd:{q % 300}", f"icd3:{q % 40}", "report:yes"]
+               for q in range(50)]
+    start = time.perf_counter()
+    for query in queries:
+        top = index.search(query, k=5)
+    per_query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    print(f"  20000 entries built in {build_time:.2f}s, top-5 search {per_query_ms:.2f} ms/query")
+    assert top[0].key == "rx49" and top[0].similarity > 0.999
+    assert per_query_ms < 100
+    return True
+
+def test_analyzer_reuse(tmp_dir):
+    """Tekrar reçete Claude'a gitmeden önceki kararla sonuçlanmalı"""
+    print("\n--- ANALYZER ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "true"
+    os.environ["AI_DECISION_CACHE_PATH"] = os.path.join(tmp_dir, "cache.db")
+    os.environ["AI_SIMILARITY_INDEX_PATH"] = os.path.join(tmp_dir, "analyzer_index.npz")
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": _Messages()})()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+
+    first = analyzer.analyze_prescription_with_claude(copy.deepcopy(CHRONIC))
+    repeat = analyzer.analyze_prescription_with_claude(copy.deepcopy(REPEAT))
+    other = analyzer.analyze_prescription_with_claude(copy.deepcopy(OTHER))
+
+    print(f"  calls: {analyzer.client.messages.calls}, {analyzer.get_similarity_stats()}")
+    assert analyzer.client.messages.calls == 2
+    assert "similar_reuse" not in first and "similar_reuse" not in other
+    assert repeat["similar_reuse"]["similarity"] > 0.99 and repeat["prescription_id"] == "K2"
+    assert repeat["analysis_details"]["claude_analysis"]["action"] == first["analysis_details"]["claude_analysis"]["action"]
+
+    # Eşiği aşan benzerlikte bile farklı ilaç için verilmiş karar kullanılmaz
+    analyzer.analyze_prescription_with_claude(copy.deepcopy(POLYPHARMACY))
+    similarity = analyzer.similarity_index.search(similarity_features(SWAPPED))[0].similarity
+    swapped = analyzer.analyze_prescription_with_claude(copy.deepcopy(SWAPPED))
+    print(f"  swapped drug similarity: {similarity:.4f}")
+    assert similarity >= analyzer.similarity_index.threshold
+    assert "similar_reuse" not in swapped and analyzer.client.messages.calls == 4
+
+    # Kapalıyken indeks oluşturulmaz
+    os.environ["AI_SIMILARITY_REUSE"] = "false"
+    assert ClaudePrescriptionAnalyzer().similarity_index is None
+    return True
+
+if __name__ == "__main__":
+    print("=== SIMILARITY INDEX TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = test_index(tmp_dir) and test_search_speed() and test_analyzer_reuse(tmp_dir)
+
+    sys.exit(0 if success else 1)
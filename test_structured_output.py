@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Structured Output Test
+Kararın araç çağrısıyla (tool use) yapılandırılmış geldiğini, doğrulayıcının şemaya
+uymayan yanıtları reddettiğini ve ayrıştırma hatalarının sayıldığını kontrol eder
+"""
+
+import sys
+import os
+import copy
+import json
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer.decision_schema import (DECISION_SCHEMA, DECISION_TOOL_NAME, PACKED_DECISION_TOOL_NAME,
+                                         DecisionValidationError, ParseMetrics, decode_json_object,
+                                         extract_tool_input, openai_tool, parse_decision, validate_decision)
+from ai_analyzer.message_batches import LocalMessageBatchClient, MessageBatchRunner
+
+PRESCRIPTION = {
+    "recete_no": "S1", "hasta_tc": "11916110202", "recete_tarihi": "22/05/2025",
+    "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET", "adet": "1"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi"
+}
+
+DECISION = {"action": "approve", "confidence": 0.9, "reason": "Uygun", "clinical_assessment": "",
+            "sut_compliance": "uyumlu", "risk_factors": [], "recommendations": [], "key_findings": []}
+
+class _ToolMessages:
+    """Araç çağrısıyla yanıt veren sahte Messages API"""
+
+    def __init__(self, tool_input):
+        self.tool_input = tool_input
+        self.params = []
+
+    def create(self, **params):
+        self.params.append(params)
+        name = params["tool_choice"]["name"]
+        tool_input = self.tool_input(params) if callable(self.tool_input) else self.tool_input
+        return SimpleNamespace(content=[SimpleNamespace(type="tool_use", name=name, input=tool_input)],
+                               usage={"input_tokens": 100, "output_tokens": 40})
+
+def _analyzer(messages):
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+
+    analyzer = ClaudePrescriptionAnalyzer()
+    analyzer.client = type("Client", (), {"messages": messages})()
+    analyzer.model = "test-model"
+    analyzer.claude_enabled = True
+    return analyzer
+
+def test_validator():
+    """Şema doğrulama, açgözlü olmayan JSON okuma ve hata sayımı"""
+    print("\n--- VALIDATOR ---")
+
+    decision = validate_decision({"action": "hold", "confidence": 1, "reason": "x"})
+    assert decision["confidence"] == 1.0 and decision["risk_factors"] == [] and decision["sut_compliance"] == ""
+
+    for bad in ({"action": "red", "confidence": 0.9, "reason": "x"},
+                {"action": "approve", "confidence": 1.5, "reason": "x"},
+                {"action": "approve", "confidence": True, "reason": "x"},
+                {"action": "approve", "confidence": "0.9", "reason": "x"},
+                {"action": "approve", "confidence": 0.9},
+                {"action": "approve", "confidence": 0.9, "reason": "x", "risk_factors": "tek"},
+                ["approve"]):
+        try:
+            validate_decision(bad)
+            raise AssertionError(f"kabul edilmemeliydi: {bad}")
+        except DecisionValidationError:
+            pass
+
+    # İlk tam nesne okunur; sonraki süslü parantezler karışmaz
+    text = 'Karar: {"action": "reject", "confidence": 0.8, "reason": "doz"} not: {bozuk'
+    assert decode_json_object(text)["action"] == "reject"
+
+    # Anahtar kelime tahmini yapılmaz: "Reddedilecek" içeren metin reject olmaz
+    metrics = ParseMetrics()
+    assert parse_decision(json.dumps(DECISION), metrics)["action"] == "approve"
+    assert parse_decision(dict(DECISION), metrics)["action"] == "approve"
+    try:
+        parse_decision("Reddedilecek bir durum görülmedi, onaylanabilir.", metrics)
+        raise AssertionError("metin yanıt karar sayılmamalı")
+    except DecisionValidationError:
+        pass
+
+    stats = metrics.stats()
+    print(f"  {stats}")
+    assert stats["total"] == 3 and stats["failures"] == 1 and stats["failure_rate"] == 0.3333
+    assert stats["by_method"] == {"json_text": 1, "tool_use": 1, "failed": 1}
+
+    # OpenAI function calling yanıtı
+    tool = openai_tool()
+    assert tool["function"]["strict"] and set(DECISION_SCHEMA["required"]) == set(DECISION_SCHEMA["properties"])
+    call = SimpleNamespace(function=SimpleNamespace(name=DECISION_TOOL_NAME, arguments=json.dumps(DECISION)))
+    response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(tool_calls=[call], content=None))])
+    assert extract_tool_input(response)["reason"] == "Uygun"
+    return True
+
+def test_analyzer_tool_use():
+    """Analizör karar aracını zorlamalı, geçersiz araç girdisi beklemeye düşmeli"""
+    print("\n--- ANALYZER ---")
+
+    messages = _ToolMessages(dict(DECISION))
+    analyzer = _analyzer(messages)
+    decision = analyzer.analyze_prescription_with_claude(copy.deepcopy(PRESCRIPTION))
+
+    params = messages.params[0]
+    assert params["tools"][0]["name"] == DECISION_TOOL_NAME
+    assert params["tool_choice"] == {"type": "tool", "name": DECISION_TOOL_NAME}
+    assert decision["analysis_details"]["claude_analysis"]["action"] == "approve"
+    assert decision["analysis_details"]["claude_analysis"]["sut_compliance"] == "uyumlu"
+
+    messages.tool_input = dict(DECISION, confidence=2)
+    decision = analyzer.analyze_prescription_with_claude(copy.deepcopy(PRESCRIPTION))
+    assert decision["analysis_details"]["claude_analysis"]["parse_error"]
+    assert decision["action"] == "hold"
+
+    stats = analyzer.get_parse_stats()
+    print(f"  {stats}")
+    assert stats["by_method"] == {"tool_use": 1, "failed": 1} and stats["failures"] == 1
+
+    # Kapalıyken araç gönderilmez, metin yanıt doğrulanarak kullanılır
+    analyzer.settings.ai_structured_output = False
+    assert "tools" not in analyzer.build_message_params("x")
+    return True
+
+def test_packed_tool_use():
+    """Paketli istekte kararlar dizisi aracı kullanılmalı, eksikler yeniden denenmeli"""
+    print("\n--- PACKED ---")
+
+    attempts = {}
+
+    def respond(params):
+        ids = [line.split()[1] for line in params["messages"][0]["content"].splitlines()
+               if line.startswith("Reçete:")]
+        if params["tool_choice"]["name"] == DECISION_TOOL_NAME:
+            return dict(DECISION)
+        decisions = []
+        for recete_no in ids:
+            attempts[recete_no] = attempts.get(recete_no, 0) + 1
+            if recete_no == "P1" and attempts[recete_no] == 1:
+                continue
+            decisions.append(dict(DECISION, recete_no=recete_no))
+        return {"decisions": decisions}
+
+    messages = _ToolMessages(respond)
+    analyzer = _analyzer(messages)
+    prescriptions = [dict(copy.deepcopy(PRESCRIPTION), recete_no=f"P{i}") for i in range(3)]
+    decisions = analyzer.analyze_prescriptions_packed(prescriptions, max_items=3)
+
+    assert messages.params[0]["tool_choice"]["name"] == PACKED_DECISION_TOOL_NAME
+    assert [d["prescription_id"] for d in decisions] == ["P0", "P1", "P2"]
+    assert all(d["analysis_method"] == "sut_plus_claude" for d in decisions) and attempts["P1"] == 2
+    stats = analyzer.get_parse_stats()
+    print(f"  {stats}")
+    assert stats["by_method"]["tool_use"] == 3 and stats["failures"] == 1
+    return True
+
+def test_message_batch_tool_use():
+    """Message Batches sonucu araç girdisini taşımalı"""
+    print("\n--- MESSAGE BATCH ---")
+
+    client = LocalMessageBatchClient(lambda params: dict(DECISION))
+    runner = MessageBatchRunner(client, poll_interval=0, sleep=lambda _: None)
+    params = {"messages": [{"role": "user", "content": "x"}],
+              "tool_choice": {"type": "tool", "name": DECISION_TOOL_NAME}}
+    result = runner.run({"rx-1": params})["rx-1"]
+    assert result.succeeded and result.response == DECISION
+
+    analyzer = _analyzer(_ToolMessages(dict(DECISION)))
+    prepared = analyzer.prepare_claude_request(copy.deepcopy(PRESCRIPTION))
+    decision = analyzer.complete_claude_request(prepared, PRESCRIPTION, result.response)
+    assert decision["analysis_details"]["claude_analysis"]["action"] == "approve"
+    return True
+
+if __name__ == "__main__":
+    print("=== STRUCTURED OUTPUT TEST ===")
+
+    success = (test_validator() and test_analyzer_tool_use()
+               and test_packed_tool_use() and test_message_batch_tool_use())
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+SUT Bulk Audit Test
+Vektörel toplu denetimin reçete bazlı analizle aynı bulguları verdiğini ve hızını kontrol eder
+"""
+
+import sys
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from ai_analyzer.sut_rules_database import SUTRulesDatabase
+
+DRUGS = [
+    "VEMLIDY 25MG 30 FILM KAPLI TABLET", "BARACLUDE 0.5 MG 30 TABLET", "GLIFIX 850 MG 100 FILM TABLET",
+    "RISPERDAL 2 MG 20 TABLET", "NEXIUM 40 MG 28 TABLET", "PARACETAMOL 500MG 20 TABLET", "XALFU 10 MG 30 TABLET"
+]
+DIAGNOSES = ["B18.1", "E11.9", "F20", "I10", "K21.0", "N40"]
+MESSAGES = ["", "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi", "1038(1) - 4.2.13 Kronik hepatit"]
+
+def _generate(count, seed=7):
+    rng = random.Random(seed)
+    today = datetime.now()
+    prescriptions = []
+    for i in range(count):
+        prescription = {
+            "recete_no": f"RX{i:06d}",
+            "hasta_tc": "" if i % 17 == 0 else "11916110202",
+            "drugs": [{"ilac_adi": rng.choice(DRUGS)} for _ in range(rng.randint(1, 3))],
+            "ilac_mesajlari": rng.choice(MESSAGES),
+            "recete_tarihi": (today - timedelta(days=rng.randint(0, 60))).strftime("%d/%m/%Y"),
+        }
+        if i % 3:
+            prescription["report_details"] = {
+                "rapor_numarasi": "" if i % 11 == 0 else str(1000 + i),
+                "tani_bilgileri": [{"tani_kodu": code} for code in rng.sample(DIAGNOSES, rng.randint(0, 2))]
+            }
+        if i % 29 == 0:
+            prescription["recete_tarihi"] = "31/02/2025"
+        prescriptions.append(prescription)
+    return prescriptions
+
+def _loop_categories(sut_db, prescriptions):
+    """Reçete bazlı analiz bulgularını toplu denetim kategorilerine çevirir"""
+    counts = Counter()
+    for prescription in prescriptions:
+        analysis = sut_db.get_sut_analysis_for_prescription(prescription)
+        for drug in analysis["drug_analyses"]:
+            for issue in drug["issues"]:
+                counts["diagnosis_mismatch" if issue.startswith("Diagnosis mismatch") else "report_required"] += 1
+            counts["drug_not_found"] += sum("not found in SUT database" in w for w in drug["warnings"])
+        counts["missing_message_code"] += len(analysis["message_code_analysis"]["missing_codes"])
+        for issue in analysis["general_compliance"]["issues"]:
+            if issue.startswith("Patient TC"):
+                counts["patient_tc_missing"] += 1
+            elif issue.startswith("Prescription too old"):
+                counts["prescription_too_old"] += 1
+            else:
+                counts["invalid_prescription_date"] += 1
+    return counts
+
+def test_bulk_matches_per_prescription():
+    """Toplu denetim reçete bazlı analizle aynı kategori sayılarını vermeli"""
+    print("\n--- BULK vs PER-PRESCRIPTION ---")
+
+    sut_db = SUTRulesDatabase()
+    prescriptions = _generate(3000)
+
+    expected = _loop_categories(sut_db, prescriptions)
+    result = sut_db.bulk_audit(prescriptions)
+    actual = Counter(result["issues"]["category"])
+    print(f"  {dict(sorted(actual.items()))}")
+    assert actual == expected, (actual, expected)
+
+    compliance = {p["recete_no"]: sut_db.get_sut_analysis_for_prescription(p)["overall_compliance"]
+                  for p in prescriptions[:500]}
+    summary = result["prescriptions"].set_index("recete_no")["overall_compliance"]
+    assert all(summary[recete_no] == compliant for recete_no, compliant in compliance.items())
+
+    # DataFrame girdisi aynı sonucu vermeli
+    from_frame = sut_db.bulk_audit(pd.DataFrame(prescriptions))
+    assert from_frame["issues"]["category"].tolist() == result["issues"]["category"].tolist()
+
+    empty = sut_db.bulk_audit([])
+    assert empty["issues"].empty and empty["prescriptions"].empty
+
+    return True
+
+def test_bulk_audit_speed():
+    """Toplu denetim reçete bazlı döngüden belirgin şekilde hızlı olmalı"""
+    print("\n--- BULK AUDIT SPEED ---")
+
+    sut_db = SUTRulesDatabase()
+    prescriptions = _generate(20000, seed=11)
+
+    # Yük altındaki tek seferlik yavaşlamalar sonucu bozmasın: her yolun en iyi süresi
+    loop_times, bulk_times = [], []
+    for _ in range(3):
+        start = time.perf_counter()
+        for prescription in prescriptions:
+            sut_db.get_sut_analysis_for_prescription(prescription)
+        loop_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        sut_db.bulk_audit(prescriptions)
+        bulk_times.append(time.perf_counter() - start)
+    loop_time, bulk_time = min(loop_times), min(bulk_times)
+
+    print(f"  {len(prescriptions)} prescriptions: loop {loop_time:.2f}s  bulk {bulk_time:.3f}s "
+          f"({loop_time / bulk_time:.1f}x)")
+    assert bulk_time * 6 < loop_time
+
+    return True
+
+if __name__ == "__main__":
+    print("=== SUT BULK AUDIT TEST ===")
+
+    success = test_bulk_matches_per_prescription() and test_bulk_audit_speed()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+SUT Rule Engine Test
+Derlenmiş kural snapshot'ının paylaşımını, indekslerini ve hot reload davranışını kontrol eder
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer import sut_rule_engine
+from ai_analyzer.sut_rules_database import SUTRulesDatabase
+
+TEST_PRESCRIPTION = {
+    "recete_no": "3GP25RF",
+    "hasta_tc": "11916110202",
+    "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET"}],
+    "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+    "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}
+}
+
+def test_shared_snapshot_and_indexes():
+    """Tüm SUTRulesDatabase örnekleri aynı derlenmiş snapshot'ı kullanmalı"""
+    print("\n--- SHARED SNAPSHOT & INDEXES ---")
+
+    first, second = SUTRulesDatabase(), SUTRulesDatabase()
+    snapshot = first.snapshot
+    assert snapshot is second.snapshot
+
+    print(f"  {json.dumps(snapshot.summary(), ensure_ascii=False)}")
+    assert "VEMLIDY" in snapshot.drugs_by_message_code["1013"]
+
+    # Kural verisi salt okunur olmalı
+    try:
+        snapshot.drug_diagnosis_mapping["VEMLIDY"]["report_required"] = False
+        raise AssertionError("snapshot must be immutable")
+    except TypeError:
+        pass
+
+    # Gereksinim araması kanonik markayla snapshot'ın sınırlı LRU cache'inden gelmeli
+    first.get_drug_requirements("VEMLİDY 25 MG 90 FTB")
+    hits = snapshot.drug_rule.cache_info().hits
+    assert second.get_drug_requirements("VEMLIDY 25MG 30 FILM KAPLI TABLET") is snapshot.get_drug("VEMLIDY")
+    assert snapshot.drug_rule.cache_info().hits == hits + 1
+    assert snapshot.drug_rule.cache_info().maxsize == sut_rule_engine.DRUG_RULE_CACHE_SIZE
+
+    return True
+
+def test_hot_reload_keeps_inflight_version(tmp_dir):
+    """Reload yeni snapshot'ı yayınlamalı, devam eden analiz eski sürümle tamamlanmalı"""
+    print("\n--- HOT RELOAD ---")
+
+    sut_db = SUTRulesDatabase()
+    original = sut_db.snapshot
+
+    with open(original.source_path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    document["version"] = "test-reload"
+    document["drugs"]["VEMLIDY"]["required_diagnosis"] = ["K74.6"]
+
+    reloaded_path = os.path.join(tmp_dir, "sut_rules.json")
+    with open(reloaded_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False)
+
+    try:
+        with sut_db.pin_snapshot() as pinned:
+            sut_rule_engine.reload_rule_snapshot(reloaded_path)
+            inflight = sut_db.get_sut_analysis_for_prescription(TEST_PRESCRIPTION)
+            assert pinned is original
+
+        assert inflight["rule_version"] == original.snapshot_id
+        assert inflight["overall_compliance"] is True
+
+        after = sut_db.get_sut_analysis_for_prescription(TEST_PRESCRIPTION)
+        assert after["rule_version"].startswith("test-reload")
+        assert after["overall_compliance"] is False
+        print(f"  in-flight: {inflight['rule_version']}  after reload: {after['rule_version']} [OK]")
+
+        # Bozuk dosya mevcut snapshot'ı değiştirmemeli
+        with open(reloaded_path, 'w', encoding='utf-8') as f:
+            f.write("{broken")
+        try:
+            sut_rule_engine.reload_rule_snapshot(reloaded_path)
+            raise AssertionError("broken rules file must not load")
+        except ValueError:
+            pass
+        assert sut_db.snapshot.version == "test-reload"
+    finally:
+        sut_rule_engine.reload_rule_snapshot(original.source_path)
+
+    return True
+
+def test_processor_reloads_changed_rules(tmp_dir):
+    """İşlemci değişen kural dosyasını SUT analizinden önce (aralıklı) yeniden yüklemeli"""
+    print("\n--- PROCESSOR RELOAD ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    processor = UnifiedPrescriptionProcessor()
+    original = processor.sut_db.snapshot
+    with open(original.source_path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+
+    rules_path = os.path.join(tmp_dir, "watched_rules.json")
+    with open(rules_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False)
+
+    try:
+        watched = sut_rule_engine.reload_rule_snapshot(rules_path)
+        document["version"] = "test-watched"
+        with open(rules_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False)
+        os.utime(rules_path, (os.path.getmtime(rules_path) + 5,) * 2)
+
+        # Aralık dolmadan dosyaya bakılmaz
+        processor.settings.sut_rules_reload_seconds = 3600
+        assert processor._perform_sut_analysis(TEST_PRESCRIPTION)["analysis"]["rule_version"] == watched.snapshot_id
+
+        processor._rules_checked_at -= 3600
+        result = processor._perform_sut_analysis(TEST_PRESCRIPTION)
+        print(f"  {watched.snapshot_id} -> {result['analysis']['rule_version']}")
+        assert result["analysis"]["rule_version"].startswith("test-watched")
+        assert not processor._reload_rules_if_changed()
+    finally:
+        sut_rule_engine.reload_rule_snapshot(original.source_path)
+
+    return True
+
+if __name__ == "__main__":
+    print("=== SUT RULE ENGINE TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = (test_shared_snapshot_and_indexes() and test_hot_reload_keeps_inflight_version(tmp_dir)
+                   and test_processor_reloads_changed_rules(tmp_dir))
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+SUT Rule Versions Test
+Kural sürümleri arası farkı ve sadece etkilenen reçetelerin seçilmesini kontrol eder
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_analyzer import sut_rule_engine
+from ai_analyzer.sut_rule_versions import RuleVersionStore, diff_rule_snapshots
+from ai_analyzer.sut_rules_database import SUTRulesDatabase
+from database.sqlite_handler import SQLiteHandler
+
+PRESCRIPTIONS = [
+    {"recete_no": "R_VEMLIDY", "hasta_tc": "11916110202",
+     "drugs": [{"ilac_adi": "VEMLIDY 25MG 30 FILM KAPLI TABLET"}],
+     "ilac_mesajlari": "1013(1) - 4.2.13.1 Kronik Hepatit B tedavisi",
+     "report_details": {"rapor_numarasi": "1992805", "tani_bilgileri": [{"tani_kodu": "B18.1"}]}},
+    {"recete_no": "R_PARACETAMOL", "hasta_tc": "11916110202",
+     "drugs": [{"ilac_adi": "PARACETAMOL 500MG 20 TABLET"}]},
+    {"recete_no": "R_DIABETES", "hasta_tc": "11916110202",
+     "drugs": [{"ilac_adi": "GLIFIX 850 MG 100 FILM TABLET"}],
+     "report_details": {"rapor_numarasi": "77", "tani_bilgileri": [{"tani_kodu": "E11.9"}]}},
+    {"recete_no": "R_NEXIUM", "hasta_tc": "11916110202",
+     "drugs": [{"ilac_adi": "NEXIUM 40 MG 28 TABLET"}]},
+    {"recete_no": "R_GLIFIX_PLUS", "hasta_tc": "11916110202",
+     "drugs": [{"ilac_adi": "GLIFIX PLUS 850 MG 60 FILM TABLET"}]},
+]
+
+def _write_rules(path, document):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False)
+    return sut_rule_engine.reload_rule_snapshot(path)
+
+def test_targeted_reevaluation(tmp_dir):
+    """Sadece değişen kurallarla kesişen reçeteler seçilmeli"""
+    print("\n--- TARGETED RE-EVALUATION ---")
+
+    database = SQLiteHandler(os.path.join(tmp_dir, "rules.db"))
+    store = RuleVersionStore(database)
+    sut_db = SUTRulesDatabase()
+    original = sut_db.snapshot
+
+    with open(original.source_path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+
+    try:
+        store.record_snapshot(original)
+        for prescription in PRESCRIPTIONS:
+            analysis = sut_db.get_sut_analysis_for_prescription(prescription)
+            store.record_decision(prescription["recete_no"], analysis["rule_version"], analysis["rule_keys"])
+            print(f"  {prescription['recete_no']}: {analysis['rule_keys']}")
+
+        # Kayıtlı içerik aynı snapshot_id ile yeniden derlenmeli
+        assert store.load_snapshot(original.snapshot_id).snapshot_id == original.snapshot_id
+
+        # GLIFIX PLUS daha geniş GLIFIX kuralına kısmi eşleşir
+        assert "drug_brand:GLIFIX PLUS" in sut_db.get_sut_analysis_for_prescription(PRESCRIPTIONS[4])["rule_keys"]
+
+        # VEMLIDY kuralı değişir, PARACETAMOL ve GLIFIX PLUS eklenir, diyabet rapor kuralı değişir
+        document["version"] = "test-targeted"
+        document["drugs"]["VEMLIDY"]["max_duration_months"] = 6
+        document["drugs"]["PARACETAMOL"] = {"active_ingredient": "PARACETAMOL", "report_required": False}
+        document["drugs"]["GLIFIX PLUS"] = {"active_ingredient": "METFORMIN", "report_required": False}
+        document["rules"]["report_requirements"]["diabetes"]["max_duration_months"] = 3
+        updated = _write_rules(os.path.join(tmp_dir, "sut_rules.json"), document)
+
+        diff = diff_rule_snapshots(original, updated)
+        print(f"  diff: drugs={diff['drugs']} keys={diff['affected_keys']} icd={diff['affected_icd_prefixes']}")
+        assert diff["drugs"] == {"added": ["GLIFIX PLUS", "PARACETAMOL"], "removed": [], "changed": ["VEMLIDY"]}
+        assert diff["rule_sections"] == ["report_requirements"] and not diff["full_reevaluation"]
+        assert "E11" in diff["affected_icd_prefixes"]
+
+        plan = store.plan_reevaluation(updated)
+        assert plan["prescriptions"] == ["R_DIABETES", "R_GLIFIX_PLUS", "R_PARACETAMOL", "R_VEMLIDY"], \
+            plan["prescriptions"]
+        print(f"  selected: {plan['prescriptions']} [OK]")
+
+        # Genel kural değişikliği tüm kararları etkiler
+        document["version"] = "test-general"
+        document["rules"]["general_rules"]["max_prescription_age_days"] = 15
+        general = _write_rules(os.path.join(tmp_dir, "sut_rules.json"), document)
+        general_diff = diff_rule_snapshots(updated, general)
+        assert general_diff["full_reevaluation"] and general_diff["rule_sections"] == ["general_rules"]
+        assert len(store.plan_reevaluation(general)["prescriptions"]) == len(PRESCRIPTIONS)
+
+        # Yeniden değerlendirilen karar yeni sürüme taşınınca tekrar seçilmemeli
+        analysis = sut_db.get_sut_analysis_for_prescription(PRESCRIPTIONS[3])
+        store.record_decision("R_NEXIUM", analysis["rule_version"], analysis["rule_keys"])
+        assert "R_NEXIUM" not in store.plan_reevaluation(general)["prescriptions"]
+    finally:
+        sut_rule_engine.reload_rule_snapshot(original.source_path)
+
+    return True
+
+def test_processor_records_pinned_snapshot(tmp_dir):
+    """Analiz sırasında kurallar yeniden yüklense de karar analizin sürümüne bağlanmalı"""
+    print("\n--- PINNED SNAPSHOT ---")
+
+    for key in ("MEDULA_USERNAME", "MEDULA_PASSWORD", "CLAUDE_API_KEY"):
+        os.environ.setdefault(key, "test")
+    os.environ["AI_DECISION_CACHE"] = "false"
+
+    from unified_prescription_processor import UnifiedPrescriptionProcessor
+
+    database = SQLiteHandler(os.path.join(tmp_dir, "pinned.db"))
+    processor = UnifiedPrescriptionProcessor()
+    processor.database = database
+    processor.rule_versions = RuleVersionStore(database)
+    original = processor.sut_db.snapshot
+
+    with open(original.source_path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    document["version"] = "test-reloaded"
+    rules_path = os.path.join(tmp_dir, "reloaded_rules.json")
+    with open(rules_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False)
+
+    # SUT analizinden sonra, kayıttan önce hot reload
+    evaluate = processor.ai_gating.evaluate
+    reloaded = []
+
+    def evaluate_after_reload(dose_result, sut_result):
+        reloaded.append(sut_rule_engine.reload_rule_snapshot(rules_path))
+        return evaluate(dose_result, sut_result)
+
+    processor.ai_gating.evaluate = evaluate_after_reload
+    processor.ai_analyzer.claude_enabled = False
+    try:
+        result = processor.process_single_prescription(dict(PRESCRIPTIONS[0]))
+    finally:
+        sut_rule_engine.reload_rule_snapshot(original.source_path)
+
+    rule_version = result["sut_analysis"]["rule_version"]
+    print(f"  decision version: {rule_version}, current after reload: {reloaded[0].snapshot_id}")
+    assert rule_version == original.snapshot_id != reloaded[0].snapshot_id
+    assert processor.rule_versions.load_snapshot(rule_version).snapshot_id == rule_version
+    assert database.get_rule_snapshot_content(reloaded[0].snapshot_id) is None
+    return True
+
+if __name__ == "__main__":
+    print("=== SUT RULE VERSIONS TEST ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        success = test_targeted_reevaluation(tmp_dir) and test_processor_records_pinned_snapshot(tmp_dir)
+
+    sys.exit(0 if success else 1)
@@ -21,11 +21,16 @@ sys.path.append(os.path.dirname(__file__))
 
 from medula_automation.browser import MedulaBrowser
 from ai_analyzer.sut_rules_database import SUTRulesDatabase
+from ai_analyzer.sut_rule_engine import reload_rule_snapshot_if_changed
+from ai_analyzer.sut_rule_versions import RuleVersionStore
 from ai_analyzer.claude_prescription_analyzer import ClaudePrescriptionAnalyzer
+from ai_analyzer.ai_gating import AIGatingPolicy, summarize_ai_gating
+from ai_analyzer.message_batches import BATCH_COST_FACTOR, MessageBatchRunner, make_custom_id
 from database.sqlite_handler import SQLiteHandler
 from config.settings import Settings
 from advanced_prescription_extractor import AdvancedPrescriptionExtractor
 from prescription_dose_controller import PrescriptionDoseController
+from utils.message_codes import message_code_list
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.common.by import By
 
@@ -38,8 +43,16 @@ class UnifiedPrescriptionProcessor:
         self.sut_db = SUTRulesDatabase()
         self.ai_analyzer = ClaudePrescriptionAnalyzer()
         self.database = SQLiteHandler()
+        self.rule_versions = RuleVersionStore(self.database)  # Karar başına kural sürümü/anahtarları
+        self._rules_checked_at = time.monotonic()  # Kural dosyası en son ne zaman kontrol edildi
         self.extractor = None  # Will be initialized when needed
         self.dose_controller = PrescriptionDoseController()  # NEW: Dose controller
+        self.ai_gating = AIGatingPolicy.from_settings(self.settings)  # Kesin durumlarda AI çağrısını atlar
+        
+        # Opsiyonel SUT kural profillemesi (SUT_RULE_PROFILING=true)
+        if self.settings.sut_rule_profiling:
+            self.sut_db.enable_profiling()
+            self.ai_analyzer.sut_db.enable_profiling()
         
         # Results storage
         self.processed_prescriptions = []
@@ -143,28 +156,197 @@ class UnifiedPrescriptionProcessor:
             # SUT analizi
             sut_result = self._perform_sut_analysis(prescription_data)
             
-            # AI analizi  
-            ai_result = self._perform_ai_analysis(prescription_data)
-            
-            # Sonucu birleştir
-            final_result = self._combine_analysis_results(
-                prescription_data, sut_result, ai_result, dose_result, source, start_time
-            )
-            
-            # İstatistikleri güncelle
-            self._update_stats(final_result)
-            
-            # Veritabanına kaydet
-            self._save_to_database(prescription_data, final_result)
-            
-            logger.info(f"Prescription processed: {final_result['prescription_id']} -> {final_result['final_decision']}")
+            # AI analizi (doz/SUT kesin karar verdiyse atlanır)
+            gate = self.ai_gating.evaluate(dose_result, sut_result)
+            ai_result = AIGatingPolicy.to_ai_result(gate) if gate else self._perform_ai_analysis(prescription_data)
             
-            return final_result
+            return self._finalize_prescription(prescription_data, sut_result, ai_result, dose_result, source, start_time)
             
         except Exception as e:
             logger.error(f"Single prescription processing error: {e}")
             return self._create_error_result(prescription_data, str(e))
     
+    def _finalize_prescription(self, prescription_data, sut_result, ai_result, dose_result, source, start_time):
+        """Analizleri birleştirir, istatistikleri günceller ve kaydeder"""
+        
+        # Sonucu birleştir
+        final_result = self._combine_analysis_results(
+            prescription_data, sut_result, ai_result, dose_result, source, start_time
+        )
+        
+        # İstatistikleri güncelle
+        self._update_stats(final_result)
+        
+        # Veritabanına kaydet
+        self._save_to_database(prescription_data, final_result)
+        
+        logger.info(f"Prescription processed: {final_result['prescription_id']} -> {final_result['final_decision']}")
+        
+        return final_result
+    
+    def process_with_message_batches(self, prescriptions, source="message_batch", runner=None):
+        """
+        Reçeteleri Claude Message Batches ile toplu işler (gece işleri için)
+        
+        Doz ve SUT kontrolleri reçete başına hemen yapılır; yapay zeka gerektiren
+        reçeteler tek bir batch isteğinde gönderilir, sonuçlar custom_id ile eşlenip
+        _combine_analysis_results'a verilir. Önbellekte kararı olan reçeteler
+        gönderilmez.
+        
+        Args:
+            prescriptions: Reçete listesi
+            source: Kaynak etiketi
+            runner: MessageBatchRunner (varsayılan: analyzer'ın Claude istemcisi)
+            
+        Returns:
+            List[Dict]: Girdi sırasıyla sonuçlar
+        """
+        if not self.ai_analyzer.claude_enabled and runner is None:
+            logger.warning("Claude API not available - message batch mode falls back to per-prescription processing")
+            return [self.process_single_prescription(prescription, source) for prescription in prescriptions]
+        
+        if runner is None:
+            runner = MessageBatchRunner(self.ai_analyzer.client,
+                                        poll_interval=self.settings.ai_batch_poll_seconds,
+                                        timeout=self.settings.ai_batch_timeout_hours * 3600)
+        
+        # 1. Deterministik aşamalar ve batch isteklerinin hazırlanması
+        results, needs_ai = self._run_deterministic_stages(prescriptions, source)
+        pending = {}
+        
+        for index, prescription, dose_result, sut_result, start_time in needs_ai:
+            try:
+                prepared = self.ai_analyzer.prepare_claude_request(prescription)
+            except Exception as e:
+                logger.error(f"AI request preparation error: {e}")
+                prepared = {"decision": self.ai_analyzer._analyze_with_sut_only(prescription)}
+            
+            if "decision" in prepared:
+                ai_result = {"result": prepared["decision"], "processing_time": 0.0}
+                results[index] = self._finalize_prescription(prescription, sut_result, ai_result, dose_result,
+                                                             source, start_time)
+                continue
+            
+            custom_id = make_custom_id(index, prescription.get("recete_no"))
+            pending[custom_id] = (index, prescription, dose_result, sut_result, prepared, start_time)
+        
+        # 2. Tek batch isteği
+        batch_results = {}
+        if pending:
+            requests = {custom_id: self.ai_analyzer.build_request_params(entry[4])
+                        for custom_id, entry in pending.items()}
+            batch_start = time.time()
+            try:
+                batch_results = runner.run(requests)
+            except Exception as e:
+                logger.error(f"Message batch failed: {e}")
+            logger.info(f"Message batch: {len(requests)} requests in {time.time() - batch_start:.1f}s")
+        
+        # 3. Sonuçların custom_id ile eşlenmesi
+        for custom_id, (index, prescription, dose_result, sut_result, prepared, start_time) in pending.items():
+            try:
+                batch_result = batch_results.get(custom_id)
+                if batch_result is not None and batch_result.succeeded:
+                    cost = self.ai_analyzer.estimate_call_cost(batch_result.usage,
+                                                               prepared["routing"].tier) * BATCH_COST_FACTOR
+                    ai_result = {
+                        "result": self.ai_analyzer.complete_claude_request(prepared, prescription, batch_result.response,
+                                                                           cost, batch_result.usage),
+                        "processing_time": 0.0,
+                        "message_batch_id": custom_id
+                    }
+                else:
+                    error = batch_result.error if batch_result is not None else "no batch result"
+                    ai_result = {
+                        "result": {
+                            "action": "hold",
+                            "confidence": 0.1,
+                            "reason": f"AI batch error: {error}",
+                            "claude_available": False
+                        },
+                        "processing_time": 0.0,
+                        "error": error,
+                        "message_batch_id": custom_id
+                    }
+                
+                results[index] = self._finalize_prescription(prescription, sut_result, ai_result, dose_result,
+                                                             source, start_time)
+                
+            except Exception as e:
+                logger.error(f"Message batch result error: {e}")
+                results[index] = self._create_error_result(prescription, str(e))
+        
+        return results
+    
+    def process_with_packing(self, prescriptions, source="packed", max_items=None):
+        """
+        Yapay zeka gerektiren reçeteleri istek başına birden fazla olacak şekilde paketleyerek işler
+        
+        Kısa reçetelerde gecikmenin çoğu istek başına gidiş-dönüş süresidir; paketleme
+        çağrı sayısını max_items'a kadar azaltır (bkz. ClaudePrescriptionAnalyzer.analyze_prescriptions_packed).
+        
+        Returns:
+            List[Dict]: Girdi sırasıyla sonuçlar
+        """
+        results, needs_ai = self._run_deterministic_stages(prescriptions, source)
+        if not needs_ai:
+            return results
+        
+        ai_start = time.time()
+        try:
+            decisions = self.ai_analyzer.analyze_prescriptions_packed([entry[1] for entry in needs_ai], max_items)
+        except Exception as e:
+            logger.error(f"Packed AI analysis error: {e}")
+            decisions = [self.ai_analyzer._analyze_with_sut_only(entry[1]) for entry in needs_ai]
+        ai_time = (time.time() - ai_start) / len(needs_ai)
+        
+        for (index, prescription, dose_result, sut_result, start_time), decision in zip(needs_ai, decisions):
+            try:
+                ai_result = {"result": decision, "processing_time": ai_time}
+                results[index] = self._finalize_prescription(prescription, sut_result, ai_result, dose_result,
+                                                             source, start_time)
+            except Exception as e:
+                logger.error(f"Packed result error: {e}")
+                results[index] = self._create_error_result(prescription, str(e))
+        
+        return results
+    
+    def _run_deterministic_stages(self, prescriptions, source):
+        """
+        Toplu işlemede doz ve SUT aşamalarını çalıştırır
+        
+        Geçersiz ve kapıdan dönen reçeteler hemen sonuçlandırılır.
+        
+        Returns:
+            Tuple: (sonuç listesi, AI gereken (index, reçete, doz, SUT, başlangıç) girdileri)
+        """
+        results = [None] * len(prescriptions)
+        needs_ai = []
+        
+        for index, prescription in enumerate(prescriptions):
+            try:
+                if not self._validate_prescription_data(prescription):
+                    results[index] = self._create_error_result(prescription, "Invalid prescription data")
+                    continue
+                
+                start_time = datetime.now()
+                dose_result = self._perform_dose_control(prescription)
+                sut_result = self._perform_sut_analysis(prescription)
+                
+                gate = self.ai_gating.evaluate(dose_result, sut_result)
+                if gate:
+                    results[index] = self._finalize_prescription(prescription, sut_result, AIGatingPolicy.to_ai_result(gate),
+                                                                 dose_result, source, start_time)
+                    continue
+                
+                needs_ai.append((index, prescription, dose_result, sut_result, start_time))
+                
+            except Exception as e:
+                logger.error(f"Deterministic stage error: {e}")
+                results[index] = self._create_error_result(prescription, str(e))
+        
+        return results, needs_ai
+    
     # =========================================================================
     # MEDULA INTEGRATION METHODS
     # =========================================================================
@@ -1260,10 +1442,7 @@ class UnifiedPrescriptionProcessor:
                                     messages.append(row_text)
                                     
                                     # SUT kodlarını çıkar
-                                    import re
-                                    sut_pattern = r'\b(\d{4})\b'
-                                    sut_matches = re.findall(sut_pattern, row_text)
-                                    sut_codes.extend(sut_matches)
+                                    sut_codes.extend(message_code_list(row_text))
                                     
                                     # Detaylı mesaj yapısı
                                     if len(cells) >= 2:
@@ -1309,9 +1488,7 @@ class UnifiedPrescriptionProcessor:
                             messages.append(text)
                             
                             # SUT kodlarını çıkar
-                            import re
-                            sut_matches = re.findall(r'\b(\d{4})\b', text)
-                            sut_codes.extend(sut_matches)
+                            sut_codes.extend(message_code_list(text))
                             
                 except:
                     continue
@@ -1666,7 +1843,7 @@ class UnifiedPrescriptionProcessor:
                     "violations": dose_result.dose_violations,
                     "issues": dose_result.control_notes or []
                 },
-                "recommendation": dose_result.overall_decision,
+                "recommendation": self._dose_recommendation(dose_result),
                 "processing_time": dose_result.processing_time,
                 "drugs_analyzed": dose_result.total_drugs,
                 "reported_drugs": dose_result.reported_drugs
@@ -1679,14 +1856,37 @@ class UnifiedPrescriptionProcessor:
                 "recommendation": {"action": "hold", "confidence": 0.1, "reason": f"Dose control error: {e}"},
                 "processing_time": 0.0,
                 "drugs_analyzed": 0,
-                "reported_drugs": 0
+                "reported_drugs": 0,
+                "error": str(e)
             }
     
+    def _dose_recommendation(self, dose_result):
+        """Doz kontrol kararını SUT/AI önerileriyle aynı biçime çevirir"""
+        decision = dose_result.overall_decision
+        
+        if decision == "reject":
+            return {"action": "reject", "confidence": 0.95,
+                    "reason": f"{dose_result.dose_violations} dose violation(s)"}
+        if decision == "approve":
+            return {"action": "approve", "confidence": 0.9,
+                    "reason": "All reported drug doses are compliant"}
+        if decision == "awaiting_data":
+            return {"action": "hold", "confidence": 0.5,
+                    "reason": "Awaiting active ingredient or report dose data"}
+        if dose_result.reported_drugs == 0:
+            return {"action": "hold", "confidence": 0.5, "reason": "No reported drugs to verify"}
+        return {"action": "hold", "confidence": 0.5, "reason": "Dose compliance could not be verified"}
+    
     def _perform_sut_analysis(self, prescription_data):
         """SUT analizi yapar"""
         try:
-            sut_analysis = self.sut_db.get_sut_analysis_for_prescription(prescription_data)
-            sut_recommendation = self.sut_db.get_recommendation_for_prescription(prescription_data)
+            self._reload_rules_if_changed()
+            
+            # Analiz ve öneri aynı kural sürümüyle yapılır; kararın bağlanacağı sürüm de bu snapshot'tır
+            with self.sut_db.pin_snapshot() as snapshot:
+                sut_analysis = self.sut_db.get_sut_analysis_for_prescription(prescription_data)
+                sut_recommendation = self.sut_db.get_recommendation_for_prescription(prescription_data)
+            self.rule_versions.record_snapshot(snapshot)
             
             return {
                 "analysis": sut_analysis,
@@ -1703,6 +1903,16 @@ class UnifiedPrescriptionProcessor:
                 "error": str(e)
             }
     
+    def _reload_rules_if_changed(self):
+        """Kural dosyası değiştiyse yeniden yükler (en fazla SUT_RULES_RELOAD_SECONDS'ta bir kontrol)"""
+        interval = self.settings.sut_rules_reload_seconds
+        now = time.monotonic()
+        if interval <= 0 or now - self._rules_checked_at < interval:
+            return False
+        
+        self._rules_checked_at = now
+        return reload_rule_snapshot_if_changed()
+    
     def _perform_ai_analysis(self, prescription_data):
         """AI analizi yapar"""
         try:
@@ -1755,13 +1965,15 @@ class UnifiedPrescriptionProcessor:
                 dose_rec = dose_result.get("recommendation", {})
                 result["dose_analysis"] = {
                     "compliant": dose_result.get("analysis", {}).get("overall_compliance", False),
-                    "action": dose_result.get("recommendation", "hold"),
-                    "confidence": 0.8,
+                    "action": dose_rec.get("action", "hold"),
+                    "confidence": dose_rec.get("confidence", 0.0),
                     "drugs_analyzed": dose_result.get("drugs_analyzed", 0),
                     "reported_drugs": dose_result.get("reported_drugs", 0),
                     "issues_found": len(dose_result.get("analysis", {}).get("issues", []))
                 }
             else:
+                dose_rec = {}
+                dose_result = {}
                 result["dose_analysis"] = {
                     "compliant": False,
                     "action": "hold",
@@ -1778,7 +1990,9 @@ class UnifiedPrescriptionProcessor:
                 "action": sut_rec.get("action", "hold"),
                 "confidence": sut_rec.get("confidence", 0.0),
                 "issues_count": len(sut_result.get("analysis", {}).get("issues", [])),
-                "warnings_count": len(sut_result.get("analysis", {}).get("warnings", []))
+                "warnings_count": len(sut_result.get("analysis", {}).get("warnings", [])),
+                "rule_version": sut_result.get("analysis", {}).get("rule_version"),
+                "rule_keys": sut_result.get("analysis", {}).get("rule_keys", [])
             }
             
             # AI sonuçları
@@ -1787,7 +2001,14 @@ class UnifiedPrescriptionProcessor:
                 "action": ai_res.get("action", "hold"),
                 "confidence": ai_res.get("confidence", 0.0),
                 "claude_used": ai_res.get("claude_available", False),
-                "method": ai_res.get("analysis_method", "unknown")
+                "method": ai_res.get("analysis_method", "unknown"),
+                "cache_hit": ai_res.get("cache_hit", False),
+                "similar_reuse": ai_res.get("similar_reuse"),
+                "gated": ai_result.get("gated", False),
+                "gate_rule": ai_res.get("gate_rule"),
+                "token_usage": ai_res.get("token_usage"),
+                "model_routing": ai_res.get("model_routing"),
+                "ai_skipped": ai_res.get("ai_skipped")
             }
             
             # Final karar
@@ -1889,6 +2110,7 @@ class UnifiedPrescriptionProcessor:
             # Final stats
             self._calculate_final_stats(results)
             self._print_processing_summary(results)
+            self._dump_rule_profile()
             
             return results
             
@@ -1900,6 +2122,52 @@ class UnifiedPrescriptionProcessor:
     # UTILITY METHODS
     # =========================================================================
     
+    def reevaluate_after_rule_change(self, previous_snapshot_id=None):
+        """
+        Kural değişikliğinden etkilenen kayıtlı reçeteleri yeniden değerlendirir
+        
+        Sadece ilaç, ICD veya mesaj kodu anahtarları değişen kurallarla kesişen
+        reçeteler seçilir; genel kural değişikliklerinde tümü yeniden işlenir.
+        
+        Args:
+            previous_snapshot_id: Sadece bu kural sürümüyle verilmiş kararlar (varsayılan: eski tüm sürümler)
+        
+        Returns:
+            Dict: Sürüm farkları ve yeniden değerlendirme sonuçları
+        """
+        plan = self.rule_versions.plan_reevaluation(self.sut_db.snapshot, previous_snapshot_id)
+        
+        prescriptions = []
+        for recete_no in plan["prescriptions"]:
+            row = self.database.get_prescription(recete_no)
+            if row and row[5]:
+                prescriptions.append(json.loads(row[5]))
+            else:
+                logger.warning(f"Yeniden değerlendirme için reçete verisi bulunamadı: {recete_no}")
+        
+        results = [self.process_single_prescription(prescription, source="rule_reevaluation")
+                   for prescription in prescriptions]
+        
+        logger.info(f"Kural değişikliği sonrası {len(results)} reçete yeniden değerlendirildi (sürüm: {plan['to']})")
+        return {"rule_version": plan["to"], "diffs": plan["diffs"], "results": results}
+    
+    def _dump_rule_profile(self):
+        """Profilleme açıksa batch sonrası kural raporunu yazdırır ve kaydeder"""
+        profiler = self.sut_db.profiler
+        if profiler is None:
+            return
+        
+        print("\n=== SUT RULE PROFILE ===")
+        print(profiler.format_report(sort_by="total_ms", limit=25))
+        
+        dead_rules = profiler.dead_rules()
+        if dead_rules:
+            print(f"Never fired ({len(dead_rules)}): {', '.join(dead_rules[:20])}")
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        profiler.dump(os.path.join(self.settings.sut_rule_profile_dir, f"sut_rule_profile_{timestamp}.json"))
+        profiler.reset()
+    
     def _validate_prescription_data(self, prescription_data):
         """Reçete verisini doğrular"""
         if not isinstance(prescription_data, dict):
@@ -1981,6 +2249,43 @@ Average per Prescription: {processing_time/total:.2f}s
 
 Claude API Status: {'Active' if any(r.get('ai_analysis', {}).get('claude_used') for r in results) else 'Fallback'}
         """)
+        
+        cache_stats = self.ai_analyzer.get_cache_stats()
+        if cache_stats.get("lookups"):
+            print(f"AI Decision Cache: {cache_stats['hits']}/{cache_stats['lookups']} hits "
+                  f"({cache_stats['hit_rate']*100:.1f}%), avoided cost ${cache_stats['avoided_cost']:.4f}")
+        
+        similarity_stats = self.ai_analyzer.get_similarity_stats()
+        if similarity_stats.get("lookups"):
+            print(f"AI Similar Decisions: {similarity_stats['reuses']}/{similarity_stats['lookups']} reused "
+                  f"({similarity_stats['reuse_rate']*100:.1f}%), avg search {similarity_stats['avg_search_ms']:.2f} ms, "
+                  f"{similarity_stats['entries']} indexed")
+            self.ai_analyzer.similarity_index.save()
+        
+        token_stats = self.ai_analyzer.get_token_stats()
+        if token_stats["calls"]:
+            print(f"AI Tokens: {token_stats['calls']} calls, avg {token_stats['avg_input_tokens']:.0f} in / "
+                  f"{token_stats['avg_output_tokens']:.0f} out, cache read {token_stats['cache_read_input_tokens']}, "
+                  f"avg latency {token_stats['avg_latency_seconds']:.2f}s, cost ${token_stats['cost']:.4f}")
+        
+        self.ai_analyzer.model_router.stats.log()
+        
+        parse_stats = self.ai_analyzer.get_parse_stats()
+        if parse_stats["total"]:
+            print(f"AI Parsing: {parse_stats['by_method']}, {parse_stats['failures']} failures "
+                  f"({parse_stats['failure_rate']*100:.1f}%)")
+        
+        circuit_stats = self.ai_analyzer.get_circuit_stats()
+        if circuit_stats.get("opened") or circuit_stats.get("short_circuited"):
+            print(f"AI Circuit: {circuit_stats['state']}, opened {circuit_stats['opened']}x, "
+                  f"{circuit_stats['short_circuited']} calls skipped, {circuit_stats['probes']} probes, "
+                  f"timeout {circuit_stats['timeout_seconds']:.1f}s")
+        
+        gating = summarize_ai_gating(results)
+        if gating["ai_calls_avoided"]:
+            print(f"AI Gating: {gating['ai_calls_avoided']} calls avoided ({gating['avoided_rate']*100:.1f}%) "
+                  f"{gating['by_rule']}, avg {gating['avg_time_gated']:.2f}s vs {gating['avg_time_ai']:.2f}s with AI, "
+                  f"~{gating['estimated_time_saved']:.1f}s saved")
     
     def _save_results(self, results, output_file):
         """Sonuçları dosyaya kaydeder"""
@@ -2036,6 +2341,16 @@ Claude API Status: {'Active' if any(r.get('ai_analysis', {}).get('claude_used')
             )
             
             if success:
+                # Kural sürümü ve dokunulan kural anahtarları (hedefli yeniden değerlendirme için);
+                # sürümün içeriği analiz sırasında sabitlenen snapshot'tan kaydedilmiştir
+                sut_analysis = final_result.get("sut_analysis", {})
+                if sut_analysis.get("rule_version"):
+                    self.rule_versions.record_decision(
+                        prescription_data.get("recete_no"),
+                        sut_analysis["rule_version"],
+                        sut_analysis.get("rule_keys", [])
+                    )
+                
                 # Log the processing action
                 self.database.log_processing(
                     recete_no=prescription_data.get("recete_no"),
@@ -0,0 +1,92 @@
+"""
+Barkod Grup Tablosu
+İlaç barkodundan reçete grup sınıflandırması için gereken özellikleri
+(raporlu, kan ürünü, sıralı dağıtım) bellekteki tablodan sabit sürede döndürür
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+from loguru import logger
+
+DEFAULT_BARCODE_GROUPS_PATH = Path(__file__).parent.parent / "data" / "barcode_groups.json"
+
+
+class BarcodeAttributes(NamedTuple):
+    """Barkodun grup sınıflandırma özellikleri"""
+    name: str = ""
+    report_required: bool = False
+    blood_product: bool = False
+    sequential_distribution: bool = False
+
+    @property
+    def groups(self) -> List[str]:
+        """Özelliklerin işaret ettiği gruplar (C_blood, A, C)"""
+        groups = []
+        if self.blood_product:
+            groups.append("C_blood")
+        if self.report_required:
+            groups.append("A")
+        if self.sequential_distribution:
+            groups.append("C")
+        return groups
+
+
+class BarcodeGroupTable:
+    """Barkod -> grup özellikleri tablosu"""
+
+    def __init__(self, barcodes: Dict[str, Dict[str, Any]], version: str = "unknown"):
+        self.version = version
+        self._entries: Dict[str, BarcodeAttributes] = {
+            str(barcode).strip(): BarcodeAttributes(
+                name=str(entry.get("name", "")),
+                report_required=bool(entry.get("report_required", False)),
+                blood_product=bool(entry.get("blood_product", False)),
+                sequential_distribution=bool(entry.get("sequential_distribution", False))
+            )
+            for barcode, entry in barcodes.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, barcode: str) -> bool:
+        return str(barcode).strip() in self._entries
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "BarcodeGroupTable":
+        """Tablo dosyasını yükler (varsayılan: BARCODE_GROUPS_FILE veya data/barcode_groups.json)"""
+        data_path = Path(path or os.getenv("BARCODE_GROUPS_FILE") or DEFAULT_BARCODE_GROUPS_PATH)
+
+        with open(data_path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+
+        table = cls(document.get("barcodes", {}), str(document.get("version", "unknown")))
+        logger.info(f"Barkod grup tablosu yüklendi: {table.version} ({len(table)} barkod)")
+        return table
+
+    def lookup(self, barcode: Any) -> Optional[BarcodeAttributes]:
+        """Barkodun özellikleri; tabloda yoksa None"""
+        if not barcode:
+            return None
+        return self._entries.get(str(barcode).strip())
+
+
+_table: Optional[BarcodeGroupTable] = None
+_table_lock = threading.Lock()
+
+
+def get_barcode_group_table() -> BarcodeGroupTable:
+    """Süreç genelinde paylaşılan barkod tablosu (ilk çağrıda yüklenir)"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                try:
+                    _table = BarcodeGroupTable.load()
+                except (OSError, ValueError) as e:
+                    logger.error(f"Barkod grup tablosu yüklenemedi, anahtar kelime sınıflandırması kullanılacak: {e}")
+                    _table = BarcodeGroupTable({})
+    return _table
@@ -0,0 +1,149 @@
+"""
+İlaç Etkileşim Grafı
+Kanonik etken madde çiftleri üzerinden ilaç etkileşimlerini tek geçişte bulur
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+from loguru import logger
+
+from utils.drug_names import fold_turkish
+from utils.text_matching import AhoCorasick
+
+DEFAULT_INTERACTIONS_PATH = Path(__file__).parent.parent / "data" / "drug_interactions.json"
+
+SEVERITY_ORDER = {"low": 0, "moderate": 1, "major": 2}
+
+
+class DrugInteractionGraph:
+    """
+    Etken madde etkileşim grafı
+
+    Düğümler kanonik etken maddeler, kenarlar etkileşimlerdir. İlaç adı,
+    ATC kodu veya marka önce etken maddeye çözülür; reçete kontrolü ilaç
+    başına komşu kümesi sorgusu ile yapılır.
+    """
+
+    def __init__(self, ingredients: Dict[str, List[str]], interactions: List[Dict[str, Any]],
+                 version: str = "unknown"):
+        self.version = version
+        self._aliases: Dict[str, str] = {}
+        self._alias_matcher = AhoCorasick()
+        self._adjacency: Dict[str, Set[str]] = {}
+        self._edges: Dict[FrozenSet[str], Dict[str, Any]] = {}
+        self._resolve_cache: Dict[str, Optional[str]] = {}
+
+        for ingredient, aliases in ingredients.items():
+            for alias in [ingredient, *aliases]:
+                folded = fold_turkish(alias)
+                self._aliases[folded] = ingredient
+                self._alias_matcher.add(folded, ingredient)
+        self._alias_matcher.build()
+
+        for interaction in interactions:
+            first, second = interaction["drugs"]
+            self._adjacency.setdefault(first, set()).add(second)
+            self._adjacency.setdefault(second, set()).add(first)
+            self._edges[frozenset((first, second))] = {
+                "severity": interaction.get("severity", "major"),
+                "description": interaction.get("description", f"{first} ile {second} arasında etkileşim")
+            }
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "DrugInteractionGraph":
+        """Etkileşim dosyasını yükler (varsayılan: DRUG_INTERACTIONS_FILE veya data/drug_interactions.json)"""
+        data_path = Path(path or os.getenv("DRUG_INTERACTIONS_FILE") or DEFAULT_INTERACTIONS_PATH)
+
+        with open(data_path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+
+        graph = cls(document.get("ingredients", {}), document.get("interactions", []),
+                    str(document.get("version", "unknown")))
+        logger.info(f"İlaç etkileşim grafı yüklendi: {graph.version} ({len(graph._edges)} etkileşim)")
+        return graph
+
+    def resolve(self, drug: str) -> Optional[str]:
+        """İlaç adı/ATC kodu/markasını kanonik etken maddeye çözer"""
+        if drug in self._resolve_cache:
+            return self._resolve_cache[drug]
+
+        folded = fold_turkish(str(drug)).strip()
+        ingredient = self._aliases.get(folded)
+        if ingredient is None and folded:
+            match = self._alias_matcher.longest_match(folded, word_boundary=True)
+            ingredient = match[2] if match else None
+
+        self._resolve_cache[drug] = ingredient
+        return ingredient
+
+    def find_interactions(self, drugs: Iterable[str], existing_drugs: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Reçete ilaçları arasındaki ve mevcut ilaçlarla olan etkileşimleri bulur
+
+        Her etken madde çifti bir kez raporlanır. Mevcut ilaçların kendi
+        aralarındaki etkileşimler raporlanmaz.
+
+        Args:
+            drugs: Reçetedeki ilaçlar (ad veya ATC kodu)
+            existing_drugs: Hastanın kullanmakta olduğu ilaçlar
+
+        Returns:
+            List[Dict]: drug1, drug2, ingredients, severity, description, source
+        """
+        seen: Dict[str, tuple] = {}  # etken madde -> (ilaç, kaynak)
+        for drug in existing_drugs:
+            ingredient = self.resolve(drug)
+            if ingredient:
+                seen.setdefault(ingredient, (drug, "active_medication"))
+
+        found = []
+        reported: Set[FrozenSet[str]] = set()
+
+        for drug in drugs:
+            ingredient = self.resolve(drug)
+            if not ingredient:
+                continue
+
+            for other in self._adjacency.get(ingredient, ()):
+                if other not in seen:
+                    continue
+                pair = frozenset((ingredient, other))
+                if pair in reported:
+                    continue
+                reported.add(pair)
+
+                other_drug, source = seen[other]
+                edge = self._edges[pair]
+                found.append({
+                    "drug1": other_drug,
+                    "drug2": drug,
+                    "ingredients": [other, ingredient],
+                    "severity": edge["severity"],
+                    "description": edge["description"],
+                    "source": source
+                })
+
+            seen.setdefault(ingredient, (drug, "prescription"))
+
+        return found
+
+
+_graph: Optional[DrugInteractionGraph] = None
+_graph_lock = threading.Lock()
+
+
+def get_interaction_graph() -> DrugInteractionGraph:
+    """Süreç genelinde paylaşılan etkileşim grafı (ilk çağrıda yüklenir)"""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                try:
+                    _graph = DrugInteractionGraph.load()
+                except (OSError, ValueError) as e:
+                    logger.error(f"İlaç etkileşim dosyası yüklenemedi, etkileşim kontrolü boş: {e}")
+                    _graph = DrugInteractionGraph({}, [])
+    return _graph
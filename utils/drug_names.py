@@ -0,0 +1,193 @@
+"""
+İlaç Adı Kanonikleştirme
+Medula ilaç adlarını marka, güç, form ve kutu miktarına ayırır
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, NamedTuple
+
+# Türkçe büyük harf dönüşümü (str.upper() "i" -> "I" yapar, Türkçede "İ" olmalı)
+_TURKISH_UPPER = str.maketrans({"i": "İ", "ı": "I"})
+
+# Cache anahtarları için ASCII katlama (VEMLİDY == VEMLIDY)
+_ASCII_FOLD = str.maketrans({
+    "İ": "I", "Ş": "S", "Ğ": "G", "Ü": "U", "Ö": "O", "Ç": "C", "Â": "A", "Î": "I", "Û": "U"
+})
+
+_UNIT = r"(?:MCG|MG|MIU|ML|IU|UI|U|G|%)(?![A-Z])"
+# Güç sadece ayrı bir sayı + birim belirtecidir; "B6", "3TC" gibi marka içindeki rakamlar alınmaz
+_STRENGTH_RE = re.compile(
+    rf"(?<![A-Z0-9.])(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)*)\s*({_UNIT})((?:\s*/\s*(?:\d+(?:\.\d+)?\s*)?{_UNIT})*)"
+)
+# Birimsiz güç: kutu miktarından önce gelen ikinci sayı ("ZYRTEC 10 20 TABLET")
+_UNITLESS_STRENGTH_RE = re.compile(r"(\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)*)[\s.]+(?=\d+(?![A-Z0-9.]))")
+_NUMBER_TOKEN_RE = re.compile(r"(?<![A-Z0-9.])\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)*(?![A-Z0-9])")
+_PERCENT_PREFIX_RE = re.compile(r"%\s*(\d+(?:\.\d+)?)")
+_DECIMAL_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+_PARENTHESES_RE = re.compile(r"\([^)]*\)")
+_NUMBER_RE = re.compile(r"\d+")
+_STRENGTH_VALUE_RE = re.compile(r"\d+(?:\.\d+)?")
+_WORD_RE = re.compile(r"[A-Z]+(?:-[A-Z]+)*")
+_BRAND_WORD_RE = re.compile(r"[A-Z0-9]*[A-Z][A-Z0-9]*(?:-[A-Z0-9]+)*")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Medula'da sık kullanılan form kısaltmaları
+_FORM_ABBREVIATIONS = {
+    "TB": "TABLET",
+    "TBL": "TABLET",
+    "TAB": "TABLET",
+    "FTB": "FILM TABLET",
+    "KPS": "KAPSUL",
+    "KAP": "KAPSUL",
+    "AMP": "AMPUL",
+    "FLK": "FLAKON",
+    "SRP": "SURUP",
+}
+
+# Tek birimsiz sayıdan sonra gelince sayıyı kutu miktarı yapan form/ambalaj kelimeleri ("A-FERIN 20 TB")
+_PACK_WORDS = sorted(
+    set(_FORM_ABBREVIATIONS) | {word for form in _FORM_ABBREVIATIONS.values() for word in form.split()}
+    | {"KAPLI", "DRAJE", "SASE", "EFERVESAN", "ADET", "FITIL", "OVUL", "PASTIL", "KALEM", "SIRINGA"},
+    key=len, reverse=True
+)
+_PACK_WORD_RE = re.compile(rf"[\s.]*(?:{'|'.join(_PACK_WORDS)})(?![A-Z])")
+
+
+class CanonicalDrugName(NamedTuple):
+    """Kanonik ilaç adı bileşenleri"""
+    raw: str
+    brand: str
+    strength: str
+    form: str
+    pack_size: str
+
+    @property
+    def key(self) -> str:
+        """
+        Cache ve kural anahtarı: marka + güç değerleri (kutu miktarı, form ve birim hariç)
+
+        Birim anahtara girmez; "PANTO 40 28" ile "PANTO 40 MG 28 TABLET" aynı üründür.
+        """
+        value = "/".join(_STRENGTH_VALUE_RE.findall(self.strength))
+        return f"{self.brand} {value}" if value else self.brand
+
+
+def turkish_upper(text: str) -> str:
+    """Türkçe kurallarına göre büyük harfe çevirir (i -> İ, ı -> I)"""
+    return text.translate(_TURKISH_UPPER).upper()
+
+
+def fold_turkish(text: str) -> str:
+    """Türkçe büyük harfe çevirip Türkçe karakterleri ASCII karşılıklarına katlar"""
+    return turkish_upper(text).translate(_ASCII_FOLD)
+
+
+@lru_cache(maxsize=16384)
+def canonicalize_drug_name(drug_name: str) -> CanonicalDrugName:
+    """
+    İlaç adını kanonik bileşenlerine ayırır
+
+    Örnek: "PANTO 40 MG.28 TABLET" -> brand="PANTO", strength="40MG",
+    form="TABLET", pack_size="28", key="PANTO 40"
+
+    Birimsiz sayılar: iki sayı güç ve kutu miktarıdır ("ZYRTEC 10 20 TABLET"); tek
+    sayı, ardından form/ambalaj kelimesi gelmiyorsa güçtür ("L-THYROXIN 100").
+
+    Args:
+        drug_name: Medula'dan gelen ham ilaç adı (ilac_adi)
+
+    Returns:
+        CanonicalDrugName: Kanonik bileşenler
+    """
+    raw = drug_name or ""
+    text = fold_turkish(raw)
+    text = _PARENTHESES_RE.sub(" ", text)
+    text = _DECIMAL_COMMA_RE.sub(".", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+
+    strength = ""
+    match = _STRENGTH_RE.search(text)
+    percent_match = _PERCENT_PREFIX_RE.search(text)
+    if percent_match and (not match or percent_match.start() < match.start()):
+        # "%2,5 JEL" gibi yüzde önekli güç
+        strength = f"%{percent_match.group(1)}"
+        head, tail = text[:percent_match.start()], text[percent_match.end():]
+    elif match:
+        strength = "".join(match.group(1, 2, 3)).replace(" ", "")
+        head, tail = text[:match.start()], text[match.end():]
+    else:
+        # Birimli güç yoksa marka ilk ayrı sayıya kadar olan kısımdır
+        number = _NUMBER_TOKEN_RE.search(text)
+        split_at = number.start() if number else len(text)
+        head, tail = text[:split_at], text[split_at:]
+        unitless = _UNITLESS_STRENGTH_RE.match(tail)
+        if unitless:
+            strength = unitless.group(1)
+            tail = tail[unitless.end():]
+        elif number and not _PACK_WORD_RE.match(tail, number.end() - split_at):
+            strength = number.group()
+            tail = tail[number.end() - split_at:]
+
+    brand = " ".join(_BRAND_WORD_RE.findall(head))
+    if not brand:
+        brand = head.strip()
+
+    pack_match = _NUMBER_RE.search(tail)
+    pack_size = pack_match.group() if pack_match else ""
+
+    form_words = [_FORM_ABBREVIATIONS.get(word, word) for word in _WORD_RE.findall(tail)]
+    form = " ".join(form_words)
+
+    return CanonicalDrugName(raw=raw, brand=brand, strength=strength, form=form, pack_size=pack_size)
+
+
+def canonical_drug_key(drug_name: str) -> str:
+    """İlaç adının kanonik cache anahtarını döndürür (marka + güç)"""
+    return canonicalize_drug_name(drug_name).key
+
+
+def cache_hit_rate_report(drug_names: Iterable[str]) -> Dict[str, Any]:
+    """
+    Ham isim ve kanonik anahtar ile cache isabet oranlarını karşılaştırır
+
+    Sıradaki her isim bir cache sorgusu kabul edilir; ilk görülen anahtar
+    miss, sonrakiler hit sayılır.
+
+    Args:
+        drug_names: Geçmiş reçetelerdeki ilaç adları (sırasıyla)
+
+    Returns:
+        Dict: Sorgu sayısı, benzersiz anahtar sayıları ve isabet oranları
+    """
+    raw_seen = set()
+    canonical_seen = set()
+    raw_hits = canonical_hits = lookups = 0
+
+    for name in drug_names:
+        if not name:
+            continue
+        lookups += 1
+
+        if name in raw_seen:
+            raw_hits += 1
+        else:
+            raw_seen.add(name)
+
+        key = canonical_drug_key(name)
+        if key in canonical_seen:
+            canonical_hits += 1
+        else:
+            canonical_seen.add(key)
+
+    raw_rate = raw_hits / lookups if lookups else 0.0
+    canonical_rate = canonical_hits / lookups if lookups else 0.0
+
+    return {
+        "lookups": lookups,
+        "raw_unique_keys": len(raw_seen),
+        "canonical_unique_keys": len(canonical_seen),
+        "raw_hit_rate": round(raw_rate, 4),
+        "canonical_hit_rate": round(canonical_rate, 4),
+        "hit_rate_improvement": round(canonical_rate - raw_rate, 4)
+    }
@@ -0,0 +1,135 @@
+"""
+ICD-10 Kod Kataloğu
+ICD-10 tanı kodlarını hiyerarşik (önek) olarak eşleştirir ve kod
+açıklamalarını sağlar
+"""
+
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from loguru import logger
+
+from utils.text_matching import PrefixTrie
+
+DEFAULT_CATALOG_PATH = Path(__file__).parent.parent / "data" / "icd10_catalog.json"
+
+
+def normalize_icd_code(code: str) -> str:
+    """ICD kodunu indeks anahtarına çevirir (B18.1 -> B181)"""
+    return str(code).replace(".", "").replace(" ", "").upper()
+
+
+class ICDPrefixIndex:
+    """
+    ICD kodlarına bağlı değerler için hiyerarşik indeks
+
+    Kayıtlı "E11" kodu "E11", "E11.9" ve "E1190" tanılarını kapsar. Sorgu
+    süresi tanı kodu uzunluğu ile orantılıdır.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Any]] = None):
+        self._trie = PrefixTrie()
+        for code, value in (entries or {}).items():
+            self.add(code, value)
+
+    def __len__(self) -> int:
+        return len(self._trie)
+
+    def add(self, code: str, value: Any = None):
+        """Kod ekler; değer verilmezse orijinal kod saklanır"""
+        normalized = normalize_icd_code(code)
+        if normalized:
+            self._trie.insert(normalized, code if value is None else value)
+
+    def matches(self, diagnosis_code: str) -> List[Any]:
+        """Tanı kodunu kapsayan tüm kayıtların değerleri (genelden özele)"""
+        return [value for _, value in self._trie.prefixes(normalize_icd_code(diagnosis_code))]
+
+    def best_match(self, diagnosis_code: str) -> Optional[Any]:
+        """Tanı kodunu kapsayan en özel kaydın değeri"""
+        match = self._trie.longest_prefix(normalize_icd_code(diagnosis_code))
+        return match[1] if match else None
+
+    def covers(self, diagnosis_code: str) -> bool:
+        return self.best_match(diagnosis_code) is not None
+
+    def find_covering(self, diagnosis_codes: Iterable[str]) -> Optional[Tuple[str, Any]]:
+        """Listedeki ilk kapsanan tanı kodunu ve eşleşen kaydı döndürür"""
+        for diagnosis_code in diagnosis_codes:
+            value = self.best_match(diagnosis_code)
+            if value is not None:
+                return diagnosis_code, value
+        return None
+
+
+class ICD10Catalog:
+    """ICD-10 kod açıklamaları ve hiyerarşi sorguları"""
+
+    def __init__(self, codes: Dict[str, str], version: str = "unknown"):
+        self.version = version
+        self.codes = dict(codes)
+        self.index = ICDPrefixIndex({code: (code, description) for code, description in self.codes.items()})
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "ICD10Catalog":
+        """Katalog dosyasını yükler (varsayılan: ICD10_CATALOG_FILE veya data/icd10_catalog.json)"""
+        catalog_path = Path(path or os.getenv("ICD10_CATALOG_FILE") or DEFAULT_CATALOG_PATH)
+
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+
+        catalog = cls(document.get("codes", {}), str(document.get("version", "unknown")))
+        logger.info(f"ICD-10 kataloğu yüklendi: {catalog.version} ({len(catalog.codes)} kod)")
+        return catalog
+
+    @lru_cache(maxsize=4096)
+    def describe(self, code: str) -> Optional[str]:
+        """
+        Kod açıklaması; katalogda olmayan alt kodlar için en yakın üst kategori
+
+        Örnek: "E11.9" -> "İnsüline bağımlı olmayan diabetes mellitus, komplikasyon olmadan"
+        """
+        match = self.index.best_match(code)
+        return match[1] if match else None
+
+    @lru_cache(maxsize=4096)
+    def format_code(self, code: str) -> str:
+        """Rapor ve prompt metinleri için "KOD (açıklama)" biçimi"""
+        code = str(code).strip()
+        description = self.describe(code)
+        return f"{code} ({description})" if description else code
+
+    def ancestors(self, code: str) -> List[str]:
+        """Katalogdaki üst kodlar (genelden özele, kodun kendisi dahil)"""
+        return [catalog_code for catalog_code, _ in self.index.matches(code)]
+
+    def is_descendant(self, code: str, ancestor: str) -> bool:
+        """code, ancestor kodunun kendisi veya alt kodu mu"""
+        return normalize_icd_code(code).startswith(normalize_icd_code(ancestor))
+
+
+_catalog: Optional[ICD10Catalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_icd10_catalog() -> ICD10Catalog:
+    """Süreç genelinde paylaşılan ICD-10 kataloğu (ilk çağrıda yüklenir)"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                try:
+                    _catalog = ICD10Catalog.load()
+                except (OSError, ValueError) as e:
+                    logger.error(f"ICD-10 kataloğu yüklenemedi, açıklamasız devam ediliyor: {e}")
+                    _catalog = ICD10Catalog({})
+    return _catalog
+
+
+def format_diagnosis_codes(codes: Iterable[str]) -> str:
+    """Tanı kodlarını açıklamalarıyla virgülle ayrılmış metne çevirir"""
+    catalog = get_icd10_catalog()
+    return ", ".join(catalog.format_code(code) for code in codes if code)
@@ -0,0 +1,105 @@
+"""
+İlaç Mesaj Kodları
+Medula ilaç mesajlarını ("1013(1) - 4.2.13.1 Kronik Hepatit B ...") tek geçişte
+kod, adet ve SUT maddesi olarak ayrıştırır
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Kod ayrı bir belirteç olmalı: "11013", "1013.5" veya "22/05/2025" içindeki sayılar eşleşmez.
+# Köşeli parantez ve tırnak ("[1013]", '"1013"') ayırıcıdır; eğik çizgi sadece kod
+# listesinde ("1013/1038", "1013(1)/1038", "[1013]/1038") ayırıcı sayılır.
+MESSAGE_CODE_PATTERN = re.compile(
+    r"(?:(?<![^\s,;:|(\[\"'])|(?<=(?<![\d/.])\d{4}/)|(?<=[)\]\"']/))"
+    r"(\d{4})"                                   # 4 haneli mesaj kodu
+    r"(?:\s*\((\d+)\))?"                         # (adet)
+    r"(?:\s*-\s*(\d+(?:\.\d+)*)(?!\.?\d))?"     # - SUT maddesi (4.2.13.1)
+    r"(?=[\s,;:|)\]\"'\-]|/\d{4}(?!\d)|\.(?!\d)|$)"
+)
+
+# Reçete düzeyinde mesaj metni taşıyan alanlar
+PRESCRIPTION_MESSAGE_FIELDS = ("ilac_mesajlari",)
+
+
+class MessageCode(NamedTuple):
+    """Ayrıştırılmış mesaj kodu"""
+    code: str
+    count: int = 1
+    section: str = ""
+
+
+@lru_cache(maxsize=8192)
+def extract_message_codes(text: str) -> Tuple[MessageCode, ...]:
+    """
+    Mesaj metnindeki kodları geçiş sırasıyla döndürür
+
+    Aynı kod birden fazla geçerse adetler toplanır, ilk SUT maddesi korunur.
+    Sonuç metin başına önbelleğe alınır.
+    """
+    return merge_message_codes([[
+        MessageCode(code, int(count) if count else 1, section)
+        for code, count, section in MESSAGE_CODE_PATTERN.findall(text or "")
+    ]])
+
+
+def parse_message_codes(message_data: Any) -> Tuple[MessageCode, ...]:
+    """
+    Farklı biçimlerdeki mesaj verisinden kodları çıkarır
+
+    Desteklenen biçimler: metin, metin/dict listesi ({"kod": ...}) ve
+    anahtarında "kod"/"message" geçen dict.
+    """
+    if isinstance(message_data, str):
+        return extract_message_codes(message_data)
+    if isinstance(message_data, int) and not isinstance(message_data, bool):
+        return extract_message_codes(str(message_data))
+
+    parts: List[Tuple[MessageCode, ...]] = []
+    if isinstance(message_data, (list, tuple)):
+        for item in message_data:
+            if isinstance(item, dict):
+                if "kod" in item:
+                    parts.append(extract_message_codes(str(item["kod"])))
+            else:
+                parts.append(parse_message_codes(item))
+    elif isinstance(message_data, dict):
+        for key, value in message_data.items():
+            if "kod" in key.lower() or "message" in key.lower():
+                parts.append(parse_message_codes(value))
+
+    return merge_message_codes(parts)
+
+
+def merge_message_codes(groups: Iterable[Iterable[MessageCode]]) -> Tuple[MessageCode, ...]:
+    """Birden fazla kaynaktan gelen kodları sırayı koruyarak birleştirir"""
+    merged: Dict[str, MessageCode] = {}
+    for group in groups:
+        for message in group:
+            previous = merged.get(message.code)
+            if previous is None:
+                merged[message.code] = message
+            else:
+                merged[message.code] = MessageCode(message.code, previous.count + message.count,
+                                                   previous.section or message.section)
+    return tuple(merged.values())
+
+
+def message_code_list(message_data: Any) -> List[str]:
+    """Sadece kod listesi (geçiş sırasıyla, tekrarsız)"""
+    return [message.code for message in parse_message_codes(message_data)]
+
+
+def get_prescription_message_codes(prescription_data: Dict, fields: Optional[Tuple[str, ...]] = None) -> Tuple[MessageCode, ...]:
+    """
+    Reçete düzeyindeki mesaj kodları
+
+    Ayrıştırma metin başına önbelleğe alındığından aynı reçeteyi inceleyen
+    SUT analizi, toplu denetim ve doz kontrolü metni tekrar taramaz.
+    """
+    fields = fields or PRESCRIPTION_MESSAGE_FIELDS
+    values = [prescription_data.get(field) for field in fields]
+    if len(values) == 1:
+        return parse_message_codes(values[0]) if values[0] else ()
+    return merge_message_codes(parse_message_codes(value) for value in values if value)
@@ -0,0 +1,147 @@
+"""
+Kural Profilleyici
+SUT kural değerlendirmelerinin sayısını, tetiklenme oranını ve süresini ölçer
+"""
+
+import csv
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+REPORT_SORT_KEYS = ("total_ms", "mean_us", "evaluations", "fires", "fire_rate", "rule")
+
+
+class _RuleTimer:
+    """Tek bir kural değerlendirmesini ölçen context manager"""
+
+    __slots__ = ("_profiler", "_rule", "_start", "fired")
+
+    def __init__(self, profiler: "RuleProfiler", rule: str):
+        self._profiler = profiler
+        self._rule = rule
+        self.fired = False
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profiler.record(self._rule, time.perf_counter() - self._start, self.fired)
+        return False
+
+
+class _NullRuleTimer:
+    """Profilleme kapalıyken kullanılan boş ölçüm nesnesi"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass  # fired ataması yok sayılır
+
+
+NULL_RULE_TIMER = _NullRuleTimer()
+
+
+class RuleProfiler:
+    """Kural bazında değerlendirme, tetiklenme ve süre istatistikleri"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[float]] = {}  # kural -> [değerlendirme, tetiklenme, toplam süre]
+
+    def rule(self, rule: str) -> _RuleTimer:
+        """Kural değerlendirmesini ölçer; tetiklenirse timer.fired = True yapılmalı"""
+        return _RuleTimer(self, rule)
+
+    def record(self, rule: str, elapsed: float, fired: bool):
+        with self._lock:
+            stats = self._stats.get(rule)
+            if stats is None:
+                stats = self._stats[rule] = [0, 0, 0.0]
+            stats[0] += 1
+            stats[1] += 1 if fired else 0
+            stats[2] += elapsed
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def report(self, sort_by: str = "total_ms", descending: bool = True) -> List[Dict[str, Any]]:
+        """
+        Kural istatistik raporu
+
+        Args:
+            sort_by: total_ms, mean_us, evaluations, fires, fire_rate veya rule
+            descending: Büyükten küçüğe sırala
+
+        Returns:
+            List[Dict]: Kural başına satırlar
+        """
+        if sort_by not in REPORT_SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by} (expected one of {REPORT_SORT_KEYS})")
+
+        with self._lock:
+            snapshot = {rule: list(stats) for rule, stats in self._stats.items()}
+
+        rows = []
+        for rule, (evaluations, fires, elapsed) in snapshot.items():
+            rows.append({
+                "rule": rule,
+                "evaluations": int(evaluations),
+                "fires": int(fires),
+                "fire_rate": round(fires / evaluations, 4) if evaluations else 0.0,
+                "total_ms": round(elapsed * 1000, 3),
+                "mean_us": round(elapsed * 1e6 / evaluations, 2) if evaluations else 0.0
+            })
+
+        rows.sort(key=lambda row: row[sort_by], reverse=descending)
+        return rows
+
+    def dead_rules(self) -> List[str]:
+        """Değerlendirilip hiç tetiklenmeyen kurallar"""
+        return [row["rule"] for row in self.report(sort_by="rule", descending=False) if row["fires"] == 0]
+
+    def format_report(self, sort_by: str = "total_ms", limit: Optional[int] = None) -> str:
+        """Rapor tablosunu metin olarak döndürür"""
+        rows = self.report(sort_by)[:limit] if limit else self.report(sort_by)
+        lines = [f"{'RULE':45s} {'EVALS':>8s} {'FIRES':>8s} {'RATE':>7s} {'TOTAL ms':>10s} {'MEAN µs':>9s}"]
+        for row in rows:
+            lines.append(f"{row['rule'][:45]:45s} {row['evaluations']:8d} {row['fires']:8d} "
+                         f"{row['fire_rate']:7.2%} {row['total_ms']:10.3f} {row['mean_us']:9.2f}")
+        return "\n".join(lines)
+
+    def dump(self, output_file: str, sort_by: str = "total_ms") -> str:
+        """Raporu .json veya .csv olarak kaydeder"""
+        rows = self.report(sort_by)
+        path = Path(output_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if path.suffix.lower() == ".csv":
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=["rule", "evaluations", "fires", "fire_rate", "total_ms", "mean_us"])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"sort_by": sort_by, "rules": rows, "dead_rules": self.dead_rules()},
+                          f, ensure_ascii=False, indent=2)
+
+        logger.info(f"Kural profil raporu kaydedildi: {path} ({len(rows)} kural)")
+        return str(path)
+
+
+_default_profiler = RuleProfiler()
+
+
+def get_rule_profiler() -> RuleProfiler:
+    """Süreç genelinde paylaşılan profilleyici"""
+    return _default_profiler
@@ -5,16 +5,84 @@ SUT (Sağlık Uygulama Tebliği) Kuralları
 
 import json
 import re
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from typing import Dict, FrozenSet, Hashable, List, Any, Optional
 from datetime import datetime, timedelta
 from loguru import logger
 
+from utils.drug_interactions import SEVERITY_ORDER, get_interaction_graph
+from utils.icd10 import ICDPrefixIndex, get_icd10_catalog
+from utils.rule_profiler import NULL_RULE_TIMER, get_rule_profiler
+from utils.text_matching import PrefixTrie
+
+
+@lru_cache(maxsize=1024)
+def _compile_wildcard(pattern: str):
+    """Joker karakterli ATC desenini bir kez derler"""
+    return re.compile(pattern.replace("*", ".*"))
+
+
+class ATCPatternIndex:
+    """
+    Derlenmiş ATC desen indeksi
+    
+    "C09*" gibi önek desenleri trie'ye, tam kodlar sözlüğe yerleştirilir.
+    Tek sorgu, ATC kodu uzunluğu ile orantılı sürede eşleşen tüm kural
+    anahtarlarını döndürür.
+    """
+    
+    def __init__(self):
+        self._prefix_trie = PrefixTrie()
+        self._exact: Dict[str, List[Hashable]] = {}
+        self._wildcards: List[tuple] = []  # Ortada joker olan nadir desenler
+        self._match_cache: Dict[str, FrozenSet[Hashable]] = {}
+    
+    def add(self, pattern: str, rule_key: Hashable):
+        """Deseni kural anahtarıyla ekler"""
+        if pattern.endswith("*") and "*" not in pattern[:-1]:
+            prefix = pattern[:-1]
+            keys = self._prefix_trie.get(prefix)
+            if keys is None:
+                keys = []
+                self._prefix_trie.insert(prefix, keys)
+            keys.append(rule_key)
+        elif "*" in pattern:
+            self._wildcards.append((_compile_wildcard(pattern), rule_key))
+        else:
+            self._exact.setdefault(pattern, []).append(rule_key)
+        self._match_cache.clear()
+    
+    def add_rules(self, rule_key: Hashable, patterns: List[str]):
+        for pattern in patterns:
+            self.add(pattern, rule_key)
+    
+    def match(self, drug_code: str) -> FrozenSet[Hashable]:
+        """İlaç koduyla eşleşen tüm kural anahtarları"""
+        cached = self._match_cache.get(drug_code)
+        if cached is not None:
+            return cached
+        
+        matched = set(self._exact.get(drug_code, ()))
+        for _, keys in self._prefix_trie.prefixes(drug_code):
+            matched.update(keys)
+        # Boş önek ("*") tüm kodlarla eşleşir
+        matched.update(self._prefix_trie.get("", ()))
+        for compiled, rule_key in self._wildcards:
+            if compiled.match(drug_code):
+                matched.add(rule_key)
+        
+        result = frozenset(matched)
+        self._match_cache[drug_code] = result
+        return result
+
 
 class SUTRules:
     """SUT kuralları sınıfı"""
     
-    def __init__(self):
+    def __init__(self, db_manager=None):
         self.rules_cache = {}
+        self.db_manager = db_manager  # Hasta bazlı etkileşim kontrolü için (opsiyonel)
+        self.profiler = None  # enable_profiling() ile kontrol bazında ölçüm
         self.load_basic_rules()
     
     def load_basic_rules(self):
@@ -35,13 +103,6 @@ class SUTRules:
                 "C09AA01": {"max_daily": 10, "unit": "mg"}     # Enalapril
             },
             
-            # İlaç etkileşimleri (major)
-            "drug_interactions": {
-                "warfarin": ["aspirin", "ibuprofen", "ciprofloxacin"],
-                "metformin": ["contrast_agents", "alcohol"],
-                "digoxin": ["quinidine", "verapamil", "amiodarone"]
-            },
-            
             # Tanı-ilaç uyumluluğu
             "diagnosis_drug_compatibility": {
                 "I10": ["C09AA*", "C08CA*", "C07AB*"],     # Hipertansiyon
@@ -66,8 +127,37 @@ class SUTRules:
             }
         }
         
+        self.compile_rule_indexes()
+        
         logger.info("Temel SUT kuralları yüklendi")
     
+    def enable_profiling(self, profiler=None):
+        """Kontrol bazında değerlendirme/tetiklenme/süre ölçümünü açar (varsayılan: paylaşılan profilleyici)"""
+        self.profiler = profiler or get_rule_profiler()
+        return self.profiler
+    
+    def disable_profiling(self):
+        self.profiler = None
+    
+    def compile_rule_indexes(self):
+        """ATC desenlerini ve tanı kodlarını arama indekslerine derler"""
+        self.atc_index = ATCPatternIndex()
+        
+        # İlaç etkileşimleri data/drug_interactions.json'dan (etken madde grafı)
+        self.interaction_graph = get_interaction_graph()
+        
+        for category, patterns in self.rules_cache["age_restrictions"].items():
+            self.atc_index.add_rules(("age_restrictions", category), patterns)
+        for condition, patterns in self.rules_cache["contraindications"].items():
+            self.atc_index.add_rules(("contraindications", condition), patterns)
+        for icd_code, patterns in self.rules_cache["diagnosis_drug_compatibility"].items():
+            self.atc_index.add_rules(("diagnosis_drug_compatibility", icd_code), patterns)
+        
+        # Tanı-ilaç uyumluluğu hiyerarşik ICD indeksi ("E11" kuralı "E11.9" tanısını kapsar)
+        self.diagnosis_index = ICDPrefixIndex(
+            {code: code for code in self.rules_cache["diagnosis_drug_compatibility"]}
+        )
+    
     def check_diagnosis_drug_compatibility(self, diagnosis_code: str, drug_codes: List[str]) -> Dict[str, Any]:
         """
         Tanı-ilaç uyumluluğunu kontrol eder
@@ -87,19 +177,15 @@ class SUTRules:
         }
         
         try:
-            # Tanı kodu için uygun ilaçları bul
-            compatible_drugs = self.rules_cache["diagnosis_drug_compatibility"].get(diagnosis_code, [])
+            # Tanı kodunu kapsayan kurallar (kodun kendisi ve üst kategorileri)
+            covering_rules = {("diagnosis_drug_compatibility", code)
+                              for code in self.diagnosis_index.matches(diagnosis_code)}
+            result["diagnosis_description"] = get_icd10_catalog().describe(diagnosis_code)
             
             for drug_code in drug_codes:
-                is_compatible = False
-                
-                for compatible_pattern in compatible_drugs:
-                    if self._match_atc_pattern(drug_code, compatible_pattern):
-                        is_compatible = True
-                        result["compatible"].append(drug_code)
-                        break
-                
-                if not is_compatible:
+                if covering_rules & self.atc_index.match(drug_code):
+                    result["compatible"].append(drug_code)
+                else:
                     result["incompatible"].append(drug_code)
                     result["warnings"].append(
                         f"İlaç {drug_code} tanı {diagnosis_code} ile uyumlu görünmüyor"
@@ -142,26 +228,20 @@ class SUTRules:
             
             for drug_code in drug_codes:
                 warnings = []
+                matched_rules = self.atc_index.match(drug_code)
                 
                 # Çocuk ilaçları kontrolü
-                if patient_age >= 18:
-                    for pediatric_pattern in age_rules["pediatric_only"]:
-                        if self._match_atc_pattern(drug_code, pediatric_pattern):
-                            warnings.append(f"{drug_code} çocuk ilacı, yetişkin hastada dikkatli kullanım")
+                if patient_age >= 18 and ("age_restrictions", "pediatric_only") in matched_rules:
+                    warnings.append(f"{drug_code} çocuk ilacı, yetişkin hastada dikkatli kullanım")
                 
                 # Yetişkin ilaçları kontrolü
-                if patient_age < 18:
-                    for adult_pattern in age_rules["adult_only"]:
-                        if self._match_atc_pattern(drug_code, adult_pattern):
-                            warnings.append(f"{drug_code} yetişkin ilacı, çocukta kontrendike")
-                            result["inappropriate"].append(drug_code)
-                            continue
+                if patient_age < 18 and ("age_restrictions", "adult_only") in matched_rules:
+                    warnings.append(f"{drug_code} yetişkin ilacı, çocukta kontrendike")
+                    result["inappropriate"].append(drug_code)
                 
                 # Yaşlı hastalar için dikkat
-                if patient_age >= 65:
-                    for elderly_pattern in age_rules["elderly_caution"]:
-                        if self._match_atc_pattern(drug_code, elderly_pattern):
-                            warnings.append(f"{drug_code} yaşlı hastada dikkatli kullanım gerekli")
+                if patient_age >= 65 and ("age_restrictions", "elderly_caution") in matched_rules:
+                    warnings.append(f"{drug_code} yaşlı hastada dikkatli kullanım gerekli")
                 
                 if drug_code not in result["inappropriate"]:
                     result["appropriate"].append(drug_code)
@@ -182,12 +262,14 @@ class SUTRules:
             result["warnings"].append(f"Kontrol hatası: {e}")
             return result
     
-    def check_drug_interactions(self, drug_codes: List[str]) -> Dict[str, Any]:
+    def check_drug_interactions(self, drug_codes: List[str],
+                                active_medications: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         İlaç etkileşimlerini kontrol eder
         
         Args:
             drug_codes: İlaç kodları
+            active_medications: Hastanın kullanmakta olduğu ilaçlar (opsiyonel)
             
         Returns:
             Dict: Etkileşim sonucu
@@ -200,36 +282,19 @@ class SUTRules:
         }
         
         try:
-            interactions = self.rules_cache["drug_interactions"]
-            found_interactions = []
+            found_interactions = self.interaction_graph.find_interactions(drug_codes, active_medications or [])
             
-            for drug1 in drug_codes:
-                drug1_name = self._get_drug_name(drug1)
-                
-                if drug1_name in interactions:
-                    interacting_drugs = interactions[drug1_name]
-                    
-                    for drug2 in drug_codes:
-                        if drug1 != drug2:
-                            drug2_name = self._get_drug_name(drug2)
-                            
-                            if drug2_name in interacting_drugs:
-                                interaction = {
-                                    "drug1": drug1,
-                                    "drug2": drug2,
-                                    "severity": "major",
-                                    "description": f"{drug1_name} ile {drug2_name} arasında etkileşim"
-                                }
-                                found_interactions.append(interaction)
-                                
-                                result["warnings"].append(
-                                    f"MAJÖR ETKİLEŞİM: {drug1_name} + {drug2_name}"
-                                )
+            for interaction in found_interactions:
+                drug1_name, drug2_name = interaction["ingredients"]
+                label = "MAJÖR ETKİLEŞİM" if interaction["severity"] == "major" else "ETKİLEŞİM"
+                suffix = " (aktif ilaç)" if interaction["source"] == "active_medication" else ""
+                result["warnings"].append(f"{label}: {drug1_name} + {drug2_name}{suffix}")
             
             result["interactions"] = found_interactions
             
             if found_interactions:
-                result["severity"] = "major"
+                result["severity"] = max((i["severity"] for i in found_interactions),
+                                         key=lambda severity: SEVERITY_ORDER.get(severity, 0))
                 result["score"] = 0.0 if any(i["severity"] == "major" for i in found_interactions) else 0.5
             
             return result
@@ -239,6 +304,37 @@ class SUTRules:
             result["warnings"].append(f"Kontrol hatası: {e}")
             return result
     
+    def check_patient_drug_interactions(self, patient_tc: str, drug_codes: List[str],
+                                        active_days: int = 90,
+                                        prescription_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Yeni reçete ilaçlarını hastanın veritabanındaki aktif ilaçlarıyla birlikte kontrol eder
+        
+        Args:
+            patient_tc: Hasta TC kimlik numarası
+            drug_codes: Yeni reçetedeki ilaç kodları
+            active_days: Son kaç günün reçeteleri aktif sayılır
+            prescription_id: Kontrol edilen reçete (aktif ilaçlardan hariç tutulur)
+            
+        Returns:
+            Dict: Etkileşim sonucu (active_medications alanı ile)
+        """
+        active_medications = []
+        
+        if self.db_manager and patient_tc:
+            try:
+                rows = self.db_manager.get_active_medications(patient_tc, active_days, prescription_id)
+                for row in rows:
+                    medication = row["active_ingredient"] or row["name"] or row["barcode"]
+                    if medication and medication not in active_medications:
+                        active_medications.append(medication)
+            except Exception as e:
+                logger.error(f"Aktif ilaçlar alınamadı: {e}")
+        
+        result = self.check_drug_interactions(drug_codes, active_medications)
+        result["active_medications"] = active_medications
+        return result
+    
     def check_dosage_limits(self, drug_dosages: Dict[str, float]) -> Dict[str, Any]:
         """
         Dozaj sınırlarını kontrol eder
@@ -314,28 +410,26 @@ class SUTRules:
         try:
             contraindications = self.rules_cache["contraindications"]
             
-            for condition in patient_conditions:
-                if condition in contraindications:
-                    restricted_patterns = contraindications[condition]
-                    
-                    for drug_code in drug_codes:
-                        is_contraindicated = False
-                        
-                        for pattern in restricted_patterns:
-                            if self._match_atc_pattern(drug_code, pattern):
-                                result["contraindicated"].append({
-                                    "drug": drug_code,
-                                    "condition": condition,
-                                    "reason": f"{drug_code} {condition} durumunda kontrendike"
-                                })
-                                result["warnings"].append(
-                                    f"KONTRENDİKE: {drug_code} {condition} hastalarında kullanılamaz"
-                                )
-                                is_contraindicated = True
-                                break
-                        
-                        if not is_contraindicated and drug_code not in result["safe"]:
-                            result["safe"].append(drug_code)
+            active_conditions = [c for c in patient_conditions if c in contraindications]
+            
+            for drug_code in drug_codes if active_conditions else []:
+                matched_rules = self.atc_index.match(drug_code)
+                is_contraindicated = False
+                
+                for condition in active_conditions:
+                    if ("contraindications", condition) in matched_rules:
+                        result["contraindicated"].append({
+                            "drug": drug_code,
+                            "condition": condition,
+                            "reason": f"{drug_code} {condition} durumunda kontrendike"
+                        })
+                        result["warnings"].append(
+                            f"KONTRENDİKE: {drug_code} {condition} hastalarında kullanılamaz"
+                        )
+                        is_contraindicated = True
+                
+                if not is_contraindicated and drug_code not in result["safe"]:
+                    result["safe"].append(drug_code)
             
             # Hiç durum yoksa tüm ilaçları güvenli kabul et
             if not patient_conditions:
@@ -380,6 +474,8 @@ class SUTRules:
             patient_age = prescription_data.get("patient_age", 0)
             patient_conditions = prescription_data.get("patient_conditions", [])
             drug_dosages = prescription_data.get("drug_dosages", {})
+            patient_tc = prescription_data.get("patient_tc", "")
+            prescription_id = prescription_data.get("prescription_id")
             
             # Tüm kontrolleri çalıştır
             checks_to_run = [
@@ -388,7 +484,9 @@ class SUTRules:
                 ("age_restrictions", 
                  lambda: self.check_age_restrictions(patient_age, drug_codes)),
                 ("drug_interactions", 
-                 lambda: self.check_drug_interactions(drug_codes)),
+                 lambda: self.check_patient_drug_interactions(patient_tc, drug_codes,
+                                                              prescription_id=prescription_id)
+                 if self.db_manager and patient_tc else self.check_drug_interactions(drug_codes)),
                 ("dosage_limits", 
                  lambda: self.check_dosage_limits(drug_dosages)),
                 ("contraindications", 
@@ -398,16 +496,21 @@ class SUTRules:
             scores = []
             all_warnings = []
             
+            profiler = self.profiler
+            
             for check_name, check_func in checks_to_run:
-                try:
-                    check_result = check_func()
-                    result["checks"][check_name] = check_result
-                    scores.append(check_result["score"])
-                    all_warnings.extend(check_result.get("warnings", []))
-                except Exception as e:
-                    logger.error(f"{check_name} kontrolü hatası: {e}")
-                    result["checks"][check_name] = {"score": 0.5, "warnings": [str(e)]}
-                    scores.append(0.5)
+                with profiler.rule(f"sut_rules:{check_name}") if profiler else NULL_RULE_TIMER as rule:
+                    try:
+                        check_result = check_func()
+                        result["checks"][check_name] = check_result
+                        scores.append(check_result["score"])
+                        all_warnings.extend(check_result.get("warnings", []))
+                        rule.fired = check_result["score"] < 1.0 or bool(check_result.get("warnings"))
+                    except Exception as e:
+                        logger.error(f"{check_name} kontrolü hatası: {e}")
+                        result["checks"][check_name] = {"score": 0.5, "warnings": [str(e)]}
+                        scores.append(0.5)
+                        rule.fired = True
             
             # Genel skor hesaplama (ağırlıklı ortalama)
             weights = [0.3, 0.2, 0.25, 0.15, 0.1]  # Tanı uyumu en önemli
@@ -444,31 +547,16 @@ class SUTRules:
             return result
     
     def _match_atc_pattern(self, drug_code: str, pattern: str) -> bool:
-        """ATC kod deseni eşleştirme"""
+        """ATC kod deseni eşleştirme (tekil kontroller için; toplu kontroller atc_index kullanır)"""
         if "*" in pattern:
             # Wildcard desteği
-            regex_pattern = pattern.replace("*", ".*")
-            return bool(re.match(regex_pattern, drug_code))
+            return bool(_compile_wildcard(pattern).match(drug_code))
         else:
             return drug_code == pattern
     
     def _get_drug_name(self, drug_code: str) -> str:
-        """İlaç kodundan ilaç adını çıkarır (basit mapping)"""
-        # Bu gerçek bir sistemde veritabanından gelecek
-        drug_names = {
-            "warfarin": "warfarin",
-            "aspirin": "aspirin", 
-            "ibuprofen": "ibuprofen",
-            "metformin": "metformin",
-            "digoxin": "digoxin"
-        }
-        
-        # ATC kodundan basit çıkarım
-        for name, code in drug_names.items():
-            if name.lower() in drug_code.lower():
-                return name
-        
-        return drug_code.lower()
+        """İlaç kodundan etken madde adını çıkarır (etkileşim grafı eş adları ile)"""
+        return self.interaction_graph.resolve(drug_code) or drug_code.lower()
 
 
 # Yardımcı fonksiyonlar
@@ -0,0 +1,203 @@
+"""
+Metin Eşleştirme İndeksleri
+Çok sayıda anahtarın metin içinde tek geçişte aranması için Aho-Corasick
+otomatı ve önek (prefix) trie yapısı
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick çoklu desen arama otomatı
+
+    Desenler add() ile eklenir, build() ile otomat derlenir. Arama süresi
+    desen sayısından bağımsız olarak metin uzunluğu + eşleşme sayısı ile
+    orantılıdır.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._terminal: List[Optional[Tuple[int, Any]]] = [None]  # (desen uzunluğu, değer)
+        self._output_link: List[int] = [-1]  # Terminal olan en yakın fail düğümü
+        self._built = False
+
+    def __len__(self) -> int:
+        return sum(1 for terminal in self._terminal if terminal is not None)
+
+    def add(self, pattern: str, value: Any = None):
+        """Desen ekler (aynı desen tekrar eklenirse değeri güncellenir)"""
+        if not pattern:
+            return
+
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._output_link.append(-1)
+            node = next_node
+
+        self._terminal[node] = (len(pattern), pattern if value is None else value)
+        self._built = False
+
+    def build(self) -> "AhoCorasick":
+        """Fail ve output bağlantılarını BFS ile kurar"""
+        queue = list(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+            self._output_link[child] = -1
+
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+
+                fail_node = self._fail[child]
+                self._output_link[child] = fail_node if self._terminal[fail_node] is not None \
+                    else self._output_link[fail_node]
+
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Metindeki tüm desen eşleşmelerini döndürür
+
+        Yields:
+            Tuple[int, int, Any]: (başlangıç, bitiş, değer) - bitiş hariç
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, terminal, output_link = self._goto, self._fail, self._terminal, self._output_link
+        node = 0
+
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            match_node = node if terminal[node] is not None else output_link[node]
+            while match_node > 0:
+                length, value = terminal[match_node]
+                yield index + 1 - length, index + 1, value
+                match_node = output_link[match_node]
+
+    def longest_match(self, text: str, word_boundary: bool = False) -> Optional[Tuple[int, int, Any]]:
+        """
+        Metindeki en uzun desen eşleşmesini döndürür (eşitlikte en soldaki)
+
+        Args:
+            text: Aranacak metin
+            word_boundary: True ise sadece tam kelime eşleşmeleri kabul edilir
+        """
+        best = None
+        for start, end, value in self.iter_matches(text):
+            if word_boundary and not is_word_bounded(text, start, end):
+                continue
+            if best is None or end - start > best[1] - best[0]:
+                best = (start, end, value)
+        return best
+
+
+class PrefixTrie:
+    """
+    Önek ağacı
+
+    Hiyerarşik kodlarda (ICD-10, ATC) en uzun kayıtlı öneki ve bir öneke
+    uyan ilk kaydı anahtar uzunluğu ile orantılı sürede bulur.
+    """
+
+    _VALUE = object()  # Düğümde saklanan değer için özel anahtar
+    _SHORTEST = object()  # Alt ağaçtaki en kısa kayıt: (uzunluk, değer, düğüm)
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: str) -> bool:
+        node = self._find_node(key)
+        return node is not None and self._VALUE in node
+
+    def insert(self, key: str, value: Any = None):
+        """Anahtar ekler (mevcutsa değeri günceller)"""
+        value = key if value is None else value
+        path = [self._root]
+        for char in key:
+            path.append(path[-1].setdefault(char, {}))
+
+        node = path[-1]
+        if self._VALUE not in node:
+            self._size += 1
+        node[self._VALUE] = value
+
+        for path_node in path:
+            shortest = path_node.get(self._SHORTEST)
+            if shortest is None or len(key) < shortest[0] or shortest[2] is node:
+                path_node[self._SHORTEST] = (len(key), value, node)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Tam anahtar eşleşmesi"""
+        node = self._find_node(key)
+        if node is None:
+            return default
+        return node.get(self._VALUE, default)
+
+    def prefixes(self, text: str) -> List[Tuple[str, Any]]:
+        """Metnin kayıtlı tüm öneklerini kısadan uzuna döndürür"""
+        found = []
+        node = self._root
+        for index, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if self._VALUE in node:
+                found.append((text[:index + 1], node[self._VALUE]))
+        return found
+
+    def longest_prefix(self, text: str) -> Optional[Tuple[str, Any]]:
+        """Metnin kayıtlı en uzun önekini döndürür"""
+        found = self.prefixes(text)
+        return found[-1] if found else None
+
+    def first_with_prefix(self, prefix: str) -> Optional[Any]:
+        """Verilen önekle başlayan en kısa kaydın değerini döndürür"""
+        node = self._find_node(prefix)
+        if node is None or self._SHORTEST not in node:
+            return None
+        return node[self._SHORTEST][1]
+
+    def _find_node(self, key: str) -> Optional[Dict]:
+        node = self._root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+
+def is_word_bounded(text: str, start: int, end: int) -> bool:
+    """text[start:end] aralığının iki yanında harf/rakam olmadığını kontrol eder"""
+    if start > 0 and text[start - 1].isalnum():
+        return False
+    if end < len(text) and text[end].isalnum():
+        return False
+    return True